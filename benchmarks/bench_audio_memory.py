@@ -0,0 +1,156 @@
+"""
+Peak RSS of the audio path before and after the streaming ffmpeg pipeline,
+measured on a synthetic long file (requires ffmpeg, and pydub for the legacy path).
+
+The `whole` and `transcribe` modes include the Whisper call, which copies and pads the array it is
+given: the whole memory-mapped file at once, against `BaseHelper.audio_file2text` transcribing it
+chunk by chunk. With whisper installed the `tiny` model runs on the CPU, otherwise a stand-in makes
+the same copy of its input.
+
+    python benchmarks/bench_audio_memory.py --minutes 180
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _make_fixture(path: str, minutes: float) -> None:
+    # speech-band tone with a slow amplitude modulation, encoded like a typical yt-dlp download
+    subprocess.run([
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=48000:duration={minutes * 60}",
+        "-af", "volume='0.5+0.4*sin(2*PI*0.3*t)':eval=frame",
+        "-c:a", "libopus", "-b:a", "64k", path,
+    ], check=True)
+
+
+def _legacy(path: str) -> float:
+    """bytes in memory -> pydub decode -> wav export -> whisper style ffmpeg decode to memory"""
+    import numpy as np
+    from pydub import AudioSegment
+
+    with open(path, "rb") as f:
+        content = f.read()
+    with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+        tmp.write(content)
+        tmp.flush()
+        sound = AudioSegment.from_file(tmp.name)
+        sound.export(tmp.name, format="wav")
+        del sound
+        out = subprocess.run([
+            "ffmpeg", "-nostdin", "-threads", "0", "-i", tmp.name,
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", "16000", "-",
+        ], capture_output=True, check=True).stdout
+        audio = np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+    return float(np.abs(audio).mean())
+
+
+def _streaming(path: str) -> float:
+    import numpy as np
+    from video_summary_bot_core.audio import decoded_audio
+
+    with decoded_audio(path) as audio:
+        # touch every sample, chunk by chunk, as a consumer would
+        total = 0.0
+        for start in range(0, len(audio), 30 * 16000):
+            total += float(np.abs(audio[start:start + 30 * 16000]).sum())
+        return total / max(len(audio), 1)
+
+
+def _chunks(path: str) -> float:
+    import numpy as np
+    from video_summary_bot_core.audio import iter_audio_chunks
+
+    total, count = 0.0, 0
+    for chunk in iter_audio_chunks(path):
+        total += float(np.abs(chunk).sum())
+        count += len(chunk)
+    return total / max(count, 1)
+
+
+class _CopyingModel:
+    """stand-in for whisper.Whisper.transcribe's memory use: its input is padded, so copied as a whole"""
+
+    def transcribe(self, audio, **options) -> dict:
+        import numpy as np
+
+        padded = np.pad(np.asarray(audio, dtype=np.float32), (0, 30 * 16000))
+        return {'segments': [{'start': 0.0, 'end': len(audio) / 16000, 'text': f"{padded.sum():.0f}"}]}
+
+
+def _whisper_model():
+    try:
+        import whisper
+    except ImportError:
+        return _CopyingModel()
+    return whisper.load_model('tiny', device='cpu')
+
+
+def _whole(path: str) -> float:
+    from video_summary_bot_core.audio import decoded_audio
+
+    model = _whisper_model()
+    with decoded_audio(path) as audio:
+        return len(model.transcribe(audio, fp16=False)['segments'])
+
+
+def _transcribe(path: str) -> float:
+    from video_summary_bot_core.base_helper import BaseHelper
+    from video_summary_bot_core.model_registry import ModelRegistry
+
+    model = _whisper_model()
+
+    class Registry(ModelRegistry):
+        def get(self, *args, **kwargs):
+            return model
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        helper = BaseHelper('tiny', device='cpu', data_dir=data_dir, model_registry=Registry())
+        return len(helper.audio_file2text(path))
+
+
+_MODES = {'legacy': _legacy, 'streaming': _streaming, 'chunks': _chunks, 'whole': _whole, 'transcribe': _transcribe}
+
+
+def _run_child(mode: str, path: str) -> None:
+    t = time.perf_counter()
+    _MODES[mode](path)
+    elapsed = time.perf_counter() - t
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'mode': mode, 'seconds': elapsed, 'peak_rss_mb': peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="audio pipeline memory benchmark")
+    parser.add_argument('--minutes', type=float, default=180, help="length of the synthetic file")
+    parser.add_argument('--modes', type=str, default=','.join(_MODES))
+    parser.add_argument('--child', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--file', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _run_child(args.child, args.file)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "long.webm")
+        _make_fixture(path, args.minutes)
+        print(f"fixture: {args.minutes:.0f} min, {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        for mode in args.modes.split(','):
+            # every mode in a fresh process so ru_maxrss is its own peak (ffmpeg children excluded)
+            child = subprocess.run([sys.executable, __file__, '--child', mode, '--file', path],
+                                   capture_output=True, text=True)
+            if child.returncode != 0:
+                print(f"{mode:10s} failed: {child.stderr.strip().splitlines()[-1]}")
+                continue
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f"{mode:10s} peak RSS {result['peak_rss_mb']:8.1f} MiB  {result['seconds']:6.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Speedup of the chunked long-form transcription against the number of Whisper workers
+(CPU, `tiny` model by default).
+
+    python benchmarks/bench_chunked_transcription.py --minutes 20 --workers 1,2,4
+"""
+import argparse
+import time
+
+import whisper
+
+from fixtures import synthetic_speech
+from video_summary_bot_core.chunked_transcriber import ChunkedTranscriber
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chunked transcription speedup benchmark")
+    parser.add_argument('--minutes', type=float, default=20, help="length of the synthetic audio")
+    parser.add_argument('--audio', type=str, default=None, help="use a real recording instead")
+    parser.add_argument('--model', type=str, default='tiny')
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--chunk-minutes', type=float, default=2)
+    parser.add_argument('--workers', type=str, default='1,2,4')
+    args = parser.parse_args()
+
+    if args.audio:
+        audio = whisper.load_audio(args.audio)
+    else:
+        audio = synthetic_speech(args.minutes * 60)
+    duration = len(audio) / 16000
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',')]:
+        models = {}
+
+        def model_factory(replica: int) -> whisper.Whisper:
+            if replica not in models:
+                models[replica] = whisper.load_model(args.model, device=args.device)
+            return models[replica]
+
+        transcriber = ChunkedTranscriber(
+            model_factory,
+            workers=workers,
+            chunk_seconds=args.chunk_minutes * 60,
+        )
+        # load the replicas outside of the timed run
+        transcriber.preload()
+        t = time.perf_counter()
+        segments = transcriber.transcribe(audio, language='en', fp16=False)
+        elapsed = time.perf_counter() - t
+        baseline = baseline or elapsed
+        print(f"workers={workers}: {elapsed:7.1f} s, {duration / elapsed:6.1f}x realtime, "
+              f"speedup {baseline / elapsed:4.2f}x, {len(segments)} segments")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the precompiled ExtractorIndex with the linear `list_extractors()` scan
+previously used by GenericHelper._check_if_supported.
+
+    python benchmarks/bench_extractor_index.py --urls 3000
+"""
+import argparse
+import random
+import string
+import time
+
+import yt_dlp
+
+from video_summary_bot_core.extractor_index import ExtractorIndex
+
+_TEMPLATES = [
+    "https://www.youtube.com/watch?v={id11}",
+    "https://youtu.be/{id11}",
+    "https://m.youtube.com/watch?v={id11}&t=42s",
+    "https://www.youtube.com/shorts/{id11}",
+    "https://vimeo.com/{num}",
+    "https://www.dailymotion.com/video/x{word}",
+    "https://www.twitch.tv/videos/{num}",
+    "https://soundcloud.com/{word}/{word}",
+    "https://www.tiktok.com/@{word}/video/{num}",
+    "https://x.com/{word}/status/{num}",
+    "https://www.bilibili.com/video/BV{word}",
+    "https://www.ted.com/talks/{word}_{word}",
+    "https://archive.org/details/{word}",
+    "https://{word}.bandcamp.com/track/{word}",
+    "https://www.{word}.com/{word}/{num}.html",
+    "https://{word}.org/videos/{word}",
+]
+
+
+def _corpus(size: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+
+    def word() -> str:
+        return ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(4, 10)))
+
+    return [_fill(rnd.choice(_TEMPLATES), rnd, word) for _ in range(size)]
+
+
+def _fill(template: str, rnd: random.Random, word) -> str:
+    out = template
+    while '{word}' in out:
+        out = out.replace('{word}', word(), 1)
+    out = out.replace('{id11}', ''.join(rnd.choices(string.ascii_letters + string.digits + '-_', k=11)))
+    out = out.replace('{num}', str(rnd.randint(10 ** 5, 10 ** 9)))
+    return out
+
+
+def _linear_scan(url: str) -> bool:
+    for ie in yt_dlp.list_extractors():
+        if ie.suitable(url):
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extractor matching micro-benchmark")
+    parser.add_argument('--urls', type=int, default=3000, help="corpus size")
+    parser.add_argument('--linear-sample', type=int, default=100,
+                        help="urls timed with the original scan (it builds every extractor per url)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    urls = _corpus(args.urls, args.seed)
+
+    t = time.perf_counter()
+    index = ExtractorIndex(memo_size=0)
+    build_time = time.perf_counter() - t
+    print(f"index build: {build_time * 1000:.1f} ms "
+          f"({index.bucketed_count} bucketed extractors, {index.fallback_count} always scanned)")
+
+    classes = list(yt_dlp.extractor.gen_extractor_classes())
+    t = time.perf_counter()
+    reference = [next((ie.ie_key() for ie in classes if ie.suitable(u)), None) for u in urls]
+    class_scan_time = time.perf_counter() - t
+
+    t = time.perf_counter()
+    found = [index.find(u) for u in urls]
+    index_time = time.perf_counter() - t
+
+    sample = urls[:args.linear_sample]
+    t = time.perf_counter()
+    for u in sample:
+        _linear_scan(u)
+    linear_time = (time.perf_counter() - t) / max(len(sample), 1) * len(urls)
+
+    mismatches = sum(1 for a, b in zip(reference, found) if a != b)
+    per_url = 1e6 / len(urls)
+    print(f"list_extractors() scan (extrapolated): {linear_time * per_url:10.1f} us/url")
+    print(f"class scan, no instantiation:          {class_scan_time * per_url:10.1f} us/url")
+    print(f"ExtractorIndex:                        {index_time * per_url:10.1f} us/url")
+    print(f"speedup vs list_extractors(): {linear_time / index_time:.0f}x, "
+          f"vs class scan: {class_scan_time / index_time:.1f}x, mismatches: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
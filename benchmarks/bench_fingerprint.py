@@ -0,0 +1,179 @@
+"""
+Near-duplicate audio: an original talk and copies of it as they show up on other sites or as
+uploads, made from synthetic speech: trimmed, re-encoded at low bitrates (mp3, opus, aac), at
+another volume and all of these at once, plus unrelated recordings as controls.
+
+- the fingerprint index: similarity and estimated trim of every copy, fingerprint time and size
+- `AiBot` end to end: the copies are mirrors (stubbed `YoutubeDL`) and a forwarded upload of the
+  original, their transcript and summary are reused instead of running Whisper and the LLM again.
+  When Whisper (and the `tiny` checkpoint) is available the original is transcribed for real,
+  otherwise its transcript is seeded as if Whisper had made it at `--seeded-realtime`.
+
+    python benchmarks/bench_fingerprint.py --minutes 5 --threshold 0.1
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import fake_youtube_dl
+from fake_openai import FakeOpenAI
+from fixtures import synthetic_speech, whisper_like_segments, write_wav
+from video_summary_bot_core.artifact_store import TRANSCRIPT
+from video_summary_bot_core.audio import SAMPLE_RATE
+from video_summary_bot_core.fingerprint import FingerprintIndex, audio_fingerprint
+
+
+def reencoded(source: Path, target: Path, *options: str) -> Path:
+    subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', str(source), *options, str(target)],
+                   check=True)
+    return target
+
+
+def make_copies(tmp: Path, original: np.ndarray) -> dict[str, tuple[Path, float]]:
+    """copy name: (file, seconds trimmed from the start), controls have no trim (None)"""
+    write_wav(tmp / 'original.wav', original)
+    write_wav(tmp / 'trimmed.wav', original[int(17.3 * SAMPLE_RATE):])
+    write_wav(tmp / 'quieter.wav', original * 10 ** (-12 / 20))
+    write_wav(tmp / 'combined.wav', original[int(31.7 * SAMPLE_RATE):] * 10 ** (6 / 20))
+    write_wav(tmp / 'prefix.wav', original[:len(original) // 2])
+    write_wav(tmp / 'other.wav', synthetic_speech(len(original) / SAMPLE_RATE, seed=1))
+    write_wav(tmp / 'other_quiet.wav', 0.5 * synthetic_speech(len(original) / SAMPLE_RATE, seed=2))
+    return {
+        'same file': (tmp / 'original.wav', 0.0),
+        'trimmed 17.3 s': (tmp / 'trimmed.wav', 17.3),
+        'mp3 32 kbps': (reencoded(tmp / 'original.wav', tmp / 'mp3.mp3', '-b:a', '32k'), 0.0),
+        'opus 16 kbps': (reencoded(tmp / 'original.wav', tmp / 'opus.ogg', '-c:a', 'libopus', '-b:a', '16k'), 0.0),
+        '-12 dB': (tmp / 'quieter.wav', 0.0),
+        'trimmed 31.7 s, +6 dB, aac 48 kbps':
+            (reencoded(tmp / 'combined.wav', tmp / 'combined.m4a', '-c:a', 'aac', '-b:a', '48k'), 31.7),
+        'first half': (tmp / 'prefix.wav', 0.0),
+        'other talk (control)': (tmp / 'other.wav', None),
+        'other talk, -6 dB (control)': (tmp / 'other_quiet.wav', None),
+    }
+
+
+def index_matches(tmp: Path, copies: dict[str, tuple[Path, float]], threshold: float) -> None:
+    index = FingerprintIndex(tmp / 'index')
+    original = tmp / 'original.wav'
+    started = time.perf_counter()
+    fp = audio_fingerprint(original)
+    print(f"fingerprint of {fp['duration'] / 60:.0f} min: {(time.perf_counter() - started) * 1000:.0f} ms, "
+          f"{len(fp['hashes'])} landmarks")
+    index.add('original', fp)
+    stats = index.stats()
+    print(f"index: {stats['bytes'] / 1024:.0f} KiB for {stats['landmarks']} landmarks")
+    print(f"{'copy':<36} {'similarity':>10} {'trim':>8} {'error':>6} {'ms':>5}  duplicate")
+    for name, (path, trim) in copies.items():
+        query = audio_fingerprint(path)
+        started = time.perf_counter()
+        found = index.matches(query, threshold=0.0, min_coverage=0.0)
+        seconds = time.perf_counter() - started
+        match = found[0] if found else None
+        similarity = match['similarity'] if match else 0.0
+        estimated = f"{abs(match['offset']):.2f}s" if match else '-'
+        error = f"{abs(abs(match['offset']) - trim) * 1000:.0f}ms" if match and trim is not None else '-'
+        duplicate = bool(index.matches(query, threshold))
+        print(f"{name:<36} {similarity:>10.3f} {estimated:>8} {error:>6} {seconds * 1000:>5.0f}  {duplicate}")
+
+
+def seed_original(ai, url: str, path: Path, minutes: float, realtime: float, data_dir: Path) -> None:
+    """what transcribing `url` with Whisper leaves behind: its transcript and its fingerprint"""
+    name = f"youtube_{url.rsplit('=', 1)[1]}"
+    with ai.store.write(TRANSCRIPT, name, '.json', {'url': url, 'transcript_source': 'seeded'}) as f:
+        f.write(json.dumps(whisper_like_segments(minutes, seed=0)))
+    FingerprintIndex(data_dir).add(name, audio_fingerprint(path), whisper_seconds=minutes * 60 / realtime)
+
+
+def end_to_end(args, tmp: Path, copies: dict[str, tuple[Path, float]], whisper: bool) -> None:
+    from video_summary_bot_core.captions import WHISPER_ONLY
+    from video_summary_simple.aibot import AiBot
+
+    fixture_dir = tmp / 'fixtures'
+    fixture_dir.mkdir()
+    video_ids = {}
+    for i, (name, (path, _)) in enumerate(copies.items()):
+        if name.endswith('(control)') and not whisper:
+            continue
+        video_id = f"fp{i:09d}"
+        # mirrors are served as WAV, decoded from the re-encoded copy
+        reencoded(path, fixture_dir / f"{video_id}.wav", '-ar', str(SAMPLE_RATE), '-ac', '1')
+        video_ids[name] = video_id
+    fake_youtube_dl.install(fixture_dir)
+    data_dir = tmp / 'data'
+    ai = AiBot(data_dir=data_dir, openai_model='fake', openai_api_key='fake', whisper_model_name='tiny',
+               whisper_device='cpu', transcript_source=WHISPER_ONLY, transcription_profile='balanced',
+               duplicate_threshold=args.threshold)
+
+    with FakeOpenAI(latency=args.latency, seed=1, lines_per_topic=4) as server:
+        os.environ['OPENAI_BASE_URL'] = server.base_url
+        original_url = fake_youtube_dl.video_url(video_ids['same file'])
+        if not whisper:
+            print(f"Whisper is not installed: the original transcript is seeded at {args.seeded_realtime}x realtime")
+            seed_original(ai, original_url, copies['same file'][0], args.minutes, args.seeded_realtime, data_dir)
+        started = time.perf_counter()
+        original_topics = list(ai.summarize_video(original_url))
+        print(f"original: {time.perf_counter() - started:.1f} s, {len(original_topics)} topics, "
+              f"{server.requests} LLM requests")
+
+        original_starts = {t['topic']: t['timestamp'][0] for t in original_topics}
+        print(f"{'mirror':<36} {'seconds':>7} {'LLM':>4} {'reused':>6} {'topics':>6}  topic shift")
+        for name, video_id in video_ids.items():
+            if name == 'same file':
+                continue
+            requests = server.requests
+            before = ai.duplicate_stats()['duplicates']
+            started = time.perf_counter()
+            try:
+                topics = list(ai.summarize_video(fake_youtube_dl.video_url(video_id)))
+            except Exception as e:
+                print(f"{name:<36} failed: {e}")
+                continue
+            reused = ai.duplicate_stats()['duplicates'] > before
+            # the topics of the original moved to the timeline of the copy
+            shifts = [original_starts[t['topic']] - t['timestamp'][0] for t in topics
+                      if t['topic'] in original_starts and t['timestamp'][0] > 0]
+            shift = f"{np.median(shifts):.1f} s" if shifts else '-'
+            print(f"{name:<36} {time.perf_counter() - started:>7.2f} {server.requests - requests:>4} "
+                  f"{str(reused):>6} {len(topics):>6}  {shift}")
+
+        # the mp3 copy forwarded to the bot as a file
+        upload = 'telegram_forwarded'
+        cached = ai.media_audio_path(upload, '.mp3')
+        cached.write_bytes(copies['mp3 32 kbps'][0].read_bytes())
+        ai.add_media_audio(upload, cached)
+        started = time.perf_counter()
+        segments = ai.media_transcript_segments(upload, duration=args.minutes * 60)
+        print(f"forwarded mp3 upload: {time.perf_counter() - started:.2f} s, {len(segments)} segments, "
+              f"transcript cached: {ai.has_media_transcript(upload)}")
+
+    stats = ai.duplicate_stats()
+    print(f"near-duplicates: {stats['duplicates']}, {stats['audio_seconds'] / 60:.1f} min of audio not transcribed, "
+          f"~{stats['whisper_seconds_saved']:.0f} s of Whisper saved")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="near-duplicate audio benchmark")
+    parser.add_argument('--minutes', type=float, default=5, help="length of the original")
+    parser.add_argument('--threshold', type=float, default=0.1, help="duplicate similarity threshold")
+    parser.add_argument('--latency', type=float, default=0.2, help="fake OpenAI server base latency")
+    parser.add_argument('--seeded-realtime', type=float, default=4.0,
+                        help="without Whisper: the realtime factor the seeded original was transcribed at")
+    args = parser.parse_args()
+    whisper = importlib.util.find_spec('whisper') is not None
+
+    with tempfile.TemporaryDirectory(prefix='bench-fingerprint-') as tmp:
+        tmp = Path(tmp)
+        copies = make_copies(tmp, synthetic_speech(args.minutes * 60, seed=0))
+        index_matches(tmp, copies, args.threshold)
+        end_to_end(args, tmp, copies, whisper)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Import-time regression check of the bot entry point: runs `python -X importtime -c "import <module>"`
+in a fresh interpreter, fails (exit code 1) if a heavy dependency (torch, whisper, openai, yt-dlp)
+is imported at module load or if the import takes longer than the budget.
+
+    python benchmarks/bench_import_time.py --budget-ms 5000
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+HEAVY = ('torch', 'whisper', 'openai', 'yt_dlp')
+
+
+def import_times(module: str) -> dict[str, int]:
+    """cumulative import time (microseconds) of every module imported by `import module`"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time budget check")
+    parser.add_argument('--module', type=str, default='video_summary_telegram_bot.telegram_bot')
+    parser.add_argument('--budget-ms', type=float, default=5000)
+    parser.add_argument('--runs', type=int, default=3, help="the fastest run is kept (the first one may be cold)")
+    parser.add_argument('--top', type=int, default=10, help="slowest top level imports to show")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    times = min(runs, key=lambda t: t[args.module])
+    total_ms = times[args.module] / 1000
+    print(f"import {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, us in sorted(times.items(), key=lambda t: -t[1])[1:args.top + 1]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    heavy = sorted({name.split('.')[0] for name in times} & set(HEAVY))
+    if heavy:
+        failures.append(f"heavy modules imported at load time: {', '.join(heavy)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"{total_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Wall-clock time of the windowed summarizer against the number of windows, on a synthetic
+transcript and the local fake OpenAI server (no network, no API key).
+
+    python benchmarks/bench_map_reduce_summary.py --hours 3 --latency 0.5
+"""
+import argparse
+import time
+
+from fake_openai import FakeOpenAI
+from video_summary_simple.summarizer import MapReduceSummarizer, split_transcript
+
+_WORDS = "the model then compares each window with the previous results and we look at why it works".split()
+
+
+def synthetic_transcript(hours: float, segment_seconds: float = 5.0) -> str:
+    lines = []
+    t = 0.0
+    while t < hours * 3600:
+        words = [_WORDS[(int(t) + i) % len(_WORDS)] for i in range(14)]
+        lines.append(f"[{t} --> {t + segment_seconds}] {' '.join(words)}")
+        t += segment_seconds
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="map-reduce summarization benchmark")
+    parser.add_argument('--hours', type=float, default=3)
+    parser.add_argument('--latency', type=float, default=0.5, help="fake server base latency per request")
+    parser.add_argument('--window-tokens', type=str, default='200000,48000,24000,12000,6000')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--output-tokens-per-second', type=float, default=200,
+                        help="fake server generation speed")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of requests answered with a 429")
+    args = parser.parse_args()
+
+    transcript = synthetic_transcript(args.hours)
+    print(f"transcript: {args.hours:.1f} h, {len(transcript.splitlines())} segments, ~{len(transcript) // 4} tokens")
+    with FakeOpenAI(latency=args.latency, output_tokens_per_second=args.output_tokens_per_second,
+                    failure_rate=args.failure_rate, seed=1) as server:
+        for window_tokens in map(int, args.window_tokens.split(',')):
+            summarizer = MapReduceSummarizer(
+                "fake", api_key="fake", base_url=server.base_url,
+                window_tokens=window_tokens, concurrency=args.concurrency, backoff_seconds=0.05
+            )
+            started = time.perf_counter()
+            stats = {}
+            topics = summarizer.summarize("summarize", transcript, stats)
+            elapsed = time.perf_counter() - started
+            windows = len(split_transcript(transcript, window_tokens))
+            print(f"window {window_tokens:6d} tokens: {windows:3d} windows, {len(topics):3d} topics, "
+                  f"{stats['retries']} retries, {elapsed:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Audio/video uploads through the fake Bot API server (getFile and the file endpoint):
+
+- downloading into memory like `Bot.download` does by default, against `MediaDownloader` streaming
+  to the cache, in time and peak Python memory (tracemalloc)
+- a local Bot API server (`local=True`): the file is hard linked into the cache instead of copied
+- the same file forwarded to several chats at once is downloaded once
+- files over the limits are rejected before getFile
+- the message handler on recorded messages: an unsupported message, a too large document and (when
+  Whisper and the `tiny` checkpoint are available) the same voice note forwarded to several chats,
+  summarized by the fake OpenAI server
+
+    python benchmarks/bench_media_upload.py --mb 16 --forwards 5
+"""
+import argparse
+import asyncio
+import importlib.util
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from aiogram import types
+
+from bench_pipeline import FakeTelegramBot
+from fake_openai import FakeOpenAI
+from fake_telegram import FakeTelegram
+from fixtures import synthetic_speech, write_wav
+from video_summary_telegram_bot.media import MediaDownloader, MediaFile, MediaLimitError, artifact_name
+
+
+def write_random(path: Path, size: int) -> Path:
+    with path.open('wb') as f:
+        for _ in range(size // 2 ** 20):
+            f.write(os.urandom(2 ** 20))
+        f.write(os.urandom(size % 2 ** 20))
+    return path
+
+
+def media(file_id: str, file_unique_id: str, path: Path, duration: float = None) -> MediaFile:
+    return MediaFile(kind='voice', file_id=file_id, file_unique_id=file_unique_id, file_size=path.stat().st_size,
+                     duration=duration, mime_type='audio/ogg', file_name=None)
+
+
+async def measured(coroutine) -> tuple[float, float]:
+    """seconds and peak MiB allocated by Python while awaiting `coroutine`"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    await coroutine
+    seconds = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+
+async def downloads(server: FakeTelegram, path: Path, cache_dir: Path, forwards: int) -> None:
+    bot = server.bot()
+    file_id, unique_id = server.add_file(path)
+    size = path.stat().st_size / 2 ** 20
+
+    seconds, peak = await measured(bot.download(file_id))
+    print(f"into memory (Bot.download): {seconds:.2f} s, peak {peak:.1f} MiB for a {size:.0f} MiB file")
+    downloader = MediaDownloader(bot)
+    seconds, peak = await measured(downloader.download(media(file_id, unique_id, path), cache_dir / 'streamed.wav'))
+    print(f"streamed to the cache:      {seconds:.2f} s, peak {peak:.1f} MiB")
+
+    before = server.file_downloads
+    forwarded = [server.add_file(path)[0] for _ in range(forwards)]
+    await asyncio.gather(*(downloader.download(media(f, unique_id, path), cache_dir / 'forwarded.wav')
+                           for f in forwarded))
+    print(f"{forwards} forwards downloaded at once: {server.file_downloads - before} file download(s)")
+
+    huge = MediaFile(kind='video', file_id=file_id, file_unique_id='huge', file_size=2 ** 31, duration=60,
+                     mime_type='video/mp4', file_name='huge.mp4')
+    long = MediaFile(kind='voice', file_id=file_id, file_unique_id='long', file_size=2 ** 20, duration=10 * 3600,
+                     mime_type='audio/ogg', file_name=None)
+    limited = MediaDownloader(bot, max_duration=4 * 3600)
+    requests = server.requests.get('getFile', 0)
+    for rejected in (huge, long):
+        try:
+            await limited.download(rejected, cache_dir / 'rejected')
+        except MediaLimitError as e:
+            print(f"{rejected['file_unique_id']}: {e}")
+    print(f"getFile calls for rejected files: {server.requests.get('getFile', 0) - requests}")
+    await bot.session.close()
+
+
+async def local_download(server: FakeTelegram, path: Path, cache_dir: Path) -> None:
+    bot = server.bot()
+    file_id, unique_id = server.add_file(path)
+    downloader = MediaDownloader(bot)
+    destination = cache_dir / 'local.bin'
+    seconds, peak = await measured(downloader.download(media(file_id, unique_id, path), destination))
+    linked = os.path.samefile(path, destination)
+    print(f"local Bot API server, {path.stat().st_size / 2 ** 20:.0f} MiB: {seconds * 1000:.1f} ms, "
+          f"peak {peak:.2f} MiB, hard linked: {linked}, limit {downloader.max_bytes / 2 ** 20:.0f} MiB")
+    await bot.session.close()
+
+
+def message(chat_id: int, **content) -> types.Message:
+    """a recorded message with `content` (voice, document, location, ...)"""
+    return types.Message.model_validate({
+        'message_id': chat_id, 'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"},
+        **content,
+    })
+
+
+async def handler_messages(server: FakeTelegram, voice: Path, data_dir: Path, forwards: int, whisper: bool) -> None:
+    from video_summary_bot_core.jobs import JobQueue
+    from video_summary_simple.aibot import AiBot
+    from video_summary_telegram_bot.handlers.on_message_handler import OnMessageHandler
+
+    ai = AiBot(data_dir=data_dir, openai_model='fake', openai_api_key='fake', whisper_model_name='tiny',
+               whisper_device='cpu', transcription_profile='balanced')
+    jobs = JobQueue(max_pending=forwards + 2, max_running=forwards)
+    bot = FakeTelegramBot(ai, jobs, server, stream_summary=True)
+    handler = OnMessageHandler(bot)
+
+    await handler.on_message(message(1, location={'latitude': 45.0, 'longitude': 9.0}))
+    big = {'file_id': 'big', 'file_unique_id': 'big', 'file_name': 'talk.mkv', 'mime_type': 'video/x-matroska',
+           'file_size': 3 * 2 ** 30}
+    await handler.on_message(message(2, document=big))
+    print(f"location: '{server.texts(1)[-1]}', 3 GiB document: '{server.texts(2)[-1]}'")
+
+    if not whisper:
+        print("Whisper is not installed, voice notes skipped")
+    else:
+        unique_id = None
+        updates = []
+        for chat_id in range(10, 10 + forwards):
+            file_id, unique_id = server.add_file(voice)
+            updates.append(message(chat_id, voice={
+                'file_id': file_id, 'file_unique_id': unique_id, 'duration': 120, 'mime_type': 'audio/ogg',
+                'file_size': voice.stat().st_size,
+            }))
+        before = server.file_downloads
+        started = time.perf_counter()
+        await asyncio.gather(*(handler.on_message(u) for u in updates))
+        answered = sum(1 for u in updates if len(server.texts(u.chat.id)) > 1)
+        print(f"{forwards} forwards of a voice note: {time.perf_counter() - started:.1f} s, "
+              f"{server.file_downloads - before} download(s), {answered} chats answered, "
+              f"transcript cached: {ai.has_media_transcript(artifact_name({'file_unique_id': unique_id}))}")
+    jobs.shutdown()
+    await bot.delivery.bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="telegram upload benchmark")
+    parser.add_argument('--mb', type=float, default=16, help="size of the downloaded file (under 20 MB)")
+    parser.add_argument('--local-mb', type=float, default=500, help="size of the file of the local server")
+    parser.add_argument('--forwards', type=int, default=5)
+    args = parser.parse_args()
+    whisper = importlib.util.find_spec('whisper') is not None
+
+    with tempfile.TemporaryDirectory(prefix='bench-media-') as tmp:
+        tmp = Path(tmp)
+        cache_dir = tmp / 'cache'
+        cache_dir.mkdir()
+        audio = write_random(tmp / 'audio.bin', int(args.mb * 2 ** 20))
+        voice = tmp / 'voice.wav'
+        write_wav(voice, synthetic_speech(120, seed=0))
+
+        with FakeTelegram(latency=0.01) as server:
+            asyncio.run(downloads(server, audio, cache_dir, args.forwards))
+        with FakeTelegram(latency=0.01, local=True) as server:
+            asyncio.run(local_download(server, write_random(tmp / 'local.bin', int(args.local_mb * 2 ** 20)),
+                                       cache_dir))
+        with FakeOpenAI(latency=0.2, seed=1) as openai_server, FakeTelegram(latency=0.01) as server:
+            os.environ['OPENAI_BASE_URL'] = openai_server.base_url
+            asyncio.run(handler_messages(server, voice, tmp / 'data', args.forwards, whisper))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""
+End-to-end benchmark of the whole pipeline, offline: `AiBot.summarize_video` and the Telegram message
+handler on generated videos of several lengths. Downloads come from a stubbed `YoutubeDL` serving
+speech-like WAV fixtures, Whisper runs the `tiny` model on CPU (its checkpoint must already be in the
+Whisper cache), the summaries come from the local fake OpenAI server and the messages go to the local
+fake Bot API server.
+`--source captions` serves generated captions instead, to benchmark everything but Whisper.
+
+Every case runs in a fresh interpreter with an empty data directory (cold caches, own peak RSS).
+Latency, per-stage time, peak RSS and throughput are written as JSON, `--baseline` compares them with
+the results of another commit.
+
+    python benchmarks/bench_pipeline.py --minutes 1,5,15 --targets summarize_video,telegram
+    python benchmarks/bench_pipeline.py --source captions --baseline benchmarks/results/<commit>.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+from aiogram import enums
+
+from fake_openai import FakeOpenAI
+from fake_telegram import FakeTelegram
+from fixtures import json3_captions, synthetic_speech, whisper_like_segments, write_wav
+from video_summary_bot_core import metrics
+from video_summary_telegram_bot.delivery import Delivery
+from video_summary_telegram_bot.media import MediaDownloader
+from video_summary_telegram_bot.summary_messages import SummaryMessages
+
+TARGETS = ('summarize_video', 'telegram')
+SOURCES = ('whisper', 'captions')
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def make_fixtures(fixture_dir: Path, minutes: float, videos: int, source: str) -> list[str]:
+    """write `videos` fixture videos of `minutes`, their (11 character) YouTube ids"""
+    ids = []
+    for i in range(videos):
+        video_id = f"b{int(minutes * 60):06d}s{i:03d}"
+        if source == 'whisper':
+            write_wav(fixture_dir / f"{video_id}.wav", synthetic_speech(minutes * 60, seed=i))
+        else:
+            # the audio is never decoded, it only gives the video its duration
+            write_wav(fixture_dir / f"{video_id}.wav", np.zeros(int(minutes * 60 * 16000), dtype=np.float32))
+            (fixture_dir / f"{video_id}.json3").write_text(json3_captions(whisper_like_segments(minutes, seed=i)))
+        ids.append(video_id)
+    return ids
+
+
+def peak_rss_mib() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+class FakeTelegramBot:
+    """the parts of TelegramBot used by OnMessageHandler, talking to the fake Bot API server"""
+
+    def __init__(self, ai, jobs, server: FakeTelegram, stream_summary: bool):
+        self.ai = ai
+        self.jobs = jobs
+        self.stream_summary = stream_summary
+        self.reorder_summary = False
+        self.delivery = Delivery(server.bot())
+        self.media = MediaDownloader(self.delivery.bot)
+        self.summary_messages = SummaryMessages(ai.store.data_dir)
+        self.answer_top_k = 4
+
+
+def fake_message(chat_id: int, text: str) -> SimpleNamespace:
+    return SimpleNamespace(content_type=enums.ContentType.TEXT, text=text, message_id=chat_id,
+                           from_user=SimpleNamespace(id=chat_id), chat=SimpleNamespace(id=chat_id),
+                           reply_to_message=None)
+
+
+async def run_telegram(ai, urls: list[str], case: dict) -> tuple[list[float], list[float], int]:
+    """latency and first topic latency of every message (all sent at once), failed messages"""
+    from video_summary_bot_core.jobs import JobQueue
+    from video_summary_telegram_bot.handlers.on_message_handler import OnMessageHandler
+
+    with FakeTelegram(latency=case['telegram_latency']) as server:
+        jobs = JobQueue(max_pending=len(urls), max_running=case['max_running_jobs'])
+        bot = FakeTelegramBot(ai, jobs, server, stream_summary=not case['no_stream'])
+        handler = OnMessageHandler(bot)
+        messages = [fake_message(chat_id, url) for chat_id, url in enumerate(urls)]
+        started = time.perf_counter()
+
+        async def one(message: SimpleNamespace) -> float:
+            await handler.on_message(message)
+            return time.perf_counter() - started
+
+        try:
+            latencies = await asyncio.gather(*(one(m) for m in messages))
+        finally:
+            jobs.shutdown()
+            await bot.delivery.bot.session.close()
+        # the first message of a chat is the status message
+        first_topic = [server.sent_at[m.chat.id][1] - started for m in messages
+                       if len(server.sent_at.get(m.chat.id, [])) > 1]
+        failed = sum(1 for m in messages
+                     if len(server.sent_at.get(m.chat.id, [])) < 2 or any(
+                         t.startswith("Sorry") for t in server.texts(m.chat.id)))
+    return list(latencies), first_topic, failed
+
+
+def run_case(case: dict) -> dict:
+    """runs in the child process"""
+    import fake_youtube_dl
+    fake_youtube_dl.install(case['fixture_dir'])
+    from video_summary_bot_core.captions import CAPTIONS_ONLY, WHISPER_ONLY
+    from video_summary_bot_core.transcription_profiles import BALANCED
+    from video_summary_simple.aibot import AiBot
+
+    urls = [fake_youtube_dl.video_url(video_id) for video_id in case['video_ids']]
+    with tempfile.TemporaryDirectory(prefix='bench-data-') as data_dir:
+        ai = AiBot(
+            data_dir=data_dir,
+            openai_model='fake',
+            openai_api_key='fake',
+            whisper_model_name=case['whisper_model'],
+            whisper_device=case['device'],
+            transcript_source=WHISPER_ONLY if case['source'] == 'whisper' else CAPTIONS_ONLY,
+            transcription_profile=BALANCED,
+            summary_window_tokens=case['summary_window_tokens'],
+            incremental_summary=not case['no_incremental_summary'],
+        )
+        model_load = 0.0
+        if case['source'] == 'whisper':
+            # loaded once per process, outside of the measured latency
+            started = time.perf_counter()
+            ai.preload_models(warm_up=False)
+            model_load = time.perf_counter() - started
+
+        started = time.perf_counter()
+        first_topic: list[float] = []
+        failed = 0
+        if case['target'] == 'summarize_video':
+            latencies = []
+            for url in urls:
+                video_started = time.perf_counter()
+                try:
+                    topics = ai.summarize_video(url)
+                    next(topics)
+                    first_topic.append(time.perf_counter() - video_started)
+                    list(topics)
+                except Exception as e:
+                    print(f"{url}: {e}", file=sys.stderr)
+                    failed += 1
+                latencies.append(time.perf_counter() - video_started)
+        else:
+            latencies, first_topic, failed = asyncio.run(run_telegram(ai, urls, case))
+        wall = time.perf_counter() - started
+
+    audio_seconds = case['minutes'] * 60 * len(urls)
+    realtime = list(metrics.REALTIME_FACTOR.samples().values())
+    return {
+        'target': case['target'],
+        'minutes': case['minutes'],
+        'videos': len(urls),
+        'failed': failed,
+        'wall_seconds': wall,
+        'latency_seconds': {'mean': float(np.mean(latencies)), 'max': float(np.max(latencies))},
+        'first_topic_seconds': float(np.mean(first_topic)) if first_topic else None,
+        'model_load_seconds': model_load,
+        'stages': {
+            dict(labels)['stage']: {'count': count, 'seconds': total}
+            for labels, (total, count) in sorted(metrics.STAGE_SECONDS.samples().items())
+        },
+        'realtime_factor': sum(t for t, _ in realtime) / sum(c for _, c in realtime) if realtime else None,
+        'llm_tokens': {dict(labels)['direction']: value for labels, value in metrics.LLM_TOKENS.samples().items()},
+        'peak_rss_mib': peak_rss_mib(),
+        'videos_per_hour': len(urls) / wall * 3600,
+        'audio_seconds_per_second': audio_seconds / wall,
+    }
+
+
+def run_in_subprocess(case: dict, server: FakeOpenAI, verbose: bool) -> dict:
+    env = dict(os.environ, OPENAI_BASE_URL=server.base_url, OPENAI_API_KEY='fake')
+    requests = server.requests
+    process = subprocess.run(
+        [sys.executable, __file__, '--case', json.dumps(case)],
+        env=env, stdout=subprocess.PIPE, stderr=None if verbose else subprocess.PIPE, text=True
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{case['target']} {case['minutes']} min failed:\n{process.stderr or ''}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['openai_requests'] = server.requests - requests
+    return result
+
+
+def git_revision() -> dict:
+    root = Path(__file__).parent
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit, 'dirty': dirty}
+
+
+def print_result(result: dict, baseline: dict = None) -> None:
+    def change(key: str, value: float) -> str:
+        if baseline is None or baseline.get(key) in (None, 0) or value is None:
+            return ""
+        return f" ({(value - baseline[key]) / baseline[key]:+.0%})"
+
+    latency = result['latency_seconds']['mean']
+    stages = ", ".join(f"{stage} {s['seconds']:.1f} s" for stage, s in result['stages'].items())
+    print(f"{result['target']:>15} {result['minutes']:5g} min x {result['videos']}: "
+          f"latency {latency:.2f} s{change('latency', latency)}, "
+          f"peak RSS {result['peak_rss_mib']:.0f} MiB{change('peak_rss_mib', result['peak_rss_mib'])}, "
+          f"{result['videos_per_hour']:.0f} videos/h{change('videos_per_hour', result['videos_per_hour'])}"
+          + (f", {result['failed']} failed" if result['failed'] else ""))
+    print(f"{'':>15} {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline end-to-end pipeline benchmark")
+    parser.add_argument('--case', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--minutes', type=str, default='1,5,15', help="comma separated video lengths")
+    parser.add_argument('--videos', type=int, default=1,
+                        help="videos per case (summarized one after the other, or sent to the bot at once)")
+    parser.add_argument('--targets', type=str, default=','.join(TARGETS))
+    parser.add_argument('--source', type=str, choices=SOURCES, default='whisper')
+    parser.add_argument('--whisper-model', type=str, default='tiny')
+    parser.add_argument('--device', type=str, default='cpu')
+    parser.add_argument('--summary-window-tokens', type=int, default=12000)
+    parser.add_argument('--no-incremental-summary', action='store_true')
+    parser.add_argument('--no-stream', action='store_true', help="telegram: send the summary when complete")
+    parser.add_argument('--max-running-jobs', type=int, default=2, help="telegram: videos processed at once")
+    parser.add_argument('--telegram-latency', type=float, default=0.05, help="seconds per Telegram API call")
+    parser.add_argument('--latency', type=float, default=0.5, help="fake OpenAI server base latency")
+    parser.add_argument('--output-tokens-per-second', type=float, default=200, help="fake OpenAI generation speed")
+    parser.add_argument('--output', type=Path, default=None, help="default: benchmarks/results/<commit>.json")
+    parser.add_argument('--baseline', type=Path, default=None, help="results of another run to compare with")
+    parser.add_argument('--verbose', action='store_true', help="show the log of every case")
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    targets = args.targets.split(',')
+    for target in targets:
+        if target not in TARGETS:
+            parser.error(f"unknown target '{target}'")
+    revision = git_revision()
+    baseline = {}
+    if args.baseline is not None:
+        baseline = {(r['target'], r['minutes']): r for r in json.loads(args.baseline.read_text())['results']}
+    config = {k: v for k, v in vars(args).items() if k not in ('case', 'output', 'baseline', 'verbose')}
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench-fixtures-') as fixture_dir, \
+            FakeOpenAI(latency=args.latency, output_tokens_per_second=args.output_tokens_per_second,
+                       seed=1) as server:
+        for minutes in map(float, args.minutes.split(',')):
+            video_ids = make_fixtures(Path(fixture_dir), minutes, args.videos, args.source)
+            for target in targets:
+                case = {**config, 'target': target, 'minutes': minutes, 'video_ids': video_ids,
+                        'fixture_dir': fixture_dir}
+                result = run_in_subprocess(case, server, args.verbose)
+                old = baseline.get((target, minutes))
+                print_result(result, old and {
+                    'latency': old['latency_seconds']['mean'],
+                    'peak_rss_mib': old['peak_rss_mib'],
+                    'videos_per_hour': old['videos_per_hour'],
+                })
+                results.append(result)
+
+    output = args.output or RESULTS_DIR / f"{(revision['commit'] or 'unknown')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        **revision,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': config,
+        'results': results,
+    }, indent=2))
+    print(f"results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Time to a complete summary when the transcript windows are summarized while the rest of the audio
+is still transcribed, against transcribing everything first. Whisper is simulated by a generator
+releasing one chunk of Whisper-like segments every `--seconds-per-chunk`, the summaries come from
+the local fake OpenAI server (no GPU, no network, no API key).
+
+    python benchmarks/bench_pipelined_summary.py --minutes 180 --seconds-per-chunk 1.5
+"""
+import argparse
+import time
+
+from fake_openai import FakeOpenAI
+from fixtures import whisper_like_segments
+from video_summary_simple.summarizer import MapReduceSummarizer
+from video_summary_simple.transcript_encoder import encode_transcript, encode_windows
+
+
+def transcription(segments: list[dict], chunk_seconds: float, seconds_per_chunk: float):
+    """the segments in chunks of `chunk_seconds` of audio, one chunk every `seconds_per_chunk`"""
+    chunk: list[dict] = []
+    chunk_end = chunk_seconds
+    for segment in segments:
+        if segment['start'] >= chunk_end:
+            time.sleep(seconds_per_chunk)
+            yield chunk
+            chunk, chunk_end = [], chunk_end + chunk_seconds
+        chunk.append(segment)
+    time.sleep(seconds_per_chunk)
+    yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pipelined transcription + summarization benchmark")
+    parser.add_argument('--minutes', type=float, default=180)
+    parser.add_argument('--chunk-minutes', type=float, default=10)
+    parser.add_argument('--seconds-per-chunk', type=float, default=1.5, help="simulated Whisper time per chunk")
+    parser.add_argument('--window-tokens', type=int, default=12000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.5, help="fake server base latency per request")
+    parser.add_argument('--output-tokens-per-second', type=float, default=200,
+                        help="fake server generation speed")
+    args = parser.parse_args()
+
+    segments = whisper_like_segments(args.minutes)
+    chunks = int(args.minutes // args.chunk_minutes) + 1
+    print(f"transcript: {args.minutes:.0f} min, {len(segments)} segments, {chunks} chunks of "
+          f"{args.chunk_minutes:.0f} min, {args.seconds_per_chunk} s of transcription each")
+    with FakeOpenAI(latency=args.latency, output_tokens_per_second=args.output_tokens_per_second, seed=1) as server:
+        summarizer = MapReduceSummarizer("fake", api_key="fake", base_url=server.base_url,
+                                         window_tokens=args.window_tokens, concurrency=args.concurrency)
+
+        started = time.perf_counter()
+        transcript = [s for chunk in transcription(segments, args.chunk_minutes * 60, args.seconds_per_chunk)
+                      for s in chunk]
+        transcribed = time.perf_counter() - started
+        stats = {}
+        topics = summarizer.summarize("summarize", encode_transcript(transcript).text, stats)
+        sequential = time.perf_counter() - started
+        print(f"sequential: transcribed in {transcribed:.2f} s, {len(topics)} topics after {sequential:.2f} s "
+              f"({stats['windows']} windows)")
+
+        started = time.perf_counter()
+        windows = encode_windows(transcription(segments, args.chunk_minutes * 60, args.seconds_per_chunk),
+                                 args.window_tokens)
+        stats = {}
+        topics = summarizer.summarize_windows("summarize", windows, stats)
+        pipelined = time.perf_counter() - started
+        print(f"pipelined:  {len(topics)} topics after {pipelined:.2f} s ({stats['windows']} windows), "
+              f"{pipelined - transcribed:+.2f} s after the end of the transcription")
+
+
+if __name__ == '__main__':
+    main()
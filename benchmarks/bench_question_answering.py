@@ -0,0 +1,171 @@
+"""
+Follow-up questions about a summarized video, answered from its cached transcript:
+
+- the top-k transcript windows retrieved from the BM25 index against the whole transcript in the
+  prompt, for talks of several lengths: prompt tokens, answer latency (fake OpenAI server, latency
+  growing with the prompt) and how often the excerpts come from a section about the question
+- building the index of a transcript against loading it from the artifact store
+- the Telegram flow through the fake Bot API server: a video url, then a question replying to one of
+  the summary messages, then another one replying to the answer
+
+    python benchmarks/bench_question_answering.py --minutes 15,60,120 --top-k 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from aiogram import types
+
+import fake_youtube_dl
+from bench_pipeline import FakeTelegramBot
+from fake_openai import FakeOpenAI
+from fake_telegram import FakeTelegram
+from fixtures import TOPICS, synthetic_speech, topical_segments, write_wav
+from video_summary_bot_core import lazy_imports
+from video_summary_bot_core.artifact_store import TRANSCRIPT
+from video_summary_simple.transcript_index import TranscriptIndex
+
+
+def seed_transcripts(ai, fixture_dir: Path, minutes: list[float]) -> dict[float, tuple[str, list]]:
+    """minutes: (url, sections) of a talk whose transcript is already cached"""
+    talks = {}
+    for m in minutes:
+        video_id = f"qa{int(m):09d}"
+        # only the video info is read from the audio, the transcript is cached
+        write_wav(fixture_dir / f"{video_id}.wav", synthetic_speech(1.0))
+        segments, sections = topical_segments(m, seed=int(m))
+        with ai.store.write(TRANSCRIPT, f"youtube_{video_id}", '.json', {'transcript_source': 'seeded'}) as f:
+            f.write(json.dumps(segments))
+        talks[m] = (fake_youtube_dl.video_url(video_id), sections)
+    return talks
+
+
+def compare(ai, talks: dict[float, tuple[str, list]], top_k: int) -> None:
+    print(f"{'talk':>8} {'mode':>10} {'prompt tokens':>13} {'reduction':>9} {'latency':>8} {'on topic':>8}")
+    for minutes, (url, sections) in talks.items():
+        results = {'full': [], f"top-{top_k}": []}
+        on_topic = []
+        for topic, (_, question) in TOPICS.items():
+            spans = [(start, end) for start, end, t in sections if t == topic]
+            if not spans:
+                continue
+            results['full'].append(ai.ask(url, question, top_k=None))
+            answer = ai.ask(url, question, top_k=top_k)
+            results[f"top-{top_k}"].append(answer)
+            on_topic += [any(s['start'] < end and s['end'] > start for start, end in spans)
+                         for s in answer['sources']]
+        full_tokens = statistics.mean(a['prompt_tokens'] for a in results['full'])
+        for mode, answers in results.items():
+            tokens = statistics.mean(a['prompt_tokens'] for a in answers)
+            latency = statistics.mean(a['seconds'] for a in answers)
+            hits = f"{sum(on_topic) / len(on_topic):.0%}" if mode != 'full' else '-'
+            print(f"{minutes:>6.0f} m {mode:>10} {tokens:>13.0f} {full_tokens / tokens:>8.1f}x {latency:>7.2f}s "
+                  f"{hits:>8}")
+
+
+def index_load(minutes: float) -> None:
+    segments, _ = topical_segments(minutes, seed=int(minutes))
+    started = time.perf_counter()
+    index = TranscriptIndex.build(segments)
+    built = time.perf_counter() - started
+    data = json.dumps(index.to_json())
+    started = time.perf_counter()
+    TranscriptIndex.from_json(json.loads(data), segments)
+    loaded = time.perf_counter() - started
+    started = time.perf_counter()
+    index.search(TOPICS['pricing'][1], 4)
+    searched = time.perf_counter() - started
+    print(f"index of {minutes:.0f} min ({len(index.windows)} windows, {len(data) / 1024:.0f} KiB): "
+          f"built in {built * 1000:.1f} ms, loaded in {loaded * 1000:.1f} ms, searched in {searched * 1000:.2f} ms")
+
+
+def message(chat_id: int, message_id: int, text: str, reply_to: types.Message = None) -> types.Message:
+    return types.Message.model_validate({
+        'message_id': message_id, 'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}"},
+        'text': text,
+        **({'reply_to_message': reply_to.model_dump(exclude_none=True)} if reply_to is not None else {}),
+    })
+
+
+def bot_message(chat_id: int, message_id: int, text: str) -> types.Message:
+    return types.Message.model_validate({
+        'message_id': message_id, 'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': 1, 'is_bot': True, 'first_name': 'fake'},
+        'text': text,
+    })
+
+
+async def telegram_flow(ai, server: FakeTelegram, url: str) -> None:
+    from video_summary_bot_core.jobs import JobQueue
+    from video_summary_telegram_bot.handlers.on_message_handler import OnMessageHandler
+
+    jobs = JobQueue(max_pending=4, max_running=2)
+    bot = FakeTelegramBot(ai, jobs, server, stream_summary=True)
+    handler = OnMessageHandler(bot)
+    chat_id = 42
+    await handler.on_message(message(chat_id, 1, url))
+    summary_ids = sorted(server.messages[chat_id])
+    print(f"summary: {len(summary_ids)} messages (status and topics)")
+
+    question = TOPICS['battery'][1]
+    replied = bot_message(chat_id, summary_ids[-1], server.messages[chat_id][summary_ids[-1]])
+    started = time.perf_counter()
+    await handler.on_message(message(chat_id, 2, question, reply_to=replied))
+    answer_id = max(server.messages[chat_id])
+    print(f"question replying to a summary message: answered in {time.perf_counter() - started:.2f} s")
+    print(f"  {server.messages[chat_id][answer_id]}")
+
+    follow_up = TOPICS['pricing'][1]
+    replied = bot_message(chat_id, answer_id, server.messages[chat_id][answer_id])
+    await handler.on_message(message(chat_id, 3, follow_up, reply_to=replied))
+    answered = max(server.messages[chat_id]) > answer_id
+    print(f"question replying to the answer: answered {answered}")
+
+    # a reply to a message the bot does not know about is a url (or not supported)
+    await handler.on_message(message(chat_id, 4, "and the camera?", reply_to=bot_message(chat_id, 10 ** 6, "?")))
+    print(f"reply to an unknown message: '{server.texts(chat_id)[-1]}'")
+    jobs.shutdown()
+    await bot.delivery.bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="follow-up question answering benchmark")
+    parser.add_argument('--minutes', type=str, default='15,60,120', help="comma separated talk lengths")
+    parser.add_argument('--top-k', type=int, default=4, help="transcript excerpts sent to the model")
+    parser.add_argument('--latency', type=float, default=0.3, help="fake OpenAI server base latency")
+    parser.add_argument('--seconds-per-1k-tokens', type=float, default=0.05,
+                        help="fake OpenAI server latency per 1000 prompt tokens")
+    args = parser.parse_args()
+    minutes = [float(m) for m in args.minutes.split(',')]
+
+    from video_summary_simple.aibot import AiBot
+
+    with tempfile.TemporaryDirectory(prefix='bench-qa-') as tmp:
+        tmp = Path(tmp)
+        fixture_dir = tmp / 'fixtures'
+        fixture_dir.mkdir()
+        fake_youtube_dl.install(fixture_dir)
+        ai = AiBot(data_dir=tmp / 'data', openai_model='fake', openai_api_key='fake', whisper_device='cpu',
+                   duplicate_threshold=None)
+        talks = seed_transcripts(ai, fixture_dir, minutes)
+        # not in the latency of the first answer
+        lazy_imports.preload(['openai'])
+        for m in minutes:
+            index_load(m)
+        with FakeOpenAI(latency=args.latency, seconds_per_1k_tokens=args.seconds_per_1k_tokens, seed=1) as server:
+            os.environ['OPENAI_BASE_URL'] = server.base_url
+            compare(ai, talks, args.top_k)
+            with FakeTelegram(latency=0.01) as telegram:
+                asyncio.run(telegram_flow(ai, telegram, talks[minutes[0]][0]))
+
+
+if __name__ == '__main__':
+    main()
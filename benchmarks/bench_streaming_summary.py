@@ -0,0 +1,58 @@
+"""
+Time to first topic of the streamed summary against the blocking one, on the local fake OpenAI
+server. The captured stream in data/add_topic_stream.sse is replayed first to check that tool calls
+split in arbitrary fragments (braces and escaped quotes inside strings) are assembled correctly.
+
+    python benchmarks/bench_streaming_summary.py --hours 1 --output-tokens-per-second 50
+"""
+import argparse
+import os
+import time
+
+from bench_map_reduce_summary import synthetic_transcript
+from fake_openai import FakeOpenAI
+from video_summary_simple.summarizer import MapReduceSummarizer
+
+_REPLAY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'add_topic_stream.sse')
+
+
+def _replay() -> None:
+    with FakeOpenAI(replay_sse=_REPLAY, replay_delay=0.01) as server:
+        summarizer = MapReduceSummarizer("fake", api_key="fake", base_url=server.base_url)
+        started = time.perf_counter()
+        for topic in summarizer.stream("summarize", "[0.0 --> 1.0] replayed"):
+            print(f"  {time.perf_counter() - started:5.2f} s  {topic['timestamp']}  {topic['topic']}: {topic['summary']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="streamed summary benchmark")
+    parser.add_argument('--hours', type=float, default=1)
+    parser.add_argument('--latency', type=float, default=0.5, help="fake server latency before the first token")
+    parser.add_argument('--output-tokens-per-second', type=float, default=50)
+    parser.add_argument('--window-tokens', type=int, default=12000)
+    args = parser.parse_args()
+
+    print("replaying the captured stream:")
+    _replay()
+
+    transcript = synthetic_transcript(args.hours)
+    with FakeOpenAI(latency=args.latency, output_tokens_per_second=args.output_tokens_per_second) as server:
+        summarizer = MapReduceSummarizer("fake", api_key="fake", base_url=server.base_url,
+                                         window_tokens=args.window_tokens)
+        started = time.perf_counter()
+        topics = summarizer.summarize("summarize", transcript)
+        blocking = time.perf_counter() - started
+        print(f"blocking:  {len(topics)} topics, first after {blocking:6.2f} s, all after {blocking:6.2f} s")
+
+        started = time.perf_counter()
+        first = None
+        count = 0
+        for _ in summarizer.stream("summarize", transcript):
+            count += 1
+            first = first or time.perf_counter() - started
+        total = time.perf_counter() - started
+        print(f"streaming: {count} topics, first after {first:6.2f} s, all after {total:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Sending summaries to several chats at once through the fake Bot API server (with flood control):
+one message per topic, sent as soon as it is generated (the previous behaviour), against the
+delivery layer packing topics into messages under the rate limits. Also counts the status edits
+reaching the server when a job reports progress faster than the limits allow.
+
+    python benchmarks/bench_telegram_delivery.py --chats 5 --topics 30
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from fake_telegram import FakeTelegram
+from video_summary_telegram_bot.delivery import Delivery
+from video_summary_telegram_bot.handlers.on_message_handler import OnMessageHandler
+
+_WORDS = "the model runs over every window of audio & compares <results> with what we expected".split()
+
+
+def summary(topics: int, seed: int) -> list[str]:
+    rnd = random.Random(seed)
+    texts = []
+    for i in range(topics):
+        topic = {
+            'topic': ' '.join(rnd.choices(_WORDS, k=rnd.randint(3, 8))),
+            'summary': ' '.join(rnd.choices(_WORDS, k=rnd.randint(30, 120))),
+            'timestamp': (i * 60.0, i * 60.0 + 55),
+            'ref_url': f"https://youtu.be/abcdefghijk?t={i * 60}s",
+        }
+        texts.append(OnMessageHandler._format_response_text(topic, i + 1))
+    return texts
+
+
+async def generated(texts: list[str], interval: float):
+    for text in texts:
+        await asyncio.sleep(interval)
+        yield text
+
+
+async def per_topic(server: FakeTelegram, chats: int, texts: list[list[str]], interval: float) -> dict:
+    bot = server.bot()
+    failed = 0
+
+    async def chat(chat_id: int) -> None:
+        nonlocal failed
+        async for text in generated(texts[chat_id], interval):
+            try:
+                await bot.send_message(chat_id, text, parse_mode='HTML')
+            except TelegramRetryAfter:
+                # the old handler let the error end the job
+                failed += 1
+                return
+
+    started = time.perf_counter()
+    await asyncio.gather(*(chat(c) for c in range(chats)))
+    wall = time.perf_counter() - started
+    await bot.session.close()
+    return {'wall': wall, 'failed_chats': failed}
+
+
+async def delivered(server: FakeTelegram, chats: int, texts: list[list[str]], interval: float, args) -> dict:
+    bot = server.bot()
+    delivery = Delivery(bot, global_rate=args.global_rate, chat_rate=args.chat_rate, chat_burst=args.chat_burst)
+
+    async def chat(chat_id: int) -> None:
+        outbox = delivery.outbox(chat_id)
+        async for text in generated(texts[chat_id], interval):
+            outbox.add(text)
+        await outbox.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(chat(c) for c in range(chats)))
+    wall = time.perf_counter() - started
+
+    # a status message (in a chat of its own) updated every 10 ms for a second
+    status_chat = chats
+    status = (await delivery.send(status_chat, ["processing ..."]))[0]
+    for i in range(100):
+        delivery.set_status(status_chat, status.message_id, f"processing: {i} %")
+        await asyncio.sleep(0.01)
+    await delivery.wait_status(status_chat, status.message_id)
+    await bot.session.close()
+    return {'wall': wall, 'stats': delivery.stats(), 'status': server.texts(status_chat)[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="telegram delivery benchmark")
+    parser.add_argument('--chats', type=int, default=5)
+    parser.add_argument('--topics', type=int, default=30)
+    parser.add_argument('--interval', type=float, default=0.05, help="seconds between generated topics")
+    parser.add_argument('--latency', type=float, default=0.05, help="fake Bot API latency")
+    parser.add_argument('--server-chat-rate', type=float, default=1.0)
+    parser.add_argument('--server-chat-burst', type=int, default=3)
+    parser.add_argument('--chat-rate', type=float, default=1.0, help="delivery per chat rate")
+    parser.add_argument('--chat-burst', type=int, default=3, help="delivery per chat burst")
+    parser.add_argument('--global-rate', type=float, default=30.0)
+    args = parser.parse_args()
+
+    texts = [summary(args.topics, seed=c) for c in range(args.chats)]
+    print(f"{args.chats} chats x {args.topics} topics ({sum(map(len, texts[0])) / args.topics:.0f} characters each)")
+
+    server_args = dict(latency=args.latency, chat_rate=args.server_chat_rate, chat_burst=args.server_chat_burst)
+    with FakeTelegram(**server_args) as server:
+        result = asyncio.run(per_topic(server, args.chats, texts, args.interval))
+        print(f"one message per topic: {result['wall']:.2f} s, {server.requests.get('sendMessage', 0)} requests, "
+              f"{server.rejected} rejected (429), {result['failed_chats']} of {args.chats} chats incomplete")
+
+    with FakeTelegram(**server_args) as server:
+        result = asyncio.run(delivered(server, args.chats, texts, args.interval, args))
+        complete = all(
+            ''.join(server.texts(c)).replace("\n", "") == ''.join(texts[c]).replace("\n", "")
+            for c in range(args.chats)
+        )
+        stats = result['stats']
+        print(f"delivery layer:        {result['wall']:.2f} s, {stats['sent'] - 1} messages, "
+              f"{server.rejected} rejected (429), {server.invalid} invalid, every chat complete: {complete}")
+        print(f"status edits: 100 set, {stats['edited']} sent, {stats['coalesced']} coalesced, "
+              f"last one '{result['status']}'")
+
+
+if __name__ == '__main__':
+    main()
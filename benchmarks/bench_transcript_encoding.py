@@ -0,0 +1,48 @@
+"""
+Prompt tokens of the compact transcript encoding against the old `[start --> end] text` lines,
+on fixture transcripts (Whisper-like segments). Tokens are counted with tiktoken when it is
+installed, with the 4 characters per token estimate otherwise.
+
+    python benchmarks/bench_transcript_encoding.py --minutes 10,60,180
+"""
+import argparse
+
+from fixtures import whisper_like_segments
+from video_summary_simple.summarizer import estimate_tokens
+from video_summary_simple.transcript_encoder import encode_transcript
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding('o200k_base')
+
+    def count_tokens(text: str) -> int:
+        return len(_ENCODING.encode(text))
+except ImportError:
+    count_tokens = estimate_tokens
+
+
+def legacy_text(segments: list[dict]) -> str:
+    return "\n".join([f"[{s['start']} --> {s['end']}] {s['text']}" for s in segments])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="transcript encoding token benchmark")
+    parser.add_argument('--minutes', type=str, default='10,60,180')
+    parser.add_argument('--merge-seconds', type=float, default=15)
+    parser.add_argument('--token-budget', type=int, default=None)
+    args = parser.parse_args()
+
+    print(f"tokens counted with {'tiktoken o200k_base' if count_tokens is not estimate_tokens else 'the estimate'}")
+    for minutes in map(float, args.minutes.split(',')):
+        segments = whisper_like_segments(minutes)
+        legacy = count_tokens(legacy_text(segments))
+        encoded = encode_transcript(segments, args.merge_seconds, args.token_budget)
+        compact = count_tokens(encoded.text)
+        words = count_tokens(' '.join(s['text'].strip() for s in segments))
+        print(f"{minutes:5.0f} min, {len(segments):5d} segments: {legacy:7d} -> {compact:7d} tokens "
+              f"({100 * (1 - compact / legacy):4.1f}% saved, {encoded.text.count(chr(10)) + 1} lines, "
+              f"words alone {words})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Webhook mode end to end, offline: two bot replicas serve webhooks on local ports and recorded
+updates (video links, /start, plain text) are POSTed to them round robin, like a load balancer
+would. Replies go to the local fake Bot API server, summaries come from the fake OpenAI server
+and videos from the stubbed `YoutubeDL` serving captions (no Whisper).
+Reports how fast updates are acknowledged compared with how long they take to answer, checks
+that a wrong secret token is rejected and that every update is answered exactly once. The updates
+are POSTed all at once and the replicas share the event loop of the client, acknowledgement times
+are an upper bound.
+
+    python benchmarks/bench_webhook.py --updates 20
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+
+import fake_youtube_dl
+from bench_pipeline import make_fixtures
+from fake_openai import FakeOpenAI
+from fake_telegram import FakeTelegram
+from video_summary_bot_core.captions import CAPTIONS_ONLY
+from video_summary_telegram_bot.telegram_bot import TelegramBot
+
+SECRET = 'bench-secret'
+PATH = '/telegram'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def recorded_update(update_id: int, chat_id: int, text: str) -> dict:
+    """an update as Telegram POSTs it"""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f"user{chat_id}", 'language_code': 'en'}
+    message = {
+        'message_id': update_id,
+        'from': user,
+        'chat': {'id': chat_id, 'first_name': user['first_name'], 'type': 'private'},
+        'date': int(time.time()),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'offset': 0, 'length': len(text), 'type': 'bot_command'}]
+    return {'update_id': update_id, 'message': message}
+
+
+def recorded_updates(count: int, video_ids: list[str]) -> list[dict]:
+    """every 4th update is a /start or plain text, the others video links, one chat per update"""
+    updates = []
+    for i in range(count):
+        if i % 4 == 1:
+            text = '/start'
+        elif i % 4 == 3:
+            text = 'hello'
+        else:
+            text = fake_youtube_dl.video_url(video_ids[i % len(video_ids)])
+        updates.append(recorded_update(1000 + i, chat_id=i + 1, text=text))
+    return updates
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, timeout: float = 60) -> dict:
+    """the health of the replica at `url` once it has loaded the ML stack"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f"{url}/health") as response:
+                health = await response.json()
+                if health['ml_stack_ready']:
+                    return health
+        except aiohttp.ClientConnectionError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} not ready after {timeout} s")
+        await asyncio.sleep(0.1)
+
+
+def answered(server: FakeTelegram, update: dict) -> bool:
+    texts = server.texts(update['message']['chat']['id'])
+    if not update['message']['text'].startswith('http'):
+        return len(texts) >= 1
+    # the status message, then the first message of topics
+    return len(texts) >= 2
+
+
+async def run(args, telegram: FakeTelegram, video_ids: list[str], data_dir: str) -> None:
+    ports = [free_port() for _ in range(args.replicas)]
+    bots = [
+        TelegramBot(
+            token=telegram.token,
+            telegram_bot_api_server=telegram.base_url,
+            openai_model='fake',
+            openai_api_key='fake',
+            data_dir=Path(data_dir) / f"replica{i}",
+            transcript_source=CAPTIONS_ONLY,
+            preload_models=[],
+            webhook_url=f"https://bot.example.com{PATH}",
+            webhook_host='127.0.0.1',
+            webhook_port=port,
+            webhook_path=PATH,
+            webhook_secret=SECRET,
+        )
+        for i, port in enumerate(ports)
+    ]
+    tasks = [asyncio.create_task(bot.start_async()) for bot in bots]
+    urls = [f"http://127.0.0.1:{port}" for port in ports]
+    updates = recorded_updates(args.updates, video_ids)
+    try:
+        async with aiohttp.ClientSession() as session:
+            for url in urls:
+                await wait_ready(session, url)
+
+            async with session.post(f"{urls[0]}{PATH}", json=updates[0],
+                                    headers={'X-Telegram-Bot-Api-Secret-Token': 'wrong'}) as response:
+                print(f"wrong secret token: HTTP {response.status}")
+
+            started = time.perf_counter()
+
+            async def post(i: int, update: dict) -> float:
+                sent = time.perf_counter()
+                async with session.post(f"{urls[i % len(urls)]}{PATH}", json=update,
+                                        headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as response:
+                    response.raise_for_status()
+                return time.perf_counter() - sent
+
+            acks = await asyncio.gather(*(post(i, u) for i, u in enumerate(updates)))
+            answered_at: dict[int, float] = {}
+            while len(answered_at) < len(updates) and time.perf_counter() - started < args.timeout:
+                for update in updates:
+                    if update['update_id'] not in answered_at and answered(telegram, update):
+                        answered_at[update['update_id']] = time.perf_counter() - started
+                await asyncio.sleep(0.05)
+            while any(bot.jobs.stats()['pending'] for bot in bots):
+                await asyncio.sleep(0.05)
+            health = [await wait_ready(session, url) for url in urls]
+            async with session.get(f"{urls[0]}/metrics") as response:
+                exposition = await response.text()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for bot in bots:
+            bot.jobs.shutdown(wait=False)
+
+    print(f"{len(updates)} updates to {len(urls)} replicas: acknowledged in "
+          f"{np.median(acks) * 1000:.1f} ms median, {max(acks) * 1000:.1f} ms max")
+    if answered_at:
+        print(f"answered (first reply or topic): {len(answered_at)} of {len(updates)}, "
+              f"in {np.median(list(answered_at.values())):.2f} s median, {max(answered_at.values()):.2f} s max")
+    # a /start or plain text update gets a single reply
+    duplicated = [u['update_id'] for u in updates if not u['message']['text'].startswith('http')
+                  and len(telegram.texts(u['message']['chat']['id'])) > 1]
+    print(f"answered more than once: {len(duplicated)}")
+    registered = {(w['url'], w['secret_token']) for w in telegram.webhooks}
+    print(f"setWebhook calls: {len(telegram.webhooks)}, distinct url/secret: {len(registered)}")
+    print(f"health: {health[0]}")
+    accepted = [line for line in exposition.splitlines() if line.startswith('video_summary_webhook_updates_total')]
+    print(f"/metrics: {'; '.join(accepted)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webhook mode benchmark")
+    parser.add_argument('--updates', type=int, default=20)
+    parser.add_argument('--replicas', type=int, default=2)
+    parser.add_argument('--minutes', type=float, default=1, help="length of the fixture videos")
+    parser.add_argument('--latency', type=float, default=0.5, help="fake OpenAI server base latency")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds to wait for every answer")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    with tempfile.TemporaryDirectory(prefix='bench-webhook-') as tmp, \
+            FakeOpenAI(latency=args.latency, seed=1) as openai_server, \
+            FakeTelegram(latency=0.01) as telegram:
+        fixture_dir = Path(tmp) / 'fixtures'
+        fixture_dir.mkdir()
+        video_ids = make_fixtures(fixture_dir, args.minutes, videos=4, source='captions')
+        fake_youtube_dl.install(fixture_dir)
+        os.environ['OPENAI_BASE_URL'] = openai_server.base_url
+        asyncio.run(run(args, telegram, video_ids, tmp))
+
+
+if __name__ == '__main__':
+    main()
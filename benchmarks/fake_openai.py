@@ -0,0 +1,215 @@
+"""
+Local OpenAI compatible chat completions server for offline benchmarks.
+Every request answers with one add_topic tool call per `lines_per_topic` transcript lines, after a
+simulated latency growing with the prompt size and
+the generated tool calls (~4 characters per output token); `failure_rate` of the requests get a 429.
+Requests without tools (questions about a transcript) are answered with the transcript lines sharing
+the most words with the question.
+Streaming requests get server-sent events paced at `output_tokens_per_second`, or, with
+`replay_sse`, the chunks of a captured stream replayed verbatim.
+
+    with FakeOpenAI(latency=0.2) as server:
+        client = OpenAI(base_url=server.base_url, api_key="fake")
+"""
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional
+
+# `[start --> end] text` or the compact `[start] text` lines
+_TIMESTAMP_RE = re.compile(r'^\[([\d.]+)(?: --> ([\d.]+))?\]\s*(.*)$')
+_WORD_RE = re.compile(r'\w+')
+
+
+def fake_topics(prompt: str, lines_per_topic: int) -> list[dict]:
+    segments = [m.groups() for m in map(_TIMESTAMP_RE.match, prompt.splitlines()) if m]
+    topics = []
+    for i in range(0, len(segments), lines_per_topic):
+        group = segments[i:i + lines_per_topic]
+        topics.append({
+            'topic': f"topic {zlib.crc32(group[0][0].encode()):08x}",
+            'summary': ' '.join(text for _, _, text in group)[:200],
+            'timestamp': [float(group[0][0]), float(group[-1][1] or group[-1][0])],
+        })
+    return topics
+
+
+def fake_answer(prompt: str, question: str, lines: int = 2) -> str:
+    words = set(_WORD_RE.findall(question.lower()))
+    candidates = [m.group(3) for m in map(_TIMESTAMP_RE.match, prompt.splitlines()) if m]
+    best = sorted(candidates, key=lambda text: -len(words & set(_WORD_RE.findall(text.lower()))))[:lines]
+    return ' '.join(best) if best else "The transcript does not say."
+
+
+class FakeOpenAI:
+
+    def __init__(
+            self,
+            latency: float = 0.2,
+            seconds_per_1k_tokens: float = 0.02,
+            output_tokens_per_second: float = 500.0,
+            lines_per_topic: int = 60,
+            failure_rate: float = 0.0,
+            seed: int = 0,
+            replay_sse: Optional[str] = None,
+            replay_delay: float = 0.02
+    ):
+        self.latency = latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.output_tokens_per_second = output_tokens_per_second
+        self.lines_per_topic = lines_per_topic
+        self.failure_rate = failure_rate
+        self.replay_sse = replay_sse
+        self.replay_delay = replay_delay
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> 'FakeOpenAI':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _prompt(self, body: dict) -> str:
+        return "\n".join(m['content'] for m in body['messages'] if isinstance(m.get('content'), str))
+
+    def completion(self, body: dict) -> dict:
+        if 'tools' not in body:
+            return self.answer(body)
+        prompt = self._prompt(body)
+        topics = fake_topics(prompt, self.lines_per_topic)
+        output_tokens = sum(len(json.dumps(topic)) // 4 + 1 for topic in topics)
+        time.sleep(self.latency + len(prompt) / 4000 * self.seconds_per_1k_tokens
+                   + output_tokens / self.output_tokens_per_second)
+        tool_calls = [
+            {
+                'id': f"call_{i}",
+                'type': 'function',
+                'function': {'name': 'add_topic', 'arguments': json.dumps(topic)},
+            }
+            for i, topic in enumerate(topics)
+        ]
+        return {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'tool_calls',
+                'message': {'role': 'assistant', 'content': None, 'tool_calls': tool_calls},
+            }],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': output_tokens,
+                      'total_tokens': len(prompt) // 4 + output_tokens},
+        }
+
+    def answer(self, body: dict) -> dict:
+        prompt = self._prompt(body)
+        question = next(m['content'] for m in reversed(body['messages']) if m['role'] == 'user')
+        content = fake_answer(prompt, question)
+        output_tokens = len(content) // 4 + 1
+        time.sleep(self.latency + len(prompt) / 4000 * self.seconds_per_1k_tokens
+                   + output_tokens / self.output_tokens_per_second)
+        return {
+            'id': 'chatcmpl-fake',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content},
+            }],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': output_tokens,
+                      'total_tokens': len(prompt) // 4 + output_tokens},
+        }
+
+    def stream_chunks(self, body: dict) -> Iterator[str]:
+        """`data:` payloads of a streamed completion, sleeping between them like a real server"""
+        if self.replay_sse:
+            with open(self.replay_sse) as f:
+                for line in f:
+                    if line.startswith('data: '):
+                        time.sleep(self.replay_delay)
+                        yield line[len('data: '):].strip()
+            return
+        prompt = self._prompt(body)
+        time.sleep(self.latency + len(prompt) / 4000 * self.seconds_per_1k_tokens)
+        base = {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                'model': body.get('model', 'fake')}
+
+        def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+            return json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]})
+
+        for i, topic in enumerate(fake_topics(prompt, self.lines_per_topic)):
+            yield chunk({'role': 'assistant', 'content': None, 'tool_calls': [{
+                'index': i, 'id': f"call_{i}", 'type': 'function',
+                'function': {'name': 'add_topic', 'arguments': ''},
+            }]})
+            arguments = json.dumps(topic)
+            # ~4 characters per token, one token per chunk
+            for start in range(0, len(arguments), 4):
+                time.sleep(1 / self.output_tokens_per_second)
+                yield chunk({'tool_calls': [{'index': i, 'function': {'arguments': arguments[start:start + 4]}}]})
+        yield chunk({}, 'tool_calls')
+        yield '[DONE]'
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake._lock:
+                    fake.requests += 1
+                    fail = fake._random.random() < fake.failure_rate
+                    fake.failures += fail
+                if fail:
+                    self._send(429, {'error': {'message': 'rate limited', 'type': 'rate_limit'}},
+                               {'retry-after': '0.1'})
+                    return
+                if body.get('stream'):
+                    self._send_stream(fake.stream_chunks(body))
+                else:
+                    self._send(200, fake.completion(body))
+
+            def _send_stream(self, chunks: Iterator[str]):
+                # HTTP/1.0 without Content-Length: the body ends when the connection closes
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for data in chunks:
+                    self.wfile.write(f"data: {data}\n\n".encode())
+                    self.wfile.flush()
+
+            def _send(self, status: int, payload: dict, headers: dict = None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
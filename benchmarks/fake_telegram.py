@@ -0,0 +1,300 @@
+"""
+Local Telegram Bot API server for offline benchmarks, with Telegram's flood control: a chat gets
+`chat_burst` messages at once and then `chat_rate` per second, the bot `global_rate` per second across
+chats; a request over the limit gets a 429 with `retry_after`. Message texts are checked like Telegram
+does (well-formed HTML, at most 4096 characters of text) and every accepted message is recorded.
+Files added with `add_file` are served by getFile and the file endpoint (up to 20 MB like the cloud
+Bot API); with `local=True` it behaves like a local Bot API server: getFile returns the absolute path
+of the file, of any size, and nothing is served over HTTP.
+
+    with FakeTelegram(latency=0.05) as server:
+        bot = server.bot()
+        await bot.send_message(1, "hello")
+"""
+import asyncio
+import hashlib
+import html.parser
+import json
+import math
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+TOKEN = '123456:fake-token'
+# largest file getFile serves from the cloud Bot API
+CLOUD_FILE_LIMIT = 20 * 2 ** 20
+_TAGS = {'b', 'strong', 'i', 'em', 'u', 'ins', 's', 'strike', 'del', 'a', 'code', 'pre', 'blockquote',
+         'tg-spoiler', 'tg-emoji', 'span'}
+
+
+class _Entities(html.parser.HTMLParser):
+    """the visible text of a Telegram HTML message, ValueError if the markup is invalid"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.open: list[str] = []
+        self.text: list[str] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in _TAGS:
+            raise ValueError(f"Unsupported start tag \"{tag}\"")
+        self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.open or self.open.pop() != tag:
+            raise ValueError(f"Unmatched end tag \"{tag}\"")
+
+    def handle_data(self, data):
+        self.text.append(data)
+
+
+def visible_text(text: str) -> str:
+    parser = _Entities()
+    parser.feed(text)
+    parser.close()
+    if parser.open:
+        raise ValueError(f"Unclosed start tag \"{parser.open[-1]}\"")
+    return ''.join(parser.text)
+
+
+class _Bucket:
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0 if a token was taken, otherwise the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FakeTelegram:
+
+    def __init__(
+            self,
+            latency: float = 0.05,
+            chat_rate: float = 1.0,
+            chat_burst: int = 3,
+            global_rate: float = 30.0,
+            token: str = TOKEN,
+            local: bool = False
+    ):
+        self.latency = latency
+        self.local = local
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.token = token
+        # chat id -> message id -> text
+        self.messages: dict[int, dict[int, str]] = {}
+        # chat id -> time.perf_counter() of every message sent
+        self.sent_at: dict[int, list[float]] = {}
+        self.requests: dict[str, int] = {}
+        # parameters of every setWebhook call
+        self.webhooks: list[dict] = []
+        self.rejected = 0
+        self.invalid = 0
+        # file id -> (file unique id, path)
+        self.files: dict[str, tuple[str, Path]] = {}
+        self.file_downloads = 0
+        self._global = _Bucket(global_rate, global_rate)
+        self._chats: dict[int, _Bucket] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+        self.base_url = ''
+
+    def __enter__(self) -> 'FakeTelegram':
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def serve() -> None:
+            asyncio.set_event_loop(self._loop)
+            app = self.app()
+            self._runner = web.AppRunner(app)
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, '127.0.0.1', 0)
+            self._loop.run_until_complete(site.start())
+            port = site._server.sockets[0].getsockname()[1]
+            self.base_url = f"http://127.0.0.1:{port}"
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=serve, name='fake-telegram', daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def app(self) -> web.Application:
+        """the Bot API routes, to mount on another aiohttp application"""
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        app.router.add_get('/file/bot{token}/{path:.+}', self._handle_file)
+        return app
+
+    def bot(self) -> Bot:
+        """an aiogram Bot talking to this server"""
+        api = TelegramAPIServer.from_base(self.base_url, is_local=self.local)
+        return Bot(self.token, session=AiohttpSession(api=api))
+
+    def add_file(self, path: str | Path, file_unique_id: Optional[str] = None) -> tuple[str, str]:
+        """
+        serve `path` to getFile, (file id, file unique id) to put in a message; the file id differs for
+        every call, like for every forward of a file, the unique id is the same for the same file
+        """
+        file_id = uuid.uuid4().hex
+        file_unique_id = file_unique_id or hashlib.sha1(str(Path(path).resolve()).encode()).hexdigest()[:16]
+        with self._lock:
+            self.files[file_id] = (file_unique_id, Path(path))
+        return file_id, file_unique_id
+
+    def texts(self, chat_id: int) -> list[str]:
+        """texts of the messages of `chat_id` currently in the chat, in sending order"""
+        with self._lock:
+            return [text for _, text in sorted(self.messages.get(chat_id, {}).items())]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if request.match_info['token'] != self.token:
+            return self._error(401, "Unauthorized")
+        method = request.match_info['method']
+        params = dict(await request.post())
+        if not params and request.can_read_body:
+            params = await request.json()
+        await asyncio.sleep(self.latency)
+        with self._lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            handler = getattr(self, f"_{method}", None)
+            if handler is None:
+                return self._error(404, "Not Found: method not found")
+            return handler(params)
+
+    async def _handle_file(self, request: web.Request) -> web.StreamResponse:
+        if self.local or request.match_info['token'] != self.token:
+            return web.Response(status=404, text="Not Found")
+        with self._lock:
+            paths = {str(path.name): path for _, path in self.files.values()}
+            self.file_downloads += 1
+        path = paths.get(request.match_info['path'])
+        if path is None:
+            return web.Response(status=404, text="Not Found")
+        return web.FileResponse(path, chunk_size=2 ** 16)
+
+    def _flood_control(self, chat_id: int) -> Optional[web.Response]:
+        chat = self._chats.setdefault(chat_id, _Bucket(self.chat_rate, self.chat_burst))
+        wait = max(chat.take(), self._global.take())
+        if wait:
+            self.rejected += 1
+            retry_after = max(math.ceil(wait), 1)
+            return self._error(429, f"Too Many Requests: retry after {retry_after}", {'retry_after': retry_after})
+        return None
+
+    def _check_text(self, text: str) -> Optional[web.Response]:
+        try:
+            visible = visible_text(text)
+        except ValueError as e:
+            self.invalid += 1
+            return self._error(400, f"Bad Request: can't parse entities: {e}")
+        if not visible.strip():
+            self.invalid += 1
+            return self._error(400, "Bad Request: message text is empty")
+        if len(visible) > 4096:
+            self.invalid += 1
+            return self._error(400, "Bad Request: message is too long")
+        return None
+
+    def _check(self, chat_id: int, text: str) -> Optional[web.Response]:
+        # responses are (empty) mappings, always false: no `or` between them
+        error = self._flood_control(chat_id)
+        return error if error is not None else self._check_text(text)
+
+    def _message(self, chat_id: int, message_id: int, text: str) -> dict:
+        return {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+                'text': text}
+
+    def _getMe(self, params: dict) -> web.Response:
+        return self._ok({'id': int(self.token.split(':')[0]), 'is_bot': True, 'first_name': 'fake'})
+
+    def _sendMessage(self, params: dict) -> web.Response:
+        chat_id, text = int(params['chat_id']), params.get('text', '')
+        error = self._check(chat_id, text)
+        if error is not None:
+            return error
+        message_id = self._next_id
+        self._next_id += 1
+        self.messages.setdefault(chat_id, {})[message_id] = text
+        self.sent_at.setdefault(chat_id, []).append(time.perf_counter())
+        return self._ok(self._message(chat_id, message_id, text))
+
+    def _editMessageText(self, params: dict) -> web.Response:
+        chat_id, message_id, text = int(params['chat_id']), int(params['message_id']), params.get('text', '')
+        error = self._check(chat_id, text)
+        if error is not None:
+            return error
+        messages = self.messages.get(chat_id, {})
+        if message_id not in messages:
+            return self._error(400, "Bad Request: message to edit not found")
+        if messages[message_id] == text:
+            return self._error(400, "Bad Request: message is not modified")
+        messages[message_id] = text
+        return self._ok(self._message(chat_id, message_id, text))
+
+    def _getFile(self, params: dict) -> web.Response:
+        if params.get('file_id') not in self.files:
+            return self._error(400, "Bad Request: invalid file_id")
+        file_unique_id, path = self.files[params['file_id']]
+        size = path.stat().st_size
+        if not self.local and size > CLOUD_FILE_LIMIT:
+            return self._error(400, "Bad Request: file is too big")
+        return self._ok({'file_id': params['file_id'], 'file_unique_id': file_unique_id, 'file_size': size,
+                         'file_path': str(path.resolve()) if self.local else path.name})
+
+    def _setWebhook(self, params: dict) -> web.Response:
+        self.webhooks.append(params)
+        return self._ok(True)
+
+    def _deleteWebhook(self, params: dict) -> web.Response:
+        return self._ok(True)
+
+    def _setMyCommands(self, params: dict) -> web.Response:
+        return self._ok(True)
+
+    def _deleteMyCommands(self, params: dict) -> web.Response:
+        return self._ok(True)
+
+    def _deleteMessage(self, params: dict) -> web.Response:
+        chat_id, message_id = int(params['chat_id']), int(params['message_id'])
+        if self.messages.get(chat_id, {}).pop(message_id, None) is None:
+            return self._error(400, "Bad Request: message to delete not found")
+        return self._ok(True)
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    @staticmethod
+    def _error(status: int, description: str, parameters: Optional[dict] = None) -> web.Response:
+        body = {'ok': False, 'error_code': status, 'description': description}
+        if parameters:
+            body['parameters'] = parameters
+        return web.Response(status=status, text=json.dumps(body), content_type='application/json')
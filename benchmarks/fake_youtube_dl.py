@@ -0,0 +1,83 @@
+"""
+Offline stand-in for `yt_dlp.YoutubeDL` serving the videos of a fixture directory: `<id>.wav` is the
+audio track of https://www.youtube.com/watch?v=<id>, an optional `<id>.json3` its English captions.
+`install` replaces `yt_dlp.YoutubeDL`, so every helper creating a downloader gets this one.
+
+    install('fixtures/')
+    ai.summarize_video('https://www.youtube.com/watch?v=bench005m00')
+"""
+import io
+import shutil
+import wave
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import yt_dlp
+
+_fixture_dir: Path = Path('.')
+
+
+def video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+class FakeYoutubeDL:
+
+    def __init__(self, params: dict = None, *args, **kwargs):
+        self.params = params or {}
+
+    def __enter__(self) -> 'FakeYoutubeDL':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def extract_info(self, url: str, download: bool = True, *args, **kwargs) -> dict:
+        video_id = (parse_qs(urlsplit(url).query).get('v') or [''])[0]
+        audio = _fixture_dir / f"{video_id}.wav"
+        if not audio.exists():
+            raise yt_dlp.DownloadError(f"ERROR: [youtube] {video_id}: Video unavailable")
+        with wave.open(str(audio), 'rb') as f:
+            duration = f.getnframes() / f.getframerate()
+        captions = _fixture_dir / f"{video_id}.json3"
+        info = {
+            'id': video_id,
+            'extractor': 'youtube',
+            'title': f"benchmark video {video_id}",
+            'webpage_url': url,
+            'duration': duration,
+            'language': 'en',
+            'formats': [{
+                'format_id': '140', 'ext': 'wav', 'acodec': 'pcm_s16le', 'vcodec': 'none', 'abr': 256,
+                'filesize': audio.stat().st_size, 'url': f"fake://{audio.name}",
+            }],
+            'subtitles': {'en': [{'ext': 'json3', 'url': f"fake://{captions.name}"}]} if captions.exists() else {},
+            'automatic_captions': {},
+        }
+        if download:
+            self.download([url])
+        return info
+
+    def download(self, urls: list[str]) -> int:
+        for url in urls:
+            self.process_ie_result(self.extract_info(url, download=False), download=True)
+        return 0
+
+    def process_ie_result(self, info: dict, download: bool = True, *args, **kwargs) -> dict:
+        if download:
+            template = self.params.get('outtmpl', {}).get('default', '%(id)s.%(ext)s')
+            shutil.copyfile(_fixture_dir / f"{info['id']}.wav", template % {'id': info['id'], 'ext': 'wav'})
+        return info
+
+    @staticmethod
+    def sanitize_info(info: dict, remove_private_keys: bool = False) -> dict:
+        return dict(info)
+
+    def urlopen(self, url: str) -> io.BytesIO:
+        return io.BytesIO((_fixture_dir / url.removeprefix('fake://')).read_bytes())
+
+
+def install(fixture_dir: str | Path) -> None:
+    global _fixture_dir
+    _fixture_dir = Path(fixture_dir)
+    yt_dlp.YoutubeDL = FakeYoutubeDL
@@ -0,0 +1,130 @@
+"""Offline fixtures shared by the benchmarks."""
+import json
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_speech(seconds: float, seed: int = 0, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Speech-like float32 audio: voiced "syllables" (a glottal pitch with a few formant
+    harmonics and a syllable envelope) grouped into phrases separated by pauses.
+    """
+    rnd = np.random.default_rng(seed)
+    out = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    position = 0
+    while position < len(out):
+        phrase_end = position + int(rnd.uniform(2.0, 7.0) * sample_rate)
+        while position < min(phrase_end, len(out)):
+            n = int(rnd.uniform(0.12, 0.3) * sample_rate)
+            t = np.arange(n) / sample_rate
+            pitch = rnd.uniform(90, 220) * (1 + 0.05 * np.sin(2 * np.pi * rnd.uniform(2, 5) * t))
+            phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+            formants = rnd.uniform([300, 900, 2200], [800, 1800, 3000])
+            voice = sum(np.sin(phase * max(round(f / pitch.mean()), 1)) / (i + 1) for i, f in enumerate(formants))
+            envelope = np.sin(np.pi * np.arange(n) / n) ** 2
+            syllable = (0.3 * voice * envelope + 0.01 * rnd.standard_normal(n)).astype(np.float32)
+            stop = min(position + n, len(out))
+            out[position:stop] = syllable[:stop - position]
+            position = stop + int(rnd.uniform(0.0, 0.08) * sample_rate)
+        position += int(rnd.uniform(0.3, 1.2) * sample_rate)
+    return out
+
+
+_WORDS = (
+    "so the idea here is that we take the model and run it over every window of audio then we "
+    "look at the results and compare them with what we expected which is not always what happens "
+    "in practice because real data is messy and you need to handle the edge cases carefully"
+).split()
+
+
+def whisper_like_segments(minutes: float, seed: int = 0) -> list[dict]:
+    """
+    Transcript segments shaped like Whisper output: 1-8 s segments with float noise in the
+    timestamps (e.g. 12.340000000000002), short pauses and the occasional one-word segment.
+    """
+    rnd = np.random.default_rng(seed)
+    segments = []
+    t = 0.0
+    while t < minutes * 60:
+        duration = float(rnd.choice([rnd.uniform(0.4, 1.2), rnd.uniform(1.5, 8.0)], p=[0.2, 0.8]))
+        n_words = max(int(duration * rnd.uniform(2.0, 3.2)), 1)
+        # whisper timestamps are multiples of 20 ms, as floats
+        start = round(t / 0.02) * 0.02
+        end = round((t + duration) / 0.02) * 0.02
+        words = [_WORDS[int(i)] for i in rnd.integers(0, len(_WORDS), n_words)]
+        segments.append({'start': start, 'end': end, 'text': ' ' + ' '.join(words).capitalize() + '.'})
+        t = end + float(rnd.choice([0.0, rnd.uniform(0.1, 1.5)], p=[0.7, 0.3]))
+    return segments
+
+
+# words of the sections of `topical_segments`, and a question about each topic
+TOPICS = {
+    'pricing': ("price subscription plan cost monthly discount tier cheaper",
+                "How much does the subscription cost per month?"),
+    'battery': ("battery charging hours capacity drain charger",
+                "How long does the battery last on a charge?"),
+    'camera': ("camera lens photo sensor zoom portrait",
+               "Is the camera any good for portrait photos?"),
+    'display': ("display screen brightness refresh resolution panel",
+                "What did they say about the screen brightness?"),
+    'shipping': ("shipping delivery courier warehouse tracking parcel",
+                 "When does delivery happen and can the parcel be tracked?"),
+    'warranty': ("warranty repair replacement broken guarantee claim",
+                 "What does the warranty cover if it breaks?"),
+    'software': ("software update firmware bugs release patch",
+                 "Are there firmware updates fixing the bugs?"),
+    'speakers': ("speakers audio bass volume stereo headphones",
+                 "How is the audio through the speakers?"),
+}
+
+
+def topical_segments(minutes: float, seed: int = 0) -> tuple[list[dict], list[tuple[float, float, str]]]:
+    """
+    Whisper-like segments of a talk going through the `TOPICS` in 2-5 minute sections (each topic
+    coming back several times in a long talk), about a fifth of the words from the vocabulary of the
+    section topic; and the (start, end, topic) of every section.
+    """
+    rnd = np.random.default_rng(seed)
+    names = list(TOPICS)
+    segments = []
+    sections = []
+    t = 0.0
+    while t < minutes * 60:
+        topic = names[int(rnd.integers(0, len(names)))]
+        vocabulary = TOPICS[topic][0].split()
+        section_end = min(t + rnd.uniform(120, 300), minutes * 60)
+        sections.append((t, section_end, topic))
+        while t < section_end:
+            duration = float(rnd.uniform(1.5, 8.0))
+            words = [vocabulary[int(rnd.integers(0, len(vocabulary)))] if rnd.random() < 0.2
+                     else _WORDS[int(rnd.integers(0, len(_WORDS)))]
+                     for _ in range(max(int(duration * rnd.uniform(2.0, 3.2)), 1))]
+            start = round(t / 0.02) * 0.02
+            end = round((t + duration) / 0.02) * 0.02
+            segments.append({'start': start, 'end': end, 'text': ' ' + ' '.join(words).capitalize() + '.'})
+            t = end + float(rnd.choice([0.0, rnd.uniform(0.1, 1.5)], p=[0.7, 0.3]))
+    return segments, sections
+
+
+def write_wav(path, audio: np.ndarray, sample_rate: int = SAMPLE_RATE) -> None:
+    """16 bit mono WAV of float samples in [-1, 1]"""
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype('<i2').tobytes())
+
+
+def json3_captions(segments: list[dict]) -> str:
+    """the segments as YouTube json3 captions"""
+    return json.dumps({'events': [
+        {
+            'tStartMs': int(s['start'] * 1000),
+            'dDurationMs': int((s['end'] - s['start']) * 1000),
+            'segs': [{'utf8': s['text'].strip()}],
+        }
+        for s in segments
+    ]})
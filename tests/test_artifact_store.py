@@ -0,0 +1,68 @@
+import os
+import time
+
+from video_summary_bot_core.artifact_store import ArtifactStore, AUDIO, TRANSCRIPT
+from video_summary_bot_core.fs import file_lock
+
+
+def add(store: ArtifactStore, kind: str, name: str, size: int = 1000) -> None:
+    with store.write(kind, name, '.bin', mode='wb') as f:
+        f.write(os.urandom(size))
+
+
+def test_file_lock_without_blocking_tells_whether_it_is_held(tmp_path):
+    with file_lock(tmp_path / 'a') as locked:
+        assert locked
+        with file_lock(tmp_path / 'a', blocking=False) as again:
+            assert not again
+        with file_lock(tmp_path / 'b', blocking=False) as other:
+            assert other
+    with file_lock(tmp_path / 'a', blocking=False) as locked:
+        assert locked
+
+
+def test_evict_removes_the_least_recently_used_first(tmp_path):
+    store = ArtifactStore(tmp_path)
+    for name in ('old', 'middle', 'new'):
+        add(store, AUDIO, name)
+        time.sleep(0.01)
+    store.get(AUDIO, 'old')
+    assert store.evict(max_bytes=1500) == {'removed': 2, 'freed_bytes': 2000, 'skipped': 0}
+    assert [store.info(AUDIO, name) is not None for name in ('old', 'middle', 'new')] == [True, False, False]
+
+
+def test_evict_keeps_the_artifacts_being_produced(tmp_path):
+    store = ArtifactStore(tmp_path)
+    for name in ('locked', 'other', 'newest'):
+        add(store, TRANSCRIPT, name)
+        time.sleep(0.01)
+    with store.lock(TRANSCRIPT, 'locked'):
+        # the next least recently used one goes instead
+        assert store.evict(max_bytes=2000) == {'removed': 1, 'freed_bytes': 1000, 'skipped': 1}
+        assert store.get(TRANSCRIPT, 'locked') is not None
+        assert store.info(TRANSCRIPT, 'other') is None
+    assert store.evict(ttl=0) == {'removed': 2, 'freed_bytes': 2000, 'skipped': 0}
+    assert store.stats()['count'] == 0
+    assert not list((tmp_path / 'artifacts').rglob('*.bin'))
+
+
+def test_an_artifact_added_again_with_another_extension_replaces_its_file(tmp_path):
+    store = ArtifactStore(tmp_path)
+    (tmp_path / 'audio.webm').write_bytes(b'webm')
+    old = store.add(AUDIO, 'video', tmp_path / 'audio.webm')
+    (tmp_path / 'audio.m4a').write_bytes(b'm4a')
+    new = store.add(AUDIO, 'video', tmp_path / 'audio.m4a')
+    assert store.get(AUDIO, 'video') == new and new.suffix == '.m4a'
+    assert not old.exists()
+    assert store.stats()['bytes'] == 3
+
+
+def test_lock_files_go_with_their_artifact(tmp_path):
+    store = ArtifactStore(tmp_path)
+    for name in ('evicted', 'removed'):
+        with store.lock(TRANSCRIPT, name):
+            add(store, TRANSCRIPT, name)
+    assert len(list((tmp_path / 'artifacts').rglob('*.lock'))) == 2
+    assert store.remove(TRANSCRIPT, 'removed')
+    assert store.evict(ttl=0)['removed'] == 1
+    assert [p for p in (tmp_path / 'artifacts').rglob('*') if p.is_file()] == []
@@ -0,0 +1,86 @@
+import wave
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from video_summary_bot_core.audio import SAMPLE_RATE, decoded_audio, iter_audio_chunks
+from video_summary_bot_core.base_helper import BaseHelper
+from video_summary_bot_core.model_registry import ModelRegistry
+
+
+def write_wav(path: Path, seconds: float, sample_rate: int = 8000) -> np.ndarray:
+    """a 440 Hz tone as 16-bit PCM, the samples written"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    samples = (0.5 * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return samples
+
+
+@pytest.fixture
+def tone(tmp_path) -> Path:
+    write_wav(tmp_path / 'tone.wav', 2.5)
+    return tmp_path / 'tone.wav'
+
+
+def test_decoded_audio_is_a_16_khz_memory_map_removed_afterwards(tone, tmp_path):
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    with decoded_audio(tone, tmp_dir=scratch) as audio:
+        assert isinstance(audio, np.memmap)
+        assert audio.dtype == np.float32
+        assert len(audio) == 2.5 * SAMPLE_RATE
+        assert 0.45 < np.abs(audio).max() < 0.55
+        assert len(list(scratch.iterdir())) == 1
+    assert list(scratch.iterdir()) == []
+
+
+def test_decoded_audio_of_an_invalid_file_raises(tmp_path):
+    (tmp_path / 'broken.webm').write_bytes(b'not audio')
+    with pytest.raises(RuntimeError):
+        with decoded_audio(tmp_path / 'broken.webm', tmp_dir=tmp_path):
+            pass
+    assert [p.name for p in tmp_path.iterdir()] == ['broken.webm']
+
+
+def test_iter_audio_chunks_matches_the_decoded_audio(tone):
+    chunks = list(iter_audio_chunks(tone, chunk_seconds=1))
+    assert [len(c) for c in chunks] == [SAMPLE_RATE, SAMPLE_RATE, SAMPLE_RATE // 2]
+    with decoded_audio(tone) as audio:
+        assert np.array_equal(np.concatenate(chunks), audio)
+
+
+def test_iter_audio_chunks_stopped_early_or_on_an_invalid_file(tone, tmp_path):
+    chunks = iter_audio_chunks(tone, chunk_seconds=1)
+    next(chunks)
+    # ffmpeg is killed, no error
+    chunks.close()
+    (tmp_path / 'broken.webm').write_bytes(b'not audio')
+    with pytest.raises(RuntimeError):
+        list(iter_audio_chunks(tmp_path / 'broken.webm'))
+
+
+def test_audio_file2text_gives_whisper_one_chunk_at_a_time(tmp_path):
+    write_wav(tmp_path / 'long.wav', 10)
+    lengths = []
+
+    class Model:
+        def transcribe(self, audio: np.ndarray, **options) -> dict:
+            lengths.append(len(audio))
+            return {'segments': [{'start': 0.0, 'end': len(audio) / SAMPLE_RATE, 'text': f"chunk {len(lengths)}"}]}
+
+    class Registry(ModelRegistry):
+        def get(self, *args, **kwargs):
+            return Model()
+
+    helper = BaseHelper('tiny', device='cpu', data_dir=tmp_path, chunk_seconds=2, model_registry=Registry())
+    segments = helper.audio_file2text(tmp_path / 'long.wav')
+    # never the whole memory-mapped file
+    assert sum(lengths) == 10 * SAMPLE_RATE
+    assert max(lengths) <= 3 * SAMPLE_RATE
+    assert [s['text'] for s in segments] == [f"chunk {i + 1}" for i in range(len(lengths))]
+    assert segments[-1]['end'] == 10
@@ -0,0 +1,95 @@
+import threading
+import time
+
+from video_summary_simple.batch import BatchPipeline, DOWNLOAD, SUMMARIZE, TRANSCRIBE, to_markdown
+
+
+class FakeAi:
+    """the parts of AiBot used by the pipeline, each stage taking `seconds[url]`, recording what runs"""
+
+    def __init__(self, seconds: dict[str, float], fail: dict[str, str] = None):
+        self.seconds = seconds
+        self.fail = fail or {}
+        self.lock = threading.Lock()
+        self.events: list[tuple[str, str]] = []
+        # downloaded, not transcribed yet
+        self.ahead = 0
+        self.max_ahead = 0
+
+    def run(self, stage: str, url: str) -> None:
+        with self.lock:
+            self.events.append((stage, url))
+        if self.fail.get(url) == stage:
+            raise RuntimeError(f"{stage} of {url} failed")
+        time.sleep(self.seconds[url])
+
+    def validate_video_url(self, url: str) -> bool:
+        return url.startswith('https://')
+
+    def video_info(self, url: str) -> dict:
+        return {'extractor': 'youtube', 'id': url[-1], 'title': f"Video {url[-1]}"}
+
+    def needs_audio(self, url: str) -> bool:
+        return True
+
+    def download_audio(self, url: str) -> None:
+        self.run(DOWNLOAD, url)
+        with self.lock:
+            self.ahead += 1
+            self.max_ahead = max(self.max_ahead, self.ahead)
+
+    def transcript_segments(self, url: str) -> list[dict]:
+        with self.lock:
+            self.ahead -= 1
+        self.run(TRANSCRIBE, url)
+        return [{'start': 0.0, 'end': 60.0, 'text': f"transcript of {url}"}]
+
+    def generate_summary(self, url: str, segments: list[dict]):
+        self.run(SUMMARIZE, url)
+        yield {'topic': "Topic", 'summary': segments[0]['text'], 'timestamp': (0.0, 60.0), 'ref_url': url + '?t=0'}
+
+
+def test_results_come_as_each_video_is_done_with_the_stages_overlapped():
+    urls = [f"https://youtu.be/{i}" for i in range(4)]
+    ai = FakeAi({url: 0.05 for url in urls} | {urls[0]: 0.3})
+    pipeline = BatchPipeline(ai, download_workers=2, transcribe_workers=1, summarize_workers=2)
+    results = list(pipeline.run(iter(urls)))
+    # the long first video does not hold back the others
+    assert {r['url'] for r in results} == set(urls) and results[-1]['url'] == urls[0]
+    assert all(r['error'] is None and r['name'] == f"youtube_{r['url'][-1]}" for r in results)
+    assert results[0]['topics'][0]['summary'] == f"transcript of {results[0]['url']}"
+    # every video goes through the stages in order
+    for url in urls:
+        assert [stage for stage, u in ai.events if u == url] == [DOWNLOAD, TRANSCRIBE, SUMMARIZE]
+    stats = pipeline.stats()
+    assert stats['videos'] == 4 and stats['failed'] == 0
+    assert all(stats['stages'][stage]['videos'] == 4 for stage in (DOWNLOAD, TRANSCRIBE, SUMMARIZE))
+
+
+def test_downloads_stay_at_most_prefetch_ahead_of_the_transcription():
+    urls = [f"https://youtu.be/{i}" for i in range(6)]
+
+    class SlowTranscription(FakeAi):
+        def transcript_segments(self, url: str) -> list[dict]:
+            # the bottleneck: the downloads would race ahead
+            time.sleep(0.05)
+            return super().transcript_segments(url)
+
+    ai = SlowTranscription({url: 0.02 for url in urls})
+    results = list(BatchPipeline(ai, download_workers=3, prefetch=2).run(urls))
+    assert len(results) == 6
+    assert ai.max_ahead <= 2
+
+
+def test_a_failed_stage_is_reported_and_the_batch_goes_on():
+    urls = ["https://youtu.be/0", "not a url", "https://youtu.be/2"]
+    ai = FakeAi({url: 0.01 for url in urls}, fail={urls[2]: TRANSCRIBE})
+    pipeline = BatchPipeline(ai, prefetch=1)
+    results = {r['url']: r for r in pipeline.run(urls)}
+    assert results[urls[0]]['error'] is None
+    assert results[urls[1]]['error'] == "download: Invalid video URL"
+    assert results[urls[2]]['error'] == f"transcribe: transcribe of {urls[2]} failed"
+    assert (SUMMARIZE, urls[2]) not in ai.events
+    assert pipeline.stats()['failed'] == 2
+    markdown = to_markdown(results[urls[2]])
+    assert markdown.startswith("# Video 2\n") and "Failed: transcribe:" in markdown
@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import pytest
+
+from video_summary_bot_core.captions import parse_json3, parse_srv3, parse_subtitles, parse_vtt, select_caption_track
+
+FIXTURES = Path(__file__).parent / 'fixtures' / 'captions'
+
+# the same automatic captions in the three formats youtube serves them in
+AUTO_SEGMENTS = [
+    {'start': 0.0, 'end': 2.32, 'text': 'hello everyone and welcome'},
+    {'start': 2.32, 'end': 5.04, 'text': 'to the show'},
+    {'start': 5.04, 'end': 7.0, 'text': 'today we talk'},
+]
+
+
+def read(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding='utf-8')
+
+
+def texts(segments: list[dict]) -> list[str]:
+    return [s['text'] for s in segments]
+
+
+def test_parse_vtt_manual_subtitles():
+    assert parse_vtt(read('manual.vtt')) == [
+        {'start': 1.0, 'end': 3.5, 'text': 'Welcome to the show & thanks for coming'},
+        {'start': 3.5, 'end': 6.0, 'text': 'This cue has two lines'},
+        {'start': 3600.0, 'end': 3602.25, 'text': 'An hour in'},
+    ]
+
+
+def test_parse_vtt_drops_rolling_duplicates_of_automatic_captions():
+    segments = parse_vtt(read('auto.vtt'))
+    assert texts(segments) == texts(AUTO_SEGMENTS)
+    assert [s['start'] for s in segments] == [0.0, 2.32, 5.04]
+
+
+def test_parse_vtt_keeps_lines_repeated_elsewhere_in_the_next_cue():
+    content = ("WEBVTT\n\n"
+               "00:01.000 --> 00:03.000\n"
+               "- What do you want?\n"
+               "- Pizza.\n\n"
+               "00:03.000 --> 00:05.000\n"
+               "- Really?\n"
+               "- Pizza.\n")
+    # only the lines a cue starts with are rolled over from the previous one
+    assert texts(parse_vtt(content)) == ['- What do you want? - Pizza.', '- Really? - Pizza.']
+
+
+def test_parse_vtt_keeps_cues_with_whitespace_only_lines():
+    # the first automatic caption cue starts with a ' ' line, it is part of the cue, not a separator
+    assert parse_vtt(read('auto.vtt'))[0] == {'start': 0.0, 'end': 2.31, 'text': 'hello everyone and welcome'}
+
+
+@pytest.mark.parametrize('newline', ['\r\n', '\r'])
+def test_parse_vtt_line_endings(newline):
+    for name in ('manual.vtt', 'auto.vtt'):
+        content = read(name)
+        assert parse_vtt('\ufeff' + content.replace('\n', newline)) == parse_vtt(content)
+
+
+def test_parse_vtt_ignores_text_that_looks_like_a_timing():
+    content = ("WEBVTT\n\n"
+               "00:01.000 --> 00:02.000\n"
+               "the arrow --> goes here\n\n"
+               "NOTE 00:03.000 --> 00:04.000 is not a cue\n\n"
+               "00:05.000 --> 00:06.000 position:10%\n"
+               "last\n")
+    assert parse_vtt(content) == [
+        {'start': 1.0, 'end': 2.0, 'text': 'the arrow --> goes here'},
+        {'start': 5.0, 'end': 6.0, 'text': 'last'},
+    ]
+
+
+def test_parse_srv3_automatic_captions():
+    # the appended newline paragraphs of the rolling window carry no text
+    segments = parse_srv3(read('auto.srv3'))
+    assert texts(segments) == texts(AUTO_SEGMENTS)
+    assert segments[0] == {'start': 0.0, 'end': 2.32, 'text': 'hello everyone and welcome'}
+    assert segments[-1]['end'] == pytest.approx(7.0)
+
+
+def test_parse_json3_automatic_captions():
+    # the window event has no segs, the appended events only a newline
+    segments = parse_json3(read('auto.json3'))
+    assert texts(segments) == texts(AUTO_SEGMENTS)
+    assert [(s['start'], s['end']) for s in segments] == [
+        (s['start'], pytest.approx(s['end'])) for s in AUTO_SEGMENTS]
+
+
+def test_parse_subtitles_dispatches_on_the_extension():
+    assert texts(parse_subtitles(read('auto.json3'), 'json3')) == texts(parse_subtitles(read('auto.vtt'), 'vtt'))
+    with pytest.raises(ValueError):
+        parse_subtitles('', 'srt')
+
+
+def tracks(*exts: str) -> list[dict]:
+    return [{'ext': ext, 'url': f"https://example.com/captions.{ext}", 'name': None} for ext in exts]
+
+
+def video_info(subtitles: dict = None, automatic_captions: dict = None, language: str = None) -> dict:
+    return {
+        'url': 'https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'id': 'dQw4w9WgXcQ', 'extractor': 'youtube',
+        'title': None, 'duration': 60.0, 'language': language, 'audio_format': None,
+        'subtitles': subtitles or {}, 'automatic_captions': automatic_captions or {},
+    }
+
+
+def test_select_caption_track_prefers_manual_subtitles_and_clean_formats():
+    info = video_info(subtitles={'en': tracks('vtt', 'srv3', 'json3')},
+                      automatic_captions={'en-orig': tracks('json3'), 'en': tracks('json3')}, language='en')
+    lang, track = select_caption_track(info)
+    assert lang == 'en'
+    assert track['ext'] == 'json3'
+
+
+def test_select_caption_track_languages_order():
+    info = video_info(subtitles={'de': tracks('vtt'), 'en-GB': tracks('vtt'), 'live_chat': tracks('json3')},
+                      language='de')
+    assert select_caption_track(info, ['en'])[0] == 'en-GB'
+    assert select_caption_track(info, ['fr'])[0] == 'de'
+    assert select_caption_track(info)[0] == 'de'
+
+
+def test_select_caption_track_automatic_captions():
+    info = video_info(automatic_captions={'en': tracks('vtt'), 'en-orig': tracks('vtt'), 'fr': tracks('vtt')},
+                      language='en')
+    # the speech recognition track, not a translation
+    assert select_caption_track(info)[0] == 'en-orig'
+    # machine translated captions only when asked for
+    assert select_caption_track(info, ['fr'])[0] == 'fr'
+    unknown_language = video_info(automatic_captions={'fr': tracks('vtt'), 'es-orig': tracks('srv3')})
+    assert select_caption_track(unknown_language) == ('es-orig', tracks('srv3')[0])
+
+
+def test_select_caption_track_single_manual_track_without_language():
+    info = video_info(subtitles={'pt': tracks('srv3')})
+    assert select_caption_track(info)[0] == 'pt'
+
+
+def test_select_caption_track_none():
+    assert select_caption_track(video_info(language='en')) is None
+    # tracks without an url can not be downloaded, live chat is not a caption track
+    no_url = video_info(subtitles={'en': [{'ext': 'vtt', 'url': None, 'name': None}], 'live_chat': tracks('json3')},
+                        automatic_captions={'en': tracks('ttml')}, language='en')
+    assert select_caption_track(no_url) is None
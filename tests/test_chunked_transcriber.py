@@ -0,0 +1,43 @@
+from video_summary_bot_core.chunked_transcriber import SegmentStitcher, stitch_segments
+
+
+def segment(start: float, end: float, text: str) -> dict:
+    return {'start': start, 'end': end, 'text': text}
+
+
+def test_a_segment_repeated_at_the_seam_is_merged():
+    chunks = [
+        (0.0, [segment(0, 4, "Welcome back."), segment(4, 9.5, "Today: rockets.")]),
+        # Whisper heard the last sentence again at the start of the next chunk
+        (9.0, [segment(0, 1.2, "today, rockets"), segment(1.2, 5, "First the engine.")]),
+    ]
+    assert stitch_segments(chunks) == [
+        segment(0, 4, "Welcome back."),
+        segment(4, 10.2, "Today: rockets."),
+        segment(10.2, 14, "First the engine."),
+    ]
+
+
+def test_repeats_away_from_the_seam_are_kept():
+    chunks = [
+        (0.0, [segment(0, 3, "Again."), segment(3, 5, "Again.")]),
+        # the same words well after the seam
+        (10.0, [segment(3, 5, "Again.")]),
+        (20.0, [segment(0, 2, "Next."), segment(2, 4, "Again."), segment(4, 6, "Next.")]),
+    ]
+    assert [s['text'] for s in stitch_segments(chunks)] == ["Again.", "Again.", "Again.", "Next.", "Again.", "Next."]
+
+
+def test_timestamps_never_go_backwards_across_a_seam():
+    stitcher = SegmentStitcher()
+    assert stitcher.add(0.0, [segment(0, 9.6, "Long sentence."), segment(9.8, 10.6, "Right.")]) == [
+        segment(0, 9.6, "Long sentence."),
+        segment(9.8, 10.6, "Right."),
+    ]
+    # the last segment ran past the cut at 9.5 s
+    assert stitcher.add(9.5, [segment(0, 0.2, "Uh."), segment(0.5, 2, "So.")]) == [
+        segment(9.8, 9.8, "Uh."),
+        segment(10.0, 11.5, "So."),
+    ]
+    assert stitcher.add(20.0, []) == []
+    assert stitcher.add(20.0, [segment(0, 1, "so")]) == [segment(20, 21, "so")]
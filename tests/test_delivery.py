@@ -0,0 +1,158 @@
+import asyncio
+import re
+import time
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from video_summary_telegram_bot.delivery import Delivery, TokenBucket, pack_messages, split_html
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_ENTITY_RE = re.compile(r'&#?\w+;')
+
+
+def text_of(html: str) -> str:
+    return _TAG_RE.sub('', html)
+
+
+def test_split_html_short_text_is_one_chunk():
+    assert split_html("<b>short</b>", 100) == ["<b>short</b>"]
+
+
+def test_split_html_reopens_the_tags_open_at_a_split():
+    html = "<b>bold <i>" + "word " * 60 + "</i> end</b> after"
+    chunks = split_html(html, 80)
+    assert len(chunks) > 3
+    assert all(len(chunk) <= 80 for chunk in chunks)
+    # every chunk is balanced, the nested tags are opened again in order
+    assert chunks[0].startswith("<b>bold <i>") and chunks[0].endswith("</i></b>")
+    for chunk in chunks[1:-1]:
+        assert chunk.startswith("<b><i>") and chunk.endswith("</i></b>")
+    assert chunks[-1].endswith(" end</b> after")
+    # split at whitespace: no word is lost or cut
+    assert " ".join(text_of(chunk) for chunk in chunks).split() == text_of(html).split()
+
+
+def test_split_html_cuts_words_longer_than_the_limit():
+    word = "x" * 250
+    chunks = split_html(f"<code>{word}</code>", 60)
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    assert all(chunk.startswith("<code>") and chunk.endswith("</code>") for chunk in chunks)
+    assert "".join(text_of(chunk) for chunk in chunks) == word
+
+
+def test_split_html_never_splits_entities():
+    html = "&lt;tag&gt; &amp;&amp;&amp; &#8212; " * 40
+    for limit in (20, 33, 50, 64):
+        chunks = split_html(html, limit)
+        assert all(len(chunk) <= limit for chunk in chunks)
+        for chunk in chunks:
+            # every & starts a whole entity
+            assert chunk.count('&') == len(_ENTITY_RE.findall(chunk))
+        assert "".join(chunks).replace(" ", "") == html.replace(" ", "")
+
+
+def test_pack_messages_joins_parts_in_order():
+    parts = [f"<b>topic {i}</b>" + " words" * 5 for i in range(10)]
+    messages = pack_messages(parts, limit=100)
+    assert all(len(message) <= 100 for message in messages)
+    assert "\n".join(messages) == "\n".join(parts)
+    # as few messages as possible: no two consecutive ones fit together
+    assert len(messages) == 5
+    assert all(len(a) + 1 + len(b) > 100 for a, b in zip(messages, messages[1:]))
+
+
+def test_pack_messages_splits_a_part_above_the_limit():
+    parts = ["first", "<b>" + "long " * 50 + "</b>", "last"]
+    messages = pack_messages(parts, limit=60)
+    assert messages[0] == "first"
+    assert messages[-1] == "last"
+    assert all(len(message) <= 60 for message in messages)
+    assert all(message.startswith("<b>") for message in messages[1:-1])
+
+
+def test_token_bucket_bursts_then_waits_for_the_rate():
+    async def main():
+        bucket = TokenBucket(rate=50, capacity=2)
+        started = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        assert time.monotonic() - started < 0.01
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.015
+
+    asyncio.run(main())
+
+
+def test_token_bucket_pause_holds_every_request():
+    async def main():
+        bucket = TokenBucket(rate=1000, capacity=5)
+        bucket.pause(0.1)
+        assert not bucket.idle
+        started = time.monotonic()
+        await bucket.acquire()
+        assert time.monotonic() - started >= 0.09
+        # refilled from empty after the pause
+        await asyncio.sleep(0.01)
+        assert bucket.idle
+
+    asyncio.run(main())
+
+
+class FakeBot:
+    """records the calls, answers the first `flood` of them with a 429"""
+
+    def __init__(self, flood: int = 0, retry_after: int = 1, latency: float = 0.0):
+        self.calls: list[tuple] = []
+        self._flood = flood
+        self._retry_after = retry_after
+        self._latency = latency
+
+    async def _call(self, *call) -> SimpleNamespace:
+        await asyncio.sleep(self._latency)
+        if self._flood:
+            self._flood -= 1
+            raise TelegramRetryAfter(SendMessage(chat_id=call[1], text=call[2]), "Too Many Requests",
+                                     self._retry_after)
+        self.calls.append((time.monotonic(), *call))
+        return SimpleNamespace(message_id=len(self.calls))
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> SimpleNamespace:
+        return await self._call('send', chat_id, text)
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int, **kwargs) -> SimpleNamespace:
+        return await self._call('edit', chat_id, text)
+
+
+def test_send_waits_for_the_retry_after_of_a_429_and_pauses_the_chat():
+    async def main():
+        bot = FakeBot(flood=1, retry_after=1)
+        delivery = Delivery(bot, chat_rate=100, chat_burst=10)
+        started = time.monotonic()
+        await delivery.send(1, ["first"])
+        assert time.monotonic() - started >= 1
+        # the other chats are not paused
+        await delivery.send(2, ["other chat"])
+        assert [call[1:] for call in bot.calls] == [('send', 1, 'first'), ('send', 2, 'other chat')]
+        assert delivery.stats()['retry_after'] == 1
+        assert delivery.stats()['sent'] == 2
+
+    asyncio.run(main())
+
+
+def test_set_status_sends_only_the_latest_pending_text():
+    async def main():
+        bot = FakeBot(latency=0.01)
+        delivery = Delivery(bot, chat_rate=20, chat_burst=1)
+        delivery.set_status(1, 10, "downloading")
+        await delivery.wait_status(1, 10)
+        # faster than the chat rate: superseded before their turn
+        for status in ("transcribing 10%", "transcribing 50%", "summarizing"):
+            delivery.set_status(1, 10, status)
+        await delivery.wait_status(1, 10)
+        assert [call[3] for call in bot.calls] == ["downloading", "summarizing"]
+        assert delivery.stats()['coalesced'] == 2
+        assert delivery.stats()['edited'] == 2
+
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+import pytest
+
+from video_summary_bot_core.extractor_index import ExtractorIndex
+
+
+@pytest.fixture(scope='module')
+def index() -> ExtractorIndex:
+    return ExtractorIndex()
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+    'https://youtube.com/watch?v=dQw4w9WgXcQ&t=42s',
+    'https://youtu.be/dQw4w9WgXcQ',
+])
+def test_youtube_videos_are_matched_by_the_youtube_extractor(index, url):
+    # not by the generic extractor, which also claims every http url
+    assert index.find(url) == 'Youtube'
+
+
+def test_youtube_short_link_resolves_like_the_watch_url(index):
+    assert index.find('https://youtu.be/dQw4w9WgXcQ') == index.find('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+
+
+def test_other_sites_and_unknown_urls(index):
+    assert index.find('https://vimeo.com/123456') == 'Vimeo'
+    assert index.find('https://www.youtube.com/playlist?list=PL0123456789') == 'YoutubeTab'
+    assert index.find('https://example.com/talk.mp4') == 'Generic'
+
+
+def test_matches_the_order_youtube_dl_tries_extractors(index):
+    import yt_dlp.extractor
+
+    classes = list(yt_dlp.extractor.gen_extractor_classes())
+    urls = ['https://www.youtube.com/watch?v=dQw4w9WgXcQ', 'https://youtu.be/dQw4w9WgXcQ',
+            'https://vimeo.com/123456', 'https://www.twitch.tv/videos/123456', 'https://example.com/a.mp4']
+    for url in urls:
+        assert index.find(url) == next(ie.ie_key() for ie in classes if ie.suitable(url))
@@ -0,0 +1,104 @@
+import json
+import subprocess
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from benchmarks.fixtures import synthetic_speech, write_wav
+from video_summary_bot_core import fingerprint as fingerprint_module
+from video_summary_bot_core.artifact_store import ArtifactStore, TRANSCRIPT
+from video_summary_bot_core.audio import SAMPLE_RATE, probe_duration
+from video_summary_bot_core.fingerprint import FingerprintIndex, audio_fingerprint
+
+SECONDS = 90
+
+
+@pytest.fixture(scope='module')
+def talk(tmp_path_factory) -> tuple[Path, np.ndarray]:
+    audio = synthetic_speech(SECONDS, seed=0)
+    path = tmp_path_factory.mktemp('talk') / 'talk.wav'
+    write_wav(path, audio)
+    return path, audio
+
+
+@pytest.fixture
+def index(tmp_path, talk) -> FingerprintIndex:
+    index = FingerprintIndex(tmp_path)
+    index.add('original', audio_fingerprint(talk[0]))
+    return index
+
+
+def reencoded(source: Path, target: Path, *options: str) -> Path:
+    subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', str(source), *options, str(target)],
+                   check=True)
+    return target
+
+
+def best_match(index: FingerprintIndex, path: Path) -> dict:
+    matches = index.matches(audio_fingerprint(path), threshold=0.1)
+    assert matches, f"{path.name} not recognized"
+    return matches[0]
+
+
+def test_a_trimmed_copy_matches_at_its_offset(index, talk, tmp_path):
+    write_wav(tmp_path / 'trimmed.wav', talk[1][int(7.3 * SAMPLE_RATE):])
+    match = best_match(index, tmp_path / 'trimmed.wav')
+    assert match['name'] == 'original'
+    # the original starts 7.3 s before the copy
+    assert match['offset'] == pytest.approx(-7.3, abs=0.05)
+
+
+def test_re_encoded_and_volume_shifted_copies_match(index, talk, tmp_path):
+    mp3 = reencoded(talk[0], tmp_path / 'copy.mp3', '-b:a', '32k')
+    assert best_match(index, mp3)['offset'] == pytest.approx(0, abs=0.05)
+    write_wav(tmp_path / 'quieter.wav', talk[1] * 10 ** (-12 / 20))
+    assert best_match(index, tmp_path / 'quieter.wav')['similarity'] > 0.5
+    # all at once
+    write_wav(tmp_path / 'combined.wav', talk[1][int(3.1 * SAMPLE_RATE):] * 10 ** (6 / 20))
+    combined = reencoded(tmp_path / 'combined.wav', tmp_path / 'combined.ogg', '-c:a', 'libopus', '-b:a', '24k')
+    assert best_match(index, combined)['offset'] == pytest.approx(-3.1, abs=0.05)
+
+
+def test_other_audio_does_not_match(index, tmp_path):
+    write_wav(tmp_path / 'other.wav', synthetic_speech(SECONDS, seed=1))
+    assert index.matches(audio_fingerprint(tmp_path / 'other.wav'), threshold=0.1) == []
+
+
+def test_only_the_fingerprinted_seconds_are_decoded(talk, monkeypatch):
+    decoded = []
+    iter_audio_chunks = fingerprint_module.iter_audio_chunks
+
+    def counting(path):
+        for chunk in iter_audio_chunks(path):
+            decoded.append(len(chunk))
+            yield chunk
+
+    monkeypatch.setattr(fingerprint_module, 'iter_audio_chunks', counting)
+    fp = audio_fingerprint(talk[0], max_seconds=20)
+    assert sum(decoded) == 30 * SAMPLE_RATE
+    # the duration of the whole file, from its header
+    assert fp['duration'] == pytest.approx(SECONDS, abs=0.01) == probe_duration(talk[0])
+    head = np.concatenate(list(iter_audio_chunks(talk[0])))[:20 * SAMPLE_RATE]
+    assert fp['hashes'].tolist() == fingerprint_module.fingerprint(head)['hashes'].tolist()
+
+
+def test_fingerprints_of_audio_without_a_transcript_are_pruned(tmp_path, talk):
+    store = ArtifactStore(tmp_path)
+    index = FingerprintIndex(tmp_path)
+    fp = audio_fingerprint(talk[0], max_seconds=10)
+    for name in ('transcribed', 'evicted'):
+        index.add(name, fp)
+        with store.write(TRANSCRIPT, name, '.json') as f:
+            f.write(json.dumps([]))
+    # still being transcribed
+    index.add('new', fp)
+    assert index.prune(store) == 0
+    store.remove(TRANSCRIPT, 'evicted')
+    assert index.prune(store, min_age=0) == 2
+    assert [index.contains(name) for name in ('transcribed', 'evicted', 'new')] == [True, False, False]
+    # run after every eviction
+    store.add_eviction_callback(lambda: index.prune(store, min_age=0))
+    store.remove(TRANSCRIPT, 'transcribed')
+    store.evict()
+    assert index.stats()['count'] == 0
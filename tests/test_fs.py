@@ -0,0 +1,46 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from video_summary_bot_core.fs import atomic_write, file_lock
+
+HOLD_LOCK = """
+import sys, time
+from video_summary_bot_core.fs import file_lock
+with file_lock(sys.argv[1]):
+    print('locked', flush=True)
+    time.sleep(float(sys.argv[2]))
+"""
+
+
+def test_file_lock_serializes_processes(tmp_path):
+    holder = subprocess.Popen([sys.executable, '-c', HOLD_LOCK, str(tmp_path / 'audio'), '0.5'],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'locked'
+        with file_lock(tmp_path / 'audio', blocking=False) as locked:
+            assert not locked
+        started = time.monotonic()
+        with file_lock(tmp_path / 'audio') as locked:
+            # waited for the other process to release it
+            assert locked and time.monotonic() - started > 0.2
+    finally:
+        holder.wait()
+
+
+def test_atomic_write_replaces_the_file_only_on_success(tmp_path):
+    path = tmp_path / 'sub' / 'transcript.json'
+    with atomic_write(path, 'w') as f:
+        f.write("first")
+        # not visible before the block ends
+        assert not path.exists()
+    assert path.read_text() == "first"
+    with pytest.raises(RuntimeError):
+        with atomic_write(path, 'w') as f:
+            f.write("partial")
+            raise RuntimeError("interrupted")
+    assert path.read_text() == "first"
+    # no temporary file left behind
+    assert [p.name for p in path.parent.iterdir()] == ['transcript.json']
@@ -0,0 +1,16 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+
+@pytest.mark.parametrize('module', ['video_summary_telegram_bot.__main__', 'video_summary_simple.__main__'])
+def test_entry_points_do_not_import_heavy_modules(module):
+    # imported on first use (or preloaded after startup), not when the bot starts
+    code = (f"import sys, {module}\n"
+            "print(','.join(m for m in ('torch', 'whisper', 'openai', 'yt_dlp') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from video_summary_bot_core.jobs import JobContext, JobQueue, QueueFullError
+
+
+@pytest.fixture
+def jobs():
+    jobs = JobQueue(max_pending=3, max_running=2, io_workers=4)
+    yield jobs
+    jobs.shutdown()
+
+
+def test_submissions_above_max_pending_are_rejected(jobs):
+    async def main():
+        release = asyncio.Event()
+
+        async def job(ctx: JobContext) -> int:
+            await release.wait()
+            return 1
+
+        futures = [jobs.submit(job) for _ in range(3)]
+        assert jobs.is_full()
+        with pytest.raises(QueueFullError):
+            jobs.submit(job)
+        release.set()
+        assert await asyncio.gather(*futures) == [1, 1, 1]
+        # finished jobs free their place
+        assert jobs.pending == 0
+        assert await jobs.submit(job) == 1
+
+    asyncio.run(main())
+
+
+def test_at_most_max_running_jobs_run_at_once(jobs):
+    async def main():
+        running = 0
+        most_running = 0
+
+        async def job(ctx: JobContext) -> None:
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+        futures = [jobs.submit(job) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        assert (jobs.running, jobs.waiting) == (2, 1)
+        await asyncio.gather(*futures)
+        assert most_running == 2
+        assert jobs.stats() == {'pending': 0, 'running': 0, 'max_pending': 3}
+
+    asyncio.run(main())
+
+
+def test_queued_jobs_report_their_position_and_wait(jobs):
+    async def main():
+        progress = []
+
+        async def job(ctx: JobContext) -> float:
+            await asyncio.sleep(0.05)
+            return ctx.queue_wait
+
+        first = [jobs.submit(job) for _ in range(2)]
+        waits = await asyncio.gather(*first, jobs.submit(job, progress.append))
+        assert progress == ["queued: 1 jobs waiting"]
+        assert waits[0] < 0.04 < waits[2]
+
+    asyncio.run(main())
+
+
+def test_io_stages_run_while_the_transcribe_executor_is_busy(jobs):
+    async def main():
+        transcribing = threading.Event()
+        release = threading.Event()
+
+        def transcribe() -> str:
+            transcribing.set()
+            release.wait(5)
+            return 'transcript'
+
+        async def whisper_job(ctx: JobContext) -> str:
+            return await ctx.run_transcribe(transcribe)
+
+        async def io_job(ctx: JobContext) -> str:
+            return await ctx.run_io(lambda x: x * 2, 'io')
+
+        whisper = jobs.submit(whisper_job)
+        await asyncio.to_thread(transcribing.wait, 5)
+        started = time.monotonic()
+        assert await asyncio.wait_for(jobs.submit(io_job), 1) == 'ioio'
+        assert time.monotonic() - started < 0.5
+        assert not whisper.done()
+        release.set()
+        assert await whisper == 'transcript'
+
+    asyncio.run(main())
+
+
+def test_progress_and_report_call_the_callback(jobs):
+    async def main():
+        progress = []
+
+        async def callback(text: str) -> None:
+            progress.append(text)
+
+        def stage(ctx: JobContext) -> None:
+            # from an executor thread
+            ctx.report("processing: half way")
+
+        async def job(ctx: JobContext) -> None:
+            await ctx.progress("processing: downloading ...")
+            # repeated texts are not sent again
+            await ctx.progress("processing: downloading ...")
+            await ctx.run_io(stage, ctx)
+            await asyncio.sleep(0.01)
+            await ctx.progress("processing: complete")
+
+        await jobs.submit(job, callback)
+        assert progress == ["processing: downloading ...", "processing: half way", "processing: complete"]
+
+    asyncio.run(main())
+
+
+def test_failing_progress_callback_does_not_fail_the_job(jobs):
+    async def main():
+        def callback(text: str) -> None:
+            raise RuntimeError("message to edit is gone")
+
+        async def job(ctx: JobContext) -> str:
+            await ctx.progress("processing: downloading ...")
+            return 'done'
+
+        assert await jobs.submit(job, callback) == 'done'
+
+    asyncio.run(main())
+
+
+def test_iterate_io_yields_items_and_raises_errors(jobs):
+    async def main():
+        def items():
+            yield 1
+            yield 2
+            raise ValueError("broken stream")
+
+        async def job(ctx: JobContext) -> list:
+            received = []
+            with pytest.raises(ValueError):
+                async for item in ctx.iterate_io(items):
+                    received.append(item)
+            return received
+
+        assert await jobs.submit(job) == [1, 2]
+
+    asyncio.run(main())
+
+
+def test_iterate_io_stops_the_generator_when_the_consumer_does(jobs, caplog):
+    async def main():
+        closed = threading.Event()
+        produced = []
+
+        def items():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    time.sleep(0.01)
+                    yield i
+            finally:
+                closed.set()
+                raise RuntimeError("cleanup failed")
+
+        async def job(ctx: JobContext) -> None:
+            async for item in ctx.iterate_io(items):
+                if item == 1:
+                    break
+
+        await jobs.submit(job)
+        assert await asyncio.to_thread(closed.wait, 5)
+        # let the producer finish and its error be logged
+        await asyncio.sleep(0.05)
+        assert len(produced) < 10
+
+    asyncio.run(main())
+    assert "failed after its consumer stopped: cleanup failed" in caplog.text
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+
+from benchmarks.fake_telegram import FakeTelegram
+from video_summary_telegram_bot.media import MediaDownloader, MediaFile, MediaLimitError
+
+KIB = 2 ** 10
+
+
+@pytest.fixture
+def upload(tmp_path) -> Path:
+    path = tmp_path / 'voice.ogg'
+    path.write_bytes(os.urandom(300 * KIB))
+    return path
+
+
+def media(file_id: str, file_unique_id: str, file_size=None, duration=None) -> MediaFile:
+    return MediaFile(kind='voice', file_id=file_id, file_unique_id=file_unique_id, file_size=file_size,
+                     duration=duration, mime_type='audio/ogg', file_name=None)
+
+
+def run(server: FakeTelegram, download) -> None:
+    """`download(bot)` with a bot of `server`"""
+    async def main():
+        bot = server.bot()
+        try:
+            await download(bot)
+        finally:
+            await bot.session.close()
+
+    asyncio.run(main())
+
+
+def test_limits_known_from_the_message_are_checked_before_downloading(upload, tmp_path):
+    with FakeTelegram(latency=0) as server:
+        file_id, unique_id = server.add_file(upload)
+
+        async def download(bot):
+            downloader = MediaDownloader(bot, max_bytes=100 * KIB, max_duration=60)
+            with pytest.raises(MediaLimitError, match="too large"):
+                await downloader.download(media(file_id, unique_id, file_size=300 * KIB), tmp_path / 'a.ogg')
+            with pytest.raises(MediaLimitError, match="too long"):
+                await downloader.download(media(file_id, unique_id, duration=61), tmp_path / 'a.ogg')
+            downloader.check(media(file_id, unique_id, file_size=100 * KIB, duration=60))
+
+        run(server, download)
+        assert server.requests == {}
+
+
+def test_a_file_larger_than_announced_is_aborted_while_streaming(upload, tmp_path):
+    with FakeTelegram(latency=0) as server:
+        file_id, unique_id = server.add_file(upload)
+
+        async def download(bot):
+            get_file = bot.get_file
+
+            async def get_file_without_size(file_id: str):
+                # the size is optional in getFile
+                return (await get_file(file_id)).model_copy(update={'file_size': None})
+
+            bot.get_file = get_file_without_size
+            downloader = MediaDownloader(bot, max_bytes=100 * KIB, chunk_size=16 * KIB)
+            with pytest.raises(MediaLimitError):
+                await downloader.download(media(file_id, unique_id), tmp_path / 'cache' / 'a.ogg')
+
+        run(server, download)
+        assert server.file_downloads == 1
+    # the partial download is removed
+    assert list((tmp_path / 'cache').iterdir()) == []
+
+
+def test_concurrent_downloads_of_the_same_file_are_shared(upload, tmp_path):
+    with FakeTelegram(latency=0.05) as server:
+        # every forward of a file has its own file id
+        first = media(*server.add_file(upload))
+        forward = media(*server.add_file(upload))
+        assert first['file_unique_id'] == forward['file_unique_id']
+
+        async def download(bot):
+            downloader = MediaDownloader(bot, chunk_size=16 * KIB)
+            destination = tmp_path / 'cache' / 'a.ogg'
+            paths = await asyncio.gather(downloader.download(first, destination),
+                                         downloader.download(forward, destination))
+            assert paths == [destination, destination]
+            assert destination.read_bytes() == upload.read_bytes()
+
+        run(server, download)
+        assert server.requests['getFile'] == 1
+        assert server.file_downloads == 1
+
+
+def test_a_local_bot_api_server_file_is_hard_linked(upload, tmp_path):
+    with FakeTelegram(latency=0, local=True) as server:
+        file_id, unique_id = server.add_file(upload)
+
+        async def download(bot):
+            downloader = MediaDownloader(bot)
+            destination = await downloader.download(media(file_id, unique_id), tmp_path / 'cache' / 'a.ogg')
+            assert os.path.samefile(destination, upload)
+
+        run(server, download)
+        assert server.file_downloads == 0
+    assert [p.name for p in (tmp_path / 'cache').iterdir()] == ['a.ogg']
@@ -0,0 +1,58 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from video_summary_bot_core.metrics import MetricsRegistry, MetricsServer
+
+
+def test_counters_render_one_sample_per_label_set():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', "requests by result")
+    assert registry.counter('requests_total', "ignored") is requests
+    requests.inc(result='ok', method='sendMessage')
+    requests.inc(2, method='sendMessage', result='ok')
+    requests.inc(0.5, result='say "hi"\n')
+    assert requests.value(result='ok', method='sendMessage') == 3
+    assert registry.render() == (
+        "# HELP requests_total requests by result\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{method="sendMessage",result="ok"} 3\n'
+        'requests_total{result="say \\"hi\\"\\n"} 0.5\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative_and_include_their_bound():
+    registry = MetricsRegistry()
+    seconds = registry.histogram('stage_seconds', "stage wall time", buckets=(1, 0.5))
+    for value in (0.5, 0.75, 3):
+        seconds.observe(value, stage='download')
+    with pytest.raises(ValueError):
+        with seconds.time(stage='summarize'):
+            raise ValueError
+    lines = registry.render().splitlines()
+    assert lines[2:7] == [
+        'stage_seconds_bucket{stage="download",le="0.5"} 1',
+        'stage_seconds_bucket{stage="download",le="1"} 2',
+        'stage_seconds_bucket{stage="download",le="+Inf"} 3',
+        'stage_seconds_sum{stage="download"} 4.25',
+        'stage_seconds_count{stage="download"} 3',
+    ]
+    # timed when the block raised too
+    assert lines[-1] == 'stage_seconds_count{stage="summarize"} 1'
+    assert seconds.samples()[(('stage', 'download'),)] == (4.25, 3)
+
+
+def test_the_server_exposes_the_registry():
+    registry = MetricsRegistry()
+    registry.counter('videos_total', "videos summarized").inc()
+    server = MetricsServer(0, host='127.0.0.1', registry=registry).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert response.read().decode() == registry.render()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.port}/other")
+        assert e.value.code == 404
+    finally:
+        server.stop()
@@ -0,0 +1,112 @@
+import gc
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from video_summary_bot_core import lazy_imports
+from video_summary_bot_core.audio import SAMPLE_RATE
+from video_summary_bot_core.chunked_transcriber import ChunkedTranscriber
+from video_summary_bot_core.model_registry import ModelRegistry
+
+MIB = 2 ** 20
+
+
+class FakeModel:
+    """a Whisper model of `size` bytes, transcribing to one segment per call"""
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.device = SimpleNamespace(type='cpu')
+        self.calls = 0
+        self.busy = False
+        self.seconds = 0.0
+
+    def parameters(self) -> list:
+        return [SimpleNamespace(numel=lambda: self.size, element_size=lambda: 1)]
+
+    def buffers(self) -> list:
+        return []
+
+    def transcribe(self, audio: np.ndarray, **options) -> dict:
+        # two inferences at once on one instance corrupt each other
+        assert not self.busy
+        self.busy = True
+        time.sleep(self.seconds)
+        self.busy = False
+        self.calls += 1
+        return {'segments': [{'start': 0.0, 'end': len(audio) / SAMPLE_RATE, 'text': f"{self.name} {self.calls}"}]}
+
+
+@pytest.fixture
+def loads(monkeypatch) -> list[str]:
+    loaded = []
+
+    def load_model(name: str, download_root=None, device=None) -> FakeModel:
+        loaded.append(name)
+        model = FakeModel(name, {'tiny': 40 * MIB, 'small': 250 * MIB}.get(name, 100 * MIB))
+        model.seconds = 0.2 if name == 'slow' else 0.0
+        return model
+
+    monkeypatch.setattr(lazy_imports, 'whisper', lambda: SimpleNamespace(load_model=load_model))
+    return loaded
+
+
+def test_get_loads_once_and_shares_the_model(loads):
+    registry = ModelRegistry()
+    model = registry.get('tiny', 'cpu')
+    assert registry.get('tiny', 'cpu') is model
+    # replicas are independent copies
+    assert registry.get('tiny', 'cpu', replica=1) is not model
+    assert loads == ['tiny', 'tiny']
+    assert registry.resident_bytes() == 80 * MIB
+
+
+def test_the_least_recently_used_models_are_evicted_for_the_budget(loads):
+    registry = ModelRegistry(memory_budget=300 * MIB)
+    registry.get('tiny', 'cpu')
+    registry.get('base', 'cpu')
+    registry.get('tiny', 'cpu')
+    # 390 MiB: base, used least recently, goes
+    registry.get('small', 'cpu')
+    assert [s['name'] for s in registry.stats()] == ['tiny', 'small']
+    assert registry.evict('tiny', 'cpu')
+    assert not registry.evict('tiny', 'cpu')
+    assert registry.resident_bytes() == 250 * MIB
+
+
+def test_an_evicted_replica_of_a_chunked_transcription_is_released(loads):
+    registry = ModelRegistry(memory_budget=150 * MIB)
+    transcriber = ChunkedTranscriber(lambda replica: registry.get('base', 'cpu', replica=replica),
+                                     workers=1, chunk_seconds=1)
+    audio = np.zeros(5 * SAMPLE_RATE, dtype=np.float32)
+    assert len(transcriber.transcribe(audio)) == 5
+    model = weakref.ref(registry.get('base', 'cpu'))
+    assert model().calls == 5
+
+    # another model needs the budget
+    registry.get('small', 'cpu')
+    gc.collect()
+    assert model() is None
+    # the next chunks get the model from the registry again
+    transcriber.transcribe(audio)
+    assert loads == ['base', 'small', 'base']
+    assert [s['name'] for s in registry.stats()] == ['base']
+
+
+def test_a_job_waits_for_the_warm_up_of_a_preloaded_model(loads):
+    registry = ModelRegistry()
+    preload = threading.Thread(target=registry.preload, args=(['slow'], 'cpu'))
+    preload.start()
+    while not loads:
+        time.sleep(0.001)
+    # asked during the warm-up: given once the warm-up inference is done
+    model = registry.get('slow', 'cpu')
+    model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+    preload.join()
+    assert model.calls == 2
+    assert registry.stats()[0]['warm_up_seconds'] >= 0.2
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from video_summary_bot_core.jobs import JobQueue
+from video_summary_telegram_bot.handlers.on_message_handler import OnMessageHandler
+
+
+def topic(title: str, start: float) -> dict:
+    return {'topic': title, 'summary': "summary", 'timestamp': (start, start + 10), 'ref_url': None}
+
+
+class FakeAi:
+    """records which summary path runs, and on which thread"""
+
+    def __init__(self, needs_whisper: bool, incremental_summary: bool = True):
+        self._needs_whisper = needs_whisper
+        self.incremental_summary = incremental_summary
+        self.calls: list[tuple[str, str]] = []
+        self.first_sent = threading.Event()
+
+    def _call(self, name: str) -> None:
+        self.calls.append((name, threading.current_thread().name.rsplit('_', 1)[0]))
+
+    def needs_audio(self, video_url: str) -> bool:
+        return self._needs_whisper
+
+    def download_audio(self, video_url: str) -> None:
+        self._call('download_audio')
+
+    def needs_whisper(self, video_url: str) -> bool:
+        return self._needs_whisper
+
+    def transcript_windows(self, video_url: str, segments: list[dict]):
+        self._call('transcript_windows')
+        segments.append({'start': 0.0, 'end': 30.0, 'text': "intro"})
+        yield "[0] intro"
+        # the topics of the first window are sent while the second one is transcribed
+        assert self.first_sent.wait(5)
+        segments.append({'start': 30.0, 'end': 70.0, 'text': "later"})
+        yield "[30] later"
+
+    def summarize_window(self, video_url: str, window: str, index: int) -> list[dict]:
+        self._call('summarize_window')
+        start, text = window.split()
+        return [topic(text, float(start.strip('[]')))]
+
+    def merge_windows(self, video_url: str, windows: list[list[dict]], segments: list[dict]) -> list[dict]:
+        self._call('merge_windows')
+        assert len(segments) == 2
+        # timestamps snapped to the segments
+        return [{**t, 'timestamp': (t['timestamp'][0], t['timestamp'][0] + 30)} for w in windows for t in w]
+
+    def transcript_segments(self, video_url: str) -> list[dict]:
+        self._call('transcript_segments')
+        return [{'start': 0.0, 'end': 70.0, 'text': "words"}]
+
+    def generate_summary(self, video_url: str, transcript: list[dict]):
+        self._call('generate_summary')
+        yield from [topic("Later", 60), topic("Intro", 0)]
+
+    stream_summary = generate_summary
+
+
+@pytest.fixture
+def jobs():
+    jobs = JobQueue()
+    yield jobs
+    jobs.shutdown()
+
+
+def process(jobs: JobQueue, ai: FakeAi, stream_summary: bool = True) -> tuple[list[dict], list[dict]]:
+    handler = OnMessageHandler(SimpleNamespace(ai=ai, stream_summary=stream_summary))
+    sent = []
+
+    async def send_topic(t: dict) -> None:
+        sent.append(t)
+        ai.first_sent.set()
+
+    async def main() -> list[dict]:
+        return await jobs.submit(lambda ctx: handler._process_video_url(ctx, "https://youtu.be/video", send_topic))
+
+    return asyncio.run(main()), sent
+
+
+def test_a_video_transcribed_with_whisper_is_summarized_while_it_is_transcribed(jobs):
+    ai = FakeAi(needs_whisper=True)
+    summary, sent = process(jobs, ai)
+    # transcribed on the Whisper executor, summarized on the I/O one
+    assert sorted(ai.calls) == sorted([
+        ('download_audio', 'job-io'), ('transcript_windows', 'job-transcribe'),
+        ('summarize_window', 'job-io'), ('summarize_window', 'job-io'), ('merge_windows', 'job-io'),
+    ])
+    assert [t['topic'] for t in summary] == ["intro", "later"]
+    assert summary[0]['timestamp'] == (0.0, 30.0)
+    # streamed window by window, before the merge
+    assert [t['timestamp'] for t in sent] == [(0.0, 10.0), (30.0, 40.0)]
+    # not streaming: sent with the rest of the summary
+    ai = FakeAi(needs_whisper=True)
+    ai.first_sent.set()
+    assert process(jobs, ai, stream_summary=False)[1] == []
+
+
+def test_transcripts_without_whisper_are_summarized_once_complete(jobs):
+    ai = FakeAi(needs_whisper=False)
+    summary, sent = process(jobs, ai)
+    assert ai.calls == [('transcript_segments', 'job-io'), ('generate_summary', 'job-io')]
+    assert [t['topic'] for t in summary] == ["Intro", "Later"]
+    # streamed in the order they are generated
+    assert [t['topic'] for t in sent] == ["Later", "Intro"]
+
+    ai = FakeAi(needs_whisper=True, incremental_summary=False)
+    process(jobs, ai)
+    assert [name for name, _ in ai.calls] == ['download_audio', 'transcript_segments', 'generate_summary']
+    assert ai.calls[1] == ('transcript_segments', 'job-transcribe')
+
+
+class FakeOutbox:
+    def __init__(self):
+        self.texts: list[str] = []
+        self.replaced: list[list[str]] = []
+
+    def add(self, text: str) -> None:
+        self.texts.append(text)
+
+    async def close(self) -> list:
+        return [SimpleNamespace(message_id=i + 2) for i in range(len(self.texts))]
+
+    async def replace(self, parts: list[str]) -> list:
+        self.replaced.append(parts)
+        return [SimpleNamespace(message_id=i + 2) for i in range(len(parts))]
+
+
+def summarize(jobs: JobQueue, process_summary, reorder_summary: bool = False) -> FakeOutbox:
+    """run `_summarize` with `process_summary(send_topic)` as the job, the outbox of the topics"""
+    outbox = FakeOutbox()
+
+    async def send(chat_id: int, parts: list[str], reply_to_message_id=None) -> list:
+        return [SimpleNamespace(message_id=1)]
+
+    async def wait_status(chat_id: int, message_id: int) -> None:
+        pass
+
+    delivery = SimpleNamespace(send=send, outbox=lambda chat_id: outbox, set_status=lambda *args: None,
+                               wait_status=wait_status)
+    bot = SimpleNamespace(
+        delivery=delivery, jobs=jobs, stream_summary=True, reorder_summary=reorder_summary,
+        summary_messages=SimpleNamespace(add=lambda *args: None), ai=SimpleNamespace(whisper_stats=lambda: None)
+    )
+    message = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=1, from_user=SimpleNamespace(id=1), text="")
+    handler = OnMessageHandler(bot)
+    asyncio.run(handler._summarize(message, "source", lambda ctx, send_topic: process_summary(send_topic)))
+    return outbox
+
+
+def test_streamed_topics_are_replaced_only_when_the_summary_differs(jobs):
+    async def streamed(send_topic) -> list[dict]:
+        topics = [topic("Later", 60), topic("Intro", 0)]
+        for t in topics:
+            await send_topic(t)
+        return sorted(topics, key=lambda x: x['timestamp'][0])
+
+    assert summarize(jobs, streamed).replaced == []
+    assert len(summarize(jobs, streamed, reorder_summary=True).replaced) == 1
+
+    async def merged(send_topic) -> list[dict]:
+        await send_topic(topic("Intro", 0))
+        await send_topic(topic("Intro, continued", 5))
+        return [{**topic("Intro", 0), 'timestamp': (0, 15)}]
+
+    outbox = summarize(jobs, merged)
+    assert len(outbox.texts) == 2
+    assert len(outbox.replaced) == 1 and len(outbox.replaced[0]) == 1
+    assert "Intro" in outbox.replaced[0][0] and "0:00:15" in outbox.replaced[0][0]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from video_summary_bot_core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_run_once():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def transcribe() -> str:
+        calls.append(threading.current_thread().name)
+        release.wait(5)
+        return "transcript"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('video', transcribe))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        time.sleep(0.001)
+    # another key is not held back
+    assert flight.do('other', lambda: "other") == "other"
+    assert flight.in_flight() == 1
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["transcript"] * 4 and len(calls) == 1
+    assert flight.in_flight() == 0
+    # finished: the next call runs again
+    assert flight.do('video', lambda: "again") == "again"
+
+
+def test_every_waiter_gets_the_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail() -> None:
+        started.set()
+        time.sleep(0.05)
+        raise ValueError("Invalid video URL")
+
+    errors = []
+
+    def call() -> None:
+        try:
+            flight.do('video', fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    call()
+    leader.join()
+    assert len(errors) == 2 and errors[0] is errors[1]
+    with pytest.raises(ValueError):
+        flight.do('video', fail)
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAI
+from video_summary_simple.summarizer import (
+    MapReduceSummarizer, Topic, ToolCallAssembler, create_with_retry, merge_topics, split_transcript
+)
+
+RECORDED_SSE = Path(__file__).parent.parent / 'benchmarks' / 'data' / 'add_topic_stream.sse'
+
+
+def line(i: int) -> str:
+    # 35 characters: 9 estimated tokens, 10 with the newline
+    return f"[{i:04d}.0 --> {i + 1:04d}.0] words words w"
+
+
+def test_split_transcript_fills_windows_up_to_the_budget():
+    lines = [line(i) for i in range(7)]
+    windows = split_transcript("\n".join(lines), max_tokens=30)
+    assert [w.splitlines() for w in windows] == [lines[0:3], lines[3:6], lines[6:7]]
+
+
+def test_split_transcript_keeps_every_line_once():
+    transcript = "\n".join(line(i) for i in range(100))
+    for max_tokens in (1, 10, 25, 100, 10 ** 6):
+        windows = split_transcript(transcript, max_tokens)
+        assert "\n".join(windows) == transcript
+    # a line above the budget is a window of its own
+    assert len(split_transcript(transcript, 1)) == 100
+    assert split_transcript(transcript, 10 ** 6) == [transcript]
+    assert split_transcript("", 100) == []
+
+
+def topic(title: str, start: float, end: float, summary: str = "summary") -> Topic:
+    return Topic(topic=title, summary=summary, timestamp=(start, end))
+
+
+def test_merge_topics_joins_a_topic_split_by_a_window_boundary():
+    windows = [
+        [topic("Intro", 0, 60), topic("Battery life", 60, 150, "short")],
+        # overlaps more than half of the shorter one, whatever the title
+        [topic("Charging", 100, 200, "a longer summary"), topic("Pricing", 200, 260)],
+    ]
+    assert merge_topics(windows) == [
+        topic("Intro", 0, 60),
+        topic("Battery life", 60, 200, "a longer summary"),
+        topic("Pricing", 200, 260),
+    ]
+
+
+def test_merge_topics_adjacent_topics_need_a_similar_title():
+    windows = [[topic("Battery life", 0, 100)], [topic("battery life!", 103, 150), topic("Camera", 150, 200)]]
+    assert [t['timestamp'] for t in merge_topics(windows)] == [(0, 150), (150, 200)]
+    # too far apart, or another subject
+    assert len(merge_topics([[topic("Battery life", 0, 100)], [topic("Battery life", 110, 150)]])) == 2
+    assert len(merge_topics([[topic("Battery life", 0, 100)], [topic("Pricing", 102, 150)]])) == 2
+
+
+def test_merge_topics_keeps_overlapping_topics_of_the_same_window():
+    windows = [[topic("Overview", 0, 100), topic("Details", 50, 100)]]
+    assert merge_topics(windows) == windows[0]
+
+
+def test_merge_topics_orders_by_start_and_does_not_modify_its_input():
+    windows = [[topic("Later", 300, 400)], [topic("Earlier", 0, 100), topic("Later again", 350, 420)]]
+    original = json.loads(json.dumps(windows))
+    assert [t['topic'] for t in merge_topics(windows)] == ["Earlier", "Later"]
+    assert json.loads(json.dumps(windows)) == original
+
+
+def delta(index: int, arguments: str = None, name: str = None) -> SimpleNamespace:
+    return SimpleNamespace(index=index, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def test_tool_call_assembler_completes_a_call_when_its_arguments_close():
+    arguments = json.dumps({'topic': "Intro", 'summary': "The {speaker} says \"hi\" [twice]", 'timestamp': [0, 12]})
+    assembler = ToolCallAssembler()
+    assert assembler.feed([delta(0, name='add_')]) == []
+    assert assembler.feed([delta(0, name='topic')]) == []
+    completed = []
+    for i in range(0, len(arguments), 7):
+        completed += assembler.feed([delta(0, arguments[i:i + 7])])
+        if i + 7 < len(arguments):
+            # braces and quotes inside strings do not close the object
+            assert completed == []
+    assert completed == [('add_topic', arguments)]
+    assert assembler.finish() == []
+
+
+def test_tool_call_assembler_interleaved_calls():
+    first = json.dumps({'topic': "A", 'summary': "a", 'timestamp': [0, 1]})
+    second = json.dumps({'topic': "B", 'summary': "b", 'timestamp': [1, 2]})
+    assembler = ToolCallAssembler()
+    assert assembler.feed([delta(0, first[:10], 'add_topic'), delta(1, second[:5], 'add_topic')]) == []
+    assert assembler.feed([delta(1, second[5:]), SimpleNamespace(index=0, function=None)]) == [('add_topic', second)]
+    assert assembler.feed([delta(0, first[10:])]) == [('add_topic', first)]
+    # text after the closing brace is ignored
+    assert assembler.feed([delta(0, ' ')]) == []
+
+
+def test_tool_call_assembler_finish_returns_truncated_calls():
+    assembler = ToolCallAssembler()
+    assembler.feed([delta(0, '{"topic": "Cut', 'add_topic'), delta(1, None, 'add_topic')])
+    assert assembler.finish() == [('add_topic', '{"topic": "Cut')]
+    assert assembler.feed(None) == []
+
+
+def replay(sse: Path) -> list[Topic]:
+    """the topics streamed by the summarizer from a server replaying `sse`"""
+    with FakeOpenAI(replay_sse=str(sse), replay_delay=0) as server:
+        summarizer = MapReduceSummarizer('fake', api_key='fake', base_url=server.base_url, max_retries=0)
+        return list(summarizer.stream("summarize", "[0] words"))
+
+
+def sse_file(path: Path, calls: list[str], fragment: int = 3, done: bool = True) -> Path:
+    """a stream of `calls` (add_topic arguments) in `fragment` character deltas"""
+    chunks = []
+    for index, arguments in enumerate(calls):
+        chunks.append({'tool_calls': [{'index': index, 'id': f"call_{index}", 'type': 'function',
+                                       'function': {'name': 'add_topic', 'arguments': ''}}]})
+        chunks += [{'tool_calls': [{'index': index, 'function': {'arguments': arguments[i:i + fragment]}}]}
+                   for i in range(0, len(arguments), fragment)]
+    lines = [
+        json.dumps({'id': 'chatcmpl-test', 'object': 'chat.completion.chunk', 'created': 0, 'model': 'fake',
+                    'choices': [{'index': 0, 'delta': chunk, 'finish_reason': None}]})
+        for chunk in chunks
+    ]
+    if done:
+        lines.append('[DONE]')
+    path.write_text(''.join(f"data: {line}\n\n" for line in lines))
+    return path
+
+
+def test_stream_replays_a_recorded_stream_of_fragmented_tool_calls():
+    topics = replay(RECORDED_SSE)
+    assert [t['topic'] for t in topics] == ["Introduction", "Scaling inference", "Questions"]
+    # braces, escaped quotes and backslashes inside the strings
+    assert topics[0]['summary'] == 'The host introduces the guest and the {agenda} for the "episode".'
+    assert topics[2]['summary'] == "Audience questions about cost, GPUs and data\\pipelines."
+    assert [t['timestamp'] for t in topics] == [(0, 95), (95, 610), (610, 900)]
+
+
+def test_stream_cut_mid_arguments_keeps_the_complete_topics(tmp_path):
+    calls = [json.dumps({'topic': f"Topic {i}", 'summary': "s", 'timestamp': [i * 10, i * 10 + 10]}) for i in range(3)]
+    cut = sse_file(tmp_path / 'cut.sse', calls[:2] + [calls[2][:20]], done=False)
+    assert [t['topic'] for t in replay(cut)] == ["Topic 0", "Topic 1"]
+
+
+def test_stream_skips_tool_calls_with_missing_arguments(tmp_path):
+    calls = [
+        json.dumps({'topic': "No summary", 'timestamp': [0, 10]}),
+        json.dumps({'topic': "Complete", 'summary': "s", 'timestamp': [10, 20]}),
+        json.dumps({'topic': "No timestamp", 'summary': "s", 'timestamp': []}),
+    ]
+    assert [t['topic'] for t in replay(sse_file(tmp_path / 'missing.sse', calls))] == ["Complete"]
+
+
+def api_error(error: type, status: int, headers: dict = None) -> Exception:
+    # what the errors read of an http response
+    response = SimpleNamespace(status_code=status, headers=headers or {}, request=None)
+    return error("failed", response=response, body=None)
+
+
+class FailingClient:
+    """a client whose `create` raises `errors` one after the other, then answers"""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "completion"
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list[float]:
+    slept = []
+
+    async def sleep(seconds: float) -> None:
+        slept.append(seconds)
+
+    monkeypatch.setattr(asyncio, 'sleep', sleep)
+    # no jitter
+    monkeypatch.setattr(random, 'uniform', lambda low, high: 1.0)
+    return slept
+
+
+def test_create_with_retry_backs_off_on_rate_limits_and_server_errors(sleeps):
+    client = FailingClient(
+        api_error(openai.RateLimitError, 429),
+        api_error(openai.InternalServerError, 503),
+        # the retry-after the server asks for, when longer than the backoff
+        api_error(openai.RateLimitError, 429, {'retry-after': '7'}),
+    )
+    retries = []
+    result = asyncio.run(create_with_retry(client, 'gpt', [], backoff_seconds=0.5,
+                                           on_retry=lambda: retries.append(1)))
+    assert result == "completion"
+    assert client.calls == 4 and len(retries) == 3
+    assert sleeps == [0.5, 1.0, 7.0]
+
+
+def test_create_with_retry_gives_up(sleeps):
+    client = FailingClient(*[api_error(openai.InternalServerError, 500) for _ in range(3)])
+    with pytest.raises(openai.InternalServerError):
+        asyncio.run(create_with_retry(client, 'gpt', [], max_retries=2))
+    assert client.calls == 3 and sleeps == [1.0, 2.0]
+    # a bad request is not retried
+    client = FailingClient(api_error(openai.BadRequestError, 400))
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(create_with_retry(client, 'gpt', []))
+    assert client.calls == 1
@@ -0,0 +1,79 @@
+import threading
+import time
+
+from video_summary_bot_core.artifact_store import ArtifactStore, SUMMARY
+from video_summary_simple.summarizer import Topic
+from video_summary_simple.summary_cache import SummaryCache, summary_key
+
+TOPICS = [Topic(topic="Engines", summary="How rocket engines work", timestamp=(0.0, 60.0))]
+KEY_INPUTS = {'transcript': "[0] hello", 'model': 'gpt-4o', 'system_prompt': "summarize", 'language': None,
+              'tools': [{'name': 'add_topic'}]}
+
+
+def test_summary_key_depends_on_every_input():
+    key = summary_key(**KEY_INPUTS, window_tokens=8000)
+    assert summary_key(**KEY_INPUTS, window_tokens=8000) == key
+    changed = [
+        summary_key(**{**KEY_INPUTS, 'transcript': "[0] hello!"}, window_tokens=8000),
+        summary_key(**{**KEY_INPUTS, 'model': 'gpt-4o-mini'}, window_tokens=8000),
+        summary_key(**{**KEY_INPUTS, 'system_prompt': "summarize briefly"}, window_tokens=8000),
+        summary_key(**{**KEY_INPUTS, 'language': 'en'}, window_tokens=8000),
+        summary_key(**{**KEY_INPUTS, 'tools': [{'name': 'add_topics'}]}, window_tokens=8000),
+        summary_key(**KEY_INPUTS, window_tokens=4000),
+        summary_key(**KEY_INPUTS),
+    ]
+    assert len({key, *changed}) == len(changed) + 1
+
+
+def test_fresh_stale_and_missing_entries(tmp_path):
+    store = ArtifactStore(tmp_path)
+    cache = SummaryCache(store)
+    assert cache.get('key') is None
+    cache.put('key', TOPICS, {'url': 'https://youtu.be/a'})
+    assert cache.get('key') == (TOPICS, True)
+    assert store.info(SUMMARY, 'key')['provenance'] == {'url': 'https://youtu.be/a'}
+    # every entry is stale at once
+    assert SummaryCache(store, ttl=0).get('key') == (TOPICS, False)
+    assert SummaryCache(store, ttl=0, serve_stale=False).get('key') is None
+    assert cache.stats() == {'hits': 1, 'stale_hits': 0, 'misses': 1, 'refreshing': 0}
+
+
+def test_compute_stores_the_summary_without_holding_the_lock(tmp_path):
+    store = ArtifactStore(tmp_path)
+    cache = SummaryCache(store)
+
+    def summarize() -> list[Topic]:
+        # eviction and the other processes are not held up by the summarization
+        with store.lock(SUMMARY, 'key', blocking=False) as locked:
+            assert locked
+        return TOPICS
+
+    assert cache.compute('key', summarize, {'url': 'https://youtu.be/a'}) == TOPICS
+    assert store.info(SUMMARY, 'key')['provenance'] == {'url': 'https://youtu.be/a'}
+    # already fresh: not summarized again
+    assert cache.compute('key', lambda: []) == TOPICS
+
+
+def test_a_stale_entry_is_refreshed_once_in_the_background(tmp_path):
+    store = ArtifactStore(tmp_path)
+    cache = SummaryCache(store, ttl=0)
+    cache.put('key', TOPICS)
+    release = threading.Event()
+    calls = []
+    fresh = [Topic(topic="Engines", summary="Rocket engines, again", timestamp=(0.0, 60.0))]
+
+    def summarize() -> list[Topic]:
+        calls.append(1)
+        release.wait(5)
+        return fresh
+
+    provenance = {'url': 'https://youtu.be/a', 'model': 'gpt-4o'}
+    assert cache.refresh_in_background('key', summarize, provenance)
+    assert not cache.refresh_in_background('key', summarize, provenance)
+    assert cache.stats()['refreshing'] == 1
+    release.set()
+    while cache.stats()['refreshing']:
+        time.sleep(0.01)
+    assert len(calls) == 1
+    assert cache.get('key') == (fresh, False)
+    assert store.info(SUMMARY, 'key')['provenance'] == provenance
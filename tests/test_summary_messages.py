@@ -0,0 +1,28 @@
+import time
+
+from video_summary_telegram_bot.summary_messages import SummaryMessages
+
+
+def test_the_source_of_a_summary_message(tmp_path):
+    messages = SummaryMessages(tmp_path)
+    messages.add(1, [10, 11], "https://youtu.be/a")
+    assert messages.source(1, 11) == "https://youtu.be/a"
+    # another chat, or not a summary
+    assert messages.source(2, 11) is None
+    assert messages.source(1, 12) is None
+    # kept across restarts
+    assert SummaryMessages(tmp_path).source(1, 10) == "https://youtu.be/a"
+
+
+def test_messages_older_than_the_ttl_are_forgotten(tmp_path, monkeypatch):
+    messages = SummaryMessages(tmp_path, ttl=60)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now - 120)
+    messages.add(1, [10], "old")
+    monkeypatch.setattr(time, 'time', lambda: now)
+    assert messages.source(1, 10) is None
+    messages.add(1, [20], "new")
+    assert messages.source(1, 20) == "new"
+    # removed from the database by the next add
+    monkeypatch.setattr(time, 'time', lambda: now - 120)
+    assert messages.source(1, 10) is None
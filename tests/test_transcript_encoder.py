@@ -0,0 +1,62 @@
+from video_summary_simple.summarizer import estimate_tokens
+from video_summary_simple.transcript_encoder import encode_transcript, encode_windows
+
+
+def transcript(count: int, seconds: float = 2.0, words: int = 6) -> list[dict]:
+    return [{'start': i * seconds, 'end': (i + 1) * seconds, 'text': f" segment {i} " + "word " * words}
+            for i in range(count)]
+
+
+def test_segments_are_merged_into_lines_split_at_pauses():
+    segments = transcript(10)
+    segments[6:] = [{**s, 'start': s['start'] + 10.5, 'end': s['end'] + 10.5} for s in segments[6:]]
+    segments[3]['text'] = "  "
+    encoded = encode_transcript(segments, merge_seconds=8)
+    lines = encoded.text.splitlines()
+    # lines of up to 8 s, the blank segment skipped, a new line after the 10 s pause
+    assert [line.split()[0] for line in lines] == ['[0]', '[8]', '[22]']
+    assert lines[0].startswith("[0] segment 0 word") and "segment 3" not in encoded.text
+
+
+def test_a_token_budget_makes_the_lines_longer_without_dropping_words():
+    # a line per 10 s segment, mostly timestamps
+    segments = [{'start': i * 10.0, 'end': i * 10.0 + 10, 'text': "ok"} for i in range(300)]
+    full = encode_transcript(segments)
+    encoded = encode_transcript(segments, token_budget=estimate_tokens(full.text) * 3 // 4)
+    assert encoded.merge_seconds > 15
+    assert estimate_tokens(encoded.text) <= estimate_tokens(full.text) * 3 // 4
+    assert encoded.text.count("ok") == 300 and len(encoded.text.splitlines()) < len(full.text.splitlines())
+    # the words alone are over the budget: only timestamps could go, the resolution is kept
+    assert encode_transcript(segments, token_budget=100).text == full.text
+
+
+def test_snap_moves_timestamps_to_the_original_segments():
+    segments = [{'start': 0.4, 'end': 3.7, 'text': "a"}, {'start': 3.7, 'end': 9.2, 'text': "b"},
+                {'start': 9.9, 'end': 14.1, 'text': "c"}]
+    encoded = encode_transcript(segments)
+    assert encoded.text == "[0] a b c"
+    # line starts are floored, the end given back anywhere inside a segment
+    assert encoded.snap((0, 8)) == (0.4, 9.2)
+    assert encoded.snap((9, 20)) == (9.9, 14.1)
+    assert encode_transcript([]).snap((1, 2)) == (1, 2)
+
+
+def test_windows_are_made_of_whole_chunks_within_the_budget():
+    segments = transcript(120)
+    chunks = [segments[i:i + 10] for i in range(0, len(segments), 10)]
+    into = []
+    windows = list(encode_windows(chunks, window_tokens=300, into=into))
+    assert into == segments
+    assert len(windows) > 1 and all(estimate_tokens(w) <= 300 for w in windows)
+    assert "\n".join(windows).count("segment") == 120
+    # a window is yielded just before the chunk that would not fit
+    first = windows[0].count("segment")
+    assert first % 10 == 0 and windows[0] == encode_transcript(segments[:first]).text
+    assert estimate_tokens(encode_transcript(segments[:first + 10]).text) > 300
+
+
+def test_a_chunk_alone_over_the_budget_is_split():
+    windows = list(encode_windows([transcript(2), transcript(60)], window_tokens=100))
+    assert windows[0] == encode_transcript(transcript(2)).text
+    assert len(windows) > 2 and all(estimate_tokens(w) <= 100 for w in windows)
+    assert list(encode_windows([], window_tokens=100)) == []
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from video_summary_bot_core.artifact_store import TRANSCRIPT
+from video_summary_simple.aibot import AiBot
+from video_summary_simple.transcript_index import TranscriptIndex, tokenize
+
+TEXTS = [
+    "welcome to the channel", "today we review a phone", "the screen is bright",
+    "the battery lasts two days", "charging takes an hour", "the camera is sharp at night",
+    "prices start at five hundred dollars", "thanks for watching",
+]
+
+
+def segments(texts: list[str] = TEXTS, seconds: float = 20.0) -> list[dict]:
+    return [{'start': i * seconds, 'end': (i + 1) * seconds, 'text': text} for i, text in enumerate(texts)]
+
+
+def test_tokenize_stems_and_drops_stopwords():
+    assert tokenize("How much are the prices?") == ['much', 'pric']
+    assert tokenize("Pricing") == tokenize("priced") == ['pric']
+
+
+def test_search_finds_the_windows_with_the_question_words():
+    index = TranscriptIndex.build(segments(), window_seconds=40, stride_seconds=20)
+    excerpts = index.search("How long does the battery last when charging?", k=1)
+    assert [s['text'] for s in excerpts[0]['segments']] == [TEXTS[3], TEXTS[4]]
+    assert (excerpts[0]['start'], excerpts[0]['end']) == (60.0, 100.0)
+    # non-overlapping, in transcript order
+    excerpts = index.search("battery price", k=2)
+    assert [e['start'] for e in excerpts] == [40.0, 120.0]
+    assert all(a['end'] <= b['start'] for a, b in zip(excerpts, excerpts[1:]))
+
+
+def test_search_without_a_known_word_spreads_over_the_video():
+    index = TranscriptIndex.build(segments(), window_seconds=40, stride_seconds=20)
+    excerpts = index.search("zebra", k=2)
+    assert len(excerpts) == 2 and all(e['score'] == 0.0 for e in excerpts)
+    assert excerpts[0]['start'] == 0.0 and excerpts[1]['start'] >= 60.0
+
+
+def test_the_index_is_saved_without_the_segments():
+    index = TranscriptIndex.build(segments(), window_seconds=40, stride_seconds=20)
+    data = json.loads(json.dumps(index.to_json()))
+    loaded = TranscriptIndex.from_json(data, segments())
+    assert loaded.search("camera") == index.search("camera")
+    with pytest.raises(ValueError):
+        TranscriptIndex.from_json(data, segments()[:-1])
+    with pytest.raises(ValueError):
+        TranscriptIndex.from_json({**data, 'version': 0}, segments())
+
+
+def test_ask_only_answers_from_a_cached_transcript(tmp_path, monkeypatch):
+    ai = AiBot(data_dir=tmp_path, openai_model='fake', openai_api_key='fake', whisper_device='cpu',
+               duplicate_threshold=None)
+    monkeypatch.setattr(ai._helper, 'get_video_info', lambda url: {'extractor': 'youtube', 'id': 'abcdefghijk'})
+
+    def transcribe(*args):
+        raise AssertionError("a question started a transcription")
+
+    monkeypatch.setattr(ai, 'transcript_stream', transcribe)
+    monkeypatch.setattr(ai, 'media_transcript_segments', transcribe)
+    monkeypatch.setattr(ai._answerer, 'answer', lambda question, context, language: ("two days", 42))
+    url = "https://www.youtube.com/watch?v=abcdefghijk"
+    with pytest.raises(ValueError):
+        ai.ask(url, "how long does the battery last?")
+    with pytest.raises(ValueError):
+        ai.ask("telegram_upload", "how long does the battery last?")
+
+    with ai.store.write(TRANSCRIPT, 'youtube_abcdefghijk', '.json') as f:
+        f.write(json.dumps(segments()))
+    answer = ai.ask(url, "how long does the battery last?", top_k=1)
+    assert answer['answer'] == "two days"
+    assert answer['sources'][0]['ref_url'] == "https://youtu.be/abcdefghijk?t=40s"
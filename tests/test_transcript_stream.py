@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from video_summary_bot_core.artifact_store import TRANSCRIPT
+from video_summary_simple.aibot import AiBot
+
+
+@pytest.fixture
+def ai(tmp_path) -> AiBot:
+    return AiBot(data_dir=tmp_path, openai_model='fake', openai_api_key='fake', whisper_device='cpu',
+                 duplicate_threshold=None)
+
+
+def chunks(count: int, produced: list, seconds: float = 0.0):
+    try:
+        for i in range(count):
+            time.sleep(seconds)
+            produced.append(i)
+            yield [{'start': float(i), 'end': i + 1.0, 'text': f"chunk {i}"}]
+    finally:
+        produced.append('closed')
+
+
+def locked(ai: AiBot, name: str) -> bool:
+    """whether the transcript lock is held elsewhere"""
+    acquired = threading.Event()
+
+    def acquire() -> None:
+        with ai.store.lock(TRANSCRIPT, name):
+            acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+    return not acquired.wait(2)
+
+
+def test_the_lock_is_not_held_while_the_consumer_works_on_a_chunk(ai):
+    produced = []
+    stream = ai._cached_transcript_stream('talk', lambda: chunks(3, produced), {'url': 'talk'})
+    assert next(stream)[0]['text'] == "chunk 0"
+    # the consumer is busy with the first chunk: the transcription goes on, and is cached
+    deadline = time.monotonic() + 2
+    while ai.store.get(TRANSCRIPT, 'talk') is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ai.store.get(TRANSCRIPT, 'talk') is not None
+    assert not locked(ai, 'talk')
+    assert [s['text'] for segments in stream for s in segments] == ["chunk 1", "chunk 2"]
+    # cached: read at once
+    assert len(list(ai._cached_transcript_stream('talk', lambda: chunks(3, []), {}))) == 1
+
+
+def test_a_consumer_going_away_stops_the_transcription(ai):
+    produced = []
+    stream = ai._cached_transcript_stream('talk', lambda: chunks(5, produced, 0.05), {'url': 'talk'})
+    next(stream)
+    stream.close()
+    # stopped after the chunk being transcribed, not cached as a complete transcript
+    assert produced[-1] == 'closed' and len(produced) < 5
+    assert ai.store.get(TRANSCRIPT, 'talk') is None
+    assert not locked(ai, 'talk')
+
+
+def test_transcription_errors_reach_the_consumer(ai):
+    def failing():
+        yield [{'start': 0.0, 'end': 1.0, 'text': "first"}]
+        raise RuntimeError("whisper failed")
+
+    stream = ai._cached_transcript_stream('talk', failing, {'url': 'talk'})
+    assert next(stream)[0]['text'] == "first"
+    with pytest.raises(RuntimeError):
+        next(stream)
+    assert not locked(ai, 'talk')
@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+import pytest
+
+from video_summary_bot_core import lazy_imports
+from video_summary_bot_core.transcription_profiles import (
+    PROFILES, FAST, BALANCED, ACCURATE, whisper_language, whisper_options
+)
+
+
+@pytest.fixture(autouse=True)
+def whisper_languages(monkeypatch):
+    # a part of whisper.tokenizer.LANGUAGES, whisper itself takes seconds to import
+    languages = {'en': 'english', 'pt': 'portuguese', 'zh': 'chinese', 'he': 'hebrew', 'yue': 'cantonese'}
+    monkeypatch.setattr(lazy_imports, 'whisper', lambda: SimpleNamespace(tokenizer=SimpleNamespace(LANGUAGES=languages)))
+
+
+@pytest.mark.parametrize('language, expected', [
+    ('en', 'en'),
+    ('en-US', 'en'),
+    ('pt_BR', 'pt'),
+    ('zh-Hans', 'zh'),
+    ('EN-gb', 'en'),
+    ('yue', 'yue'),
+    # unknown to Whisper: detected from the audio
+    ('iw', None),
+    ('und', None),
+    ('', None),
+    (None, None),
+])
+def test_whisper_language(language, expected):
+    assert whisper_language(language) == expected
+
+
+def test_whisper_options_pins_the_normalized_language():
+    assert whisper_options(PROFILES[FAST], 'en-US')['language'] == 'en'
+    assert whisper_options(PROFILES[BALANCED], 'xx-YY')['language'] is None
+    # the accurate profile lets Whisper detect the language
+    assert whisper_options(PROFILES[ACCURATE], 'en')['language'] is None
+
+
+def test_only_the_fast_profile_picks_its_own_model():
+    # None: the configured Whisper model
+    assert PROFILES[BALANCED]['model'] is None
+    assert PROFILES[ACCURATE]['model'] is None
@@ -0,0 +1,65 @@
+import numpy as np
+
+from video_summary_bot_core.audio import SAMPLE_RATE
+from video_summary_bot_core.vad import split_points, window_points
+from video_summary_bot_core.whisper_scheduler import BatchedWhisperScheduler
+
+
+def speech(pauses: list[tuple[float, float]], seconds: float) -> np.ndarray:
+    """noise (the words) with silent `pauses` (start, end in seconds)"""
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, int(seconds * SAMPLE_RATE)).astype(np.float32)
+    for start, end in pauses:
+        audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] = 0
+    return audio
+
+
+def in_pause(sample: int, pauses: list[tuple[float, float]]) -> bool:
+    return any(start <= sample / SAMPLE_RATE <= end for start, end in pauses)
+
+
+def test_window_points_cut_at_the_pauses():
+    pauses = [(27.0, 27.6), (54.0, 54.5), (81.0, 81.8), (108.0, 108.4)]
+    audio = speech(pauses, 120)
+    boundaries = window_points(audio, max_seconds=30, search_seconds=5)
+    assert boundaries[0] == 0 and boundaries[-1] == len(audio)
+    assert all(0 < stop - start <= 30 * SAMPLE_RATE for start, stop in zip(boundaries, boundaries[1:]))
+    assert len(boundaries) == 6
+    assert all(in_pause(b, pauses) for b in boundaries[1:-1])
+
+
+def test_window_points_without_pauses_never_exceed_the_window():
+    audio = speech([], 95)
+    boundaries = window_points(audio, max_seconds=30)
+    assert all(0 < stop - start <= 30 * SAMPLE_RATE for start, stop in zip(boundaries, boundaries[1:]))
+    assert window_points(audio[:30 * SAMPLE_RATE]) == [0, 30 * SAMPLE_RATE]
+    assert window_points(audio[:0]) == [0, 0]
+
+
+def test_split_points_cut_at_the_pauses():
+    pauses = [(55.0, 56.0), (118.0, 119.0)]
+    audio = speech(pauses, 170)
+    boundaries = split_points(audio, chunk_seconds=60, search_seconds=10)
+    assert len(boundaries) == 4
+    assert all(in_pause(b, pauses) for b in boundaries[1:-1])
+
+
+def test_scheduler_transcribes_windows_cut_at_the_pauses(monkeypatch):
+    pauses = [(26.0, 27.0), (53.0, 54.0)]
+    audio = speech(pauses, 70)
+    scheduler = BatchedWhisperScheduler(lambda: None, batch_size=4, max_wait=0.01)
+    windows = []
+
+    def decode_batch(batch: list[np.ndarray], options: dict) -> list[list[dict]]:
+        windows.extend(len(w) for w in batch)
+        return [[{'start': 0.0, 'end': len(w) / SAMPLE_RATE, 'text': f"window {len(windows)}"}] for w in batch]
+
+    monkeypatch.setattr(scheduler, '_decode_batch', decode_batch)
+    try:
+        segments = scheduler.transcribe(audio)
+    finally:
+        scheduler.stop()
+    assert len(windows) == 3 and sum(windows) == len(audio)
+    # segments stitched end to end at the pauses
+    assert segments[0]['start'] == 0.0 and segments[-1]['end'] == len(audio) / SAMPLE_RATE
+    assert all(a['end'] == b['start'] for a, b in zip(segments, segments[1:]))
+    assert all(in_pause(int(s['end'] * SAMPLE_RATE), pauses) for s in segments[:-1])
@@ -0,0 +1,103 @@
+import http.server
+import os
+import threading
+
+import pytest
+
+from video_summary_bot_core import metrics
+from video_summary_bot_core.artifact_store import ArtifactStore, VIDEO_INFO
+from video_summary_bot_core.generic_helper import GenericHelper
+
+AUDIO = os.urandom(64 * 1024)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    requests: list[str] = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/mp4')
+        self.send_header('Content-Length', str(len(AUDIO)))
+        self.end_headers()
+        self.wfile.write(AUDIO)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_reuses_the_resolved_video_info(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/talk.m4a"
+    helper = GenericHelper(device='cpu', data_dir=tmp_path)
+    info = helper.get_video_info(url)
+    assert (info['extractor'], info['audio_format']['ext']) == ('generic', 'm4a')
+    assert len(_Handler.requests) == 1
+
+    audio_file = helper.video2audio_file(url, tmp_path / 'audio')
+    assert audio_file.name == 'audio.m4a'
+    assert audio_file.read_bytes() == AUDIO
+    # the download itself, not another extraction
+    assert len(_Handler.requests) == 2
+
+    # resolved by another process: the info is on disk, the download resolves the url again
+    helper = GenericHelper(device='cpu', data_dir=tmp_path)
+    assert helper.get_video_info(url) == info
+    assert helper.video_info_cache.stats() == {'hits': 1, 'misses': 0, 'entries': 1}
+    helper.video2audio_file(url, tmp_path / 'again')
+    assert len(_Handler.requests) == 4
+
+
+def test_video_info_lookups_are_counted_in_the_metrics(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/talk.m4a"
+
+    def lookups() -> tuple[float, float]:
+        return tuple(metrics.CACHE_REQUESTS.value(cache='video_info', result=r) for r in ('hit', 'miss'))
+
+    before = lookups()
+    helper = GenericHelper(device='cpu', data_dir=tmp_path)
+    helper.get_video_info(url)
+    helper.get_video_info(url)
+    # from the file written by the first helper
+    GenericHelper(device='cpu', data_dir=tmp_path).get_video_info(url)
+    hits, misses = (after - b for after, b in zip(lookups(), before))
+    assert (hits, misses) == (2, 1)
+    assert helper.video_info_cache.stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+    assert "video_info cache: " in metrics.breakdown()
+
+
+def test_video_info_files_are_evicted_with_the_artifacts(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/talk.m4a"
+    store = ArtifactStore(tmp_path)
+    GenericHelper(device='cpu', data_dir=tmp_path, store=store).get_video_info(url)
+    assert store.stats()['kinds'][VIDEO_INFO]['count'] == 1
+
+    assert store.evict(max_bytes=0)['removed'] == 1
+    assert VIDEO_INFO not in store.stats()['kinds']
+    assert not list((tmp_path / 'artifacts' / VIDEO_INFO).rglob('*.json'))
+    # resolved again
+    helper = GenericHelper(device='cpu', data_dir=tmp_path, store=store)
+    helper.get_video_info(url)
+    assert helper.video_info_cache.stats()['misses'] == 1
+
+
+def test_a_single_video_expanded_is_not_extracted_again(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/talk.m4a"
+    helper = GenericHelper(device='cpu', data_dir=tmp_path)
+    assert helper.expand_playlist(url) == [url]
+    requests = len(_Handler.requests)
+    assert helper.get_video_info(url)['extractor'] == 'generic'
+    audio_file = helper.video2audio_file(url, tmp_path / 'audio')
+    assert audio_file.read_bytes() == AUDIO
+    # only the download
+    assert len(_Handler.requests) == requests + 1
+    assert helper.video_info_cache.stats() == {'hits': 1, 'misses': 0, 'entries': 1}
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import aiohttp
+from aiogram import Bot, Dispatcher, types
+
+from video_summary_bot_core import metrics
+from video_summary_telegram_bot.webhook import WebhookServer, default_secret_token
+
+SECRET = default_secret_token("123456:TEST")
+
+
+def update(update_id: int, text: str) -> dict:
+    user = {'id': 1, 'is_bot': False, 'first_name': "user"}
+    message = {'message_id': update_id, 'from': user, 'chat': {'id': 1, 'type': 'private'},
+               'date': int(time.time()), 'text': text}
+    return {'update_id': update_id, 'message': message}
+
+
+def test_webhook_server_authenticates_and_acknowledges_updates_at_once():
+    async def main():
+        release = asyncio.Event()
+        handled = []
+        dispatcher = Dispatcher()
+
+        @dispatcher.message()
+        async def on_message(message: types.Message) -> None:
+            # a long job
+            await release.wait()
+            handled.append(message.text)
+
+        bot = Bot("123456:TEST")
+        server = await WebhookServer(dispatcher, bot, host='127.0.0.1', port=0, secret_token=SECRET,
+                                     health=lambda: {'ml_stack_ready': True}).start()
+        url = f"http://127.0.0.1:{server.port}"
+        try:
+            async with aiohttp.ClientSession() as session:
+                unauthorized = metrics.WEBHOOK_UPDATES.value(result='unauthorized')
+                for headers in ({}, {'X-Telegram-Bot-Api-Secret-Token': 'wrong'}):
+                    async with session.post(url + server.path, json=update(1, "forged"), headers=headers) as r:
+                        assert r.status == 401
+                assert metrics.WEBHOOK_UPDATES.value(result='unauthorized') == unauthorized + 2
+
+                async with session.post(url + server.path, json=update(2, "https://youtu.be/video"),
+                                        headers={'X-Telegram-Bot-Api-Secret-Token': SECRET}) as r:
+                    assert r.status == 200
+                # acknowledged before the handler is done
+                assert handled == []
+                release.set()
+                for _ in range(100):
+                    if handled:
+                        break
+                    await asyncio.sleep(0.01)
+                assert handled == ["https://youtu.be/video"]
+
+                async with session.get(url + '/health') as r:
+                    assert r.status == 200
+                    assert await r.json() == {'status': 'ok', 'ml_stack_ready': True}
+                async with session.get(url + '/metrics') as r:
+                    assert r.status == 200
+                    assert r.headers['Content-Type'].startswith('text/plain')
+                    assert 'result="unauthorized"' in await r.text()
+        finally:
+            await server.stop()
+            await bot.session.close()
+
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from video_summary_bot_core import lazy_imports
+from video_summary_bot_core.audio import SAMPLE_RATE
+from video_summary_bot_core.base_helper import BaseHelper
+from video_summary_bot_core.model_registry import ModelRegistry
+from video_summary_bot_core.whisper_scheduler import BatchedWhisperScheduler
+
+
+@pytest.fixture
+def fake_whisper(monkeypatch):
+    # the mel of a window is its first sample: the fake decoder knows which window it decodes
+    monkeypatch.setattr(lazy_imports, 'whisper', lambda: SimpleNamespace(
+        pad_or_trim=lambda audio: audio,
+        log_mel_spectrogram=lambda audio, n_mels: SimpleNamespace(numpy=lambda: np.full((n_mels, 2), audio[0]))
+    ))
+
+
+@pytest.fixture
+def scheduler(fake_whisper):
+    scheduler = BatchedWhisperScheduler(lambda: SimpleNamespace(dims=SimpleNamespace(n_mels=2)),
+                                        batch_size=4, max_wait=0.05)
+    scheduler.decoded = []
+
+    def decode(model, mel: np.ndarray, options: dict, temperature: float) -> list[SimpleNamespace]:
+        values = [int(m[0, 0]) for m in mel]
+        scheduler.decoded.append((options['language'], temperature, values))
+        # window 1 loops at low temperatures, window 2 is silence
+        return [SimpleNamespace(
+            value=v,
+            temperature=temperature,
+            compression_ratio=3.0 if v == 1 and temperature < 0.4 else 1.5,
+            avg_logprob=-2.0 if v == 2 else -0.3,
+            no_speech_prob=0.9 if v == 2 else 0.1
+        ) for v in values]
+
+    scheduler._decode = decode
+    scheduler._segments = lambda model, result, seconds: [
+        {'start': 0.0, 'end': seconds, 'text': f"{result.value} at {result.temperature}"}
+    ]
+    yield scheduler
+    scheduler.stop()
+
+
+def window(value: float, seconds: float = 1.0) -> np.ndarray:
+    return np.full(int(seconds * SAMPLE_RATE), value, dtype=np.float32)
+
+
+def test_windows_failing_the_thresholds_are_decoded_again_at_the_next_temperature(scheduler):
+    futures = [scheduler.submit_window(window(v), temperature=(0.0, 0.4, 0.8)) for v in (0, 1, 2)]
+    texts = [[s['text'] for s in f.result()] for f in futures]
+    assert texts == [["0 at 0.0"], ["1 at 0.4"], []]
+    # only the looping window again, the silent one is dropped rather than retried
+    assert scheduler.decoded == [(None, 0.0, [0, 1, 2]), (None, 0.4, [1])]
+    assert scheduler.stats()['fallbacks'] == 1
+    assert scheduler.stats()['windows'] == 3
+
+
+def test_the_last_temperature_is_kept_and_a_single_one_never_retries(scheduler):
+    futures = [scheduler.submit_window(window(1), temperature=0.0), scheduler.submit_window(window(1))]
+    assert [s['text'] for s in futures[0].result()] == ["1 at 0.0"]
+    assert [s['text'] for s in futures[1].result()] == ["1 at 0.4"]
+    # the default schedule is whisper.transcribe's
+    assert [t for _, t, _ in scheduler.decoded] == [0.0, 0.0, 0.2, 0.4]
+
+
+def test_a_batch_holds_windows_with_the_same_options(scheduler):
+    futures = [scheduler.submit_window(window(v), language=language, temperature=0.0)
+               for v, language in ((0, 'en'), (3, 'de'), (4, 'en'), (5, 'de'))]
+    for future in futures:
+        future.result()
+    assert sorted(scheduler.decoded) == [('de', 0.0, [3, 5]), ('en', 0.0, [0, 4])]
+    assert scheduler.stats()['batches'] == 2
+
+
+def test_transcribe_iter_yields_the_windows_as_they_are_decoded(scheduler):
+    decode = scheduler._decode
+    release = threading.Event()
+
+    def slow_decode(model, mel, options, temperature):
+        # the second batch waits until the first one is consumed
+        if scheduler.decoded:
+            release.wait(2)
+        return decode(model, mel, options, temperature)
+
+    scheduler._decode = slow_decode
+    # 100 s of constant audio: 4 windows, in batches of up to 4 submitted at once
+    scheduler._batch_size = 2
+    steps = scheduler.transcribe_iter(window(0, 100), temperature=0.0)
+    end, segments = next(steps)
+    assert len(segments) == 2 and end < 100
+    release.set()
+    rest = list(steps)
+    assert rest[-1][0] == 100
+    starts = [s['start'] for s in segments + [s for _, step in rest for s in step]]
+    assert len(starts) == 4 and starts == sorted(starts)
+
+
+def test_transcribe_iter_drops_the_windows_of_a_consumer_gone_away(scheduler):
+    decode = scheduler._decode
+    scheduler._decode = lambda *args: (time.sleep(0.05), decode(*args))[1]
+    scheduler._batch_size = 1
+    steps = scheduler.transcribe_iter(window(0, 300), temperature=0.0)
+    next(steps)
+    steps.close()
+    time.sleep(0.2)
+    assert scheduler.stats()['windows'] < 10
+
+
+def test_helpers_share_one_scheduler_per_model():
+    registry = ModelRegistry()
+    first = BaseHelper('base', device='cpu', batch_size=4, model_registry=registry)
+    second = BaseHelper('base', device='cpu', batch_size=8, model_registry=registry)
+    assert first.batch_scheduler is second.batch_scheduler
+    assert BaseHelper('base', device='cpu', model_registry=registry).batch_scheduler is None
@@ -0,0 +1,309 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, TypedDict, Iterator, IO, Any, Callable
+
+from video_summary_bot_core.fs import atomic_write, file_lock
+
+__all__ = [
+    'Artifact', 'ArtifactStore', 'AUDIO', 'TRANSCRIPT', 'PARTIAL_TRANSCRIPT', 'TRANSCRIPT_INDEX', 'SUMMARY',
+    'VIDEO_INFO',
+]
+
+AUDIO = 'audio'
+TRANSCRIPT = 'transcript'
+# checkpoint of a transcription in progress
+PARTIAL_TRANSCRIPT = 'partial_transcript'
+# retrieval index of a transcript, for questions about the video
+TRANSCRIPT_INDEX = 'transcript_index'
+SUMMARY = 'summary'
+# resolved video metadata (VideoInfoCache), named after the hash of the url
+VIDEO_INFO = 'video_info'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    provenance TEXT NOT NULL DEFAULT '{}',
+    PRIMARY KEY (kind, name)
+);
+CREATE INDEX IF NOT EXISTS artifacts_last_access ON artifacts (last_access);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# files written next to the data_dir root before the store existed: `{extractor}_{video_id}.{webm,json}`
+_FLAT_KINDS = {'.webm': AUDIO, '.json': TRANSCRIPT}
+_UNSAFE_RE = re.compile(r'[^\w.-]')
+
+
+class Artifact(TypedDict):
+    kind: str
+    name: str
+    path: str
+    size: int
+    created_at: float
+    last_access: float
+    # what produced it: source url, tool, model, ...
+    provenance: dict[str, Any]
+
+
+class ArtifactStore:
+    """
+    Index of the files cached under `data_dir` (audio, transcripts, summaries, ...) in SQLite.
+    Files live in sharded directories `data_dir/artifacts/<kind>/<xx>/<yy>/`, the index records their
+    size, last access and provenance, and `evict` keeps the total under `max_bytes` (least recently
+    used first) and drops entries not accessed for `ttl` seconds.
+    The database is shared by every process using the same `data_dir`.
+    Two other databases live in `data_dir`, outside of `max_bytes`: `fingerprints.sqlite3` (pruned
+    with the transcripts through an eviction callback, see `add_eviction_callback`) and
+    `summary_messages.sqlite3` of the Telegram bot (expired after its own ttl).
+    """
+    _root: Path
+    _db_path: Path
+    _max_bytes: Optional[int]
+    _ttl: Optional[float]
+
+    def __init__(self, data_dir: str | Path, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        self._data_dir = Path(data_dir)
+        self._root = self._data_dir / 'artifacts'
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._db_path = self._data_dir / 'artifacts.sqlite3'
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._eviction_thread: Optional[threading.Thread] = None
+        self._eviction_callbacks: list[Callable[[], Any]] = []
+        self._stop = threading.Event()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @property
+    def data_dir(self) -> Path:
+        return self._data_dir
+
+    def path_for(self, kind: str, name: str, ext: str = '') -> Path:
+        """where the artifact file goes, the directory is created"""
+        digest = hashlib.sha1(f"{kind}/{name}".encode('utf-8')).hexdigest()
+        directory = self._root / kind / digest[:2] / digest[2:4]
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f"{_UNSAFE_RE.sub('_', name)}{ext}"
+
+    def get(self, kind: str, name: str) -> Optional[Path]:
+        """the artifact file, None if unknown or deleted behind our back; the access time is updated"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT path FROM artifacts WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+            if row is None:
+                return None
+            path = self._data_dir / row[0]
+            if not path.exists():
+                conn.execute('DELETE FROM artifacts WHERE kind = ? AND name = ?', (kind, name))
+                return None
+            conn.execute('UPDATE artifacts SET last_access = ? WHERE kind = ? AND name = ?',
+                         (time.time(), kind, name))
+        return path
+
+    def info(self, kind: str, name: str) -> Optional[Artifact]:
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM artifacts WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+        return self._artifact(row) if row is not None else None
+
+    @contextlib.contextmanager
+    def lock(self, kind: str, name: str, blocking: bool = True) -> Iterator[bool]:
+        """cross-process lock for producing the artifact, yields whether it is held (see `file_lock`)"""
+        with file_lock(self.path_for(kind, name), blocking) as locked:
+            yield locked
+
+    def add(self, kind: str, name: str, path: str | Path, provenance: Optional[dict] = None) -> Path:
+        """index a finished file, moving it into the store (keeping its extension) if it is elsewhere"""
+        path = Path(path)
+        target = self.path_for(kind, name, path.suffix)
+        if path.resolve() != target.resolve():
+            os.replace(path, target)
+        self._index(kind, name, target, provenance)
+        return target
+
+    @contextlib.contextmanager
+    def write(self, kind: str, name: str, ext: str, provenance: Optional[dict] = None,
+              mode: str = 'w') -> Iterator[IO]:
+        """atomically write the artifact file and index it"""
+        target = self.path_for(kind, name, ext)
+        with atomic_write(target, mode) as f:
+            yield f
+        self._index(kind, name, target, provenance)
+
+    def remove(self, kind: str, name: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute('SELECT path FROM artifacts WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM artifacts WHERE kind = ? AND name = ?', (kind, name))
+        (self._data_dir / row[0]).unlink(missing_ok=True)
+        with self.lock(kind, name, blocking=False) as locked:
+            if locked:
+                self._unlink_lock(kind, name)
+        return True
+
+    def evict(self, max_bytes: Optional[int] = None, ttl: Optional[float] = None) -> dict:
+        """
+        delete artifacts not accessed for `ttl` seconds, then the least recently used ones until the
+        total size fits `max_bytes` (both default to the store settings); artifacts locked by their
+        producer, or accessed meanwhile, are kept until the next run
+        """
+        max_bytes = self._max_bytes if max_bytes is None else max_bytes
+        ttl = self._ttl if ttl is None else ttl
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT kind, name, path, size, last_access FROM artifacts ORDER BY last_access'
+            ).fetchall()
+        expired_before = time.time() - ttl if ttl is not None else None
+        total = sum(row[3] for row in rows)
+        removed = 0
+        freed = 0
+        skipped = 0
+        for kind, name, path, size, last_access in rows:
+            expired = expired_before is not None and last_access < expired_before
+            # least recently used first: once one is kept, the newer ones are too
+            if not expired and (max_bytes is None or total <= max_bytes):
+                break
+            if self._evict_one(kind, name, path, last_access):
+                removed += 1
+                freed += size
+                total -= size
+            else:
+                skipped += 1
+        if removed or skipped:
+            logging.info(f"evicted {removed} artifacts, {freed / 2 ** 20:.1f} MiB freed, {skipped} in use kept")
+        for callback in self._eviction_callbacks:
+            callback()
+        return {'removed': removed, 'freed_bytes': freed, 'skipped': skipped}
+
+    def add_eviction_callback(self, callback: Callable[[], Any]) -> None:
+        """call `callback` after every `evict` run, to drop what refers to evicted artifacts (fingerprints, ...)"""
+        self._eviction_callbacks.append(callback)
+
+    def _evict_one(self, kind: str, name: str, path: str, last_access: float) -> bool:
+        """delete the artifact unless it is locked or was accessed after `last_access`"""
+        with self.lock(kind, name, blocking=False) as locked:
+            if not locked:
+                return False
+            with self._connect() as conn:
+                deleted = conn.execute('DELETE FROM artifacts WHERE kind = ? AND name = ? AND last_access = ?',
+                                       (kind, name, last_access)).rowcount
+            if deleted:
+                (self._data_dir / path).unlink(missing_ok=True)
+                self._unlink_lock(kind, name)
+            return bool(deleted)
+
+    def _unlink_lock(self, kind: str, name: str) -> None:
+        """
+        remove the lock file of an artifact gone, while holding it: a process already waiting on it
+        may then produce the artifact alongside the next one, the atomic writes keep that safe
+        """
+        lock_path = self.path_for(kind, name)
+        lock_path.with_name(f"{lock_path.name}.lock").unlink(missing_ok=True)
+
+    def start_eviction(self, interval: float = 600.0) -> None:
+        """run `evict` every `interval` seconds on a daemon thread"""
+        if self._eviction_thread is not None or (self._max_bytes is None and self._ttl is None):
+            return
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.evict()
+                except (sqlite3.Error, OSError) as e:
+                    logging.warning(f"artifact eviction failed: {e}")
+
+        self._eviction_thread = threading.Thread(target=run, name='artifact-eviction', daemon=True)
+        self._eviction_thread.start()
+
+    def stop_eviction(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        """count and bytes per kind, and in total"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT kind, COUNT(*), COALESCE(SUM(size), 0), MIN(last_access) FROM artifacts GROUP BY kind'
+            ).fetchall()
+        kinds = {kind: {'count': count, 'bytes': size, 'oldest_access': oldest} for kind, count, size, oldest in rows}
+        return {
+            'kinds': kinds,
+            'count': sum(k['count'] for k in kinds.values()),
+            'bytes': sum(k['bytes'] for k in kinds.values()),
+            'max_bytes': self._max_bytes,
+            'ttl': self._ttl,
+        }
+
+    def migrate_flat_files(self) -> int:
+        """
+        move the `{extractor}_{video_id}.webm/.json` files of the flat data_dir layout (and the
+        `summaries/` directory) into the store, once per data_dir
+        """
+        with file_lock(self._db_path), self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'flat_files_migrated'").fetchone():
+                return 0
+            migrated = 0
+            flat = [(_FLAT_KINDS.get(path.suffix), path) for path in sorted(self._data_dir.iterdir())]
+            # summaries cached before the store, named after their key
+            flat += [(SUMMARY, path) for path in sorted((self._data_dir / 'summaries').glob('*.json'))]
+            for kind, path in flat:
+                if kind is None or not path.is_file() or path.name.startswith('.'):
+                    continue
+                name = path.stem
+                target = self.path_for(kind, name, path.suffix)
+                os.replace(path, target)
+                self._insert(conn, kind, name, target, {'migrated_from': path.name})
+                path.with_name(f"{path.name}.lock").unlink(missing_ok=True)
+                migrated += 1
+            conn.execute("INSERT INTO meta (key, value) VALUES ('flat_files_migrated', ?)", (str(time.time()),))
+        if migrated:
+            logging.info(f"migrated {migrated} cached files into the artifact store")
+        return migrated
+
+    def _index(self, kind: str, name: str, path: Path, provenance: Optional[dict]) -> None:
+        with self._connect() as conn:
+            self._insert(conn, kind, name, path, provenance)
+
+    def _insert(self, conn: sqlite3.Connection, kind: str, name: str, path: Path, provenance: Optional[dict]) -> None:
+        now = time.time()
+        previous = conn.execute('SELECT path FROM artifacts WHERE kind = ? AND name = ?', (kind, name)).fetchone()
+        # added again with another extension: the old file is no longer indexed, not kept on disk
+        if previous is not None and self._data_dir / previous[0] != path:
+            (self._data_dir / previous[0]).unlink(missing_ok=True)
+        conn.execute(
+            'INSERT OR REPLACE INTO artifacts (kind, name, path, size, created_at, last_access, provenance) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (kind, name, str(path.relative_to(self._data_dir)), path.stat().st_size, now, now,
+             json.dumps(provenance or {}))
+        )
+
+    @staticmethod
+    def _artifact(row: tuple) -> Artifact:
+        kind, name, path, size, created_at, last_access, provenance = row
+        return Artifact(kind=kind, name=name, path=path, size=size, created_at=created_at,
+                        last_access=last_access, provenance=json.loads(provenance))
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a short lived connection per operation: usable from any thread, and from several processes
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
@@ -0,0 +1,106 @@
+import contextlib
+import os
+import re
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+__all__ = ['SAMPLE_RATE', 'decoded_audio', 'iter_audio_chunks', 'audio_duration', 'probe_duration']
+
+# whisper works on 16 kHz mono float32 samples
+SAMPLE_RATE = 16000
+_BYTES_PER_SAMPLE = 4
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+
+
+def _ffmpeg_decode_command(path: str | Path, output: str, sample_rate: int) -> list[str]:
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", str(path),
+        "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(sample_rate),
+        "-y", output,
+    ]
+
+
+@contextlib.contextmanager
+def decoded_audio(
+        path: str | Path,
+        sample_rate: int = SAMPLE_RATE,
+        tmp_dir: Optional[str | Path] = None
+) -> Iterator[np.ndarray]:
+    """
+    Decode an audio/video file once, straight to mono float32 PCM, and expose it as a memory-mapped array.
+    ffmpeg writes the samples to a temporary file, so peak RSS does not grow with the file length;
+    the file is removed when the context exits.
+    """
+    fd, raw_path = tempfile.mkstemp(suffix='.f32', dir=tmp_dir)
+    os.close(fd)
+    try:
+        try:
+            subprocess.run(_ffmpeg_decode_command(path, raw_path, sample_rate), check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"failed to decode audio {path}: {e.stderr.decode(errors='replace')}") from e
+        if os.path.getsize(raw_path) == 0:
+            yield np.zeros(0, dtype=np.float32)
+        else:
+            # copy-on-write: torch wants writable arrays, pages are only copied if actually written
+            yield np.memmap(raw_path, dtype=np.float32, mode='c')
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(raw_path)
+
+
+def iter_audio_chunks(
+        path: str | Path,
+        chunk_seconds: float = 30.0,
+        sample_rate: int = SAMPLE_RATE
+) -> Iterator[np.ndarray]:
+    """decode a file with ffmpeg and yield fixed-size float32 chunks (the last one may be shorter)"""
+    chunk_bytes = int(chunk_seconds * sample_rate) * _BYTES_PER_SAMPLE
+    process = subprocess.Popen(
+        _ffmpeg_decode_command(path, "-", sample_rate),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            buffer = bytearray(chunk_bytes)
+            view = memoryview(buffer)
+            filled = 0
+            while filled < chunk_bytes:
+                n = process.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            filled -= filled % _BYTES_PER_SAMPLE
+            if filled:
+                yield np.frombuffer(buffer, dtype=np.float32, count=filled // _BYTES_PER_SAMPLE)
+            if filled < chunk_bytes:
+                break
+        process.wait()
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            # the consumer stopped early
+            process.kill()
+            process.wait()
+    if process.returncode != 0:
+        raise RuntimeError(f"failed to decode audio {path}: ffmpeg exit code {process.returncode}")
+
+
+def audio_duration(samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> float:
+    return len(samples) / sample_rate
+
+
+def probe_duration(path: str | Path) -> Optional[float]:
+    """seconds of an audio/video file from its container header (nothing is decoded), None if unknown"""
+    # ffmpeg without an output prints the input header and exits with an error
+    result = subprocess.run(["ffmpeg", "-nostdin", "-hide_banner", "-i", str(path)], capture_output=True)
+    match = _DURATION_RE.search(result.stderr.decode(errors='replace'))
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
@@ -1,55 +1,182 @@
 import logging
-import os
 import tempfile
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional, TYPE_CHECKING
 
-import whisper
-from pydub import AudioSegment
+from video_summary_bot_core import metrics
+from video_summary_bot_core.audio import decoded_audio, SAMPLE_RATE
+from video_summary_bot_core.chunked_transcriber import ChunkedTranscriber
+from video_summary_bot_core.model_registry import ModelRegistry, get_model_registry
+from video_summary_bot_core.transcription_profiles import TranscriptionProfile, PROFILES, BALANCED, whisper_options
+from video_summary_bot_core.whisper_scheduler import BatchedWhisperScheduler, get_batch_scheduler
+
+if TYPE_CHECKING:
+    import whisper
 
 
 class BaseHelper:
-    _whisper_model: Optional[whisper.Whisper]
+    _model_registry: ModelRegistry
     _whisper_model_name: str
     _device: str
     _data_dir: Path
+    _chunked_transcribers: dict[str, ChunkedTranscriber]
 
-    def __init__(self, whisper_model_name: str = "large-v3", device: str = "cuda", data_dir: str | Path = "data"):
-        self._whisper_model = None
+    def __init__(
+            self,
+            whisper_model_name: str = "large-v3",
+            device: str = "cuda",
+            data_dir: str | Path = "data",
+            whisper_workers: int = 1,
+            chunk_seconds: float = 600.0,
+            batch_size: int = 1,
+            batch_max_wait: float = 0.05,
+            model_registry: Optional[ModelRegistry] = None
+    ):
+        self._model_registry = model_registry or get_model_registry()
         self._whisper_model_name = whisper_model_name
         self._device = device
         self._data_dir = Path(data_dir)
+        self._whisper_workers = whisper_workers
+        self._chunk_seconds = chunk_seconds
+        self._chunked_transcribers = {}
+        self._batch_size = batch_size
+        self._batch_max_wait = batch_max_wait
 
     def audio2text(
             self,
             file_content: bytes,
-            initial_prompt: Optional[str] = None
+            initial_prompt: Optional[str] = None,
+            profile: Optional[TranscriptionProfile] = None,
+            language: Optional[str] = None
     ) -> list[dict]:
-        with tempfile.NamedTemporaryFile(suffix=f".wav") as tmp:
+        with tempfile.NamedTemporaryFile() as tmp:
             tmp.write(file_content)
             tmp.flush()
-            tmp.seek(0)
-            # convert to wav
-            sound = AudioSegment.from_file(tmp.name)
-            sound.export(tmp.name, format="wav")
-            result = self._get_whisper_model().transcribe(
-                tmp.name,
-                verbose=True,
-                initial_prompt=initial_prompt,
-                temperature=0.7,
-                compression_ratio_threshold=1,
-                condition_on_previous_text=True,
-                # language=language,
-                word_timestamps=True
-            )
-        return [{'start': s['start'], 'end': s['end'], 'text': s['text']} for s in result['segments']]
-
-    def _get_whisper_model(self) -> whisper.Whisper:
-        if self._whisper_model is None:
-            logging.debug(f"Loading Whisper model using device {self._device}")
-            self._whisper_model = whisper.load_model(
-                self._whisper_model_name,
-                download_root=str(self._data_dir),
-                device=self._device
+            return self.audio_file2text(tmp.name, initial_prompt=initial_prompt, profile=profile, language=language)
+
+    def audio_file2text(
+            self,
+            audio_file: str | Path,
+            initial_prompt: Optional[str] = None,
+            profile: Optional[TranscriptionProfile] = None,
+            language: Optional[str] = None
+    ) -> list[dict]:
+        """
+        `profile` defaults to balanced, `language` is the spoken language if known
+        (used only by profiles pinning the language).
+        Transcribed chunk by chunk like `audio_file2segments`: Whisper copies (and pads) the array it is
+        given, so only a chunk of the memory-mapped audio per worker is in RAM, not the whole file.
+        """
+        return [
+            segment
+            for _, segments in self.audio_file2segments(audio_file, initial_prompt, profile, language)
+            for segment in segments
+        ]
+
+    @staticmethod
+    def _record_transcription(audio_seconds: float, seconds: float) -> None:
+        metrics.AUDIO_SECONDS.inc(audio_seconds)
+        if seconds > 0:
+            metrics.REALTIME_FACTOR.observe(audio_seconds / seconds)
+        logging.info(f"transcribed {audio_seconds:.0f} s of audio in {seconds:.1f} s "
+                     f"({audio_seconds / max(seconds, 1e-6):.1f}x realtime)")
+
+    def audio_file2segments(
+            self,
+            audio_file: str | Path,
+            initial_prompt: Optional[str] = None,
+            profile: Optional[TranscriptionProfile] = None,
+            language: Optional[str] = None,
+            start_seconds: float = 0.0
+    ) -> Iterator[tuple[float, list[dict]]]:
+        """
+        Incremental `audio_file2text`: the audio (from `start_seconds` on, to resume an interrupted
+        transcription) is split at silences into ~`chunk_seconds` chunks, and (seconds transcribed so far,
+        new segments) is yielded as soon as each chunk is done.
+        With the batched scheduler the chunks are ~30 s windows, the ones decoded together are one step.
+        """
+        profile = profile or PROFILES[BALANCED]
+        model_name = profile['model'] or self._whisper_model_name
+        options = whisper_options(profile, language)
+        options['initial_prompt'] = initial_prompt
+        logging.info(f"transcribing {audio_file} from {start_seconds:.0f} s with the {profile['name']} profile "
+                     f"({model_name})")
+        started = time.monotonic()
+        # time spent waiting for the consumer between chunks is not transcription time
+        busy = 0.0
+        with decoded_audio(audio_file, tmp_dir=self._tmp_dir()) as audio:
+            audio = audio[int(start_seconds * SAMPLE_RATE):]
+            scheduler = self._batch_scheduler_for(model_name)
+            if scheduler is not None:
+                steps = scheduler.transcribe_iter(audio, **options)
+            else:
+                steps = self._get_chunked_transcriber(model_name).transcribe_iter(audio, **options)
+            try:
+                for end, segments in steps:
+                    busy += time.monotonic() - started
+                    yield start_seconds + end, [
+                        {'start': s['start'] + start_seconds, 'end': s['end'] + start_seconds, 'text': s['text']}
+                        for s in segments
+                    ]
+                    started = time.monotonic()
+            finally:
+                getattr(steps, 'close', lambda: None)()
+            metrics.STAGE_SECONDS.observe(busy, stage=metrics.TRANSCRIBE)
+            self._record_transcription(len(audio) / SAMPLE_RATE, busy)
+
+    def preload_models(self, model_names: Optional[list[str]] = None, warm_up: bool = True) -> None:
+        """load (and warm up) `model_names`, by default the configured Whisper model, into the shared registry"""
+        self._model_registry.preload(
+            model_names if model_names is not None else [self._whisper_model_name],
+            device=self._device,
+            download_root=self._data_dir,
+            warm_up=warm_up
+        )
+
+    @property
+    def model_registry(self) -> ModelRegistry:
+        return self._model_registry
+
+    @property
+    def batch_scheduler(self) -> Optional[BatchedWhisperScheduler]:
+        """the batched scheduler of the configured model, None if batching is disabled"""
+        return self._batch_scheduler_for(self._whisper_model_name)
+
+    def _batch_scheduler_for(self, model_name: str) -> Optional[BatchedWhisperScheduler]:
+        if self._batch_size <= 1:
+            return None
+        # shared by every helper of the process
+        return get_batch_scheduler(
+            self._model_registry,
+            model_name,
+            device=self._device,
+            download_root=self._data_dir,
+            batch_size=self._batch_size,
+            max_wait=self._batch_max_wait
+        )
+
+    def _tmp_dir(self) -> Path:
+        """scratch space for decoded audio, on the data_dir disk rather than on a (possibly RAM backed) /tmp"""
+        tmp_dir = self._data_dir / 'tmp'
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tmp_dir
+
+    def _get_whisper_model(self, replica: int = 0, model_name: Optional[str] = None) -> 'whisper.Whisper':
+        # not kept on the instance: every helper shares the registry copy, and an evicted model can be freed
+        return self._model_registry.get(
+            model_name or self._whisper_model_name,
+            device=self._device,
+            download_root=self._data_dir,
+            replica=replica
+        )
+
+    def _get_chunked_transcriber(self, model_name: str) -> ChunkedTranscriber:
+        if model_name not in self._chunked_transcribers:
+            # the first replica is the shared model already used for short files
+            self._chunked_transcribers[model_name] = ChunkedTranscriber(
+                lambda replica: self._get_whisper_model(replica, model_name),
+                workers=self._whisper_workers,
+                chunk_seconds=self._chunk_seconds
             )
-        return self._whisper_model
+        return self._chunked_transcribers[model_name]
@@ -0,0 +1,164 @@
+import html
+import json
+import re
+import xml.etree.ElementTree as ElementTree
+from typing import Optional, Iterable
+
+from video_summary_bot_core.video_info import VideoInfo, SubtitleTrack
+
+__all__ = [
+    'TRANSCRIPT_SOURCES', 'PREFER_CAPTIONS', 'WHISPER_ONLY', 'CAPTIONS_ONLY',
+    'NoCaptionsError', 'parse_vtt', 'parse_srv3', 'parse_json3', 'parse_subtitles', 'select_caption_track',
+]
+
+PREFER_CAPTIONS = 'prefer-captions'
+WHISPER_ONLY = 'whisper-only'
+CAPTIONS_ONLY = 'captions-only'
+TRANSCRIPT_SOURCES = (PREFER_CAPTIONS, WHISPER_ONLY, CAPTIONS_ONLY)
+
+# parsers in order of preference, json3 and srv3 carry clean cues, youtube vtt repeats rolling lines
+_FORMATS = ('json3', 'srv3', 'vtt')
+# `[hh:]mm:ss.ttt --> [hh:]mm:ss.ttt [cue settings]`
+_VTT_TIMING_RE = re.compile(
+    r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})[ \t]+-->[ \t]+(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})(?:[ \t].*)?'
+)
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+class NoCaptionsError(LookupError):
+    pass
+
+
+def _segment(start: float, end: float, text: str) -> Optional[dict]:
+    text = ' '.join(text.split())
+    if not text:
+        return None
+    return {'start': start, 'end': max(end, start), 'text': text}
+
+
+def _vtt_seconds(hours: Optional[str], minutes: str, seconds: str, millis: str) -> float:
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds) + int(millis) / 1000
+
+
+def _vtt_cue(block: str) -> Optional[tuple[float, float, list[str]]]:
+    """(start, end, text lines) of a cue block, None for the header, NOTE, STYLE and REGION blocks"""
+    lines = block.split('\n')
+    # the timing line is the first one, or the second after a cue identifier
+    if '-->' not in lines[0]:
+        lines = lines[1:]
+    m = _VTT_TIMING_RE.fullmatch(lines[0].strip()) if lines else None
+    if m is None:
+        return None
+    start = _vtt_seconds(*m.group(1, 2, 3, 4))
+    end = _vtt_seconds(*m.group(5, 6, 7, 8))
+    text_lines = [html.unescape(_TAG_RE.sub('', line)).strip() for line in lines[1:]]
+    return start, end, [line for line in text_lines if line]
+
+
+def parse_vtt(content: str) -> list[dict]:
+    segments = []
+    previous_lines: list[str] = []
+    content = content.lstrip('\ufeff').replace('\r\n', '\n').replace('\r', '\n')
+    # blocks are separated by empty lines only: youtube automatic captions have
+    # whitespace only lines inside their cues
+    for block in content.split('\n\n'):
+        cue = _vtt_cue(block.strip('\n'))
+        if cue is None:
+            continue
+        start, end, text_lines = cue
+        # auto generated captions roll: a cue starts with the last lines of the previous one
+        overlap = next((n for n in range(min(len(previous_lines), len(text_lines)), 0, -1)
+                        if previous_lines[-n:] == text_lines[:n]), 0)
+        new_lines = text_lines[overlap:]
+        if text_lines:
+            previous_lines = text_lines
+        segment = _segment(start, end, ' '.join(new_lines))
+        if segment:
+            segments.append(segment)
+    return segments
+
+
+def parse_srv3(content: str) -> list[dict]:
+    root = ElementTree.fromstring(content)
+    segments = []
+    for p in root.iter('p'):
+        start = int(p.get('t', 0)) / 1000
+        end = start + int(p.get('d', 0)) / 1000
+        segment = _segment(start, end, ''.join(p.itertext()))
+        if segment:
+            segments.append(segment)
+    return segments
+
+
+def parse_json3(content: str) -> list[dict]:
+    data = json.loads(content)
+    segments = []
+    for event in data.get('events', []):
+        if 'segs' not in event:
+            continue
+        start = event.get('tStartMs', 0) / 1000
+        end = start + event.get('dDurationMs', 0) / 1000
+        segment = _segment(start, end, ''.join(s.get('utf8', '') for s in event['segs']))
+        if segment:
+            segments.append(segment)
+    return segments
+
+
+_PARSERS = {
+    'vtt': parse_vtt,
+    'srv3': parse_srv3,
+    'json3': parse_json3,
+}
+
+
+def parse_subtitles(content: str, ext: str) -> list[dict]:
+    """parse a subtitle file into the `[{'start', 'end', 'text'}]` format returned by BaseHelper.audio2text"""
+    try:
+        parser = _PARSERS[ext]
+    except KeyError:
+        raise ValueError(f"unsupported subtitle format '{ext}'")
+    return parser(content)
+
+
+def _pick_format(tracks: Iterable[SubtitleTrack]) -> Optional[SubtitleTrack]:
+    by_ext = {t.get('ext'): t for t in tracks if t.get('url')}
+    return next((by_ext[ext] for ext in _FORMATS if ext in by_ext), None)
+
+
+def select_caption_track(
+        video_info: VideoInfo,
+        languages: Optional[list[str]] = None
+) -> Optional[tuple[str, SubtitleTrack]]:
+    """
+    Best caption track for the video: manual subtitles first, then automatic captions,
+    in the preferred languages order (the video language when none is given).
+    Machine translated automatic captions are only used when explicitly requested.
+    """
+    subtitles = {k: v for k, v in (video_info.get('subtitles') or {}).items() if k != 'live_chat'}
+    automatic = video_info.get('automatic_captions') or {}
+    video_language = video_info.get('language')
+    wanted = list(languages or [])
+    if video_language and video_language not in wanted:
+        wanted.append(video_language)
+
+    for lang in wanted:
+        for key in (lang, *sorted(k for k in subtitles if k.startswith(f"{lang}-"))):
+            track = _pick_format(subtitles.get(key, []))
+            if track:
+                return key, track
+    if not wanted and len(subtitles) == 1:
+        lang, tracks = next(iter(subtitles.items()))
+        track = _pick_format(tracks)
+        if track:
+            return lang, track
+    for lang in wanted:
+        # `<lang>-orig` is the original speech recognition track, plain `<lang>` may be a translation
+        for key in (f"{lang}-orig", lang):
+            track = _pick_format(automatic.get(key, []))
+            if track:
+                return key, track
+    for key in sorted(k for k in automatic if k.endswith('-orig')):
+        track = _pick_format(automatic[key])
+        if track:
+            return key, track
+    return None
@@ -0,0 +1,120 @@
+import logging
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, Iterator, Optional
+
+import numpy as np
+
+from video_summary_bot_core.audio import SAMPLE_RATE
+from video_summary_bot_core.vad import split_points
+
+__all__ = ['ChunkedTranscriber', 'SegmentStitcher', 'stitch_segments']
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+
+class SegmentStitcher:
+    """
+    Incremental `stitch_segments`: chunks are added in order and the stitched segments of each
+    chunk are returned as soon as it is added.
+    """
+
+    def __init__(self, seam_seconds: float = 2.0):
+        self._seam_seconds = seam_seconds
+        self._previous: Optional[dict] = None
+
+    def add(self, offset: float, segments: list[dict]) -> list[dict]:
+        """segments of the chunk starting at `offset` (relative timestamps) with global timestamps"""
+        stitched: list[dict] = []
+        for s in segments:
+            segment = {'start': s['start'] + offset, 'end': s['end'] + offset, 'text': s['text']}
+            previous = self._previous
+            if previous is not None:
+                at_seam = not stitched and segment['start'] - previous['end'] < self._seam_seconds
+                if at_seam and _normalize(segment['text']) == _normalize(previous['text']):
+                    previous['end'] = max(previous['end'], segment['end'])
+                    continue
+                # timestamps never go backwards across a seam
+                segment['start'] = max(segment['start'], previous['start'])
+                segment['end'] = max(segment['end'], segment['start'])
+            stitched.append(segment)
+            self._previous = segment
+        return stitched
+
+
+def stitch_segments(chunks: list[tuple[float, list[dict]]], seam_seconds: float = 2.0) -> list[dict]:
+    """
+    Merge per-chunk segments (chunk start offset, segments relative to the chunk) into one
+    transcript with global timestamps. A segment repeating the previous one right at a seam
+    (a common Whisper artifact at chunk edges) is dropped.
+    """
+    stitcher = SegmentStitcher(seam_seconds)
+    return [segment for offset, segments in chunks for segment in stitcher.add(offset, segments)]
+
+
+class ChunkedTranscriber:
+    """
+    Long-form transcription: split the audio at silences into ~`chunk_seconds` chunks and transcribe
+    them concurrently on up to `workers` model replicas, then stitch the segments back.
+    `model_factory(replica)` is asked for the replica (0 to `workers` - 1) of every chunk and no model is
+    kept in between, so a replica evicted from the model registry is freed once its chunk is done.
+    """
+
+    def __init__(
+            self,
+            model_factory: Callable[[int], Any],
+            workers: int = 2,
+            chunk_seconds: float = 600.0,
+            sample_rate: int = SAMPLE_RATE
+    ):
+        self._model_factory = model_factory
+        self._workers = max(workers, 1)
+        self._chunk_seconds = chunk_seconds
+        self._sample_rate = sample_rate
+        # replicas not transcribing a chunk
+        self._replicas: queue.Queue[int] = queue.Queue()
+        for replica in range(self._workers):
+            self._replicas.put(replica)
+
+    def preload(self) -> None:
+        """load every replica now instead of on first use"""
+        for replica in range(self._workers):
+            self._model_factory(replica)
+
+    def _transcribe_chunk(self, audio: np.ndarray, options: dict) -> list[dict]:
+        replica = self._replicas.get()
+        try:
+            logging.debug(f"transcribing a chunk on Whisper replica {replica + 1}/{self._workers}")
+            result = self._model_factory(replica).transcribe(np.ascontiguousarray(audio, dtype=np.float32), **options)
+        finally:
+            self._replicas.put(replica)
+        return [{'start': s['start'], 'end': s['end'], 'text': s['text']} for s in result['segments']]
+
+    def transcribe(self, audio: np.ndarray, **options) -> list[dict]:
+        """`options` are passed to `whisper.Whisper.transcribe` for every chunk"""
+        return [segment for _, segments in self.transcribe_iter(audio, **options) for segment in segments]
+
+    def transcribe_iter(self, audio: np.ndarray, **options) -> Iterator[tuple[float, list[dict]]]:
+        """
+        like `transcribe`, yielding (end of the chunk in seconds, its stitched segments) for every chunk
+        in order, as soon as the chunk and the ones before it are transcribed
+        """
+        boundaries = split_points(audio, self._sample_rate, self._chunk_seconds)
+        logging.debug(f"transcribing {len(boundaries) - 1} chunks with up to {self._workers} workers")
+        stitcher = SegmentStitcher()
+        with ThreadPoolExecutor(min(self._workers, len(boundaries) - 1), thread_name_prefix='whisper-chunk') as pool:
+            futures = [
+                (start / self._sample_rate, stop / self._sample_rate,
+                 pool.submit(self._transcribe_chunk, audio[start:stop], options))
+                for start, stop in zip(boundaries, boundaries[1:])
+            ]
+            try:
+                for offset, end, future in futures:
+                    yield end, stitcher.add(offset, future.result())
+            finally:
+                # the consumer stopped early: do not transcribe the chunks nobody will read
+                for _, _, future in futures:
+                    future.cancel()
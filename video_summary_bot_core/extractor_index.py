@@ -0,0 +1,252 @@
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Iterable
+from urllib.parse import urlsplit
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # python < 3.11
+    import sre_parse
+    import sre_constants
+
+__all__ = ['ExtractorIndex', 'get_extractor_index']
+
+# placeholder for a wildcard subdomain label such as `[^/]+` or `\w+`
+_WILDCARD = '\0'
+_MAX_EXPANSIONS = 512
+_SCHEME_RE = re.compile(r'^(?:[a-z]+:)?//$')
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _is_host_wildcard(op, av) -> bool:
+    """single character matcher that can never match '/' (so it stays inside the host)"""
+    if op is sre_constants.NOT_LITERAL:
+        return av == ord('/')
+    if op is sre_constants.IN:
+        if av and av[0][0] is sre_constants.NEGATE:
+            return any(o is sre_constants.LITERAL and v == ord('/') for o, v in av[1:])
+        for o, v in av:
+            if o is sre_constants.LITERAL and v == ord('/'):
+                return False
+            if o is sre_constants.RANGE and v[0] <= ord('/') <= v[1]:
+                return False
+            if o is sre_constants.CATEGORY and v not in (sre_constants.CATEGORY_WORD, sre_constants.CATEGORY_DIGIT):
+                return False
+        return True
+    return False
+
+
+def _expand(items) -> set[str]:
+    """every string a sequence of regex items can match, with wildcard labels collapsed to _WILDCARD"""
+    results = {''}
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            options = {chr(av).lower()}
+        elif op is sre_constants.IN and len(av) <= 2 and all(o is sre_constants.LITERAL for o, _ in av) \
+                and len({chr(v).lower() for _, v in av}) == 1:
+            # case folding such as [yY]
+            options = {chr(av[0][1]).lower()}
+        elif _is_host_wildcard(op, av):
+            options = {_WILDCARD}
+        elif op is sre_constants.SUBPATTERN:
+            options = _expand(av[3])
+        elif op is sre_constants.BRANCH:
+            options = set().union(*(_expand(branch) for branch in av[1]))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            low, high, sub = av
+            if high == 1:
+                options = _expand(sub) | ({''} if low == 0 else set())
+            elif len(sub) == 1 and _is_host_wildcard(*sub[0]):
+                options = {_WILDCARD} | ({''} if low == 0 else set())
+            else:
+                inner = _expand(sub)
+                if not all(set(s) <= {_WILDCARD, '.'} or s.endswith('.') and _WILDCARD in s for s in inner):
+                    raise _Unsupported()
+                # repeated wildcard subdomains such as (?:[^/]+\.)*
+                options = {_WILDCARD + '.'} | ({''} if low == 0 else set())
+        else:
+            raise _Unsupported()
+        results = {r + o for r, o in itertools.product(results, options)}
+        if len(results) > _MAX_EXPANSIONS:
+            raise _Unsupported()
+    return results
+
+
+def _ends_host(op, av) -> bool:
+    if op is sre_constants.LITERAL:
+        return chr(av) in '/?#'
+    if op is sre_constants.AT:
+        return av is sre_constants.AT_END
+    if op is sre_constants.SUBPATTERN:
+        return len(av[3]) > 0 and _ends_host(*av[3][0])
+    if op is sre_constants.BRANCH:
+        return all(len(branch) > 0 and _ends_host(*branch[0]) for branch in av[1])
+    return False
+
+
+def _is_port(op, av) -> bool:
+    return op is sre_constants.MAX_REPEAT and av[0] == 0 and av[1] == 1 and len(av[2]) > 0 \
+        and av[2][0] == (sre_constants.LITERAL, ord(':'))
+
+
+def _sequence_domains(items: list) -> set[str]:
+    while items and items[0][0] is sre_constants.AT and items[0][1] is sre_constants.AT_BEGINNING:
+        items = items[1:]
+    if not items:
+        raise _Unsupported()
+    op, av = items[0]
+    if op is sre_constants.SUBPATTERN:
+        return _sequence_domains(list(av[3]) + items[1:])
+    if op is sre_constants.BRANCH:
+        domains = set()
+        for branch in av[1]:
+            branch = list(branch) + items[1:]
+            prefix = ''.join(itertools.takewhile(str.isalnum, (chr(v) for o, v in itertools.takewhile(
+                lambda i: i[0] is sre_constants.LITERAL, branch))))
+            if prefix and not 'https'.startswith(prefix) and len(branch) > len(prefix) \
+                    and branch[len(prefix)] == (sre_constants.LITERAL, ord(':')):
+                # `ytsearch:`, `limelight:media:`, ... never carry a host
+                continue
+            domains |= _sequence_domains(branch)
+        return domains
+
+    scheme_end = next((j for j in range(1, len(items) + 1)
+                       if all(_SCHEME_RE.match(s) for s in _expand(items[:j]))), None)
+    if scheme_end is None:
+        raise _Unsupported()
+    host_end = scheme_end
+    while host_end < len(items) and not _ends_host(*items[host_end]):
+        host_end += 1
+    if host_end == len(items) or host_end == scheme_end:
+        raise _Unsupported()
+    if _is_port(*items[host_end - 1]):
+        host_end -= 1
+    domains = set()
+    for host in _expand(items[scheme_end:host_end]):
+        domain = host.rsplit(_WILDCARD, 1)[-1]
+        if domain != host:
+            if not domain.startswith('.'):
+                raise _Unsupported()
+            domain = domain[1:]
+        if '.' not in domain or '/' in domain or not domain.replace('.', '').replace('-', '').isalnum():
+            raise _Unsupported()
+        domains.add(domain)
+    return domains
+
+
+def _host_domains(pattern: str) -> Optional[set[str]]:
+    """
+    Literal domains a `_VALID_URL` pattern can match, or None if the host part of the pattern
+    cannot be reduced to a list of literal domains (such extractors are always scanned).
+    """
+    try:
+        return _sequence_domains(list(sre_parse.parse(pattern)))
+    except (_Unsupported, re.error, RecursionError):
+        return None
+
+
+def _class_domains(ie: type) -> Optional[set[str]]:
+    valid_url = getattr(ie, '_VALID_URL', False)
+    if not valid_url:
+        # extractors without a _VALID_URL override suitable() themselves
+        return None
+    patterns = [valid_url] if isinstance(valid_url, str) else list(valid_url)
+    domains = set()
+    for pattern in patterns:
+        found = _host_domains(pattern)
+        if not found:
+            return None
+        domains |= found
+    return domains
+
+
+class ExtractorIndex:
+    """
+    Precompiled url -> extractor matcher.
+    Extractor classes are bucketed once by the literal domains of their `_VALID_URL`,
+    a lookup only runs `suitable()` on the buckets of the url host plus the extractors
+    that could not be bucketed (generic matchers), in the order `YoutubeDL` tries them
+    (`gen_extractor_classes()`: `list_extractor_classes()` is sorted by name, where the lazy
+    `GenericIE` matches before the specific extractors).
+    """
+    _classes: list[type]
+    _buckets: dict[str, list[int]]
+    _fallback: list[int]
+    _memo: OrderedDict[str, Optional[str]]
+
+    def __init__(self, classes: Optional[Iterable[type]] = None, memo_size: int = 1024):
+        if classes is None:
+            # imported here: yt-dlp and its extractors take a while to import, the index is built at startup
+            import yt_dlp.extractor
+            classes = yt_dlp.extractor.gen_extractor_classes()
+        self._classes = list(classes)
+        self._buckets = {}
+        self._fallback = []
+        for position, ie in enumerate(self._classes):
+            domains = _class_domains(ie)
+            if domains is None:
+                self._fallback.append(position)
+                continue
+            for domain in domains:
+                self._buckets.setdefault(domain, []).append(position)
+        self._memo = OrderedDict()
+        self._memo_size = memo_size
+        self._lock = threading.Lock()
+
+    @property
+    def bucketed_count(self) -> int:
+        return len(self._classes) - len(self._fallback)
+
+    @property
+    def fallback_count(self) -> int:
+        return len(self._fallback)
+
+    def candidates(self, url: str) -> list[type]:
+        try:
+            parts = urlsplit(url)
+            host = (parts.hostname or '').lower()
+        except ValueError:
+            host = ''
+        if not host or parts.netloc.lower() != host:
+            # naked ids, search prefixes, credentials or ports: nothing reliable to bucket on
+            return self._classes
+        positions = set(self._fallback)
+        labels = host.split('.')
+        for i in range(len(labels) - 1):
+            positions.update(self._buckets.get('.'.join(labels[i:]), ()))
+        return [self._classes[p] for p in sorted(positions)]
+
+    def find(self, url: str) -> Optional[str]:
+        """key of the first extractor suitable for the url, or None"""
+        with self._lock:
+            if url in self._memo:
+                self._memo.move_to_end(url)
+                return self._memo[url]
+        found = next((ie.ie_key() for ie in self.candidates(url) if ie.suitable(url)), None)
+        with self._lock:
+            self._memo[url] = found
+            while len(self._memo) > self._memo_size:
+                self._memo.popitem(last=False)
+        return found
+
+    def is_supported(self, url: str) -> bool:
+        return self.find(url) is not None
+
+
+_index: Optional[ExtractorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_extractor_index() -> ExtractorIndex:
+    """process wide index, built on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ExtractorIndex()
+    return _index
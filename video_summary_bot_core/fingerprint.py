@@ -0,0 +1,293 @@
+"""
+Acoustic fingerprints (hashed pairs of spectral peaks) to recognize the same audio behind different
+urls and uploads, even trimmed, re-encoded or at another volume.
+"""
+import contextlib
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterator, Optional, TypedDict
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from video_summary_bot_core.artifact_store import ArtifactStore, TRANSCRIPT, PARTIAL_TRANSCRIPT
+from video_summary_bot_core.audio import SAMPLE_RATE, iter_audio_chunks, probe_duration
+
+__all__ = ['Fingerprint', 'FingerprintMatch', 'FingerprintIndex', 'fingerprint', 'audio_fingerprint',
+           'FRAME_SECONDS']
+
+_N_FFT = 1024
+_HOP = 256
+# seconds between two spectrogram frames, the time unit of the landmarks
+FRAME_SECONDS = _HOP / SAMPLE_RATE
+# 250 Hz - 4 kHz, where speech (and most of what a codec keeps) is
+_LOW_BIN = 16
+_HIGH_BIN = 256
+# a peak is the maximum of its neighbourhood of +-_PEAK_BINS bins and +-_PEAK_FRAMES frames
+_PEAK_BINS = 8
+_PEAK_FRAMES = 8
+_PEAK_FLOOR_DB = 60.0
+_PEAKS_PER_SECOND = 15
+# every peak is paired with the next _FAN_OUT peaks within _MAX_DT frames and +-_MAX_DF bins
+_FAN_OUT = 5
+_MAX_DT = 127
+_MAX_DF = 63
+_PAIR_SEARCH = 48
+# matches at offsets this many frames apart are counted together, a peak moves by a frame when the
+# audio is trimmed by a fraction of a frame
+_OFFSET_TOLERANCE = 1
+# at least this many consistent landmarks, a short clip never matches by chance
+_MIN_MATCHES = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    duration REAL NOT NULL,
+    landmarks INTEGER NOT NULL,
+    whisper_seconds REAL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS landmarks (
+    hash INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    PRIMARY KEY (hash, id, time)
+) WITHOUT ROWID;
+"""
+
+
+class Fingerprint(TypedDict):
+    # landmark hashes and the frame of their first peak, as many as there are landmarks
+    hashes: np.ndarray
+    times: np.ndarray
+    # seconds of the whole audio, not only of the fingerprinted part
+    duration: float
+
+
+class FingerprintMatch(TypedDict):
+    name: str
+    # landmarks at a consistent offset, over the landmarks of the shorter fingerprint
+    similarity: float
+    # seconds to add to a time of the match to get the same moment in the query
+    offset: float
+    duration: float
+    # how long Whisper took to transcribe it, None if unknown
+    whisper_seconds: Optional[float]
+
+
+def _max_filter(a: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    pad = [(radius, radius) if i == axis else (0, 0) for i in range(a.ndim)]
+    padded = np.pad(a, pad, constant_values=-np.inf)
+    return sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+
+def _peaks(audio: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(frames, bins) of the spectral peaks, in time order"""
+    if len(audio) < _N_FFT:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    frames = sliding_window_view(audio, _N_FFT)[::_HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(_N_FFT).astype(np.float32), axis=1))[:, _LOW_BIN:_HIGH_BIN]
+    db = 20 * np.log10(spectrum + 1e-10)
+    # the max filter is separable: over time, then over frequency
+    neighbourhood = _max_filter(_max_filter(db, _PEAK_FRAMES, axis=0), _PEAK_BINS, axis=1)
+    # relative to the loudest bin, so the peaks do not depend on the volume
+    t, f = np.nonzero((db == neighbourhood) & (db > db.max() - _PEAK_FLOOR_DB))
+    # the strongest peaks of every second, a loud passage does not crowd out the rest
+    second = t // int(1 / FRAME_SECONDS)
+    order = np.lexsort((-db[t, f], second))
+    t, f, second = t[order], f[order], second[order]
+    rank = np.arange(len(t)) - np.searchsorted(second, second)
+    keep = rank < _PEAKS_PER_SECOND
+    t, f = t[keep], f[keep]
+    order = np.lexsort((f, t))
+    return t[order], f[order]
+
+
+def fingerprint(audio: np.ndarray, duration: Optional[float] = None) -> Fingerprint:
+    """landmarks of 16 kHz mono `audio`, `duration` defaults to its length"""
+    t, f = _peaks(np.asarray(audio, dtype=np.float32))
+    hashes, times = [], []
+    paired = np.zeros(len(t), dtype=np.int64)
+    for d in range(1, min(_PAIR_SEARCH, len(t))):
+        anchor = np.arange(len(t) - d)
+        dt = t[d:] - t[:-d]
+        df = f[d:] - f[:-d]
+        ok = (dt > 0) & (dt <= _MAX_DT) & (np.abs(df) <= _MAX_DF) & (paired[anchor] < _FAN_OUT)
+        anchor = anchor[ok]
+        paired[anchor] += 1
+        hashes.append((f[anchor] << 14) | ((df[ok] + _MAX_DF) << 7) | dt[ok])
+        times.append(t[anchor])
+    return Fingerprint(
+        hashes=np.concatenate(hashes).astype(np.int64) if hashes else np.zeros(0, dtype=np.int64),
+        times=np.concatenate(times).astype(np.int64) if times else np.zeros(0, dtype=np.int64),
+        duration=len(audio) / SAMPLE_RATE if duration is None else duration
+    )
+
+
+def audio_fingerprint(path: str | Path, max_seconds: float = 180.0) -> Fingerprint:
+    """
+    fingerprint of the first `max_seconds` of an audio/video file: only these are decoded, the duration
+    comes from the container header (the file is decoded to the end only when it has none)
+    """
+    max_samples = int(max_seconds * SAMPLE_RATE)
+    duration = probe_duration(path)
+    head: list[np.ndarray] = []
+    kept = 0
+    total = 0
+    chunks = iter_audio_chunks(path)
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            if kept < max_samples:
+                head.append(chunk[:max_samples - kept])
+                kept += len(head[-1])
+            if kept >= max_samples and duration is not None:
+                break
+    finally:
+        # ffmpeg is stopped
+        chunks.close()
+    if kept < max_samples or duration is None:
+        # decoded to the end
+        duration = total / SAMPLE_RATE
+    audio = np.concatenate(head) if head else np.zeros(0, dtype=np.float32)
+    return fingerprint(audio, duration=duration)
+
+
+def _best_offset(offsets: np.ndarray) -> tuple[int, int]:
+    """(number of matches, offset in frames) of the most common offset, give or take _OFFSET_TOLERANCE"""
+    low = offsets.min()
+    counts = np.bincount(offsets - low)
+    window = np.convolve(counts, np.ones(2 * _OFFSET_TOLERANCE + 1, dtype=np.int64), mode='same')
+    best = int(np.argmax(window))
+    # the most common offset of the best window
+    first = max(best - _OFFSET_TOLERANCE, 0)
+    return int(window[best]), first + int(np.argmax(counts[first:best + _OFFSET_TOLERANCE + 1])) + int(low)
+
+
+class FingerprintIndex:
+    """
+    Fingerprints of the transcribed audio in SQLite (`data_dir/fingerprints.sqlite3`), looked up by
+    landmark hash. Shared by every process using the same `data_dir`.
+    """
+
+    def __init__(self, data_dir: str | Path):
+        self._db_path = Path(data_dir) / 'fingerprints.sqlite3'
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def add(self, name: str, fp: Fingerprint, whisper_seconds: Optional[float] = None) -> None:
+        """index (or replace) the fingerprint of `name`"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT id FROM fingerprints WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                conn.execute('DELETE FROM landmarks WHERE id = ?', (row[0],))
+                conn.execute('DELETE FROM fingerprints WHERE id = ?', (row[0],))
+            fid = conn.execute(
+                'INSERT INTO fingerprints (name, duration, landmarks, whisper_seconds, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (name, fp['duration'], len(fp['hashes']), whisper_seconds, time.time())
+            ).lastrowid
+            conn.executemany(
+                'INSERT OR IGNORE INTO landmarks (hash, id, time) VALUES (?, ?, ?)',
+                ((h, fid, t) for h, t in zip(fp['hashes'].tolist(), fp['times'].tolist()))
+            )
+
+    def set_whisper_seconds(self, name: str, seconds: float) -> None:
+        with self._connect() as conn:
+            conn.execute('UPDATE fingerprints SET whisper_seconds = ? WHERE name = ?', (seconds, name))
+
+    def contains(self, name: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute('SELECT 1 FROM fingerprints WHERE name = ?', (name,)).fetchone() is not None
+
+    def remove(self, name: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute('SELECT id FROM fingerprints WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return False
+            conn.execute('DELETE FROM landmarks WHERE id = ?', (row[0],))
+            conn.execute('DELETE FROM fingerprints WHERE id = ?', (row[0],))
+        return True
+
+    def prune(self, store: ArtifactStore, min_age: float = 24 * 60 * 60) -> int:
+        """
+        remove the fingerprints of audio whose transcript is not in `store` anymore (evicted, or the
+        transcription failed), the number removed; a fingerprint is added before its audio is transcribed,
+        the ones younger than `min_age` seconds, or with a transcription checkpoint, are kept
+        """
+        with self._connect() as conn:
+            names = [row[0] for row in conn.execute(
+                'SELECT name FROM fingerprints WHERE created_at < ?', (time.time() - min_age,)
+            )]
+        removed = 0
+        for name in names:
+            if store.info(TRANSCRIPT, name) is None and store.info(PARTIAL_TRANSCRIPT, name) is None:
+                removed += self.remove(name)
+        if removed:
+            logging.info(f"removed {removed} fingerprints of audio without a transcript")
+        return removed
+
+    def matches(self, fp: Fingerprint, threshold: float, min_coverage: float = 0.95) -> list[FingerprintMatch]:
+        """
+        the indexed fingerprints with a similarity of at least `threshold` whose audio covers at least
+        `min_coverage` of the audio of `fp`, most similar first
+        """
+        if len(fp['hashes']) == 0:
+            return []
+        with self._connect() as conn:
+            conn.execute('CREATE TEMP TABLE query (hash INTEGER NOT NULL, time INTEGER NOT NULL)')
+            conn.executemany('INSERT INTO query (hash, time) VALUES (?, ?)',
+                             zip(fp['hashes'].tolist(), fp['times'].tolist()))
+            rows = conn.execute(
+                'SELECT landmarks.id, query.time - landmarks.time FROM query '
+                'JOIN landmarks ON landmarks.hash = query.hash'
+            ).fetchall()
+            candidates = {
+                row[0]: row[1:]
+                for row in conn.execute('SELECT id, name, duration, landmarks, whisper_seconds FROM fingerprints')
+            }
+        if not rows:
+            return []
+        pairs = np.array(rows, dtype=np.int64)
+        order = np.argsort(pairs[:, 0], kind='stable')
+        ids, offsets = pairs[order, 0], pairs[order, 1]
+        bounds = np.flatnonzero(np.diff(ids)) + 1
+        found: list[FingerprintMatch] = []
+        for group_ids, group_offsets in zip(np.split(ids, bounds), np.split(offsets, bounds)):
+            candidate = candidates.get(int(group_ids[0]))
+            if candidate is None or len(group_offsets) < _MIN_MATCHES:
+                continue
+            name, duration, landmarks, whisper_seconds = candidate
+            count, offset = _best_offset(group_offsets)
+            similarity = count / max(min(len(fp['hashes']), landmarks), 1)
+            offset_seconds = offset * FRAME_SECONDS
+            # the part of the query the candidate has audio (and so a transcript) for
+            covered = min(fp['duration'], offset_seconds + duration) - max(0.0, offset_seconds)
+            if count < _MIN_MATCHES or similarity < threshold or covered < min_coverage * fp['duration']:
+                continue
+            found.append(FingerprintMatch(name=name, similarity=similarity, offset=offset_seconds,
+                                          duration=duration, whisper_seconds=whisper_seconds))
+        found.sort(key=lambda m: m['similarity'], reverse=True)
+        return found
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            count, landmarks = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(landmarks), 0) FROM fingerprints'
+            ).fetchone()
+        return {'count': count, 'landmarks': landmarks, 'bytes': self._db_path.stat().st_size}
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a short lived connection per operation, like the artifact store
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
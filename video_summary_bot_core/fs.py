@@ -0,0 +1,60 @@
+import contextlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Iterator, IO
+
+try:
+    import fcntl
+except ImportError:  # not a posix system
+    fcntl = None
+
+__all__ = ['file_lock', 'atomic_write']
+
+
+@contextlib.contextmanager
+def file_lock(path: str | Path, blocking: bool = True) -> Iterator[bool]:
+    """
+    Exclusive cross-process lock tied to `path` (a sibling `.lock` file is used).
+    Processes sharing the same data_dir serialize on it.
+    Yields whether the lock is held: without `blocking`, False at once if it is held elsewhere.
+    """
+    path = Path(path)
+    lock_path = path.with_name(f"{path.name}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_path.open('a') as f:
+        if fcntl is None:
+            logging.debug(f"file locking not available, {lock_path} is not locked")
+            yield True
+            return
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def atomic_write(path: str | Path, mode: str = 'wb') -> Iterator[IO]:
+    """
+    Write to a temporary file in the same directory and rename it over `path` on success,
+    readers never see a partially written file.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_name)
+        raise
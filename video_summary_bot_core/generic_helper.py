@@ -1,20 +1,54 @@
+import logging
 import os
 import tempfile
-from typing import Optional
-
-import yt_dlp
+import threading
+import xml.etree.ElementTree as ElementTree
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlsplit
 
+from video_summary_bot_core import lazy_imports, metrics
+from video_summary_bot_core.artifact_store import ArtifactStore
 from video_summary_bot_core.base_helper import BaseHelper
+from video_summary_bot_core.captions import select_caption_track, parse_subtitles
+from video_summary_bot_core.extractor_index import get_extractor_index
+from video_summary_bot_core.transcription_profiles import TranscriptionProfile
+from video_summary_bot_core.video_info import VideoInfo, VideoInfoCache
 
 
 class GenericHelper(BaseHelper):
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, store: Optional[ArtifactStore] = None, **kwargs):
+        """`store`: where the resolved video info is cached, by default the artifact store of `data_dir`"""
         super().__init__(*args, **kwargs)
-        self._yt = yt_dlp.YoutubeDL()
+        self._youtube_dl: Any = None
+        self._youtube_dl_lock = threading.Lock()
+        self._video_info_cache = VideoInfoCache(lambda: self._yt, store or ArtifactStore(self._data_dir))
+
+    @property
+    def _yt(self) -> Any:
+        """the shared YoutubeDL instance, created (and yt-dlp imported) on first use"""
+        with self._youtube_dl_lock:
+            if self._youtube_dl is None:
+                self._youtube_dl = lazy_imports.yt_dlp().YoutubeDL()
+            return self._youtube_dl
 
     def video2audio(self, video_url: str) -> bytes:
         with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_file = self.video2audio_file(video_url, Path(tmp_dir) / 'audio')
+            with open(audio_file, "rb") as f:
+                return f.read()
+
+    def video2audio_file(self, video_url: str, destination: str | Path) -> Path:
+        """
+        download the audio track and move it to `destination` without reading it,
+        the rename is atomic: `destination` is either missing or complete.
+        Without a suffix in `destination` the one of the downloaded container is appended.
+        """
+        destination = Path(destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # download next to the destination so the final rename does not cross filesystems
+        with tempfile.TemporaryDirectory(dir=destination.parent, prefix='.download-') as tmp_dir:
             ydl_opts = {
                 'format': 'bestaudio/best',
                 'sponsorblock_remove': ['sponsor'],
@@ -22,60 +56,121 @@ class GenericHelper(BaseHelper):
                     'default': f"{tmp_dir}/audio.%(ext)s",
                 }
             }
-            file_name = None
-            try:
-                self._yt.params.update(ydl_opts)
-                self._yt.download([video_url])
-                if len(os.listdir(tmp_dir)) > 1:
-                    fn = [
-                        f for f in os.listdir(tmp_dir)
-                        if f.lower().endswith('.mp4') or
-                           f.lower().endswith('.webm') or
-                           f.lower().endswith('.m4a') or
-                           f.lower().endswith('.ogg') or
-                           f.lower().endswith('.opus')
-                    ][0]
-                    file_name = os.path.join(tmp_dir, fn)
+            extracted = self._video_info_cache.extracted(video_url)
+            # a downloader per call: the output template must not leak into concurrent downloads
+            with metrics.stage(metrics.DOWNLOAD), lazy_imports.yt_dlp().YoutubeDL(ydl_opts) as ydl:
+                if extracted is not None:
+                    # resolved by get_video_info: only the format selection and the download are left,
+                    # as with --load-info-json (the info is copied, processing it adds the download fields)
+                    ydl.process_ie_result(ydl.sanitize_info(extracted, remove_private_keys=True), download=True)
                 else:
-                    file_name = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
-                with open(file_name, "rb") as f:
-                    content = f.read()
-                os.remove(file_name)
-                return content
-            finally:
-                if file_name and os.path.exists(file_name):
-                    os.remove(file_name)
-
-    def video2text(self, video_url: str) -> list[dict]:
-        audio_content = self.video2audio(video_url)
-        return self.audio2text(audio_content)
+                    ydl.download([video_url])
+            if len(os.listdir(tmp_dir)) > 1:
+                fn = [
+                    f for f in os.listdir(tmp_dir)
+                    if f.lower().endswith('.mp4') or
+                       f.lower().endswith('.webm') or
+                       f.lower().endswith('.m4a') or
+                       f.lower().endswith('.ogg') or
+                       f.lower().endswith('.opus')
+                ][0]
+                file_name = os.path.join(tmp_dir, fn)
+            else:
+                file_name = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+            if not destination.suffix:
+                destination = destination.with_suffix(Path(file_name).suffix)
+            metrics.DOWNLOAD_BYTES.inc(os.path.getsize(file_name))
+            os.replace(file_name, destination)
+        return destination
+
+    def video2text(self, video_url: str, profile: Optional[TranscriptionProfile] = None) -> list[dict]:
+        video_info = self.get_video_info(video_url)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            audio_file = self.video2audio_file(video_url, Path(tmp_dir) / 'audio')
+            return self.audio_file2text(audio_file, profile=profile, language=video_info.get('language'))
+
+    def video2captions(self, video_url: str, languages: Optional[list[str]] = None) -> Optional[list[dict]]:
+        """
+        transcript from the platform subtitles or automatic captions, None if there is no usable track
+        """
+        video_info = self.get_video_info(video_url)
+        selected = select_caption_track(video_info, languages) if video_info else None
+        if selected is None:
+            return None
+        lang, track = selected
+        logging.debug(f"using '{lang}' {track['ext']} captions for {video_url}")
+        try:
+            with metrics.stage(metrics.CAPTIONS), self._yt.urlopen(track['url']) as response:
+                content = response.read().decode('utf-8')
+            segments = parse_subtitles(content, track['ext'])
+        except (*lazy_imports.yt_dlp().utils.network_exceptions, ValueError, ElementTree.ParseError) as e:
+            logging.warning(f"unable to use '{lang}' captions for {video_url}: {e}")
+            return None
+        return segments or None
 
     @staticmethod
     def _check_if_supported(url: str) -> bool:
-        for ie in yt_dlp.list_extractors():
-            if ie.suitable(url):
-                return True
-        return False
+        return get_extractor_index().is_supported(url)
+
+    def is_supported_url(self, url: str) -> bool:
+        """cheap in-process check, the url is not resolved"""
+        try:
+            if urlsplit(url).scheme not in ('http', 'https'):
+                return False
+        except ValueError:
+            return False
+        return self._check_if_supported(url)
 
     def check_if_supported(self, url: str) -> bool:
         if not self._check_if_supported(url):
             return False
         try:
-            info = self._yt.extract_info(url, download=False)
+            info = self.get_info(url)
             return bool(info.get('extractor'))
-        except yt_dlp.DownloadError:
+        except lazy_imports.yt_dlp().DownloadError:
             return False
 
     def is_youtube_video(self, url: str) -> bool:
-        import yt_dlp.extractor.youtube
-        return yt_dlp.extractor.youtube.YoutubeIE().suitable(url)
+        return get_extractor_index().find(url) == 'Youtube'
+
+    def expand_playlist(self, url: str) -> list[str]:
+        """
+        the video urls of a playlist or channel url, `[url]` for a single video
+        :raise yt_dlp.DownloadError: if the url cannot be resolved
+        """
+        if self.is_youtube_video(url):
+            # a plain video page, no need to ask the extractor
+            return [url]
+        with lazy_imports.yt_dlp().YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            # a single video is resolved in full, not flat: summarizing it does not extract it again
+            self._video_info_cache.put(url, info)
+            return [url]
+        urls = []
+        for entry in info.get('entries') or []:
+            entry_url = entry and (entry.get('webpage_url') or entry.get('url'))
+            if entry_url:
+                urls.append(entry_url)
+        logging.info(f"{url}: {len(urls)} videos")
+        return urls
 
     def get_video_id(self, url: str) -> Optional[str]:
         info = self.get_video_info(url)
         return info.get('id', None)
 
-    def get_video_info(self, url: str) -> dict:
+    def get_video_info(self, url: str) -> VideoInfo | dict:
         try:
-            return self._yt.extract_info(url, download=False)
-        except yt_dlp.DownloadError:
+            return self.get_info(url)
+        except lazy_imports.yt_dlp().DownloadError:
             return {}
+
+    def get_info(self, url: str) -> VideoInfo:
+        """
+        :raise yt_dlp.DownloadError: if the url cannot be resolved
+        """
+        return self._video_info_cache.get(url)
+
+    @property
+    def video_info_cache(self) -> VideoInfoCache:
+        return self._video_info_cache
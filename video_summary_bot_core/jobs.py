@@ -0,0 +1,186 @@
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional, Callable, Awaitable, Any, TypeVar, Iterable, AsyncIterator
+
+from video_summary_bot_core import metrics
+
+__all__ = ['QueueFullError', 'JobContext', 'JobQueue']
+
+T = TypeVar('T')
+
+ProgressCallback = Callable[[str], Awaitable[None] | None]
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+def _log_abandoned(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logging.warning(f"generator stage failed after its consumer stopped: {future.exception()}")
+
+
+class JobContext:
+    """handle given to a running job to offload blocking stages and report progress"""
+
+    def __init__(self, queue: 'JobQueue', loop: asyncio.AbstractEventLoop, progress: Optional[ProgressCallback]):
+        self._queue = queue
+        self._loop = loop
+        self._progress = progress
+        self._last_progress: Optional[str] = None
+        self.queue_wait: float = 0.0
+
+    async def run_io(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """run a blocking I/O stage (download, api calls, ...) on the I/O executor"""
+        return await self._loop.run_in_executor(self._queue.io_executor, functools.partial(fn, *args, **kwargs))
+
+    async def run_transcribe(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """run a transcription stage on the dedicated Whisper executor"""
+        return await self._loop.run_in_executor(self._queue.transcribe_executor,
+                                                functools.partial(fn, *args, **kwargs))
+
+    def iterate_io(self, fn: Callable[..., Iterable[T]], *args, **kwargs) -> AsyncIterator[T]:
+        """run a blocking generator on the I/O executor, yielding its items as soon as they are produced"""
+        return self._iterate(self._queue.io_executor, fn, *args, **kwargs)
+
+    def iterate_transcribe(self, fn: Callable[..., Iterable[T]], *args, **kwargs) -> AsyncIterator[T]:
+        """like `iterate_io` for a transcribing generator, on the dedicated Whisper executor"""
+        return self._iterate(self._queue.transcribe_executor, fn, *args, **kwargs)
+
+    async def _iterate(self, executor: Executor, fn: Callable[..., Iterable[T]], *args, **kwargs) -> AsyncIterator[T]:
+        items: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        end = object()
+
+        def produce() -> None:
+            try:
+                iterator = iter(fn(*args, **kwargs))
+                for item in iterator:
+                    self._loop.call_soon_threadsafe(items.put_nowait, item)
+                    if stop.is_set():
+                        # the consumer went away, let the generator clean up
+                        getattr(iterator, 'close', lambda: None)()
+                        break
+            finally:
+                self._loop.call_soon_threadsafe(items.put_nowait, end)
+
+        producer = self._loop.run_in_executor(executor, produce)
+        consumed = False
+        try:
+            while (item := await items.get()) is not end:
+                yield item
+            consumed = True
+            # raises the generator exception, if any
+            await producer
+        finally:
+            stop.set()
+            if not consumed:
+                # the consumer stopped early: the generator stops at its next item, its error is only logged
+                producer.add_done_callback(_log_abandoned)
+
+    async def progress(self, text: str) -> None:
+        if self._progress is None or text == self._last_progress:
+            return
+        self._last_progress = text
+        try:
+            result = self._progress(text)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.warning(f"progress callback failed: {e}")
+
+    def report(self, text: str) -> None:
+        """thread safe variant of `progress`, usable from inside executor stages"""
+        asyncio.run_coroutine_threadsafe(self.progress(text), self._loop)
+
+
+class JobQueue:
+    """
+    Asyncio facing job runner.
+    At most `max_running` jobs run at once and at most `max_pending` jobs (running or waiting) are
+    admitted, further submissions are rejected with QueueFullError.
+    Blocking work runs on a thread pool for I/O stages and on a separate executor for Whisper,
+    by default a single dedicated worker thread so the model is never used concurrently.
+    """
+    io_executor: Executor
+    transcribe_executor: Executor
+
+    def __init__(
+            self,
+            max_pending: int = 16,
+            max_running: int = 4,
+            io_workers: int = 8,
+            transcribe_workers: int = 1,
+            transcribe_executor: Optional[Executor] = None
+    ):
+        self._max_pending = max_pending
+        self._max_running = max_running
+        self._pending = 0
+        self._running = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.io_executor = ThreadPoolExecutor(io_workers, thread_name_prefix='job-io')
+        self.transcribe_executor = transcribe_executor or ThreadPoolExecutor(
+            transcribe_workers, thread_name_prefix='job-transcribe'
+        )
+
+    @property
+    def pending(self) -> int:
+        """jobs admitted and not yet finished, running ones included"""
+        return self._pending
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return self._pending - self._running
+
+    def is_full(self) -> bool:
+        return self._pending >= self._max_pending
+
+    def submit(
+            self,
+            job: Callable[[JobContext], Awaitable[T]],
+            progress: Optional[ProgressCallback] = None
+    ) -> 'asyncio.Future[T]':
+        """
+        schedule `job(context)` and return a future with its result
+        :raise QueueFullError: if the queue already holds `max_pending` jobs
+        """
+        if self.is_full():
+            raise QueueFullError(f"job queue is full ({self._pending} pending jobs)")
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_running)
+        self._pending += 1
+        context = JobContext(self, loop, progress)
+        return loop.create_task(self._run(job, context))
+
+    async def _run(self, job: Callable[[JobContext], Awaitable[T]], context: JobContext) -> T:
+        submitted_at = time.monotonic()
+        try:
+            if self._semaphore.locked():
+                await context.progress(f"queued: {self.waiting} jobs waiting")
+            async with self._semaphore:
+                context.queue_wait = time.monotonic() - submitted_at
+                metrics.QUEUE_WAIT_SECONDS.observe(context.queue_wait)
+                self._running += 1
+                try:
+                    return await job(context)
+                finally:
+                    self._running -= 1
+        finally:
+            self._pending -= 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.io_executor.shutdown(wait=wait)
+        self.transcribe_executor.shutdown(wait=wait)
+
+    def stats(self) -> dict[str, Any]:
+        return {'pending': self._pending, 'running': self._running, 'max_pending': self._max_pending}
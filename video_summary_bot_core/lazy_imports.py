@@ -0,0 +1,46 @@
+import importlib
+import logging
+import time
+from types import ModuleType
+from typing import Iterable
+
+__all__ = ['whisper', 'torch', 'yt_dlp', 'openai', 'HEAVY_MODULES', 'preload']
+
+# importing these takes from a few hundred milliseconds (yt-dlp) to seconds (torch through whisper):
+# modules on the startup path import them on first use through the accessors below
+HEAVY_MODULES = ('yt_dlp', 'openai', 'whisper')
+
+
+def whisper() -> ModuleType:
+    import whisper
+    return whisper
+
+
+def torch() -> ModuleType:
+    import torch
+    return torch
+
+
+def yt_dlp() -> ModuleType:
+    import yt_dlp
+    return yt_dlp
+
+
+def openai() -> ModuleType:
+    import openai
+    return openai
+
+
+def preload(names: Iterable[str] = HEAVY_MODULES) -> dict[str, float]:
+    """import `names` now (e.g. on a background thread after startup), seconds taken by each import"""
+    timings = {}
+    for name in names:
+        started = time.monotonic()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logging.warning(f"unable to preload {name}: {e}")
+            continue
+        timings[name] = time.monotonic() - started
+        logging.info(f"imported {name} in {timings[name]:.2f} s")
+    return timings
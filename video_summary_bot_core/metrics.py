@@ -0,0 +1,297 @@
+import bisect
+import contextlib
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+__all__ = [
+    'Counter', 'Histogram', 'MetricsRegistry', 'MetricsServer', 'get_metrics', 'stage', 'breakdown', 'trace',
+    'DOWNLOAD', 'CAPTIONS', 'TRANSCRIBE', 'SUMMARIZE', 'TRANSCRIBE_SUMMARIZE', 'ANSWER', 'TELEGRAM_SEND',
+    'STAGE_SECONDS', 'DOWNLOAD_BYTES', 'AUDIO_SECONDS', 'REALTIME_FACTOR', 'LLM_TOKENS', 'CACHE_REQUESTS',
+    'QUEUE_WAIT_SECONDS', 'TELEGRAM_REQUESTS', 'WEBHOOK_UPDATES', 'DUPLICATE_AUDIO_SECONDS',
+    'WHISPER_SECONDS_SAVED',
+]
+
+DOWNLOAD = 'download'
+CAPTIONS = 'captions'
+TRANSCRIBE = 'transcribe'
+SUMMARIZE = 'summarize'
+# incremental summaries: windows are summarized while the rest of the audio is transcribed
+TRANSCRIBE_SUMMARIZE = 'transcribe_summarize'
+# follow-up questions about a transcript
+ANSWER = 'answer'
+TELEGRAM_SEND = 'telegram_send'
+
+# seconds, from a cached lookup to a long video transcribed on CPU
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_Labels = tuple[tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> _Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """monotonic sum per label set"""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[_Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_labels(labels), 0)
+
+    def samples(self) -> dict[_Labels, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """count, sum and cumulative bucket counts of the observed values per label set"""
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # label set -> [per bucket counts (last one is +Inf), sum, count]
+        self._values: dict[_Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """observe the seconds spent in the block, also when it raises"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def samples(self) -> dict[_Labels, tuple[float, int]]:
+        """label set -> (sum, count)"""
+        with self._lock:
+            return {labels: (entry[1], entry[2]) for labels, entry in self._values.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {labels: (list(entry[0]), entry[1], entry[2]) for labels, entry in self._values.items()}
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip([*self.buckets, float('inf')], counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels((*labels, ('le', le)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """the metrics of the process, rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._register(name, lambda: Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help, buckets))
+
+    def _register(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _metrics
+
+
+STAGE_SECONDS = _metrics.histogram('video_summary_stage_seconds', "wall time of each processing stage")
+DOWNLOAD_BYTES = _metrics.counter('video_summary_download_bytes_total', "bytes of audio downloaded")
+AUDIO_SECONDS = _metrics.counter('video_summary_audio_seconds_total', "seconds of audio transcribed by Whisper")
+REALTIME_FACTOR = _metrics.histogram(
+    'video_summary_transcribe_realtime_factor', "seconds of audio transcribed per wall second",
+    buckets=(0.5, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+LLM_TOKENS = _metrics.counter(
+    'video_summary_llm_tokens_total', "summary and answer tokens by direction (in/out), reported or estimated"
+)
+CACHE_REQUESTS = _metrics.counter(
+    'video_summary_cache_requests_total', "artifact, summary and video info cache lookups by result (hit/stale/miss)"
+)
+QUEUE_WAIT_SECONDS = _metrics.histogram(
+    'video_summary_queue_wait_seconds', "time a job waited in the queue for a free slot"
+)
+TELEGRAM_REQUESTS = _metrics.counter(
+    'video_summary_telegram_requests_total', "Telegram API calls by method and result (ok/retry_after/error)"
+)
+WEBHOOK_UPDATES = _metrics.counter(
+    'video_summary_webhook_updates_total', "updates POSTed to the webhook by result (accepted/unauthorized)"
+)
+DUPLICATE_AUDIO_SECONDS = _metrics.counter(
+    'video_summary_duplicate_audio_seconds_total', "seconds of audio recognized as a near-duplicate, not transcribed"
+)
+WHISPER_SECONDS_SAVED = _metrics.counter(
+    'video_summary_whisper_seconds_saved_total', "Whisper time the near-duplicates took to transcribe, not spent again"
+)
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """time the block as processing stage `name`"""
+    with STAGE_SECONDS.time(stage=name):
+        yield
+
+
+def breakdown() -> str:
+    """human readable summary of the metrics recorded so far (per run for the command line)"""
+    lines = []
+    for labels, (total, count) in sorted(STAGE_SECONDS.samples().items()):
+        name = dict(labels)['stage']
+        lines.append(f"{name:>20}: {count:4d} x {total / count:8.2f} s = {total:8.2f} s")
+    downloaded = sum(DOWNLOAD_BYTES.samples().values())
+    if downloaded:
+        lines.append(f"{'downloaded':>20}: {downloaded / 2 ** 20:.1f} MiB")
+    audio_seconds = sum(AUDIO_SECONDS.samples().values())
+    if audio_seconds:
+        rtf = [(total, count) for total, count in REALTIME_FACTOR.samples().values()]
+        mean_rtf = sum(t for t, _ in rtf) / max(sum(c for _, c in rtf), 1)
+        lines.append(f"{'audio':>20}: {audio_seconds / 60:.1f} min, {mean_rtf:.1f}x realtime")
+    tokens = {dict(labels)['direction']: value for labels, value in LLM_TOKENS.samples().items()}
+    if tokens:
+        lines.append(f"{'tokens':>20}: {tokens.get('in', 0):.0f} in, {tokens.get('out', 0):.0f} out")
+    caches: dict[str, dict[str, float]] = {}
+    for labels, value in CACHE_REQUESTS.samples().items():
+        labels = dict(labels)
+        caches.setdefault(labels['cache'], {})[labels['result']] = value
+    for cache, results in sorted(caches.items()):
+        lines.append(f"{cache + ' cache':>20}: " + ", ".join(f"{v:.0f} {k}" for k, v in sorted(results.items())))
+    waits = [(total, count) for total, count in QUEUE_WAIT_SECONDS.samples().values()]
+    if waits:
+        lines.append(f"{'queue wait':>20}: {sum(t for t, _ in waits) / max(sum(c for _, c in waits), 1):.2f} s mean")
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def trace(path: str | Path) -> Iterator[None]:
+    """
+    profile the block into `path`: an HTML flame report with pyinstrument (if installed) for a `.html` path,
+    otherwise cProfile stats readable with `python -m pstats` or snakeviz
+    """
+    path = Path(path)
+    if path.suffix == '.html':
+        try:
+            import pyinstrument
+        except ImportError:
+            logging.warning("pyinstrument is not installed, writing cProfile stats instead")
+            path = path.with_suffix('.prof')
+        else:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                path.write_text(profiler.output_html())
+                logging.info(f"profile written to {path}")
+            return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info(f"profile written to {path}")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self) -> None:
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"metrics endpoint: {format % args}")
+
+
+class MetricsServer:
+    """serve `registry` at http://host:port/metrics from a daemon thread"""
+
+    def __init__(self, port: int, host: str = '0.0.0.0', registry: Optional[MetricsRegistry] = None):
+        handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or get_metrics()})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'MetricsServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+        logging.info(f"metrics endpoint listening on port {self.port}")
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
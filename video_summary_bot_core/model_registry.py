@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, TypedDict, Iterable, TYPE_CHECKING
+
+import numpy as np
+
+from video_summary_bot_core import lazy_imports
+from video_summary_bot_core.audio import SAMPLE_RATE
+
+if TYPE_CHECKING:
+    import whisper
+
+__all__ = ['ModelStats', 'ModelRegistry', 'get_model_registry']
+
+_ModelKey = tuple[str, str, int]
+
+
+class ModelStats(TypedDict):
+    name: str
+    device: str
+    replica: int
+    load_seconds: float
+    warm_up_seconds: Optional[float]
+    resident_bytes: int
+    last_used: float
+
+
+def _resident_bytes(model: 'whisper.Whisper') -> int:
+    return sum(t.numel() * t.element_size() for t in [*model.parameters(), *model.buffers()])
+
+
+class ModelRegistry:
+    """
+    Process wide registry of loaded Whisper models, shared by every helper.
+    Models are kept while the sum of their resident sizes fits `memory_budget` (bytes, None for no limit),
+    the least recently used ones are dropped to make room for a new load.
+    A dropped model is freed once the callers still holding it are done with it.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        self._memory_budget = memory_budget
+        self._models: OrderedDict[_ModelKey, 'whisper.Whisper'] = OrderedDict()
+        self._stats: dict[_ModelKey, ModelStats] = {}
+        self._lock = threading.Lock()
+        self._load_locks: dict[_ModelKey, threading.Lock] = {}
+
+    def set_memory_budget(self, memory_budget: Optional[int]) -> None:
+        with self._lock:
+            self._memory_budget = memory_budget
+
+    def get(
+            self,
+            name: str,
+            device: str = "cuda",
+            download_root: Optional[str | Path] = None,
+            replica: int = 0,
+            warm_up: bool = False
+    ) -> 'whisper.Whisper':
+        """
+        the shared model instance, loaded on first use; `replica` > 0 gives independent copies.
+        With `warm_up` a model being loaded is warmed up before other callers get it: a Whisper instance
+        must not run two inferences at once (its kv-cache hooks are per instance)
+        """
+        key = (name, device, replica)
+        with self._lock:
+            model = self._touch(key)
+            if model is not None:
+                return model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            # loaded by another thread while we were waiting
+            with self._lock:
+                model = self._touch(key)
+                if model is not None:
+                    return model
+            logging.info(f"loading Whisper model {name} (replica {replica}) on {device}")
+            started = time.monotonic()
+            model = lazy_imports.whisper().load_model(
+                name,
+                download_root=str(download_root) if download_root else None,
+                device=device
+            )
+            load_seconds = time.monotonic() - started
+            resident = _resident_bytes(model)
+            logging.info(f"loaded Whisper model {name} in {load_seconds:.1f} s, {resident / 2 ** 20:.0f} MiB")
+            warm_up_seconds = self.warm_up(model) if warm_up else None
+            with self._lock:
+                self._evict_for(resident)
+                self._models[key] = model
+                self._stats[key] = {
+                    'name': name,
+                    'device': device,
+                    'replica': replica,
+                    'load_seconds': load_seconds,
+                    'warm_up_seconds': warm_up_seconds,
+                    'resident_bytes': resident,
+                    'last_used': time.time(),
+                }
+            return model
+
+    def preload(
+            self,
+            names: Iterable[str],
+            device: str = "cuda",
+            download_root: Optional[str | Path] = None,
+            warm_up: bool = True
+    ) -> None:
+        """load (and warm up) `names`, a job asking for one of them meanwhile waits until it is ready"""
+        for name in names:
+            self.get(name, device, download_root, warm_up=warm_up)
+
+    @staticmethod
+    def warm_up(model: 'whisper.Whisper') -> float:
+        """run one inference on a generated silent clip, so kernels and caches are ready for the first user"""
+        started = time.monotonic()
+        model.transcribe(
+            np.zeros(2 * SAMPLE_RATE, dtype=np.float32),
+            language='en',
+            fp16=model.device.type != 'cpu',
+            verbose=None
+        )
+        elapsed = time.monotonic() - started
+        logging.info(f"Whisper warm-up took {elapsed:.1f} s")
+        return elapsed
+
+    def evict(self, name: str, device: str = "cuda", replica: int = 0) -> bool:
+        with self._lock:
+            key = (name, device, replica)
+            self._stats.pop(key, None)
+            return self._models.pop(key, None) is not None
+
+    def stats(self) -> list[ModelStats]:
+        with self._lock:
+            return [dict(self._stats[key]) for key in self._models]
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._stats[key]['resident_bytes'] for key in self._models)
+
+    def _touch(self, key: _ModelKey) -> Optional['whisper.Whisper']:
+        model = self._models.get(key)
+        if model is not None:
+            self._models.move_to_end(key)
+            self._stats[key]['last_used'] = time.time()
+        return model
+
+    def _evict_for(self, needed: int) -> None:
+        if self._memory_budget is None:
+            return
+        used = sum(self._stats[key]['resident_bytes'] for key in self._models)
+        while self._models and used + needed > self._memory_budget:
+            key, _ = self._models.popitem(last=False)
+            stats = self._stats.pop(key)
+            used -= stats['resident_bytes']
+            logging.info(f"evicting Whisper model {stats['name']} (replica {stats['replica']}) "
+                         f"to fit the {self._memory_budget / 2 ** 20:.0f} MiB budget")
+        if used + needed > self._memory_budget:
+            logging.warning(f"Whisper model of {needed / 2 ** 20:.0f} MiB exceeds the memory budget on its own")
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    return _registry
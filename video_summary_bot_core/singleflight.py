@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Hashable, TypeVar
+
+__all__ = ['SingleFlight']
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    In-process deduplication of concurrent calls.
+    While a call for a key is running, later callers with the same key wait for
+    its result (or exception) instead of running the function again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
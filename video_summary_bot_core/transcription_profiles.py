@@ -0,0 +1,115 @@
+import re
+from typing import Optional, TypedDict
+
+from video_summary_bot_core import lazy_imports
+
+__all__ = [
+    'TranscriptionProfile', 'PROFILES', 'FAST', 'BALANCED', 'ACCURATE', 'AUTO', 'PROFILE_CHOICES',
+    'ProfilePolicy', 'whisper_options', 'whisper_language',
+]
+
+FAST = 'fast'
+BALANCED = 'balanced'
+ACCURATE = 'accurate'
+AUTO = 'auto'
+
+
+class TranscriptionProfile(TypedDict):
+    name: str
+    # None: the configured Whisper model
+    model: Optional[str]
+    # beam search width at temperature 0, None for greedy decoding
+    beam_size: Optional[int]
+    # candidates sampled at temperatures above 0
+    best_of: Optional[int]
+    # fallback schedule, the next temperature is tried when a window fails the quality thresholds
+    temperature: tuple[float, ...]
+    word_timestamps: bool
+    condition_on_previous_text: bool
+    # transcribe in the language reported by the platform, skipping Whisper's per-file detection
+    pin_language: bool
+
+
+PROFILES: dict[str, TranscriptionProfile] = {
+    FAST: {
+        'name': FAST,
+        'model': 'small',
+        'beam_size': None,
+        'best_of': None,
+        'temperature': (0.0,),
+        'word_timestamps': False,
+        'condition_on_previous_text': False,
+        'pin_language': True,
+    },
+    BALANCED: {
+        'name': BALANCED,
+        'model': None,
+        'beam_size': None,
+        'best_of': None,
+        'temperature': (0.0, 0.4, 0.8),
+        'word_timestamps': False,
+        'condition_on_previous_text': True,
+        'pin_language': True,
+    },
+    ACCURATE: {
+        'name': ACCURATE,
+        # more accurate through its decoding, on the model the deployment chose
+        'model': None,
+        'beam_size': 5,
+        'best_of': 5,
+        'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        'word_timestamps': True,
+        'condition_on_previous_text': True,
+        'pin_language': False,
+    },
+}
+
+PROFILE_CHOICES = (*PROFILES, AUTO)
+
+
+def whisper_options(profile: TranscriptionProfile, language: Optional[str] = None) -> dict:
+    """keyword arguments for `whisper.Whisper.transcribe`"""
+    return dict(
+        verbose=None,
+        temperature=profile['temperature'],
+        compression_ratio_threshold=2.4,
+        condition_on_previous_text=profile['condition_on_previous_text'],
+        word_timestamps=profile['word_timestamps'],
+        beam_size=profile['beam_size'],
+        best_of=profile['best_of'],
+        language=whisper_language(language) if profile['pin_language'] else None,
+    )
+
+
+def whisper_language(language: Optional[str]) -> Optional[str]:
+    """
+    the Whisper code of a platform language tag (`en-US`, `pt_BR`, `zh-Hans`: `en`, `pt`, `zh`),
+    None (Whisper detects the language) if Whisper does not know it
+    """
+    if not language:
+        return None
+    code = re.split(r'[-_]', language.strip().lower(), maxsplit=1)[0]
+    return code if code in lazy_imports.whisper().tokenizer.LANGUAGES else None
+
+
+class ProfilePolicy:
+    """
+    Picks a profile from the video duration and the number of videos waiting:
+    long videos during a backlog get the fast profile, short ones on an idle bot the accurate one.
+    """
+
+    def __init__(self, long_seconds: float = 2 * 3600, short_seconds: float = 15 * 60, busy_queue: int = 2):
+        self._long_seconds = long_seconds
+        self._short_seconds = short_seconds
+        self._busy_queue = busy_queue
+
+    def choose(self, duration: Optional[float], queue_depth: int = 0) -> TranscriptionProfile:
+        if duration is None:
+            return PROFILES[FAST if queue_depth >= self._busy_queue else BALANCED]
+        if duration >= self._long_seconds and queue_depth >= self._busy_queue:
+            return PROFILES[FAST]
+        if duration >= 2 * self._long_seconds and queue_depth > 0:
+            return PROFILES[FAST]
+        if duration <= self._short_seconds and queue_depth == 0:
+            return PROFILES[ACCURATE]
+        return PROFILES[BALANCED]
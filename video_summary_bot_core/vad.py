@@ -0,0 +1,100 @@
+import numpy as np
+
+from video_summary_bot_core.audio import SAMPLE_RATE
+
+__all__ = ['frame_energies', 'split_points', 'window_points']
+
+
+def frame_energies(audio: np.ndarray, sample_rate: int = SAMPLE_RATE, frame_ms: float = 30.0) -> np.ndarray:
+    """log energy (dB) of consecutive non overlapping frames"""
+    frame = max(int(sample_rate * frame_ms / 1000), 1)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    energies = np.empty(n_frames, dtype=np.float32)
+    # blockwise, so a memory mapped multi hour file is never squared as a whole
+    block = 4096
+    for start in range(0, n_frames, block):
+        stop = min(start + block, n_frames)
+        frames = np.asarray(audio[start * frame:stop * frame], dtype=np.float32).reshape(stop - start, frame)
+        energies[start:stop] = np.mean(np.square(frames), axis=1)
+    return 10 * np.log10(energies + 1e-12)
+
+
+def _smoothed_energies(audio: np.ndarray, sample_rate: int, frame_ms: float, min_silence_ms: float) -> np.ndarray:
+    energies = frame_energies(audio, sample_rate, frame_ms)
+    # smoothing over the minimum silence length: a single quiet frame between two words is not a pause
+    window = max(int(min_silence_ms / frame_ms), 1)
+    return np.convolve(energies, np.ones(window) / window, mode='same')
+
+
+def split_points(
+        audio: np.ndarray,
+        sample_rate: int = SAMPLE_RATE,
+        chunk_seconds: float = 600.0,
+        search_seconds: float = 30.0,
+        frame_ms: float = 30.0,
+        min_silence_ms: float = 300.0
+) -> list[int]:
+    """
+    Chunk boundaries (sample indices, first is 0 and last is len(audio)) roughly every `chunk_seconds`.
+    Each boundary is moved to the quietest stretch of at least `min_silence_ms` found within
+    `search_seconds` around the nominal position, so no word is cut in half.
+    """
+    total = len(audio)
+    if total <= chunk_seconds * sample_rate * 1.5:
+        return [0, total]
+    smoothed = _smoothed_energies(audio, sample_rate, frame_ms, min_silence_ms)
+    frame = int(sample_rate * frame_ms / 1000)
+
+    boundaries = [0]
+    search = int(search_seconds * 1000 / frame_ms)
+    nominal = chunk_seconds * 1000 / frame_ms
+    position = nominal
+    while position < len(smoothed) - nominal / 2:
+        lo = max(int(position) - search, 0)
+        hi = min(int(position) + search, len(smoothed))
+        window_energies = smoothed[lo:hi]
+        # among the (nearly) quietest frames, the one closest to the nominal position
+        quiet = np.flatnonzero(window_energies <= window_energies.min() + 1.0)
+        quietest = lo + int(quiet[np.argmin(np.abs(quiet + lo - position))])
+        boundary = quietest * frame
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+        position = quietest + nominal
+    boundaries.append(total)
+    return boundaries
+
+
+def window_points(
+        audio: np.ndarray,
+        sample_rate: int = SAMPLE_RATE,
+        max_seconds: float = 30.0,
+        search_seconds: float = 5.0,
+        frame_ms: float = 30.0,
+        min_silence_ms: float = 300.0
+) -> list[int]:
+    """
+    Boundaries (sample indices, first is 0 and last is len(audio)) of consecutive windows of at most
+    `max_seconds`, e.g. for a model with a fixed input length. Each window is cut at the quietest stretch
+    of its last `search_seconds`, so a word is not split between two windows.
+    """
+    total = len(audio)
+    max_samples = int(max_seconds * sample_rate)
+    if total <= max_samples:
+        return [0, total]
+    smoothed = _smoothed_energies(audio, sample_rate, frame_ms, min_silence_ms)
+    frame = int(sample_rate * frame_ms / 1000)
+    search = max(int(search_seconds * 1000 / frame_ms), 1)
+
+    boundaries = [0]
+    while total - boundaries[-1] > max_samples:
+        # frames entirely inside the window
+        hi = (boundaries[-1] + max_samples) // frame
+        lo = max(hi - search, boundaries[-1] // frame + 1)
+        window_energies = smoothed[lo:hi]
+        # among the (nearly) quietest frames the latest one, for windows as long as possible
+        quiet = np.flatnonzero(window_energies <= window_energies.min() + 1.0)
+        boundaries.append((lo + int(quiet[-1])) * frame)
+    boundaries.append(total)
+    return boundaries
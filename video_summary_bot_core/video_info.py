@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, TypedDict, Any, Callable
+
+from video_summary_bot_core import metrics
+from video_summary_bot_core.artifact_store import ArtifactStore, VIDEO_INFO
+
+__all__ = ['AudioFormat', 'SubtitleTrack', 'VideoInfo', 'VideoInfoCache', 'video_info_from_extract']
+
+
+class AudioFormat(TypedDict):
+    format_id: Optional[str]
+    ext: Optional[str]
+    acodec: Optional[str]
+    abr: Optional[float]
+    filesize: Optional[int]
+    url: Optional[str]
+
+
+class SubtitleTrack(TypedDict):
+    ext: Optional[str]
+    url: Optional[str]
+    name: Optional[str]
+
+
+class VideoInfo(TypedDict):
+    url: str
+    id: Optional[str]
+    extractor: Optional[str]
+    title: Optional[str]
+    duration: Optional[float]
+    language: Optional[str]
+    audio_format: Optional[AudioFormat]
+    subtitles: dict[str, list[SubtitleTrack]]
+    automatic_captions: dict[str, list[SubtitleTrack]]
+
+
+def _has_audio(f: dict) -> bool:
+    return f.get('acodec') not in (None, 'none')
+
+
+def _select_audio_format(raw: dict) -> Optional[AudioFormat]:
+    """mimic the 'bestaudio/best' format selector used by GenericHelper.video2audio"""
+    formats = raw.get('formats') or [raw]
+    audio_only = [f for f in formats if _has_audio(f) and f.get('vcodec') == 'none']
+    if audio_only:
+        best = max(audio_only, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+    else:
+        # yt-dlp sorts formats from worst to best
+        with_audio = [f for f in formats if _has_audio(f)] or formats
+        best = with_audio[-1]
+    if not best.get('url') and not best.get('format_id'):
+        return None
+    return {
+        'format_id': best.get('format_id'),
+        'ext': best.get('ext'),
+        'acodec': best.get('acodec'),
+        'abr': best.get('abr'),
+        'filesize': best.get('filesize') or best.get('filesize_approx'),
+        'url': best.get('url'),
+    }
+
+
+def _select_tracks(tracks: Optional[dict]) -> dict[str, list[SubtitleTrack]]:
+    return {
+        lang: [{'ext': t.get('ext'), 'url': t.get('url'), 'name': t.get('name')} for t in entries]
+        for lang, entries in (tracks or {}).items()
+    }
+
+
+def video_info_from_extract(url: str, raw: dict) -> VideoInfo:
+    return {
+        'url': url,
+        'id': raw.get('id'),
+        'extractor': raw.get('extractor'),
+        'title': raw.get('title'),
+        'duration': raw.get('duration'),
+        'language': raw.get('language'),
+        'audio_format': _select_audio_format(raw),
+        'subtitles': _select_tracks(raw.get('subtitles')),
+        'automatic_captions': _select_tracks(raw.get('automatic_captions')),
+    }
+
+
+class VideoInfoCache:
+    """
+    Resolve a video url once with `extract_info` and reuse the result.
+    Entries live in a TTL-bounded in-memory LRU backed by json artifacts of `store` (evicted with the
+    rest of the cache).
+    `get_yt` returns the YoutubeDL instance, it is only called on a miss (yt-dlp is imported on first use).
+    The full `extract_info` result of the last `max_extracted` misses is kept for `extracted_ttl` seconds
+    (the format urls expire), to download them without resolving the url again.
+    """
+    _get_yt: Callable[[], Any]
+    _artifacts: ArtifactStore
+    _max_entries: int
+    _ttl: float
+    _entries: OrderedDict[str, tuple[float, VideoInfo]]
+    _extracted: OrderedDict[str, tuple[float, dict]]
+
+    def __init__(self, get_yt: Callable[[], Any], store: ArtifactStore, max_entries: int = 256,
+                 ttl: float = 6 * 60 * 60, max_extracted: int = 8, extracted_ttl: float = 30 * 60):
+        self._get_yt = get_yt
+        self._artifacts = store
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_extracted = max_extracted
+        self._extracted_ttl = extracted_ttl
+        self._entries = OrderedDict()
+        self._extracted = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> VideoInfo:
+        """
+        :raise yt_dlp.DownloadError: if the url cannot be resolved
+        """
+        url = url.strip()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and now - entry[0] < self._ttl:
+                self._entries.move_to_end(url)
+                self.hits += 1
+                metrics.CACHE_REQUESTS.inc(cache=VIDEO_INFO, result='hit')
+                return entry[1]
+        entry = self._load(url, now)
+        if entry is None:
+            info = self.put(url, self._get_yt().extract_info(url, download=False))
+            with self._lock:
+                self.misses += 1
+            metrics.CACHE_REQUESTS.inc(cache=VIDEO_INFO, result='miss')
+            return info
+        with self._lock:
+            self.hits += 1
+        metrics.CACHE_REQUESTS.inc(cache=VIDEO_INFO, result='hit')
+        self._remember(url, entry)
+        return entry[1]
+
+    def put(self, url: str, raw: dict) -> VideoInfo:
+        """cache the `extract_info` result of `url` resolved elsewhere, as a miss would"""
+        url = url.strip()
+        now = time.time()
+        entry = (now, video_info_from_extract(url, raw))
+        self._store(url, entry)
+        with self._lock:
+            self._extracted[url] = (now, raw)
+            while len(self._extracted) > self._max_extracted:
+                self._extracted.popitem(last=False)
+        self._remember(url, entry)
+        return entry[1]
+
+    def extracted(self, url: str) -> Optional[dict]:
+        """the `extract_info` result of a recent miss, None if it has to be extracted again"""
+        url = url.strip()
+        with self._lock:
+            entry = self._extracted.get(url)
+        if entry is None or time.time() - entry[0] >= self._extracted_ttl:
+            return None
+        return entry[1]
+
+    def invalidate(self, url: str) -> None:
+        url = url.strip()
+        with self._lock:
+            self._entries.pop(url, None)
+            self._extracted.pop(url, None)
+        self._artifacts.remove(VIDEO_INFO, self._name(url))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def _remember(self, url: str, entry: tuple[float, VideoInfo]) -> None:
+        with self._lock:
+            self._entries[url] = entry
+            self._entries.move_to_end(url)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _name(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _load(self, url: str, now: float) -> Optional[tuple[float, VideoInfo]]:
+        path = self._artifacts.get(VIDEO_INFO, self._name(url))
+        if path is None:
+            return None
+        try:
+            with path.open('r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"ignoring unreadable video info cache file {path}: {e}")
+            return None
+        if now - data['fetched_at'] >= self._ttl:
+            return None
+        return data['fetched_at'], data['info']
+
+    def _store(self, url: str, entry: tuple[float, VideoInfo]) -> None:
+        try:
+            with self._artifacts.write(VIDEO_INFO, self._name(url), '.json', {'url': url}) as f:
+                json.dump({'fetched_at': entry[0], 'info': entry[1]}, f)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"unable to write the video info cache entry of {url}: {e}")
@@ -0,0 +1,334 @@
+import collections
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Optional, Any, Iterator, TYPE_CHECKING
+
+import numpy as np
+
+from video_summary_bot_core import lazy_imports
+from video_summary_bot_core.audio import SAMPLE_RATE
+from video_summary_bot_core.model_registry import ModelRegistry
+from video_summary_bot_core.vad import window_points
+
+if TYPE_CHECKING:
+    import whisper
+
+__all__ = ['BatchedWhisperScheduler', 'get_batch_scheduler']
+
+WINDOW_SECONDS = 30
+_WINDOW_SAMPLES = WINDOW_SECONDS * SAMPLE_RATE
+_TIME_PRECISION = 0.02
+# `whisper.transcribe` options applied to the windows, with its defaults
+_DECODE_OPTIONS = {
+    'language': None,
+    'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+    'beam_size': None,
+    'best_of': None,
+    'compression_ratio_threshold': 2.4,
+    'logprob_threshold': -1.0,
+    'no_speech_threshold': 0.6,
+}
+
+
+class _Window:
+    __slots__ = ('audio', 'options', 'future', 'submitted_at')
+
+    def __init__(self, audio: np.ndarray, options: dict):
+        self.audio = audio
+        self.options = options
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+
+def _decode_options(options: dict) -> dict:
+    decode_options = {key: options.get(key, default) for key, default in _DECODE_OPTIONS.items()}
+    temperature = decode_options['temperature']
+    decode_options['temperature'] = tuple(temperature) if isinstance(temperature, (list, tuple)) else (temperature,)
+    return decode_options
+
+
+def _is_silent(result: 'whisper.DecodingResult', options: dict) -> bool:
+    """no speech, and whatever was decoded is not trusted (like `whisper.transcribe` skips such windows)"""
+    return options['no_speech_threshold'] is not None and result.no_speech_prob > options['no_speech_threshold'] \
+        and options['logprob_threshold'] is not None and result.avg_logprob < options['logprob_threshold']
+
+
+def _needs_fallback(result: 'whisper.DecodingResult', options: dict) -> bool:
+    """a repetition loop (text compressing too well) or a low confidence, on a window that is not silent"""
+    if _is_silent(result, options):
+        return False
+    if options['compression_ratio_threshold'] is not None \
+            and result.compression_ratio > options['compression_ratio_threshold']:
+        return True
+    return options['logprob_threshold'] is not None and result.avg_logprob < options['logprob_threshold']
+
+
+class BatchedWhisperScheduler:
+    """
+    Central inference scheduler feeding one Whisper model.
+    Windows of up to 30 seconds submitted by every caller are collected into padded batches of up to
+    `batch_size` (waiting at most `max_wait` seconds for a batch to fill), run through the
+    encoder/decoder together, and the decoded segments are routed back to each caller.
+    Windows are decoded independently (no conditioning on the previous window), a batch holds windows
+    with the same decoding options; windows failing the quality thresholds are decoded again at the
+    next temperature of their fallback schedule.
+    """
+
+    def __init__(
+            self,
+            model_factory: Callable[[], 'whisper.Whisper'],
+            batch_size: int = 8,
+            max_wait: float = 0.05
+    ):
+        self._model_factory = model_factory
+        self._batch_size = max(batch_size, 1)
+        self._max_wait = max_wait
+        self._pending: collections.deque[_Window] = collections.deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._audio_seconds = 0.0
+        self._busy_seconds = 0.0
+        self._batches = 0
+        self._windows = 0
+        self._fallbacks = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                with self._condition:
+                    self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='whisper-scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        """decode the windows already submitted, then stop the scheduler thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            with self._condition:
+                self._stopping = True
+                self._condition.notify()
+            thread.join()
+
+    def submit_window(self, audio: np.ndarray, **options) -> Future:
+        """
+        transcribe up to 30 s of 16 kHz audio, the future yields segments relative to the window;
+        `options` as for `transcribe`
+        """
+        if len(audio) > _WINDOW_SAMPLES:
+            raise ValueError(f"window longer than {WINDOW_SECONDS} s")
+        self.start()
+        window = _Window(audio, _decode_options(options))
+        with self._condition:
+            self._pending.append(window)
+            self._condition.notify()
+        return window.future
+
+    def transcribe(self, audio: np.ndarray, **options) -> list[dict]:
+        """`transcribe_iter` as a whole"""
+        return [segment for _, segments in self.transcribe_iter(audio, **options) for segment in segments]
+
+    def transcribe_iter(self, audio: np.ndarray, **options) -> Iterator[tuple[float, list[dict]]]:
+        """
+        Split audio in windows of up to 30 s cut at silences (decoded independently, a word cut in two
+        would be garbled in both) and submit them all at once. (end in seconds, segments) is yielded in
+        order as soon as each window is decoded, together with the following ones already decoded.
+        `options` are `whisper.Whisper.transcribe` keyword arguments: the language, the temperature
+        fallback schedule and its thresholds, beam_size and best_of apply; the ones conditioning a window
+        on the others (initial_prompt, condition_on_previous_text) and word_timestamps are ignored.
+        """
+        boundaries = window_points(audio, SAMPLE_RATE, WINDOW_SECONDS)
+        windows = [
+            (start / SAMPLE_RATE, stop / SAMPLE_RATE, self.submit_window(audio[start:stop], **options))
+            for start, stop in zip(boundaries, boundaries[1:]) if stop > start
+        ]
+        try:
+            i = 0
+            while i < len(windows):
+                segments = []
+                while True:
+                    offset, end, future = windows[i]
+                    segments += [{'start': s['start'] + offset, 'end': s['end'] + offset, 'text': s['text']}
+                                 for s in future.result()]
+                    i += 1
+                    if i == len(windows) or not windows[i][2].done():
+                        break
+                yield end, segments
+        finally:
+            # the consumer stopped early: the windows not decoded yet are dropped
+            for _, _, future in windows:
+                future.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'batches': self._batches,
+                'windows': self._windows,
+                'mean_batch_size': self._windows / self._batches if self._batches else 0.0,
+                # windows decoded again at a higher temperature
+                'fallbacks': self._fallbacks,
+                'audio_seconds': self._audio_seconds,
+                'busy_seconds': self._busy_seconds,
+                # audio seconds transcribed per wall second spent decoding
+                'throughput': self._audio_seconds / self._busy_seconds if self._busy_seconds else 0.0,
+            }
+
+    def _next_batch(self) -> Optional[list[_Window]]:
+        """up to `batch_size` windows decoded with the options of the oldest one, None once stopped"""
+        with self._condition:
+            while True:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    return None
+                first = self._pending[0]
+                deadline = first.submitted_at + self._max_wait
+                while True:
+                    batch = [w for w in self._pending if w.options == first.options][:self._batch_size]
+                    timeout = deadline - time.monotonic()
+                    if len(batch) == self._batch_size or timeout <= 0 or self._stopping:
+                        break
+                    self._condition.wait(timeout)
+                for window in batch:
+                    self._pending.remove(window)
+                # windows of a caller gone away are not decoded
+                batch = [w for w in batch if w.future.set_running_or_notify_cancel()]
+                if batch:
+                    return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.monotonic()
+            try:
+                results = self._decode_batch([w.audio for w in batch], batch[0].options)
+            except Exception as e:
+                logging.error(f"batched Whisper inference failed: {e}")
+                for window in batch:
+                    window.future.set_exception(e)
+                continue
+            elapsed = max(time.monotonic() - started, 1e-6)
+            audio_seconds = sum(len(w.audio) for w in batch) / SAMPLE_RATE
+            with self._lock:
+                self._batches += 1
+                self._windows += len(batch)
+                self._audio_seconds += audio_seconds
+                self._busy_seconds += elapsed
+            logging.debug(f"decoded a batch of {len(batch)} windows, {audio_seconds / elapsed:.1f}x realtime")
+            for window, segments in zip(batch, results):
+                window.future.set_result(segments)
+
+    def _decode_batch(self, windows: list[np.ndarray], options: dict) -> list[list[dict]]:
+        """
+        decode the windows together at the first temperature of the fallback schedule, the ones failing
+        the quality thresholds together again at the next one (like `whisper.transcribe` does per window)
+        """
+        # asked for every batch: the factory is expected to cache (e.g. the model registry)
+        model = self._model_factory()
+        whisper = lazy_imports.whisper()
+        mel = np.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(np.ascontiguousarray(w, dtype=np.float32)),
+                n_mels=model.dims.n_mels
+            ).numpy()
+            for w in windows
+        ])
+        temperatures = options['temperature']
+        results: list[Any] = [None] * len(windows)
+        todo = list(range(len(windows)))
+        for i, temperature in enumerate(temperatures):
+            retry = []
+            for index, result in zip(todo, self._decode(model, mel[todo], options, temperature)):
+                results[index] = result
+                if i + 1 < len(temperatures) and _needs_fallback(result, options):
+                    retry.append(index)
+            if not retry:
+                break
+            logging.debug(f"decoding {len(retry)} windows again at temperature {temperatures[i + 1]}")
+            with self._lock:
+                self._fallbacks += len(retry)
+            todo = retry
+        return [
+            [] if _is_silent(result, options) else self._segments(model, result, len(w) / SAMPLE_RATE)
+            for w, result in zip(windows, results)
+        ]
+
+    @staticmethod
+    def _decode(
+            model: 'whisper.Whisper',
+            mel: np.ndarray,
+            options: dict,
+            temperature: float
+    ) -> list['whisper.DecodingResult']:
+        whisper = lazy_imports.whisper()
+        decoding_options = whisper.DecodingOptions(
+            language=options['language'],
+            temperature=temperature,
+            # beam search at temperature 0, sampling above
+            beam_size=options['beam_size'] if temperature == 0 else None,
+            best_of=options['best_of'] if temperature > 0 else None,
+            without_timestamps=False,
+            fp16=model.device.type != 'cpu'
+        )
+        return whisper.decode(model, lazy_imports.torch().from_numpy(mel).to(model.device), decoding_options)
+
+    @staticmethod
+    def _segments(model: 'whisper.Whisper', result: 'whisper.DecodingResult', window_seconds: float) -> list[dict]:
+        tokenizer = lazy_imports.whisper().tokenizer.get_tokenizer(
+            model.is_multilingual,
+            num_languages=model.num_languages,
+            language=result.language,
+            task='transcribe'
+        )
+        timestamp_begin = tokenizer.timestamp_begin
+        segments = []
+        start: Optional[float] = None
+        text_tokens: list[int] = []
+        for token in result.tokens:
+            if token < timestamp_begin:
+                text_tokens.append(token)
+                continue
+            timestamp = min((token - timestamp_begin) * _TIME_PRECISION, window_seconds)
+            if text_tokens:
+                segments.append({'start': start or 0.0, 'end': timestamp, 'text': tokenizer.decode(text_tokens)})
+                text_tokens = []
+                start = None
+            else:
+                start = timestamp
+        if text_tokens:
+            segments.append({'start': start or 0.0, 'end': window_seconds, 'text': tokenizer.decode(text_tokens)})
+        return segments
+
+
+_schedulers: dict[tuple[ModelRegistry, str, str], BatchedWhisperScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_batch_scheduler(
+        registry: ModelRegistry,
+        name: str,
+        device: str = "cuda",
+        download_root: Optional[str | Path] = None,
+        batch_size: int = 8,
+        max_wait: float = 0.05
+) -> BatchedWhisperScheduler:
+    """
+    the process wide scheduler of the model `name` on `device`, whose batches mix the windows of every
+    helper and job (created with the settings of the first caller)
+    """
+    key = (registry, name, device)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = BatchedWhisperScheduler(
+                lambda: registry.get(name, device, download_root),
+                batch_size=batch_size,
+                max_wait=max_wait
+            )
+        return _schedulers[key]
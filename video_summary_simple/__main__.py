@@ -1,30 +1,93 @@
 import argparse
+import contextlib
+import datetime
+import json
 import os
+import sys
 from pathlib import Path
 
+from video_summary_bot_core import metrics
+from video_summary_bot_core.artifact_store import ArtifactStore
+from video_summary_bot_core.captions import TRANSCRIPT_SOURCES, PREFER_CAPTIONS
+from video_summary_bot_core.fingerprint import FingerprintIndex
+from video_summary_bot_core.transcription_profiles import PROFILE_CHOICES, BALANCED
 from video_summary_simple.aibot import AiBot
+from video_summary_simple.batch import BatchPipeline, STAGES, expand_urls, to_markdown
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Simple script to summarize a Youtube video")
-    parser.add_argument("video_url", help="Youtube video url to be summarized")
+def cache_main(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="video_summary_simple cache",
+                                     description="Inspect or clean the cached audio, transcripts and summaries")
+    parser.add_argument('command', choices=['stats', 'gc'])
+    parser.add_argument('--data-dir', type=Path, default=Path('data'), help="data directory")
+    parser.add_argument('--max-gb', type=float, default=None, help="gc: evict least recently used files above this")
+    parser.add_argument('--ttl-days', type=float, default=None, help="gc: evict files not used for this long")
+    args = parser.parse_args(argv)
+    store = ArtifactStore(args.data_dir)
+    store.migrate_flat_files()
+    if args.command == 'gc':
+        if args.max_gb is None and args.ttl_days is None:
+            parser.error("gc needs --max-gb and/or --ttl-days")
+        result = store.evict(
+            max_bytes=int(args.max_gb * 2 ** 30) if args.max_gb is not None else None,
+            ttl=args.ttl_days * 24 * 3600 if args.ttl_days is not None else None
+        )
+        print(f"removed {result['removed']} artifacts, {result['freed_bytes'] / 2 ** 20:.1f} MiB freed, "
+              f"{result['skipped']} in use kept")
+        if (args.data_dir / 'fingerprints.sqlite3').exists():
+            print(f"removed {FingerprintIndex(args.data_dir).prune(store)} fingerprints of audio without a transcript")
+    stats = store.stats()
+    for kind, kind_stats in sorted(stats['kinds'].items()):
+        print(f"{kind}: {kind_stats['count']} files, {kind_stats['bytes'] / 2 ** 20:.1f} MiB")
+    print(f"total: {stats['count']} files, {stats['bytes'] / 2 ** 20:.1f} MiB")
+    # not artifacts, outside of the budget
+    for database in ('fingerprints.sqlite3', 'summary_messages.sqlite3'):
+        if (args.data_dir / database).exists():
+            print(f"{database}: {(args.data_dir / database).stat().st_size / 2 ** 20:.1f} MiB")
+
+
+def ask_main(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="video_summary_simple ask",
+                                     description="Answer a question about a video from its (cached) transcript")
+    parser.add_argument('video_url', help="video url, or the artifact name of an upload (e.g. telegram_...)")
+    parser.add_argument('question')
+    parser.add_argument('--top-k', type=int, default=4,
+                        help="transcript excerpts sent to the model, the ones most relevant to the question")
+    parser.add_argument('--full-transcript', action='store_true',
+                        help="send the whole transcript instead of the relevant excerpts")
     parser.add_argument('--data-dir', type=Path, default=Path('data'), help="data directory")
     parser.add_argument('--openai-model', type=str, help='OpenAI model', default='gpt-4o')
     parser.add_argument('--whisper-model', type=str, help='Whisper model', default='large-v3')
     parser.add_argument('--openai-api-key', type=str, help='OpenAI api key', default=None)
-    args = parser.parse_args()
-    youtube_video_url = args.video_url
-    data_dir: Path = args.data_dir
-    data_dir.mkdir(exist_ok=True, parents=True)
-    openai_api_key = os.environ.get('OPENAI_API_KEY', args.openai_api_key)
+    parser.add_argument('--transcript-source', type=str, choices=TRANSCRIPT_SOURCES, default=PREFER_CAPTIONS,
+                        help="when not cached yet: use platform captions when available, or always/never run Whisper")
+    parser.add_argument('--language', type=str, default=None, help="language of the answer")
+    args = parser.parse_args(argv)
+    args.data_dir.mkdir(exist_ok=True, parents=True)
     ai = AiBot(
-        data_dir=data_dir,
+        language=args.language,
+        data_dir=args.data_dir,
         openai_model=args.openai_model,
         whisper_model_name=args.whisper_model,
-        openai_api_key=openai_api_key
+        openai_api_key=os.environ.get('OPENAI_API_KEY', args.openai_api_key),
+        transcript_source=args.transcript_source
     )
+    try:
+        answer = ai.ask(args.video_url, args.question, top_k=None if args.full_transcript else args.top_k)
+    except ValueError as e:
+        parser.error(str(e))
+    print(answer['answer'])
+    if answer['sources']:
+        print("")
+    for source in answer['sources']:
+        start, end = (datetime.timedelta(seconds=int(source[k])) for k in ('start', 'end'))
+        print(f"- {start} - {end}" + (f" {source['ref_url']}" if source['ref_url'] else ''))
+    print(f"{answer['prompt_tokens']} prompt tokens (whole transcript: ~{answer['transcript_tokens']}), "
+          f"answered in {answer['seconds']:.1f} s", file=sys.stderr)
 
-    for d in ai.summarize_video(youtube_video_url):
+
+def summarize_one(ai: AiBot, video_url: str, stream: bool):
+    for d in ai.summarize_video(video_url, stream=stream):
         print("")
         print(f"# {d['topic']}")
         print("")
@@ -34,5 +97,172 @@ def main():
         print("")
 
 
+def summarize_many(ai: AiBot, video_urls, args: argparse.Namespace):
+    pipeline = BatchPipeline(
+        ai,
+        download_workers=args.download_jobs,
+        transcribe_workers=args.transcribe_jobs,
+        summarize_workers=args.summarize_jobs
+    )
+    jsonl = None
+    if args.output_dir is not None:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        jsonl = (args.output_dir / 'summaries.jsonl').open('a')
+    try:
+        for result in pipeline.run(video_urls):
+            line = json.dumps(result, ensure_ascii=False)
+            if args.format == 'jsonl':
+                print(line, flush=True)
+            else:
+                print(to_markdown(result), flush=True)
+            if jsonl is not None:
+                jsonl.write(line + "\n")
+                jsonl.flush()
+                if result['name'] is not None:
+                    (args.output_dir / f"{result['name']}.md").write_text(to_markdown(result))
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+    stats = pipeline.stats()
+    print(f"{stats['videos']} videos ({stats['failed']} failed) in {stats['wall_seconds'] / 60:.1f} min, "
+          f"{stats['videos_per_hour']:.1f} videos/hour", file=sys.stderr)
+    for stage in STAGES:
+        stage_stats = stats['stages'][stage]
+        print(f"  {stage}: {stage_stats['workers']} workers, {stage_stats['busy_seconds']:.0f} s busy, "
+              f"{stage_stats['utilization']:.0%} utilization", file=sys.stderr)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'cache':
+        return cache_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'ask':
+        return ask_main(sys.argv[2:])
+    parser = argparse.ArgumentParser(description="Simple script to summarize Youtube videos or playlists "
+                                                 "(`cache stats|gc` to manage the data directory, "
+                                                 "`ask URL QUESTION` for follow-up questions)")
+    parser.add_argument("video_url", nargs='*', help="video, playlist or channel urls to be summarized")
+    parser.add_argument('--urls-file', type=Path, default=None,
+                        help="file with one url per line (blank lines and lines starting with # are ignored)")
+    parser.add_argument('--output-dir', type=Path, default=None,
+                        help="write summaries.jsonl and one markdown file per video here")
+    parser.add_argument('--format', type=str, choices=['markdown', 'jsonl'], default='markdown',
+                        help="format of the summaries printed to stdout")
+    parser.add_argument('--download-jobs', type=int, default=2,
+                        help="videos downloaded at once when summarizing several videos")
+    parser.add_argument('--transcribe-jobs', type=int, default=1,
+                        help="videos transcribed at once when summarizing several videos")
+    parser.add_argument('--summarize-jobs', type=int, default=2,
+                        help="videos summarized at once when summarizing several videos")
+    parser.add_argument('--data-dir', type=Path, default=Path('data'), help="data directory")
+    parser.add_argument('--openai-model', type=str, help='OpenAI model', default='gpt-4o')
+    parser.add_argument('--whisper-model', type=str, help='Whisper model', default='large-v3')
+    parser.add_argument('--openai-api-key', type=str, help='OpenAI api key', default=None)
+    parser.add_argument('--transcript-source', type=str, choices=TRANSCRIPT_SOURCES, default=PREFER_CAPTIONS,
+                        help="use platform captions when available, or always/never run Whisper")
+    parser.add_argument('--caption-languages', type=str, default=None,
+                        help="comma separated preferred caption languages, e.g. 'en,it'")
+    parser.add_argument('--whisper-workers', type=int, default=1,
+                        help="Whisper model replicas transcribing chunks of long videos in parallel")
+    parser.add_argument('--chunk-minutes', type=float, default=10,
+                        help="chunk length for parallel long-form transcription")
+    parser.add_argument('--whisper-batch-size', type=int, default=1,
+                        help="30 s windows decoded together (1 disables batching)")
+    parser.add_argument('--whisper-batch-max-wait-ms', type=float, default=50,
+                        help="max wait for a batch to fill")
+    parser.add_argument('--profile', type=str, choices=PROFILE_CHOICES, default=BALANCED,
+                        help="transcription profile: Whisper model size, decoding and language pinning "
+                             "('auto' picks one from the video duration)")
+    parser.add_argument('--summary-window-tokens', type=int, default=12000,
+                        help="transcript tokens per summarization request, long videos are summarized in windows")
+    parser.add_argument('--summary-concurrency', type=int, default=4,
+                        help="summarization requests in flight at once")
+    parser.add_argument('--transcript-merge-seconds', type=float, default=15,
+                        help="transcript segments are merged into prompt lines of up to this length")
+    parser.add_argument('--transcript-token-budget', type=int, default=None,
+                        help="merge transcript lines further until the prompt fits this many tokens")
+    parser.add_argument('--summary-cache-ttl-hours', type=float, default=7 * 24,
+                        help="cached summaries older than this are refreshed")
+    parser.add_argument('--no-stale-summaries', action='store_true',
+                        help="recompute expired cached summaries before answering instead of in the background")
+    parser.add_argument('--duplicate-threshold', type=float, default=0.1,
+                        help="reuse the transcript and summary of audio at least this similar (acoustic "
+                             "fingerprint, 0 disables)")
+    parser.add_argument('--no-incremental-summary', action='store_true',
+                        help="wait for the whole transcript before summarizing (by default the windows already "
+                             "transcribed are summarized while Whisper is still running)")
+    parser.add_argument('--stream', action='store_true',
+                        help="print each topic as soon as it is generated (in generation order)")
+    parser.add_argument('--model-memory-budget-mb', type=float, default=None,
+                        help="max memory for loaded Whisper models, least recently used ones are evicted")
+    parser.add_argument('--cache-max-gb', type=float, default=None,
+                        help="evict the least recently used cached audio/transcripts/summaries above this size")
+    parser.add_argument('--cache-ttl-days', type=float, default=None,
+                        help="evict cached files not used for this many days")
+    parser.add_argument('--timings', action='store_true',
+                        help="print where the run spent its time: stages, audio, tokens, cache hits")
+    parser.add_argument('--trace', type=Path, default=None,
+                        help="profile the run into this file: cProfile stats, or a pyinstrument report "
+                             "for a .html file (if pyinstrument is installed)")
+    args = parser.parse_args()
+    urls = list(args.video_url)
+    if args.urls_file is not None:
+        with args.urls_file.open('r') as f:
+            urls += [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    if not urls:
+        parser.error("no video url given")
+    data_dir: Path = args.data_dir
+    data_dir.mkdir(exist_ok=True, parents=True)
+    openai_api_key = os.environ.get('OPENAI_API_KEY', args.openai_api_key)
+    ai = AiBot(
+        data_dir=data_dir,
+        openai_model=args.openai_model,
+        whisper_model_name=args.whisper_model,
+        openai_api_key=openai_api_key,
+        transcript_source=args.transcript_source,
+        caption_languages=args.caption_languages.split(',') if args.caption_languages else None,
+        whisper_workers=args.whisper_workers,
+        chunk_seconds=args.chunk_minutes * 60,
+        whisper_batch_size=args.whisper_batch_size,
+        whisper_batch_max_wait=args.whisper_batch_max_wait_ms / 1000,
+        model_memory_budget=int(args.model_memory_budget_mb * 2 ** 20) if args.model_memory_budget_mb else None,
+        transcription_profile=args.profile,
+        summary_window_tokens=args.summary_window_tokens,
+        summary_concurrency=args.summary_concurrency,
+        transcript_merge_seconds=args.transcript_merge_seconds,
+        transcript_token_budget=args.transcript_token_budget,
+        summary_cache_ttl=args.summary_cache_ttl_hours * 3600,
+        summary_cache_serve_stale=not args.no_stale_summaries,
+        cache_max_bytes=int(args.cache_max_gb * 2 ** 30) if args.cache_max_gb is not None else None,
+        cache_ttl=args.cache_ttl_days * 24 * 3600 if args.cache_ttl_days is not None else None,
+        incremental_summary=not args.no_incremental_summary,
+        duplicate_threshold=args.duplicate_threshold or None
+    )
+
+    with metrics.trace(args.trace) if args.trace is not None else contextlib.nullcontext():
+        if len(urls) == 1 and args.output_dir is None:
+            videos = ai.expand_url(urls[0])
+            if len(videos) == 1:
+                summarize_one(ai, videos[0], args.stream)
+            else:
+                summarize_many(ai, videos, args)
+        else:
+            summarize_many(ai, expand_urls(ai, urls), args)
+
+    whisper_stats = ai.whisper_stats()
+    if whisper_stats and whisper_stats['batches']:
+        print(f"whisper: {whisper_stats['windows']} windows in {whisper_stats['batches']} batches, "
+              f"{whisper_stats['throughput']:.1f} audio s / wall s", file=sys.stderr)
+    for stats in ai.model_stats():
+        print(f"whisper model {stats['name']}: loaded in {stats['load_seconds']:.1f} s, "
+              f"{stats['resident_bytes'] / 2 ** 20:.0f} MiB resident", file=sys.stderr)
+    duplicates = ai.duplicate_stats()
+    if duplicates['duplicates']:
+        print(f"near-duplicates: {duplicates['duplicates']} ({duplicates['audio_seconds'] / 60:.0f} min of audio), "
+              f"~{duplicates['whisper_seconds_saved']:.0f} s of Whisper saved", file=sys.stderr)
+    if args.timings:
+        print(metrics.breakdown(), file=sys.stderr)
+    ai.store.evict()
+
+
 if __name__ == '__main__':
     main()
@@ -1,15 +1,34 @@
 import json
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Optional, Generator, TypedDict, Tuple
-
-from openai import OpenAI
-from openai.types.chat import ChatCompletionToolParam, ChatCompletionMessageToolCall
+from typing import List, Optional, Generator, TypedDict, Tuple, Callable, Iterable
 
+from video_summary_bot_core.captions import (
+    TRANSCRIPT_SOURCES, PREFER_CAPTIONS, WHISPER_ONLY, CAPTIONS_ONLY, NoCaptionsError, select_caption_track
+)
+from video_summary_bot_core import metrics
+from video_summary_bot_core.artifact_store import (
+    ArtifactStore, AUDIO, TRANSCRIPT, PARTIAL_TRANSCRIPT, TRANSCRIPT_INDEX, SUMMARY
+)
+from video_summary_bot_core.fingerprint import Fingerprint, FingerprintIndex, FingerprintMatch, audio_fingerprint
 from video_summary_bot_core.generic_helper import GenericHelper
+from video_summary_bot_core.model_registry import ModelStats
+from video_summary_bot_core.singleflight import SingleFlight
+from video_summary_bot_core.transcription_profiles import (
+    PROFILES, PROFILE_CHOICES, AUTO, BALANCED, ProfilePolicy, TranscriptionProfile
+)
+from video_summary_simple.answerer import QuestionAnswerer
+from video_summary_simple.summarizer import MapReduceSummarizer, Topic, TOOLS, estimate_tokens, merge_topics
+from video_summary_simple.summary_cache import SummaryCache, summary_key
+from video_summary_simple.transcript_encoder import EncodedTranscript, encode_transcript, encode_windows
+from video_summary_simple.transcript_index import TranscriptIndex
 
 PROMPT = """As a professional summarizer, your primary responsibility will be to create an organized summary of a video transcript segmented by topics.
-The transcript provided will include timestamps for each sentence.
+Each line of the transcript starts with its start time in seconds, a line lasts until the next one starts.
 Your task entails compiling a comprehensive list of topics covered in the video along with a succinct summary for each topic.
 It is imperative to accurately associate each topic with the corresponding timestamp from the transcript.
 Precision and meticulous attention to detail in timestamp allocation are essential for the accuracy of the summary.
@@ -19,6 +38,11 @@ Do not respond to this message, just call the function to save each topic.
 """
 
 
+def _clock(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}" if minutes >= 60 else f"{minutes:02d}:{seconds:02d}"
+
+
 class TopicSummary(TypedDict):
     topic: str
     summary: str
@@ -26,6 +50,23 @@ class TopicSummary(TypedDict):
     ref_url: Optional[str]
 
 
+class AnswerSource(TypedDict):
+    start: float
+    end: float
+    ref_url: Optional[str]
+
+
+class Answer(TypedDict):
+    question: str
+    answer: str
+    # the transcript excerpts sent to the model, empty when it got the whole transcript
+    sources: List[AnswerSource]
+    prompt_tokens: int
+    # prompt tokens of the whole encoded transcript
+    transcript_tokens: int
+    seconds: float
+
+
 class AiBot:
 
     def __init__(
@@ -35,137 +76,768 @@ class AiBot:
             openai_api_key: Optional[str] = None,
             whisper_model_name: str = "large-v3",
             whisper_device: str = "cuda",
-            data_dir: str | Path = "data"
+            data_dir: str | Path = "data",
+            transcript_source: str = PREFER_CAPTIONS,
+            caption_languages: Optional[List[str]] = None,
+            whisper_workers: int = 1,
+            chunk_seconds: float = 600.0,
+            whisper_batch_size: int = 1,
+            whisper_batch_max_wait: float = 0.05,
+            model_memory_budget: Optional[int] = None,
+            transcription_profile: str = BALANCED,
+            queue_depth: Optional[Callable[[], int]] = None,
+            summary_window_tokens: int = 12000,
+            summary_concurrency: int = 4,
+            transcript_merge_seconds: float = 15.0,
+            transcript_token_budget: Optional[int] = None,
+            summary_cache_ttl: float = 7 * 24 * 60 * 60,
+            summary_cache_serve_stale: bool = True,
+            cache_max_bytes: Optional[int] = None,
+            cache_ttl: Optional[float] = None,
+            incremental_summary: bool = True,
+            duplicate_threshold: Optional[float] = 0.1,
+            fingerprint_seconds: float = 180.0
     ):
+        """
+        `transcription_profile` is a profile name or 'auto' to choose per video from its duration
+        and `queue_depth` (videos waiting to be processed).
+        With `incremental_summary` the windows of a transcript being made are summarized while the
+        rest of the audio is still transcribed.
+        Audio about to be transcribed with Whisper is fingerprinted (its first `fingerprint_seconds`):
+        a near-duplicate of transcribed audio, with a similarity of at least `duplicate_threshold`,
+        reuses its transcript and summary instead; None disables it.
+        """
+        if transcript_source not in TRANSCRIPT_SOURCES:
+            raise ValueError(f"invalid transcript source '{transcript_source}'")
+        if transcription_profile not in PROFILE_CHOICES:
+            raise ValueError(f"invalid transcription profile '{transcription_profile}'")
+        self._transcription_profile = transcription_profile
+        self._profile_policy = ProfilePolicy()
+        self._transcript_merge_seconds = transcript_merge_seconds
+        self._transcript_token_budget = transcript_token_budget
+        self._queue_depth = queue_depth or (lambda: 0)
+        self._incremental_summary = incremental_summary
         self._language = language
-        self._data_dir = data_dir
+        self._transcript_source = transcript_source
+        self._caption_languages = caption_languages
         self._openai_model = openai_model
+        self._store = ArtifactStore(data_dir, max_bytes=cache_max_bytes, ttl=cache_ttl)
+        self._store.migrate_flat_files()
         self._helper = GenericHelper(
             whisper_model_name=whisper_model_name,
             device=whisper_device,
-            data_dir=data_dir
+            data_dir=data_dir,
+            whisper_workers=whisper_workers,
+            chunk_seconds=chunk_seconds,
+            batch_size=whisper_batch_size,
+            batch_max_wait=whisper_batch_max_wait,
+            store=self._store
+        )
+        if model_memory_budget is not None:
+            self._helper.model_registry.set_memory_budget(model_memory_budget)
+        self._summary_window_tokens = summary_window_tokens
+        self._summary_cache = SummaryCache(self._store, ttl=summary_cache_ttl, serve_stale=summary_cache_serve_stale)
+        self._summarizer = MapReduceSummarizer(
+            openai_model,
+            api_key=openai_api_key,
+            window_tokens=summary_window_tokens,
+            concurrency=summary_concurrency
         )
-        self._openai = OpenAI(api_key=openai_api_key)
+        self._answerer = QuestionAnswerer(openai_model, api_key=openai_api_key)
+        self._single_flight = SingleFlight()
+        self._duplicate_threshold = duplicate_threshold
+        self._fingerprint_seconds = fingerprint_seconds
+        self._fingerprints = FingerprintIndex(data_dir) if duplicate_threshold is not None else None
+        if self._fingerprints is not None:
+            # the fingerprint of audio whose transcript is evicted is useless
+            self._store.add_eviction_callback(lambda: self._fingerprints.prune(self._store))
+        # a file is looked up before choosing the pipelined summary, and again before Whisper
+        self._recent_fingerprints: OrderedDict[tuple[str, float], Fingerprint] = OrderedDict()
+        self._duplicates_lock = threading.Lock()
+        self._duplicate_stats = {'duplicates': 0, 'audio_seconds': 0.0, 'whisper_seconds_saved': 0.0}
 
-    def summarize_video(self, video_url: str) -> Generator[TopicSummary, None, None]:
+    def summarize_video(self, video_url: str, stream: bool = False) -> Generator[TopicSummary, None, None]:
         if not self.validate_video_url(video_url):
             raise ValueError("Invalid video URL")
-        full_transcript = self.transcript_video(video_url)
-        for s in self.generate_summary(video_url, full_transcript):
+        # the summary of a near-duplicate is cached, a pipelined summary would make a new one
+        if self._incremental_summary and not stream and not self.has_transcript(video_url) \
+                and not self._is_duplicate(video_url):
+            yield from self.pipelined_summary(video_url)
+            return
+        full_transcript = self.transcript_segments(video_url)
+        summary = self.stream_summary if stream else self.generate_summary
+        for s in summary(video_url, full_transcript):
             yield s
 
-    def generate_summary(self, video_url: str, full_transcript: str) -> Generator[TopicSummary, None, None]:
-        is_yt = self._helper.is_youtube_video(video_url)
-        video_id = self._helper.get_video_id(video_url)
-        messages = [
-            {
-                "role": "system",
-                "content": self.get_system_prompt(),
-            },
-            {
-                "role": "system",
-                "content": f"This is the video transcript with timestamps:\n\n{full_transcript}"
-            }
-        ]
-        functions = {
-            "add_topic": {
-                "description": "function for storing topics with summaries",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "topic": {
-                            "type": "string",
-                            "description": "Title of the topic",
-                        },
-                        "summary": {"type": "string", "description": "Summary of the topic"},
-                        "timestamp": {
-                            "type": "array",
-                            "description": "Timestamp of the topic in a tuple with [start, end]",
-                            "items": {
-                                "type": "number"
-                            }
-                        }
-                    },
-                    "required": ["topic", "summary", "timestamp"],
-                }
-            }
-        }
-        tools: List[ChatCompletionToolParam] = [
-            {
-                "type": "function",
-                "function": {
-                    "name": fn_name,
-                    "description": fn_info["description"],
-                    "parameters": fn_info["parameters"],
-                }
-            }
-            for fn_name, fn_info in functions.items()
-        ]
-        responses = self._openai.chat.completions.create(
-            model=self._openai_model,
-            messages=messages,
-            tools=tools,
-            tool_choice="auto",
+    def generate_summary(
+            self,
+            video_url: str,
+            full_transcript: str | List[dict]
+    ) -> Generator[TopicSummary, None, None]:
+        """`full_transcript` as segments (compactly encoded, timestamps snapped back to them) or as text"""
+        encoded = self._encode(full_transcript)
+        system_prompt = self.get_system_prompt()
+        key = self._summary_key(system_prompt, str(encoded))
+        cached = self._cached_summary(video_url, key, system_prompt, str(encoded))
+        if cached is not None:
+            topics = cached
+        else:
+            with metrics.stage(metrics.SUMMARIZE):
+                topics = self._single_flight.do(
+                    ('summary', key),
+                    lambda: self._summary_cache.compute(
+                        key, lambda: self._summarizer.summarize(system_prompt, str(encoded)),
+                        {'url': video_url, 'model': self._openai_model}
+                    )
+                )
+        yield from self._with_ref_urls(video_url, topics, encoded)
+
+    def stream_summary(
+            self,
+            video_url: str,
+            full_transcript: str | List[dict]
+    ) -> Generator[TopicSummary, None, None]:
+        """topics in the order they are generated, each one as soon as the model has written it"""
+        encoded = self._encode(full_transcript)
+        system_prompt = self.get_system_prompt()
+        key = self._summary_key(system_prompt, str(encoded))
+        cached = self._cached_summary(video_url, key, system_prompt, str(encoded))
+        if cached is not None:
+            yield from self._with_ref_urls(video_url, cached, encoded)
+            return
+        topics: List[Topic] = []
+        streamed = self._collect(self._summarizer.stream(system_prompt, str(encoded)), topics)
+        yield from self._with_ref_urls(video_url, streamed, encoded)
+        # only a complete summary is cached
+        self._summary_cache.put(key, sorted(topics, key=lambda t: t['timestamp'][0]),
+                                {'url': video_url, 'model': self._openai_model})
+
+    def pipelined_summary(self, video_url: str) -> Generator[TopicSummary, None, None]:
+        """
+        Summarize the transcript in windows as soon as each window is transcribed, instead of waiting
+        for the whole video; the topics of every window are merged at the end.
+        """
+        system_prompt = self.get_system_prompt()
+        segments: List[dict] = []
+        # transcription and summarization overlap, timed together
+        with metrics.stage(metrics.TRANSCRIBE_SUMMARIZE):
+            topics = self._summarizer.summarize_windows(system_prompt, self.transcript_windows(video_url, segments))
+        yield from self._cache_merged(video_url, system_prompt, topics, segments)
+
+    def transcript_windows(self, video_url: str, segments: List[dict]) -> Generator[str, None, None]:
+        """
+        the encoded windows of the transcript, each one as soon as it is transcribed, for `summarize_window`;
+        windows are made of whole transcription chunks, encoded on their own (no token budget), and the
+        segments are appended to `segments`
+        """
+        yield from encode_windows(self.transcript_stream(video_url), self._summary_window_tokens,
+                                  self._transcript_merge_seconds, into=segments)
+
+    def summarize_window(self, video_url: str, window: str, index: int) -> List[TopicSummary]:
+        """the topics of window `index` from `transcript_windows`, merged with the others by `merge_windows`"""
+        topics = self._summarizer.summarize_window(self.get_system_prompt(), window, index)
+        return list(self._with_ref_urls(video_url, topics, window))
+
+    def merge_windows(
+            self,
+            video_url: str,
+            windows: List[List[TopicSummary]],
+            segments: List[dict]
+    ) -> List[TopicSummary]:
+        """the summary of the transcript `segments` from the topics of its windows, cached like a whole summary"""
+        if not any(windows):
+            raise RuntimeError("no tool calls found in response")
+        topics = merge_topics([
+            [Topic(topic=t['topic'], summary=t['summary'], timestamp=t['timestamp']) for t in topics]
+            for topics in windows
+        ])
+        return list(self._cache_merged(video_url, self.get_system_prompt(), topics, segments))
+
+    def _cache_merged(
+            self,
+            video_url: str,
+            system_prompt: str,
+            topics: List[Topic],
+            segments: List[dict]
+    ) -> Generator[TopicSummary, None, None]:
+        encoded = self._encode(segments)
+        # cached as the summary of the complete transcript
+        self._summary_cache.put(self._summary_key(system_prompt, str(encoded)), topics,
+                                {'url': video_url, 'model': self._openai_model})
+        yield from self._with_ref_urls(video_url, topics, encoded)
+
+    @staticmethod
+    def _collect(topics: Iterable[Topic], into: List[Topic]) -> Generator[Topic, None, None]:
+        # only the time spent producing topics is summarization time, not the consumer's
+        busy = 0.0
+        started = time.monotonic()
+        for topic in topics:
+            busy += time.monotonic() - started
+            into.append(topic)
+            yield topic
+            started = time.monotonic()
+        busy += time.monotonic() - started
+        metrics.STAGE_SECONDS.observe(busy, stage=metrics.SUMMARIZE)
+
+    def _summary_key(self, system_prompt: str, transcript: str) -> str:
+        return summary_key(
+            transcript,
+            self._openai_model,
+            system_prompt,
+            self._language,
+            TOOLS,
+            window_tokens=self._summary_window_tokens
         )
 
-        for response in responses.choices:
-            response_message = response.message
-            tool_calls: List[ChatCompletionMessageToolCall] = response_message.tool_calls
-            if not tool_calls or len(tool_calls) == 0:
-                raise RuntimeError("no tool calls found in response")
-            for tool_call in tool_calls:
-                fn_name = tool_call.function.name
-                if fn_name not in functions.keys():
-                    logging.error(
-                        f"function '{fn_name}' not found in openai tools definitions. Skipping. (args: {tool_call.function.arguments})")
-                    raise AttributeError(f"function '{fn_name}' not found in openai tools definitions")
-                fn_args = json.loads(tool_call.function.arguments)
-                fn_args['timestamp'] = tuple(fn_args['timestamp'])
-                sec = int(fn_args['timestamp'][0])
-                if is_yt:
-                    fn_args['ref_url'] = f'https://youtu.be/{video_id}?t={sec}s'
-                else:
-                    fn_args['ref_url'] = None
-                yield fn_args
+    def _cached_summary(
+            self,
+            video_url: str,
+            key: str,
+            system_prompt: str,
+            transcript: str
+    ) -> Optional[List[Topic]]:
+        cached = self._summary_cache.get(key)
+        if cached is None:
+            metrics.CACHE_REQUESTS.inc(cache=SUMMARY, result='miss')
+            return None
+        topics, fresh = cached
+        metrics.CACHE_REQUESTS.inc(cache=SUMMARY, result='hit' if fresh else 'stale')
+        if not fresh:
+            # serve the stale summary now, a fresh one replaces it for the next request
+            self._summary_cache.refresh_in_background(
+                key, lambda: self._summarizer.summarize(system_prompt, transcript),
+                {'url': video_url, 'model': self._openai_model}
+            )
+        logging.info(f"summary cache hit ({'fresh' if fresh else 'stale'})")
+        return topics
+
+    def _encode(self, transcript: str | List[dict]) -> EncodedTranscript | str:
+        if isinstance(transcript, str):
+            return transcript
+        encoded = encode_transcript(transcript, self._transcript_merge_seconds, self._transcript_token_budget)
+        logging.info(f"transcript of {len(transcript)} segments encoded in ~{estimate_tokens(encoded.text)} tokens "
+                     f"(lines of up to {encoded.merge_seconds:.0f} s)")
+        return encoded
+
+    def _with_ref_urls(
+            self,
+            video_url: str,
+            topics: Iterable[Topic],
+            encoded: EncodedTranscript | str
+    ) -> Generator[TopicSummary, None, None]:
+        video_id = self._youtube_id(video_url)
+        for topic in topics:
+            fn_args = TopicSummary(**topic, ref_url=None)
+            if isinstance(encoded, EncodedTranscript):
+                fn_args['timestamp'] = encoded.snap(fn_args['timestamp'])
+            if video_id is not None:
+                fn_args['ref_url'] = self._ref_url(video_id, fn_args['timestamp'][0])
+            yield fn_args
+
+    def _youtube_id(self, source: str) -> Optional[str]:
+        """the id of a YouTube video url, None for other sites and uploads (no url to link to)"""
+        if self.validate_video_url(source) and self._helper.is_youtube_video(source):
+            return self._helper.get_video_id(source)
+        return None
+
+    @staticmethod
+    def _ref_url(video_id: str, seconds: float) -> str:
+        return f'https://youtu.be/{video_id}?t={int(seconds)}s'
+
+    def ask(self, source: str, question: str, top_k: Optional[int] = 4) -> Answer:
+        """
+        Answer a follow-up question about a video url or an upload (artifact name) from its transcript,
+        sending the model only the `top_k` transcript windows most relevant to the question (with their
+        times and links), or the whole transcript with None.
+        Only a cached transcript is used, a question never starts a transcription.
+        :raise ValueError: if the url cannot be resolved or there is no cached transcript
+        """
+        name = self._artifact_name(source) if self.validate_video_url(source) else source
+        data_file = self._store.get(TRANSCRIPT, name)
+        if data_file is None:
+            raise ValueError(f"no transcript of {source}")
+        with data_file.open('r') as f:
+            segments = json.loads(f.read())
+        encoded = self._encode(segments)
+        sources: List[AnswerSource] = []
+        if top_k is None:
+            context = f"This is the video transcript with timestamps:\n\n{encoded}"
+        else:
+            video_id = self._youtube_id(source)
+            excerpts = []
+            for i, excerpt in enumerate(self._transcript_index(name, segments).search(question, top_k), start=1):
+                ref_url = self._ref_url(video_id, excerpt['start']) if video_id is not None else None
+                sources.append(AnswerSource(start=excerpt['start'], end=excerpt['end'], ref_url=ref_url))
+                where = f"{_clock(excerpt['start'])}-{_clock(excerpt['end'])}" + (f", {ref_url}" if ref_url else '')
+                text = encode_transcript(excerpt['segments'], self._transcript_merge_seconds).text
+                excerpts.append(f"Excerpt {i} ({where}):\n{text}")
+            context = "These are the parts of the video transcript most relevant to the question, with " \
+                      "timestamps:\n\n" + "\n\n".join(excerpts)
+        started = time.monotonic()
+        with metrics.stage(metrics.ANSWER):
+            answer, prompt_tokens = self._answerer.answer(question, context, self._language)
+        return Answer(question=question, answer=answer, sources=sources, prompt_tokens=prompt_tokens,
+                      transcript_tokens=estimate_tokens(str(encoded)), seconds=time.monotonic() - started)
+
+    def _transcript_index(self, name: str, segments: List[dict]) -> TranscriptIndex:
+        """the retrieval index of the transcript `name`, built and cached next to it on first use"""
+        transcript = self._store.info(TRANSCRIPT, name)
+        # an index of an older transcript of the same video is rebuilt
+        provenance = {'transcript_created_at': transcript['created_at'] if transcript is not None else None}
+        info = self._store.info(TRANSCRIPT_INDEX, name)
+        data_file = self._store.get(TRANSCRIPT_INDEX, name) if info is not None else None
+        if data_file is not None and info['provenance'] == provenance:
+            try:
+                with data_file.open('r') as f:
+                    index = TranscriptIndex.from_json(json.loads(f.read()), segments)
+                metrics.CACHE_REQUESTS.inc(cache=TRANSCRIPT_INDEX, result='hit')
+                return index
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"rebuilding the unreadable transcript index {data_file}: {e}")
+        metrics.CACHE_REQUESTS.inc(cache=TRANSCRIPT_INDEX, result='miss')
+        index = TranscriptIndex.build(segments)
+        with self._store.write(TRANSCRIPT_INDEX, name, '.json', provenance) as f:
+            f.write(json.dumps(index.to_json()))
+        logging.info(f"indexed the transcript of {name}: {len(index.windows)} windows")
+        return index
+
+    def download_audio(self, video_url: str) -> Path:
+        name = self._artifact_name(video_url)
+        audio_file = self._store.get(AUDIO, name)
+        metrics.CACHE_REQUESTS.inc(cache=AUDIO, result='miss' if audio_file is None else 'hit')
+        if audio_file is not None:
+            return audio_file
+        return self._single_flight.do(
+            (name, AUDIO),
+            lambda: self._download_audio(video_url, name)
+        )
+
+    def _download_audio(self, video_url: str, name: str) -> Path:
+        with self._store.lock(AUDIO, name):
+            # another process may have downloaded it while we were waiting for the lock
+            audio_file = self._store.get(AUDIO, name)
+            if audio_file is None:
+                # the real container extension is only known once downloaded
+                audio_file = self._helper.video2audio_file(video_url, self._store.path_for(AUDIO, name))
+                audio_file = self._store.add(AUDIO, name, audio_file, {'url': video_url, 'producer': 'yt-dlp'})
+        return audio_file
 
     def transcript_video(self, video_url: str) -> str:
+        return self._transcript_to_text(self.transcript_segments(video_url))
+
+    def transcript_segments(self, video_url: str) -> List[dict]:
+        """the cached transcript segments, transcribed on first use"""
+        name = self._artifact_name(video_url)
+        data_file = self._store.get(TRANSCRIPT, name)
+        if data_file is None:
+            return self._single_flight.do(
+                (name, TRANSCRIPT),
+                lambda: [s for segments in self.transcript_stream(video_url) for s in segments]
+            )
+        metrics.CACHE_REQUESTS.inc(cache=TRANSCRIPT, result='hit')
+        # read transcript from cache
+        with data_file.open('r') as f:
+            return json.loads(f.read())
+
+    def transcript_stream(self, video_url: str) -> Generator[List[dict], None, None]:
+        """
+        The transcript as it is made: the new segments of every transcribed chunk of audio (all of them
+        at once when cached or from captions). Every chunk is checkpointed, an interrupted transcription
+        resumes after the last finished chunk.
+        """
+        name = self._artifact_name(video_url)
+        yield from self._cached_transcript_stream(
+            name,
+            lambda: self._transcribe_stream(video_url, name),
+            {'url': video_url, 'transcript_source': self._transcript_source}
+        )
+
+    def _cached_transcript_stream(
+            self,
+            name: str,
+            transcribe: Callable[[], Iterable[List[dict]]],
+            provenance: dict
+    ) -> Generator[List[dict], None, None]:
+        """
+        The transcript is made on a producer thread holding the transcript lock, the chunks are yielded
+        from a queue: the lock is not held while the consumer works on a chunk (summarizes it, ...).
+        A consumer going away stops the transcription after the current chunk (it is checkpointed).
+        """
+        data_file = self._store.get(TRANSCRIPT, name)
+        if data_file is None:
+            chunks: queue.Queue[Tuple[str, object]] = queue.Queue()
+            stop = threading.Event()
+
+            def produce() -> None:
+                try:
+                    with self._store.lock(TRANSCRIPT, name):
+                        # another process may have transcribed it while we were waiting for the lock
+                        cached = self._store.get(TRANSCRIPT, name)
+                        if cached is not None:
+                            chunks.put(('cached', cached))
+                            return
+                        metrics.CACHE_REQUESTS.inc(cache=TRANSCRIPT, result='miss')
+                        transcript: List[dict] = []
+                        stream = iter(transcribe())
+                        try:
+                            for segments in stream:
+                                transcript.extend(segments)
+                                chunks.put(('segments', segments))
+                                if stop.is_set():
+                                    return
+                        finally:
+                            getattr(stream, 'close', lambda: None)()
+                        with self._store.write(TRANSCRIPT, name, '.json', provenance) as f:
+                            f.write(json.dumps(transcript))
+                        self._store.remove(PARTIAL_TRANSCRIPT, name)
+                except Exception as e:
+                    chunks.put(('error', e))
+                finally:
+                    chunks.put(('end', None))
+
+            # the calling thread waits for the producer: a job on the Whisper executor keeps it busy meanwhile
+            producer = threading.Thread(target=produce, name=f"transcribe-{name}", daemon=True)
+            producer.start()
+            try:
+                while True:
+                    kind, value = chunks.get()
+                    if kind == 'segments':
+                        yield value
+                    elif kind == 'error':
+                        raise value
+                    elif kind == 'end':
+                        return
+                    else:
+                        data_file = value
+                        break
+            finally:
+                stop.set()
+                producer.join()
+        metrics.CACHE_REQUESTS.inc(cache=TRANSCRIPT, result='hit')
+        with data_file.open('r') as f:
+            yield json.loads(f.read())
+
+    def media_audio(self, name: str) -> Optional[Path]:
+        """
+        the cached audio/video file uploaded as artifact `name` (e.g. `telegram_{file_unique_id}`),
+        None if it has to be downloaded
+        """
+        audio_file = self._store.get(AUDIO, name)
+        metrics.CACHE_REQUESTS.inc(cache=AUDIO, result='miss' if audio_file is None else 'hit')
+        return audio_file
+
+    def media_audio_path(self, name: str, ext: str) -> Path:
+        """where to download the uploaded file `name`, before `add_media_audio`"""
+        return self._store.path_for(AUDIO, name, ext)
+
+    def add_media_audio(self, name: str, path: str | Path, provenance: Optional[dict] = None) -> Path:
+        """index a downloaded upload, moving it into the cache if it was downloaded elsewhere"""
+        return self._store.add(AUDIO, name, path, provenance)
+
+    def has_media_transcript(self, name: str) -> bool:
+        return self._store.info(TRANSCRIPT, name) is not None
+
+    def media_transcript_segments(self, name: str, duration: Optional[float] = None) -> List[dict]:
+        """
+        the cached transcript of the upload `name`, transcribed with Whisper on first use from the file
+        added with `add_media_audio`; `duration` (seconds, if known) picks the automatic profile
+        """
+        def transcribe() -> Iterable[List[dict]]:
+            return self._whisper_stream(name, name, lambda: self._uploaded_audio(name),
+                                        self._profile_for(name, duration), language=None)
+
+        return self._single_flight.do(
+            (name, TRANSCRIPT),
+            lambda: [s for segments in self._cached_transcript_stream(
+                name, transcribe, {'url': name, 'transcript_source': WHISPER_ONLY}
+            ) for s in segments]
+        )
+
+    def media_needs_whisper(self, name: str) -> bool:
+        """like `needs_whisper` for the upload `name`, once its file is added with `add_media_audio`"""
+        if self.has_media_transcript(name):
+            return False
+        if self._fingerprints is None or self._store.info(PARTIAL_TRANSCRIPT, name) is not None:
+            return True
+        return not self._has_duplicate(name, self._uploaded_audio(name))
+
+    def _uploaded_audio(self, name: str) -> Path:
+        audio_file = self._store.get(AUDIO, name)
+        if audio_file is None:
+            raise FileNotFoundError(f"the audio of {name} is not in the cache")
+        return audio_file
+
+    def has_transcript(self, video_url: str) -> bool:
+        return self._store.info(TRANSCRIPT, self._artifact_name(video_url)) is not None
+
+    def needs_audio(self, video_url: str) -> bool:
+        """whether transcript_video will have to download the audio"""
         video_info = self._helper.get_video_info(video_url)
-        video_id = video_info.get('id')
-        extractor = video_info.get('extractor')
-        audio_file = self._data_dir / f'{extractor}_{video_id}.webm'
-        data_file = self._data_dir / f'{extractor}_{video_id}.json'
-
-        if not audio_file.exists():
-            # download audio
-            audio_content = self._helper.video2audio(video_url)
-            with audio_file.open('wb') as f:
-                f.write(audio_content)
-        else:
-            # read audio from cache
-            with audio_file.open('rb') as f:
-                audio_content = f.read()
-        if not data_file.exists():
-            # transcribe audio
-            transcript = self._helper.audio2text(audio_content)
-            with data_file.open('w') as f:
-                f.write(json.dumps(transcript))
-        else:
-            # read transcript from cache
+        if not video_info:
+            raise ValueError("Invalid video URL")
+        if self.has_transcript(video_url):
+            return False
+        if self._transcript_source == WHISPER_ONLY:
+            return True
+        return select_caption_track(video_info, self._caption_languages) is None
+
+    def needs_whisper(self, video_url: str) -> bool:
+        """
+        whether transcript_segments will transcribe with Whisper, not read a cached transcript, captions
+        or the transcript of a near-duplicate; the audio is downloaded if it has to be fingerprinted
+        """
+        if not self.needs_audio(video_url):
+            return False
+        # a checkpoint is resumed without looking for a near-duplicate
+        return self._store.info(PARTIAL_TRANSCRIPT, self._artifact_name(video_url)) is not None \
+            or not self._is_duplicate(video_url)
+
+    def _artifact_name(self, video_url: str) -> str:
+        """
+        `{extractor}_{video_id}`, the name of every artifact of the video
+        :raise ValueError: if the url cannot be resolved
+        """
+        video_info = self._helper.get_video_info(video_url)
+        if not video_info:
+            raise ValueError("Invalid video URL")
+        return f"{video_info.get('extractor')}_{video_info.get('id')}"
+
+    def _transcribe_stream(self, video_url: str, name: str) -> Generator[List[dict], None, None]:
+        if self._transcript_source != WHISPER_ONLY:
+            transcript = self._helper.video2captions(video_url, self._caption_languages)
+            if transcript:
+                yield transcript
+                return
+            if self._transcript_source == CAPTIONS_ONLY:
+                raise NoCaptionsError(f"no usable captions for {video_url}")
+            logging.info(f"no usable captions for {video_url}, falling back to Whisper")
+        yield from self._whisper_stream(
+            name,
+            video_url,
+            lambda: self.download_audio(video_url),
+            self.transcription_profile(video_url),
+            self._helper.get_video_info(video_url).get('language')
+        )
+
+    def _whisper_stream(
+            self,
+            name: str,
+            source: str,
+            audio_file: Callable[[], Path],
+            profile: TranscriptionProfile,
+            language: Optional[str]
+    ) -> Generator[List[dict], None, None]:
+        """Whisper transcript of `audio_file()`, checkpointed after every chunk"""
+        transcript: List[dict] = []
+        start_seconds = 0.0
+        checkpoint = self._load_checkpoint(name)
+        # a checkpoint made with another profile is not resumed, the transcript would mix both
+        if checkpoint is not None and checkpoint['profile'] == profile['name']:
+            transcript, start_seconds = checkpoint['segments'], checkpoint['seconds']
+            logging.info(f"resuming the transcription of {source} from {start_seconds:.0f} s")
+            yield transcript
+        elif self._fingerprints is not None:
+            duplicate = self._duplicate_transcript(name, source, audio_file())
+            if duplicate is not None:
+                yield duplicate
+                return
+        # the time the consumer takes between chunks is not Whisper time
+        busy = 0.0
+        started = time.monotonic()
+        for seconds, segments in self._helper.audio_file2segments(
+                audio_file(),
+                profile=profile,
+                language=language,
+                start_seconds=start_seconds
+        ):
+            transcript = transcript + segments
+            checkpoint = {'profile': profile['name'], 'seconds': seconds, 'segments': transcript}
+            with self._store.write(PARTIAL_TRANSCRIPT, name, '.json', {'url': source}) as f:
+                f.write(json.dumps(checkpoint))
+            busy += time.monotonic() - started
+            yield segments
+            started = time.monotonic()
+        if self._fingerprints is not None and start_seconds == 0:
+            # what a near-duplicate of it will save
+            self._fingerprints.set_whisper_seconds(name, busy + time.monotonic() - started)
+
+    def _is_duplicate(self, video_url: str) -> bool:
+        """whether the video will be transcribed with Whisper and its audio is a near-duplicate"""
+        if self._fingerprints is None or not self.needs_audio(video_url):
+            return False
+        return self._has_duplicate(self._artifact_name(video_url), self.download_audio(video_url))
+
+    def _has_duplicate(self, name: str, audio_file: Path) -> bool:
+        return self._find_duplicate(name, self._fingerprint(audio_file)) is not None
+
+    def _duplicate_transcript(self, name: str, source: str, audio_file: Path) -> Optional[List[dict]]:
+        """
+        the transcript of a near-duplicate of `audio_file` moved to its timeline, None if there is none;
+        the fingerprint is indexed as `name` either way
+        """
+        fp = self._fingerprint(audio_file)
+        duplicate = self._find_duplicate(name, fp)
+        if duplicate is None:
+            self._fingerprints.add(name, fp)
+            return None
+        match, original = duplicate
+        segments = self._shifted(original, match['offset'], fp['duration'])
+        self._reuse_summary(source, match, original, segments, fp['duration'])
+        self._fingerprints.add(name, fp, match['whisper_seconds'])
+        saved = match['whisper_seconds'] or 0.0
+        metrics.DUPLICATE_AUDIO_SECONDS.inc(fp['duration'])
+        metrics.WHISPER_SECONDS_SAVED.inc(saved)
+        with self._duplicates_lock:
+            self._duplicate_stats['duplicates'] += 1
+            self._duplicate_stats['audio_seconds'] += fp['duration']
+            self._duplicate_stats['whisper_seconds_saved'] += saved
+        logging.info(f"{source} is a near-duplicate of {match['name']} (similarity {match['similarity']:.2f}, "
+                     f"offset {match['offset']:+.1f} s): transcript reused, {saved:.0f} s of Whisper saved")
+        return segments
+
+    def _fingerprint(self, audio_file: Path) -> Fingerprint:
+        key = (str(audio_file), audio_file.stat().st_mtime)
+        with self._duplicates_lock:
+            fp = self._recent_fingerprints.get(key)
+        if fp is None:
+            fp = audio_fingerprint(audio_file, self._fingerprint_seconds)
+            with self._duplicates_lock:
+                self._recent_fingerprints[key] = fp
+                while len(self._recent_fingerprints) > 8:
+                    self._recent_fingerprints.popitem(last=False)
+        return fp
+
+    def _find_duplicate(self, name: str, fp: Fingerprint) -> Optional[Tuple[FingerprintMatch, List[dict]]]:
+        """the most similar indexed audio with a cached transcript, and the transcript"""
+        for match in self._fingerprints.matches(fp, self._duplicate_threshold):
+            if match['name'] == name:
+                continue
+            # None while it is still being transcribed, or once evicted
+            data_file = self._store.get(TRANSCRIPT, match['name'])
+            if data_file is None:
+                continue
             with data_file.open('r') as f:
-                transcript = json.loads(f.read())
+                return match, json.loads(f.read())
+        return None
 
-        return self._transcript_to_text(transcript)
+    def _reuse_summary(
+            self,
+            source: str,
+            match: FingerprintMatch,
+            original: List[dict],
+            segments: List[dict],
+            duration: float
+    ) -> None:
+        """cache the fresh summary of the near-duplicate, if any, as the summary of `segments`"""
+        system_prompt = self.get_system_prompt()
+        key = self._summary_key(system_prompt, str(self._encode(original)))
+        cached = self._summary_cache.get(key)
+        if cached is None or not cached[1]:
+            return
+        shifted_key = self._summary_key(system_prompt, str(self._encode(segments)))
+        if shifted_key == key:
+            return
+        topics = []
+        for topic in cached[0]:
+            start, end = (t + match['offset'] for t in topic['timestamp'])
+            if end > 0 and start < duration:
+                topics.append(Topic(topic=topic['topic'], summary=topic['summary'],
+                                    timestamp=(max(start, 0.0), min(end, duration))))
+        self._summary_cache.put(shifted_key, topics,
+                                {'url': source, 'model': self._openai_model, 'duplicate_of': match['name']})
+
+    @staticmethod
+    def _shifted(segments: List[dict], offset: float, duration: float) -> List[dict]:
+        """`segments` moved by `offset` seconds, without the ones outside of [0, duration]"""
+        shifted = []
+        for s in segments:
+            start, end = s['start'] + offset, s['end'] + offset
+            if end > 0 and start < duration:
+                shifted.append({**s, 'start': round(max(start, 0.0), 3), 'end': round(min(end, duration), 3)})
+        return shifted
+
+    def _load_checkpoint(self, name: str) -> Optional[dict]:
+        data_file = self._store.get(PARTIAL_TRANSCRIPT, name)
+        if data_file is None:
+            return None
+        try:
+            with data_file.open('r') as f:
+                checkpoint = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            logging.warning(f"ignoring unreadable transcription checkpoint {data_file}: {e}")
+            return None
+        return checkpoint
+
+    def _transcribe_no_cache(self, video_url: str) -> List[dict]:
+        if self._transcript_source != WHISPER_ONLY:
+            transcript = self._helper.video2captions(video_url, self._caption_languages)
+            if transcript:
+                return transcript
+            if self._transcript_source == CAPTIONS_ONLY:
+                raise NoCaptionsError(f"no usable captions for {video_url}")
+            logging.info(f"no usable captions for {video_url}, falling back to Whisper")
+        return self._helper.video2text(video_url, profile=self.transcription_profile(video_url))
+
+    def transcription_profile(self, video_url: str) -> TranscriptionProfile:
+        if self._transcription_profile != AUTO:
+            return PROFILES[self._transcription_profile]
+        return self._profile_for(video_url, self._helper.get_video_info(video_url).get('duration'))
+
+    def _profile_for(self, source: str, duration: Optional[float]) -> TranscriptionProfile:
+        if self._transcription_profile != AUTO:
+            return PROFILES[self._transcription_profile]
+        profile = self._profile_policy.choose(duration, self._queue_depth())
+        logging.info(f"auto transcription profile for {source}: {profile['name']}")
+        return profile
 
     def transcript_video_no_cache(self, video_url: str) -> str:
-        audio_content = self._helper.video2audio(video_url)
-        transcript = self._helper.audio2text(audio_content)
+        transcript = self._transcribe_no_cache(video_url)
         return self._transcript_to_text(transcript)
 
     def _transcript_to_text(self, transcript: List[dict]) -> str:
-        return "\n".join([f"[{s['start']} --> {s['end']}] {s['text']}" for s in transcript])
+        return encode_transcript(transcript, self._transcript_merge_seconds).text
+
+    def whisper_stats(self) -> Optional[dict]:
+        """throughput of the batched Whisper scheduler, None if batching is disabled"""
+        scheduler = self._helper.batch_scheduler
+        return scheduler.stats() if scheduler is not None else None
+
+    def summary_cache_stats(self) -> dict:
+        return self._summary_cache.stats()
+
+    def duplicate_stats(self) -> dict:
+        """near-duplicate audio recognized so far: how many, their seconds and the Whisper seconds saved"""
+        with self._duplicates_lock:
+            return dict(self._duplicate_stats)
+
+    @property
+    def incremental_summary(self) -> bool:
+        """whether a transcript made with Whisper is summarized window by window while it is transcribed"""
+        return self._incremental_summary
+
+    @property
+    def store(self) -> ArtifactStore:
+        """the index of cached audio, transcripts and summaries"""
+        return self._store
+
+    def preload_models(self, model_names: Optional[List[str]] = None, warm_up: bool = True) -> None:
+        """load the Whisper models now (the configured one by default) instead of on the first request"""
+        self._helper.preload_models(model_names, warm_up=warm_up)
+
+    def model_stats(self) -> List[ModelStats]:
+        """load time and resident size of the Whisper models currently loaded"""
+        return self._helper.model_registry.stats()
+
+    def video_info(self, video_url: str) -> dict:
+        """metadata of the video (title, duration, ...), empty if the url cannot be resolved"""
+        return self._helper.get_video_info(video_url)
+
+    def expand_url(self, url: str) -> List[str]:
+        """the videos of a playlist or channel url, `[url]` for a single video"""
+        return self._helper.expand_playlist(url)
 
     def validate_video_url(self, video_url: str) -> bool:
-        return self._helper.check_if_supported(video_url)
+        return self._helper.is_supported_url(video_url)
 
     def get_system_prompt(self) -> str:
         prompt = PROMPT
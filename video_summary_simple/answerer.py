@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from video_summary_bot_core import lazy_imports, metrics
+from video_summary_simple.summarizer import create_with_retry, estimate_tokens
+
+__all__ = ['ANSWER_PROMPT', 'QuestionAnswerer']
+
+ANSWER_PROMPT = """You answer questions about a video using only its transcript.
+Each line of the transcript starts with its start time in seconds, a line lasts until the next one starts.
+Answer concisely. When the transcript does not contain the answer, say so instead of guessing.
+Mention the times (mm:ss) of the parts of the video the answer comes from.
+"""
+
+
+class QuestionAnswerer:
+    """
+    Answer a question from transcript text (whole or only its relevant excerpts) with a plain chat
+    completion, retried like the summaries.
+    """
+
+    def __init__(
+            self,
+            model: str,
+            api_key: Optional[str] = None,
+            base_url: Optional[str] = None,
+            max_retries: int = 5,
+            backoff_seconds: float = 1.0
+    ):
+        self._model = model
+        self._api_key = api_key
+        self._base_url = base_url
+        self._max_retries = max_retries
+        self._backoff_seconds = backoff_seconds
+
+    def answer(self, question: str, context: str, language: Optional[str] = None) -> tuple[str, int]:
+        """blocking wrapper of `answer_async`"""
+        return asyncio.run(self.answer_async(question, context, language))
+
+    async def answer_async(self, question: str, context: str, language: Optional[str] = None) -> tuple[str, int]:
+        """the answer and the prompt tokens it took (reported by the API, or estimated)"""
+        system_prompt = ANSWER_PROMPT
+        if language:
+            system_prompt = f"{system_prompt}\nIt is very important that the answer must be written in {language}"
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": context},
+            {"role": "user", "content": question},
+        ]
+        started = time.monotonic()
+        client = lazy_imports.openai().AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, max_retries=0)
+        try:
+            response = await create_with_retry(client, self._model, messages, self._max_retries,
+                                               self._backoff_seconds)
+        finally:
+            await client.close()
+        answer = (response.choices[0].message.content or '').strip()
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+        else:
+            prompt_tokens = sum(estimate_tokens(m['content']) for m in messages)
+            completion_tokens = estimate_tokens(answer)
+        metrics.LLM_TOKENS.inc(prompt_tokens, direction='in')
+        metrics.LLM_TOKENS.inc(completion_tokens, direction='out')
+        logging.info(f"answered a question from ~{prompt_tokens} prompt tokens in {time.monotonic() - started:.1f} s")
+        return answer, prompt_tokens
@@ -0,0 +1,203 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue
+from typing import Any, Callable, Iterable, Iterator, List, Optional, TypedDict
+
+from video_summary_bot_core import lazy_imports
+from video_summary_simple.aibot import AiBot, TopicSummary
+
+__all__ = ['DOWNLOAD', 'TRANSCRIBE', 'SUMMARIZE', 'STAGES', 'VideoResult', 'BatchPipeline', 'expand_urls',
+           'to_markdown']
+
+DOWNLOAD = 'download'
+TRANSCRIBE = 'transcribe'
+SUMMARIZE = 'summarize'
+STAGES = (DOWNLOAD, TRANSCRIBE, SUMMARIZE)
+
+
+class VideoResult(TypedDict):
+    url: str
+    # `{extractor}_{video_id}`, None if the url could not be resolved
+    name: Optional[str]
+    title: Optional[str]
+    topics: List[TopicSummary]
+    # `<stage>: <message>` of the stage that failed
+    error: Optional[str]
+    # seconds spent running each stage, waiting for a worker excluded
+    stage_seconds: dict[str, float]
+
+
+def expand_urls(ai: AiBot, urls: Iterable[str]) -> Iterator[str]:
+    """video urls of `urls`, playlists and channels expanded, urls that cannot be resolved skipped"""
+    for url in urls:
+        try:
+            yield from ai.expand_url(url)
+        except lazy_imports.yt_dlp().DownloadError as e:
+            logging.warning(f"skipping {url}: {e}")
+
+
+def to_markdown(result: VideoResult) -> str:
+    lines = [f"# {result['title'] or result['url']}", "", result['url'], ""]
+    if result['error']:
+        lines += [f"Failed: {result['error']}", ""]
+    for topic in result['topics']:
+        lines += [f"## {topic['topic']}", ""]
+        if topic['ref_url']:
+            lines += [f"[link]({topic['ref_url']})", ""]
+        lines += [topic['summary'], ""]
+    return "\n".join(lines)
+
+
+class BatchPipeline:
+    """
+    Summarize many videos with the stages overlapped: while a video is summarized the next one is
+    transcribed and the one after is downloaded.
+    Every stage has its own pool of workers, downloads run at most `prefetch` videos ahead of the
+    transcription so that audio files do not pile up on disk.
+    """
+    _ai: AiBot
+    _workers: dict[str, int]
+
+    def __init__(
+            self,
+            ai: AiBot,
+            download_workers: int = 2,
+            transcribe_workers: int = 1,
+            summarize_workers: int = 2,
+            prefetch: Optional[int] = None
+    ):
+        self._ai = ai
+        self._workers = {DOWNLOAD: download_workers, TRANSCRIBE: transcribe_workers, SUMMARIZE: summarize_workers}
+        self._executors = {
+            stage: ThreadPoolExecutor(workers, thread_name_prefix=f'batch-{stage}')
+            for stage, workers in self._workers.items()
+        }
+        self._ahead = threading.Semaphore(prefetch if prefetch is not None else download_workers + transcribe_workers)
+        self._lock = threading.Lock()
+        self._busy = dict.fromkeys(STAGES, 0.0)
+        self._processed = dict.fromkeys(STAGES, 0)
+        self._videos = 0
+        self._failed = 0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+    def run(self, urls: Iterable[str]) -> Iterator[VideoResult]:
+        """process `urls` (consumed lazily), yielding each result as soon as its video is done"""
+        results: Queue = Queue()
+        submitted = [0]
+        fed = threading.Event()
+        self._started_at = time.monotonic()
+
+        def feed() -> None:
+            try:
+                for url in urls:
+                    # back pressure: wait for a transcription to finish before downloading further ahead
+                    self._ahead.acquire()
+                    submitted[0] += 1
+                    self._start(url, results)
+            except Exception as e:
+                logging.error(f"unable to read the video urls: {e}")
+            finally:
+                fed.set()
+                # wake the consumer up in case every video is already done
+                results.put(None)
+
+        feeder = threading.Thread(target=feed, name='batch-feed', daemon=True)
+        feeder.start()
+        received = 0
+        try:
+            while not fed.is_set() or received < submitted[0]:
+                result = results.get()
+                if result is None:
+                    continue
+                received += 1
+                yield result
+        finally:
+            self._finished_at = time.monotonic()
+            for executor in self._executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """videos per hour and, for every stage, the share of its workers' time spent working"""
+        end = self._finished_at or time.monotonic()
+        wall = end - self._started_at if self._started_at is not None else 0.0
+        with self._lock:
+            return {
+                'videos': self._videos,
+                'failed': self._failed,
+                'wall_seconds': wall,
+                'videos_per_hour': self._videos / wall * 3600 if wall > 0 else 0.0,
+                'stages': {
+                    stage: {
+                        'workers': self._workers[stage],
+                        'videos': self._processed[stage],
+                        'busy_seconds': self._busy[stage],
+                        'utilization': self._busy[stage] / (wall * self._workers[stage]) if wall > 0 else 0.0,
+                    }
+                    for stage in STAGES
+                },
+            }
+
+    def _start(self, url: str, results: Queue) -> None:
+        result = VideoResult(url=url, name=None, title=None, topics=[], error=None, stage_seconds={})
+        steps = [(DOWNLOAD, self._download), (TRANSCRIBE, self._transcribe), (SUMMARIZE, self._summarize)]
+        self._submit(steps, result, None, results)
+
+    def _submit(self, steps: list, result: VideoResult, value: Any, results: Queue) -> None:
+        stage, fn = steps[0]
+        future = self._executors[stage].submit(self._timed, stage, fn, result, value)
+
+        def done(f: Future) -> None:
+            error = f.exception() if not f.cancelled() else RuntimeError("cancelled")
+            if stage == TRANSCRIBE or (stage == DOWNLOAD and error is not None):
+                # the audio is consumed (or will never be), let the next download start
+                self._ahead.release()
+            if error is not None:
+                logging.warning(f"{result['url']}: {stage} failed: {error}")
+                result['error'] = f"{stage}: {error}"
+                self._finish(result, results)
+            elif len(steps) == 1:
+                self._finish(result, results)
+            else:
+                self._submit(steps[1:], result, f.result(), results)
+
+        future.add_done_callback(done)
+
+    def _finish(self, result: VideoResult, results: Queue) -> None:
+        with self._lock:
+            self._videos += 1
+            if result['error'] is not None:
+                self._failed += 1
+        results.put(result)
+
+    def _timed(self, stage: str, fn: Callable[[VideoResult, Any], Any], result: VideoResult, value: Any) -> Any:
+        started_at = time.monotonic()
+        try:
+            return fn(result, value)
+        finally:
+            elapsed = time.monotonic() - started_at
+            result['stage_seconds'][stage] = elapsed
+            with self._lock:
+                self._busy[stage] += elapsed
+                self._processed[stage] += 1
+
+    def _download(self, result: VideoResult, _: Any) -> None:
+        url = result['url']
+        if not self._ai.validate_video_url(url):
+            raise ValueError("Invalid video URL")
+        info = self._ai.video_info(url)
+        if not info:
+            raise ValueError("Invalid video URL")
+        result['name'] = f"{info.get('extractor')}_{info.get('id')}"
+        result['title'] = info.get('title')
+        # videos with usable captions have nothing to download, the captions are fetched with the transcript
+        if self._ai.needs_audio(url):
+            self._ai.download_audio(url)
+
+    def _transcribe(self, result: VideoResult, _: Any) -> List[dict]:
+        return self._ai.transcript_segments(result['url'])
+
+    def _summarize(self, result: VideoResult, segments: List[dict]) -> None:
+        result['topics'] = list(self._ai.generate_summary(result['url'], segments))
@@ -0,0 +1,553 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import threading
+import time
+from typing import List, Optional, Tuple, TypedDict, AsyncIterator, Iterator, Iterable, Callable, TYPE_CHECKING
+
+from video_summary_bot_core import lazy_imports, metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from openai.types.chat import ChatCompletionToolParam
+
+__all__ = [
+    'FUNCTIONS', 'TOOLS', 'Topic', 'estimate_tokens', 'create_with_retry', 'split_transcript', 'merge_topics',
+    'ToolCallAssembler', 'SummaryStats', 'MapReduceSummarizer',
+]
+
+FUNCTIONS = {
+    "add_topic": {
+        "description": "function for storing topics with summaries",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "topic": {
+                    "type": "string",
+                    "description": "Title of the topic",
+                },
+                "summary": {"type": "string", "description": "Summary of the topic"},
+                "timestamp": {
+                    "type": "array",
+                    "description": "Timestamp of the topic in a tuple with [start, end]",
+                    "items": {
+                        "type": "number"
+                    }
+                }
+            },
+            "required": ["topic", "summary", "timestamp"],
+        }
+    }
+}
+
+TOOLS: List['ChatCompletionToolParam'] = [
+    {
+        "type": "function",
+        "function": {
+            "name": fn_name,
+            "description": fn_info["description"],
+            "parameters": fn_info["parameters"],
+        }
+    }
+    for fn_name, fn_info in FUNCTIONS.items()
+]
+
+_WORD_RE = re.compile(r'\w+')
+
+
+class Topic(TypedDict):
+    topic: str
+    summary: str
+    timestamp: Tuple[float, float]
+
+
+class SummaryStats(TypedDict, total=False):
+    windows: int
+    retries: int
+    topics: int
+    seconds: float
+    # streaming only
+    first_topic_seconds: float
+
+
+def _retryable() -> tuple[type[Exception], ...]:
+    openai = lazy_imports.openai()
+    return openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError
+
+
+def estimate_tokens(text: str) -> int:
+    """rough token count, ~4 characters per token for English text (no tokenizer dependency)"""
+    return len(text) // 4 + 1
+
+
+async def create_with_retry(
+        client: 'AsyncOpenAI',
+        model: str,
+        messages: list,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        on_retry: Optional[Callable[[], None]] = None,
+        **options
+):
+    """
+    a chat completion, retried with exponential backoff (and at least the retry-after the server asks
+    for) on rate limits and transient errors; `options` are passed to `create`
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await client.chat.completions.create(model=model, messages=messages, **options)
+        except _retryable() as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5)
+            response = getattr(e, 'response', None)
+            retry_after = response.headers.get('retry-after') if response is not None else None
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            if on_retry is not None:
+                on_retry()
+            logging.warning(f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.1f} s")
+            await asyncio.sleep(delay)
+
+
+def split_transcript(transcript: str, max_tokens: int) -> List[str]:
+    """split a timestamped transcript (one segment per line) into windows of at most ~`max_tokens`"""
+    windows: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for line in transcript.splitlines():
+        tokens = estimate_tokens(line) + 1
+        if current and current_tokens + tokens > max_tokens:
+            windows.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+
+def _similar_titles(a: str, b: str) -> bool:
+    words_a, words_b = set(_WORD_RE.findall(a.lower())), set(_WORD_RE.findall(b.lower()))
+    if not words_a or not words_b:
+        return False
+    return len(words_a & words_b) / len(words_a | words_b) >= 0.6
+
+
+def _duplicate(topic: Topic, previous: Topic, gap_seconds: float) -> bool:
+    """the same topic seen from two windows: mostly overlapping, or adjacent with a similar title"""
+    start, end = topic['timestamp']
+    previous_start, previous_end = previous['timestamp']
+    overlap = min(end, previous_end) - max(start, previous_start)
+    shorter = max(min(end - start, previous_end - previous_start), 1e-6)
+    if overlap / shorter >= 0.5:
+        return True
+    adjacent = -gap_seconds <= start - previous_end <= gap_seconds or -gap_seconds <= previous_start - end <= gap_seconds
+    return adjacent and _similar_titles(topic['topic'], previous['topic'])
+
+
+def _topic(fn_name: str, arguments: str) -> Topic:
+    """
+    :raise ValueError: if the arguments are not a JSON object with a topic, a summary and a timestamp
+    """
+    if fn_name not in FUNCTIONS:
+        logging.error(f"function '{fn_name}' not found in openai tools definitions. (args: {arguments})")
+        raise AttributeError(f"function '{fn_name}' not found in openai tools definitions")
+    fn_args = json.loads(arguments)
+    try:
+        timestamp = tuple(fn_args['timestamp'])
+        return Topic(topic=fn_args['topic'], summary=fn_args['summary'], timestamp=(timestamp[0], timestamp[-1]))
+    except (KeyError, IndexError, TypeError) as e:
+        raise ValueError(f"invalid {fn_name} arguments ({e.__class__.__name__}: {e}): {arguments}") from e
+
+
+def _valid_topics(calls: Iterable[Tuple[str, str]]) -> Iterator[Topic]:
+    """the topics of (function name, arguments) tool calls, skipping truncated or malformed arguments"""
+    for fn_name, arguments in calls:
+        try:
+            topic = _topic(fn_name, arguments)
+        except ValueError as e:
+            logging.warning(f"skipping a tool call: {e}")
+            continue
+        yield topic
+
+
+def merge_topics(windows: List[List[Topic]], gap_seconds: float = 5.0) -> List[Topic]:
+    """
+    Order the topics of every window by start time and merge the ones split by a window boundary:
+    a topic from a different window that overlaps the previous one, or follows it within
+    `gap_seconds` with a similar title.
+    """
+    tagged = sorted(
+        ((topic['timestamp'][0], index, topic) for index, topics in enumerate(windows) for topic in topics),
+        key=lambda t: (t[0], t[1])
+    )
+    merged: List[Topic] = []
+    merged_windows: List[int] = []
+    for _, index, topic in tagged:
+        if merged and merged_windows[-1] != index:
+            previous = merged[-1]
+            if _duplicate(topic, previous, gap_seconds):
+                previous['timestamp'] = (
+                    min(topic['timestamp'][0], previous['timestamp'][0]),
+                    max(topic['timestamp'][1], previous['timestamp'][1])
+                )
+                if len(topic['summary']) > len(previous['summary']):
+                    previous['summary'] = topic['summary']
+                merged_windows[-1] = index
+                continue
+        merged.append(Topic(topic=topic['topic'], summary=topic['summary'], timestamp=topic['timestamp']))
+        merged_windows.append(index)
+    return merged
+
+
+class ToolCallAssembler:
+    """
+    Rebuild tool calls from streamed deltas. `feed` returns the (function name, arguments) of every
+    call whose JSON arguments object closed in that delta, without waiting for the end of the stream.
+    """
+
+    def __init__(self):
+        self._calls: dict[int, dict] = {}
+
+    def feed(self, tool_call_deltas) -> List[Tuple[str, str]]:
+        completed = []
+        for delta in tool_call_deltas or []:
+            call = self._calls.setdefault(
+                delta.index,
+                {'name': '', 'arguments': [], 'depth': 0, 'in_string': False, 'escape': False, 'done': False}
+            )
+            function = delta.function
+            if function is None:
+                continue
+            if function.name:
+                call['name'] += function.name
+            if function.arguments and not call['done'] and self._scan(call, function.arguments):
+                completed.append((call['name'], ''.join(call['arguments'])))
+        return completed
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """calls never seen closing (truncated output), parsed as they are"""
+        return [(c['name'], ''.join(c['arguments'])) for c in self._calls.values() if not c['done'] and c['arguments']]
+
+    @staticmethod
+    def _scan(call: dict, fragment: str) -> bool:
+        for i, char in enumerate(fragment):
+            if call['in_string']:
+                if call['escape']:
+                    call['escape'] = False
+                elif char == '\\':
+                    call['escape'] = True
+                elif char == '"':
+                    call['in_string'] = False
+            elif char == '"':
+                call['in_string'] = True
+            elif char in '{[':
+                call['depth'] += 1
+            elif char in '}]':
+                call['depth'] -= 1
+                if call['depth'] == 0:
+                    call['arguments'].append(fragment[:i + 1])
+                    call['done'] = True
+                    return True
+        call['arguments'].append(fragment)
+        return False
+
+
+class MapReduceSummarizer:
+    """
+    Summarize a long transcript in token-budgeted windows, concurrently (at most `concurrency`
+    requests in flight, retried with exponential backoff), then merge the topics of all windows.
+    Every method takes an optional `stats` dict, filled with the windows, retries, topics and seconds of
+    that call (the summarizer is shared by concurrent jobs).
+    """
+
+    def __init__(
+            self,
+            model: str,
+            api_key: Optional[str] = None,
+            base_url: Optional[str] = None,
+            window_tokens: int = 12000,
+            concurrency: int = 4,
+            max_retries: int = 5,
+            backoff_seconds: float = 1.0
+    ):
+        self._model = model
+        self._api_key = api_key
+        self._base_url = base_url
+        self._window_tokens = window_tokens
+        self._concurrency = max(concurrency, 1)
+        self._max_retries = max_retries
+        self._backoff_seconds = backoff_seconds
+        # `summarize_window` calls in flight, made from concurrent threads
+        self._window_slots = threading.BoundedSemaphore(self._concurrency)
+
+    def summarize(self, system_prompt: str, transcript: str, stats: Optional[SummaryStats] = None) -> List[Topic]:
+        """blocking wrapper, runs its own event loop (call it from a worker thread in async code)"""
+        return asyncio.run(self.summarize_async(system_prompt, transcript, stats))
+
+    async def summarize_async(
+            self,
+            system_prompt: str,
+            transcript: str,
+            stats: Optional[SummaryStats] = None
+    ) -> List[Topic]:
+        windows = split_transcript(transcript, self._window_tokens)
+        started = time.monotonic()
+        stats = self._start_stats(stats, len(windows))
+        # one client per run: the underlying connection pool is bound to the event loop
+        client = lazy_imports.openai().AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, max_retries=0)
+        semaphore = asyncio.Semaphore(self._concurrency)
+        try:
+            results = await asyncio.gather(*(
+                self._summarize_window(client, semaphore, system_prompt, window, index, len(windows), stats)
+                for index, window in enumerate(windows)
+            ))
+        finally:
+            await client.close()
+        return self._merge(results, started, stats)
+
+    def summarize_windows(
+            self,
+            system_prompt: str,
+            windows: Iterable[str],
+            stats: Optional[SummaryStats] = None
+    ) -> List[Topic]:
+        """blocking wrapper of `summarize_windows_async`"""
+        return asyncio.run(self.summarize_windows_async(system_prompt, windows, stats))
+
+    async def summarize_windows_async(
+            self,
+            system_prompt: str,
+            windows: Iterable[str],
+            stats: Optional[SummaryStats] = None
+    ) -> List[Topic]:
+        """
+        Summarize the windows of a transcript still being produced: `windows` is a blocking iterator
+        (advanced on a worker thread) and each window is sent as soon as it is yielded, the topics of
+        every window are merged once the iterator is exhausted.
+        """
+        loop = asyncio.get_running_loop()
+        iterator = iter(windows)
+        end = object()
+        started = time.monotonic()
+        stats = self._start_stats(stats, 0)
+        client = lazy_imports.openai().AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, max_retries=0)
+        semaphore = asyncio.Semaphore(self._concurrency)
+        tasks: List[asyncio.Task] = []
+        try:
+            while (window := await loop.run_in_executor(None, next, iterator, end)) is not end:
+                tasks.append(asyncio.create_task(
+                    self._summarize_window(client, semaphore, system_prompt, window, len(tasks), None, stats)
+                ))
+                stats['windows'] = len(tasks)
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await client.close()
+            getattr(iterator, 'close', lambda: None)()
+        return self._merge(results, started, stats)
+
+    def summarize_window(
+            self,
+            system_prompt: str,
+            window: str,
+            index: int,
+            stats: Optional[SummaryStats] = None
+    ) -> List[Topic]:
+        """
+        blocking, the topics of window `index` of a transcript still being produced, not merged;
+        at most `concurrency` calls run at once
+        """
+        with self._window_slots:
+            return asyncio.run(self._summarize_one(system_prompt, window, index, stats))
+
+    async def _summarize_one(
+            self,
+            system_prompt: str,
+            window: str,
+            index: int,
+            stats: Optional[SummaryStats]
+    ) -> List[Topic]:
+        stats = self._start_stats(stats, 1)
+        client = lazy_imports.openai().AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, max_retries=0)
+        try:
+            return await self._summarize_window(client, asyncio.Semaphore(1), system_prompt, window, index, None, stats)
+        finally:
+            await client.close()
+
+    @staticmethod
+    def _start_stats(stats: Optional[SummaryStats], windows: int) -> SummaryStats:
+        stats = stats if stats is not None else SummaryStats()
+        stats.update(windows=windows, retries=0)
+        return stats
+
+    @staticmethod
+    def _merge(results: List[List[Topic]], started: float, stats: SummaryStats) -> List[Topic]:
+        if not any(results):
+            raise RuntimeError("no tool calls found in response")
+        topics = merge_topics(results)
+        stats['seconds'] = time.monotonic() - started
+        stats['topics'] = len(topics)
+        logging.info(f"summarized {len(results)} transcript windows into {len(topics)} topics "
+                     f"in {stats['seconds']:.1f} s")
+        return topics
+
+    def stream(self, system_prompt: str, transcript: str, stats: Optional[SummaryStats] = None) -> Iterator[Topic]:
+        """blocking wrapper of `stream_async`, the event loop runs in the calling thread"""
+        loop = asyncio.new_event_loop()
+        topics = self.stream_async(system_prompt, transcript, stats)
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(topics.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(topics.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    async def stream_async(
+            self,
+            system_prompt: str,
+            transcript: str,
+            stats: Optional[SummaryStats] = None
+    ) -> AsyncIterator[Topic]:
+        """
+        Stream the completions of every window and yield each topic as soon as its arguments are
+        complete, in arrival order. A topic duplicating one already yielded from another window is skipped.
+        """
+        windows = split_transcript(transcript, self._window_tokens)
+        started = time.monotonic()
+        stats = self._start_stats(stats, len(windows))
+        client = lazy_imports.openai().AsyncOpenAI(api_key=self._api_key, base_url=self._base_url, max_retries=0)
+        semaphore = asyncio.Semaphore(self._concurrency)
+        queue: asyncio.Queue[Tuple[int, Optional[Topic]]] = asyncio.Queue()
+
+        async def produce(index: int, window: str) -> None:
+            try:
+                async for topic in self._stream_window(client, semaphore, system_prompt, window, index, len(windows),
+                                                       stats):
+                    await queue.put((index, topic))
+            finally:
+                # end of this window
+                await queue.put((index, None))
+
+        tasks = [asyncio.create_task(produce(index, window)) for index, window in enumerate(windows)]
+        emitted: List[Tuple[int, Topic]] = []
+        try:
+            remaining = len(tasks)
+            while remaining:
+                index, topic = await queue.get()
+                if topic is None:
+                    remaining -= 1
+                    continue
+                if any(i != index and _duplicate(topic, other, 5.0) for i, other in emitted):
+                    continue
+                if not emitted:
+                    stats['first_topic_seconds'] = time.monotonic() - started
+                    logging.info(f"first topic after {stats['first_topic_seconds']:.1f} s")
+                emitted.append((index, topic))
+                yield topic
+            # surface the error of a failed window
+            for task in tasks:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await client.close()
+        if not emitted:
+            raise RuntimeError("no tool calls found in response")
+        stats['seconds'] = time.monotonic() - started
+        stats['topics'] = len(emitted)
+
+    @staticmethod
+    def _messages(system_prompt: str, window: str, index: int, count: Optional[int]) -> list:
+        if count is None:
+            # the transcript is still being produced, the number of parts is unknown
+            header = f"This is part {index + 1} of the video transcript with timestamps:"
+        elif count > 1:
+            header = f"This is part {index + 1} of {count} of the video transcript with timestamps:"
+        else:
+            header = "This is the video transcript with timestamps:"
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": f"{header}\n\n{window}"},
+        ]
+
+    async def _summarize_window(
+            self,
+            client: 'AsyncOpenAI',
+            semaphore: asyncio.Semaphore,
+            system_prompt: str,
+            window: str,
+            index: int,
+            count: Optional[int],
+            stats: SummaryStats
+    ) -> List[Topic]:
+        messages = self._messages(system_prompt, window, index, count)
+        async with semaphore:
+            response = await self._create_with_retry(client, messages, stats)
+        tool_calls = [tool_call for choice in response.choices for tool_call in choice.message.tool_calls or []]
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            metrics.LLM_TOKENS.inc(usage.prompt_tokens, direction='in')
+            metrics.LLM_TOKENS.inc(usage.completion_tokens, direction='out')
+        else:
+            self._record_estimated_tokens(messages, [tool_call.function.arguments for tool_call in tool_calls])
+        return list(_valid_topics((tool_call.function.name, tool_call.function.arguments) for tool_call in tool_calls))
+
+    async def _stream_window(
+            self,
+            client: 'AsyncOpenAI',
+            semaphore: asyncio.Semaphore,
+            system_prompt: str,
+            window: str,
+            index: int,
+            count: int,
+            stats: SummaryStats
+    ) -> AsyncIterator[Topic]:
+        messages = self._messages(system_prompt, window, index, count)
+        async with semaphore:
+            # only opening the stream is retried, a failure mid-stream would repeat topics already yielded
+            stream = await self._create_with_retry(client, messages, stats, stream=True)
+            assembler = ToolCallAssembler()
+            outputs: List[str] = []
+            try:
+                async with stream:
+                    async for chunk in stream:
+                        for choice in chunk.choices:
+                            completed = assembler.feed(choice.delta.tool_calls)
+                            outputs.extend(arguments for _, arguments in completed)
+                            for topic in _valid_topics(completed):
+                                yield topic
+            finally:
+                # streamed responses carry no usage
+                self._record_estimated_tokens(messages, outputs)
+            # calls cut by the end of the stream
+            for topic in _valid_topics(assembler.finish()):
+                yield topic
+
+    @staticmethod
+    def _record_estimated_tokens(messages: list, outputs: List[str]) -> None:
+        metrics.LLM_TOKENS.inc(sum(estimate_tokens(m['content']) for m in messages), direction='in')
+        metrics.LLM_TOKENS.inc(sum(estimate_tokens(o) for o in outputs), direction='out')
+
+    async def _create_with_retry(self, client: 'AsyncOpenAI', messages: list, stats: SummaryStats,
+                                 stream: bool = False):
+        def on_retry() -> None:
+            stats['retries'] += 1
+
+        return await create_with_retry(
+            client, self._model, messages, self._max_retries, self._backoff_seconds, on_retry,
+            tools=TOOLS, tool_choice="auto", stream=stream
+        )
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from video_summary_bot_core.artifact_store import ArtifactStore, SUMMARY
+from video_summary_simple.summarizer import Topic
+
+__all__ = ['SummaryCache', 'summary_key']
+
+# bump when the cached layout or the meaning of the topics changes
+_VERSION = 1
+
+
+def summary_key(transcript: str, model: str, system_prompt: str, language: Optional[str], tools: Any,
+                **settings: Any) -> str:
+    """content hash of everything the summary depends on"""
+    inputs = {
+        'version': _VERSION,
+        'transcript': transcript,
+        'model': model,
+        'system_prompt': system_prompt,
+        'language': language,
+        'tools': tools,
+        'settings': settings,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SummaryCache:
+    """
+    Summaries (topic lists) stored as json artifacts in the artifact store, keyed by `summary_key`.
+    Entries older than `ttl` are stale: with `serve_stale` they are still returned while a background
+    thread recomputes them. Writes are atomic and serialized across processes with a file lock.
+    """
+    _store: ArtifactStore
+    _ttl: float
+    _serve_stale: bool
+
+    def __init__(self, store: ArtifactStore, ttl: float = 7 * 24 * 60 * 60, serve_stale: bool = True):
+        self._store = store
+        self._ttl = ttl
+        self._serve_stale = serve_stale
+        self._lock = threading.Lock()
+        self._refreshing: set[str] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[tuple[List[Topic], bool]]:
+        """(topics, fresh) or None on a miss, stale entries are a miss unless `serve_stale`"""
+        entry = self._load(key)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        fresh = time.time() - entry['created_at'] < self._ttl
+        if not fresh and not self._serve_stale:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+        return [self._topic(t) for t in entry['topics']], fresh
+
+    def put(self, key: str, topics: List[Topic], provenance: Optional[dict] = None) -> None:
+        try:
+            with self._store.write(SUMMARY, key, '.json', provenance) as f:
+                json.dump({'created_at': time.time(), 'topics': topics}, f)
+        except OSError as e:
+            logging.warning(f"unable to write summary {key[:12]}: {e}")
+
+    def compute(self, key: str, summarize: Callable[[], List[Topic]], provenance: Optional[dict] = None) -> List[Topic]:
+        """
+        run `summarize` and store its result, unless another process already stored a fresh entry;
+        the store lock is only held for the write, not while summarizing
+        """
+        entry = self._load(key)
+        if entry is not None and time.time() - entry['created_at'] < self._ttl:
+            return [self._topic(t) for t in entry['topics']]
+        topics = summarize()
+        with self._store.lock(SUMMARY, key):
+            self.put(key, topics, provenance)
+        return topics
+
+    def refresh_in_background(self, key: str, summarize: Callable[[], List[Topic]],
+                              provenance: Optional[dict] = None) -> bool:
+        """recompute a stale entry on a daemon thread, False if a refresh of `key` is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self.compute(key, summarize, provenance)
+                logging.info(f"refreshed stale summary {key[:12]}")
+            except Exception as e:
+                logging.warning(f"unable to refresh stale summary {key[:12]}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name='summary-refresh', daemon=True).start()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses,
+                    'refreshing': len(self._refreshing)}
+
+    @staticmethod
+    def _topic(data: dict) -> Topic:
+        return Topic(topic=data['topic'], summary=data['summary'], timestamp=tuple(data['timestamp']))
+
+    def _load(self, key: str) -> Optional[dict]:
+        path = self._store.get(SUMMARY, key)
+        if path is None:
+            return None
+        try:
+            with path.open('r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"ignoring unreadable summary cache file {path}: {e}")
+            return None
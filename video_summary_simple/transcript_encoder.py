@@ -0,0 +1,160 @@
+import bisect
+import logging
+import math
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from video_summary_simple.summarizer import estimate_tokens, split_transcript
+
+__all__ = ['EncodedTranscript', 'encode_transcript', 'encode_windows']
+
+
+class EncodedTranscript:
+    """
+    Compact prompt form of a transcript: one `[start] text` line per group of merged segments,
+    start in whole seconds, a line lasting until the next one starts.
+    Timestamps given back by the model are snapped to the original segments with `snap`.
+    """
+    text: str
+    merge_seconds: float
+    segments: List[dict]
+
+    def __init__(self, text: str, merge_seconds: float, segments: List[dict]):
+        self.text = text
+        self.merge_seconds = merge_seconds
+        self.segments = segments
+        self._starts = [s['start'] for s in segments]
+        self._ends = [s['end'] for s in segments]
+
+    def snap(self, timestamp: Tuple[float, float]) -> Tuple[float, float]:
+        """(start, end) moved to the start and end of the original segments containing them"""
+        if not self.segments:
+            return timestamp
+        start, end = timestamp
+        # line starts are floored segment starts: the first segment starting at or after start
+        first = min(bisect.bisect_left(self._starts, start), len(self._starts) - 1)
+        last = min(bisect.bisect_left(self._ends, end), len(self._ends) - 1)
+        last = max(last, first)
+        return self._starts[first], self._ends[last]
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class _Lines:
+    """`_encode` fed a segment at a time, keeping the length of the text up to date"""
+
+    def __init__(self, merge_seconds: float, pause_seconds: float = 3.0):
+        self.lines: List[str] = []
+        self.segments = 0
+        self._merge_seconds = merge_seconds
+        self._pause_seconds = pause_seconds
+        self._length = 0
+        # the line being merged
+        self._start: Optional[float] = None
+        self._end = 0.0
+        self._texts: List[str] = []
+        self._texts_length = 0
+
+    def add(self, segment: dict) -> None:
+        self.segments += 1
+        text = segment['text'].strip()
+        if not text:
+            return
+        if self._start is not None and (segment['end'] - self._start > self._merge_seconds
+                                        or segment['start'] - self._end > self._pause_seconds):
+            line = self._line()
+            self._length += len(line) + (1 if self.lines else 0)
+            self.lines.append(line)
+            self._start, self._texts, self._texts_length = None, [], 0
+        if self._start is None:
+            self._start = segment['start']
+        self._texts.append(text)
+        self._texts_length += len(text) + (1 if len(self._texts) > 1 else 0)
+        self._end = segment['end']
+
+    def extend(self, segments: Iterable[dict]) -> None:
+        for segment in segments:
+            self.add(segment)
+
+    def tokens(self) -> int:
+        """`estimate_tokens` of the text, without joining it"""
+        length = self._length
+        if self._start is not None:
+            length += (1 if self.lines else 0) + len(f"[{math.floor(self._start)}] ") + self._texts_length
+        return length // 4 + 1
+
+    def text(self) -> str:
+        return "\n".join(self.lines + [self._line()] if self._start is not None else self.lines)
+
+    def state(self) -> tuple:
+        return len(self.lines), self.segments, self._length, self._start, self._end, list(self._texts), \
+            self._texts_length
+
+    def restore(self, state: tuple) -> None:
+        """back to `state`, forgetting the segments added since"""
+        lines, self.segments, self._length, self._start, self._end, self._texts, self._texts_length = state
+        del self.lines[lines:]
+
+    def _line(self) -> str:
+        return f"[{math.floor(self._start)}] {' '.join(self._texts)}"
+
+
+def _encode(segments: List[dict], merge_seconds: float, pause_seconds: float) -> str:
+    lines = _Lines(merge_seconds, pause_seconds)
+    lines.extend(segments)
+    return lines.text()
+
+
+def encode_transcript(
+        segments: List[dict],
+        merge_seconds: float = 15.0,
+        token_budget: Optional[int] = None,
+        pause_seconds: float = 3.0
+) -> EncodedTranscript:
+    """
+    Merge adjacent segments into lines of up to `merge_seconds` (never across a pause longer than
+    `pause_seconds`). With a `token_budget`, the lines are made longer until the text fits,
+    or until a line spans ten minutes; the words are never dropped.
+    """
+    text = _encode(segments, merge_seconds, pause_seconds)
+    if token_budget is not None and estimate_tokens(text) > token_budget:
+        words = estimate_tokens(' '.join(s['text'].strip() for s in segments))
+        if words > token_budget:
+            # only timestamps can be saved: the budget cannot be met, keep the resolution
+            logging.warning(f"transcript words alone take ~{words} tokens, over the {token_budget} tokens budget")
+            return EncodedTranscript(text, merge_seconds, segments)
+        while estimate_tokens(text) > token_budget and merge_seconds < 600:
+            merge_seconds *= 2
+            # coarser lines: pauses no longer split them
+            text = _encode(segments, merge_seconds, max(pause_seconds, merge_seconds / 5))
+    return EncodedTranscript(text, merge_seconds, segments)
+
+
+def encode_windows(
+        chunks: Iterable[List[dict]],
+        window_tokens: int,
+        merge_seconds: float = 15.0,
+        into: Optional[List[dict]] = None
+) -> Iterator[str]:
+    """
+    Encoded windows of up to ~`window_tokens` from a transcript arriving in chunks of segments.
+    A window is made of whole chunks and is yielded as soon as the next chunk would not fit in it
+    (a chunk alone over the budget is split). Segments are appended to `into`.
+    """
+    # each segment is encoded once (twice when it starts a new window), not the whole window per chunk
+    window = _Lines(merge_seconds)
+    for segments in chunks:
+        if into is not None:
+            into.extend(segments)
+        state = window.state() if window.segments else None
+        window.extend(segments)
+        if state is not None and window.tokens() > window_tokens:
+            window.restore(state)
+            yield window.text()
+            window = _Lines(merge_seconds)
+            window.extend(segments)
+        if window.tokens() >= window_tokens:
+            yield from split_transcript(window.text(), window_tokens)
+            window = _Lines(merge_seconds)
+    if window.segments:
+        yield window.text()
@@ -0,0 +1,150 @@
+import math
+import re
+from collections import Counter
+from typing import List, Tuple, TypedDict
+
+__all__ = ['Excerpt', 'TranscriptIndex', 'tokenize']
+
+# bump when the persisted layout or the tokenizer changes
+_VERSION = 1
+_WORD_RE = re.compile(r'\w+')
+_STOPWORDS = frozenset("""
+a about above after again all also am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers him
+his how i if in into is it its just me more most my no nor not now of off on once only or other our out over own
+same she should so some such than that the their them then there these they this those through to too under until
+up very was we were what when where which while who whom why will with would you your
+""".split())
+
+
+def _stem(word: str) -> str:
+    # light suffix stripping: "prices", "priced" and "pricing" all become "pric"
+    for suffix in ('ing', 'ed', 'es', 's', 'e'):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix) and not word.endswith('ss'):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """lowercase word stems of `text`, without stopwords"""
+    return [_stem(word) for word in _WORD_RE.findall(text.lower()) if word not in _STOPWORDS]
+
+
+class Excerpt(TypedDict):
+    start: float
+    end: float
+    score: float
+    segments: List[dict]
+
+
+class TranscriptIndex:
+    """
+    BM25 index over overlapping windows of a transcript: `window_seconds` of segments starting every
+    `stride_seconds`, so that a passage split by one window boundary is whole in the next window.
+    Persisted as json (`to_json`) without the segments, which are in the transcript it was built from.
+    """
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(
+            self,
+            segments: List[dict],
+            windows: List[Tuple[int, int]],
+            terms: List[dict[str, int]],
+            window_seconds: float,
+            stride_seconds: float
+    ):
+        self.segments = segments
+        self.windows = windows
+        self.window_seconds = window_seconds
+        self.stride_seconds = stride_seconds
+        self._terms = terms
+        self._lengths = [sum(counts.values()) for counts in terms]
+        self._mean_length = sum(self._lengths) / max(len(terms), 1)
+        frequencies: Counter = Counter()
+        for counts in terms:
+            frequencies.update(counts.keys())
+        n = len(terms)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in frequencies.items()}
+
+    @classmethod
+    def build(
+            cls,
+            segments: List[dict],
+            window_seconds: float = 60.0,
+            stride_seconds: float = 30.0
+    ) -> 'TranscriptIndex':
+        windows: List[Tuple[int, int]] = []
+        first = 0
+        while first < len(segments):
+            window_start = segments[first]['start']
+            last = first + 1
+            while last < len(segments) and segments[last]['start'] < window_start + window_seconds:
+                last += 1
+            windows.append((first, last))
+            if last == len(segments):
+                break
+            # the next window starts `stride_seconds` later, and always on a later segment
+            first += 1
+            while first < last and segments[first]['start'] < window_start + stride_seconds:
+                first += 1
+        terms = [
+            dict(Counter(term for s in segments[first:last] for term in tokenize(s['text'])))
+            for first, last in windows
+        ]
+        return cls(segments, windows, terms, window_seconds, stride_seconds)
+
+    def search(self, question: str, k: int = 4) -> List[Excerpt]:
+        """
+        the (at most) `k` non-overlapping windows scoring best for `question`, in transcript order;
+        k windows spread over the whole video when no word of the question is in the transcript
+        """
+        query = set(tokenize(question))
+        scores = []
+        for index, counts in enumerate(self._terms):
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / max(self._mean_length, 1e-9))
+            score = sum(
+                self._idf[term] * counts[term] * (self.k1 + 1) / (counts[term] + norm)
+                for term in query if term in counts
+            )
+            if score > 0:
+                scores.append((score, index))
+        scores.sort(key=lambda s: (-s[0], s[1]))
+        if not scores:
+            step = len(self.windows) / max(min(k, len(self.windows)), 1)
+            scores = [(0.0, int(i * step)) for i in range(min(k, len(self.windows)))]
+        taken: List[Tuple[float, int]] = []
+        for score, index in scores:
+            first, last = self.windows[index]
+            if all(last <= self.windows[i][0] or first >= self.windows[i][1] for _, i in taken):
+                taken.append((score, index))
+                if len(taken) == k:
+                    break
+        return [self._excerpt(index, score) for score, index in sorted(taken, key=lambda t: t[1])]
+
+    def _excerpt(self, index: int, score: float) -> Excerpt:
+        first, last = self.windows[index]
+        segments = self.segments[first:last]
+        return Excerpt(start=segments[0]['start'], end=segments[-1]['end'], score=score, segments=segments)
+
+    def to_json(self) -> dict:
+        return {
+            'version': _VERSION,
+            'window_seconds': self.window_seconds,
+            'stride_seconds': self.stride_seconds,
+            'windows': self.windows,
+            'terms': self._terms,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict, segments: List[dict]) -> 'TranscriptIndex':
+        """
+        the index saved with `to_json` over `segments`
+        :raise ValueError: if it was saved by another version or for other segments
+        """
+        if data.get('version') != _VERSION:
+            raise ValueError(f"transcript index version {data.get('version')}, expected {_VERSION}")
+        windows = [(first, last) for first, last in data['windows']]
+        if windows and (windows[-1][1] != len(segments) or len(data['terms']) != len(windows)):
+            raise ValueError("the transcript index does not match the transcript")
+        return cls(segments, windows, data['terms'], data['window_seconds'], data['stride_seconds'])
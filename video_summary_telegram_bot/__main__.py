@@ -4,6 +4,8 @@ from pathlib import Path
 import logging
 from dotenv import load_dotenv
 
+from video_summary_bot_core.captions import TRANSCRIPT_SOURCES, PREFER_CAPTIONS
+from video_summary_bot_core.transcription_profiles import PROFILE_CHOICES, AUTO
 from video_summary_telegram_bot.telegram_bot import TelegramBot
 
 
@@ -22,9 +24,124 @@ def main():
                         default=os.environ.get('WHISPER_MODEL', 'large-v3'))
     parser.add_argument('--openai-api-key', type=str, help='OpenAI api key', default=None)
     parser.add_argument('--telegram-bot-api-server', type=str, help="telegram bot api server", default=None)
+    parser.add_argument('--max-upload-mb', type=float,
+                        help="largest audio/video file accepted (default: 20 MB, 2000 MB with a local bot api server)",
+                        default=os.environ.get('MAX_UPLOAD_MB', None))
+    parser.add_argument('--max-upload-minutes', type=float, help="longest audio/video file accepted",
+                        default=float(os.environ.get('MAX_UPLOAD_MINUTES', 240)))
+    parser.add_argument('--webhook-port', type=int,
+                        help="receive updates on this port through a webhook instead of long polling",
+                        default=os.environ.get('WEBHOOK_PORT', None))
+    parser.add_argument('--webhook-host', type=str, help="webhook listening address",
+                        default=os.environ.get('WEBHOOK_HOST', '0.0.0.0'))
+    parser.add_argument('--webhook-path', type=str, help="webhook route on the local server",
+                        default=os.environ.get('WEBHOOK_PATH', '/telegram'))
+    parser.add_argument('--webhook-url', type=str,
+                        help="public url registered with Telegram at startup, e.g. https://bot.example.com/telegram "
+                             "(leave empty when the webhook is registered elsewhere)",
+                        default=os.environ.get('WEBHOOK_URL', None))
+    parser.add_argument('--webhook-secret', type=str,
+                        help="secret token Telegram sends with every update (default: derived from the bot token), "
+                             "the same on every replica",
+                        default=os.environ.get('WEBHOOK_SECRET', None))
+    parser.add_argument('--webhook-max-connections', type=int,
+                        help="concurrent connections Telegram opens to the webhook",
+                        default=int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', 40)))
     parser.add_argument('--language', type=str, help="summary language", default=None)
+    parser.add_argument('--transcript-source', type=str, choices=TRANSCRIPT_SOURCES,
+                        help="use platform captions when available, or always/never run Whisper",
+                        default=os.environ.get('TRANSCRIPT_SOURCE', PREFER_CAPTIONS))
+    parser.add_argument('--caption-languages', type=str,
+                        help="comma separated preferred caption languages, e.g. 'en,it'",
+                        default=os.environ.get('CAPTION_LANGUAGES', None))
+    parser.add_argument('--whisper-workers', type=int,
+                        help="Whisper model replicas transcribing chunks of long videos in parallel",
+                        default=int(os.environ.get('WHISPER_WORKERS', 1)))
+    parser.add_argument('--chunk-minutes', type=float, help="chunk length for parallel long-form transcription",
+                        default=float(os.environ.get('CHUNK_MINUTES', 10)))
+    parser.add_argument('--whisper-batch-size', type=int,
+                        help="30 s windows decoded together across in-flight videos (1 disables batching, "
+                             "use with --transcribe-workers > 1)",
+                        default=int(os.environ.get('WHISPER_BATCH_SIZE', 1)))
+    parser.add_argument('--whisper-batch-max-wait-ms', type=float, help="max wait for a batch to fill",
+                        default=float(os.environ.get('WHISPER_BATCH_MAX_WAIT_MS', 50)))
+    parser.add_argument('--max-pending-jobs', type=int, help="videos accepted at once, running or queued",
+                        default=int(os.environ.get('MAX_PENDING_JOBS', 16)))
+    parser.add_argument('--max-running-jobs', type=int, help="videos processed concurrently",
+                        default=int(os.environ.get('MAX_RUNNING_JOBS', 4)))
+    parser.add_argument('--io-workers', type=int, help="threads for downloads and OpenAI calls",
+                        default=int(os.environ.get('IO_WORKERS', 8)))
+    parser.add_argument('--transcribe-workers', type=int, help="threads running Whisper",
+                        default=int(os.environ.get('TRANSCRIBE_WORKERS', 1)))
+    parser.add_argument('--transcription-profile', type=str, choices=PROFILE_CHOICES,
+                        help="Whisper model size, decoding and language pinning; 'auto' picks one per video "
+                             "from its duration and the number of queued videos",
+                        default=os.environ.get('TRANSCRIPTION_PROFILE', AUTO))
+    parser.add_argument('--summary-window-tokens', type=int,
+                        help="transcript tokens per summarization request, long videos are summarized in windows",
+                        default=int(os.environ.get('SUMMARY_WINDOW_TOKENS', 12000)))
+    parser.add_argument('--summary-concurrency', type=int, help="summarization requests in flight per video",
+                        default=int(os.environ.get('SUMMARY_CONCURRENCY', 4)))
+    parser.add_argument('--transcript-merge-seconds', type=float,
+                        help="transcript segments are merged into prompt lines of up to this length",
+                        default=float(os.environ.get('TRANSCRIPT_MERGE_SECONDS', 15)))
+    parser.add_argument('--transcript-token-budget', type=int,
+                        help="merge transcript lines further until the prompt fits this many tokens",
+                        default=os.environ.get('TRANSCRIPT_TOKEN_BUDGET', None))
+    parser.add_argument('--summary-cache-ttl-hours', type=float,
+                        help="cached summaries older than this are refreshed",
+                        default=float(os.environ.get('SUMMARY_CACHE_TTL_HOURS', 7 * 24)))
+    parser.add_argument('--duplicate-threshold', type=float,
+                        help="reuse the transcript and summary of audio at least this similar (acoustic "
+                             "fingerprint, 0 disables)",
+                        default=float(os.environ.get('DUPLICATE_THRESHOLD', 0.1)))
+    parser.add_argument('--no-stale-summaries', action='store_true',
+                        help="recompute expired cached summaries before answering instead of in the background",
+                        default=os.environ.get('NO_STALE_SUMMARIES', '').lower() in ('1', 'true', 'yes'))
+    parser.add_argument('--no-stream-summary', action='store_true',
+                        help="send the summary only when every topic is ready instead of topic by topic",
+                        default=os.environ.get('NO_STREAM_SUMMARY', '').lower() in ('1', 'true', 'yes'))
+    parser.add_argument('--no-incremental-summary', action='store_true',
+                        help="wait for the whole transcript before summarizing (by default the windows already "
+                             "transcribed are summarized while Whisper is still running)",
+                        default=os.environ.get('NO_INCREMENTAL_SUMMARY', '').lower() in ('1', 'true', 'yes'))
+    parser.add_argument('--reorder-summary', action='store_true',
+                        help="edit streamed topics into timestamp order once the summary is complete",
+                        default=os.environ.get('REORDER_SUMMARY', '').lower() in ('1', 'true', 'yes'))
+    parser.add_argument('--answer-top-k', type=int,
+                        help="transcript excerpts sent to answer a question replying to a summary (0 sends the "
+                             "whole transcript)",
+                        default=int(os.environ.get('ANSWER_TOP_K', 4)))
+    parser.add_argument('--preload-models', type=str,
+                        help="comma separated Whisper models loaded at startup (default: --whisper-model, "
+                             "empty string to load lazily)",
+                        default=os.environ.get('PRELOAD_MODELS', None))
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help="skip the warm-up inference after preloading",
+                        default=os.environ.get('NO_WARM_UP', '').lower() in ('1', 'true', 'yes'))
+    parser.add_argument('--model-memory-budget-mb', type=float,
+                        help="max memory for loaded Whisper models, least recently used ones are evicted",
+                        default=os.environ.get('MODEL_MEMORY_BUDGET_MB', None))
+    parser.add_argument('--cache-max-gb', type=float,
+                        help="evict the least recently used cached audio/transcripts/summaries above this size",
+                        default=os.environ.get('CACHE_MAX_GB', None))
+    parser.add_argument('--cache-ttl-days', type=float,
+                        help="evict cached files not used for this many days",
+                        default=os.environ.get('CACHE_TTL_DAYS', None))
+    parser.add_argument('--telegram-global-rate', type=float,
+                        help="max messages per second sent by the bot to all chats",
+                        default=float(os.environ.get('TELEGRAM_GLOBAL_RATE', 30)))
+    parser.add_argument('--telegram-chat-rate', type=float,
+                        help="max messages per second sent to a single chat (short bursts allowed)",
+                        default=float(os.environ.get('TELEGRAM_CHAT_RATE', 1)))
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve Prometheus metrics on this port at /metrics (disabled by default, in webhook "
+                             "mode they are also served by the webhook server)",
+                        default=os.environ.get('METRICS_PORT', None))
 
     args = parser.parse_args()
+    if args.webhook_url and args.webhook_port is None:
+        parser.error("--webhook-url requires --webhook-port")
 
     logging.basicConfig(
         level=logging.INFO,
@@ -46,6 +163,44 @@ def main():
         whisper_model_name=whisper_model,
         openai_api_key=openai_api_key,
         data_dir=data_dir,
+        transcript_source=args.transcript_source,
+        caption_languages=args.caption_languages.split(',') if args.caption_languages else None,
+        whisper_workers=args.whisper_workers,
+        chunk_seconds=args.chunk_minutes * 60,
+        whisper_batch_size=args.whisper_batch_size,
+        whisper_batch_max_wait=args.whisper_batch_max_wait_ms / 1000,
+        max_pending_jobs=args.max_pending_jobs,
+        max_running_jobs=args.max_running_jobs,
+        io_workers=args.io_workers,
+        transcribe_workers=args.transcribe_workers,
+        preload_models=[m for m in args.preload_models.split(',') if m] if args.preload_models is not None else None,
+        transcription_profile=args.transcription_profile,
+        summary_window_tokens=args.summary_window_tokens,
+        summary_concurrency=args.summary_concurrency,
+        transcript_merge_seconds=args.transcript_merge_seconds,
+        transcript_token_budget=args.transcript_token_budget,
+        summary_cache_ttl=args.summary_cache_ttl_hours * 3600,
+        summary_cache_serve_stale=not args.no_stale_summaries,
+        duplicate_threshold=args.duplicate_threshold or None,
+        stream_summary=not args.no_stream_summary,
+        incremental_summary=not args.no_incremental_summary,
+        reorder_summary=args.reorder_summary,
+        answer_top_k=args.answer_top_k or None,
+        warm_up=not args.no_warm_up,
+        model_memory_budget=int(args.model_memory_budget_mb * 2 ** 20) if args.model_memory_budget_mb else None,
+        cache_max_bytes=int(args.cache_max_gb * 2 ** 30) if args.cache_max_gb is not None else None,
+        cache_ttl=args.cache_ttl_days * 24 * 3600 if args.cache_ttl_days is not None else None,
+        metrics_port=int(args.metrics_port) if args.metrics_port is not None else None,
+        global_rate_limit=args.telegram_global_rate,
+        chat_rate_limit=args.telegram_chat_rate,
+        webhook_url=args.webhook_url,
+        webhook_host=args.webhook_host,
+        webhook_port=int(args.webhook_port) if args.webhook_port is not None else None,
+        webhook_path=args.webhook_path,
+        webhook_secret=args.webhook_secret,
+        webhook_max_connections=args.webhook_max_connections,
+        max_upload_bytes=int(float(args.max_upload_mb) * 2 ** 20) if args.max_upload_mb is not None else None,
+        max_upload_duration=args.max_upload_minutes * 60,
     )
     bot.start()
 
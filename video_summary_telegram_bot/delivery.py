@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from aiogram import Bot, enums, types
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+
+from video_summary_bot_core import metrics
+
+__all__ = ['MESSAGE_LIMIT', 'split_html', 'pack_messages', 'TokenBucket', 'Outbox', 'Delivery']
+
+T = TypeVar('T')
+
+# characters of a message text, counted here on the HTML source (longer than the parsed text)
+MESSAGE_LIMIT = 4096
+
+# a tag, an entity, a run of whitespace or a run of other text
+_TOKEN_RE = re.compile(r'<[^>]*>|&#?\w+;|\s+|[^<&\s]+|[<&]')
+_TAG_NAME_RE = re.compile(r'</?\s*([\w-]+)')
+_TAG_RE = re.compile(r'<[^>]*>')
+
+
+def _tokens(text: str, limit: int) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        if token.startswith('<') or token.startswith('&') or len(token) <= limit:
+            tokens.append(token)
+        else:
+            # a single word longer than a message
+            tokens.extend(token[i:i + limit] for i in range(0, len(token), limit))
+    return tokens
+
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Split Telegram HTML into chunks of at most `limit` characters, at whitespace when possible:
+    the tags open at a split are closed at the end of the chunk and opened again in the next one.
+    """
+    if len(text) <= limit:
+        return [text]
+    chunks: List[str] = []
+    # (name, opening tag) of the tags open at the current position
+    open_tags: List[tuple[str, str]] = []
+    current: List[str] = []
+    length = 0
+
+    def closing() -> str:
+        return ''.join(f'</{name}>' for name, _ in reversed(open_tags))
+
+    for token in _tokens(text, limit // 2):
+        is_tag = token.startswith('<')
+        closes = is_tag and token.startswith('</')
+        # room for this token and the closing tags of everything open after it
+        tail = len(closing()) + (0 if not is_tag or closes else len(token) + 3)
+        if current and length + len(token) + tail > limit and not closes:
+            chunks.append(''.join(current) + closing())
+            current = [tag for _, tag in open_tags]
+            length = sum(map(len, current))
+            if token.isspace():
+                # the split replaces the whitespace
+                continue
+        current.append(token)
+        length += len(token)
+        if is_tag:
+            match = _TAG_NAME_RE.match(token)
+            name = match.group(1) if match else ''
+            if closes:
+                for i in range(len(open_tags) - 1, -1, -1):
+                    if open_tags[i][0] == name:
+                        del open_tags[i]
+                        break
+            else:
+                open_tags.append((name, token))
+    if _TAG_RE.sub('', ''.join(current)).strip():
+        chunks.append(''.join(current) + closing())
+    return chunks
+
+
+def _take(parts: List[str], limit: int, separator: str) -> tuple[List[str], int]:
+    """the messages holding the first parts of `parts` (more than one only if a part is too long), parts used"""
+    if len(parts[0]) > limit:
+        return split_html(parts[0], limit), 1
+    length = len(parts[0])
+    count = 1
+    while count < len(parts) and length + len(separator) + len(parts[count]) <= limit:
+        length += len(separator) + len(parts[count])
+        count += 1
+    return [separator.join(parts[:count])], count
+
+
+def pack_messages(parts: List[str], limit: int = MESSAGE_LIMIT, separator: str = "\n") -> List[str]:
+    """join consecutive `parts` (each one valid HTML) into as few messages of at most `limit` characters as possible"""
+    messages: List[str] = []
+    parts = list(parts)
+    while parts:
+        taken, count = _take(parts, limit, separator)
+        messages += taken
+        del parts[:count]
+    return messages
+
+
+class TokenBucket:
+    """`rate` requests per second on average, in bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # waiters are served in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep(max(self._paused_until - now, (1 - self._tokens) / self._rate, 0.001))
+
+    def pause(self, seconds: float) -> None:
+        """nothing is let through for `seconds` (a 429 `retry_after`), then the bucket refills from empty"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = max(self._updated, self._paused_until)
+
+    @property
+    def idle(self) -> bool:
+        now = time.monotonic()
+        return now >= self._paused_until and self._tokens + (now - self._updated) * self._rate >= self._capacity
+
+
+class Outbox:
+    """
+    The topics of one answer, sent in the background as soon as the rate limits allow: topics added while
+    a message is waiting for its turn or on its way are packed together into the next one.
+    """
+
+    def __init__(self, delivery: 'Delivery', chat_id: int, reply_to_message_id: Optional[int] = None):
+        self._delivery = delivery
+        self._chat_id = chat_id
+        self._reply_to_message_id = reply_to_message_id
+        self._pending: List[str] = []
+        # (message, text) in sending order
+        self._sent: List[tuple[types.Message, str]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, text: str) -> None:
+        self._pending.append(text)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._pending:
+            await self._delivery.acquire(self._chat_id)
+            texts, count = _take(self._pending, self._delivery.message_limit, self._delivery.separator)
+            del self._pending[:count]
+            for i, text in enumerate(texts):
+                message = await self._delivery.request(
+                    self._chat_id, 'send', lambda: self._delivery.bot.send_message(
+                        self._chat_id, text,
+                        reply_to_message_id=self._reply_to_message_id,
+                        link_preview_options=types.LinkPreviewOptions(is_disabled=True),
+                        parse_mode=enums.ParseMode.HTML
+                    ),
+                    acquired=i == 0
+                )
+                self._sent.append((message, text))
+
+    async def close(self) -> List[types.Message]:
+        """wait for every added topic to be sent, the messages sent"""
+        while self._task is not None and not self._task.done():
+            await self._task
+        if self._task is not None:
+            # raise the sending error, if any
+            self._task.result()
+        return [message for message, _ in self._sent]
+
+    async def replace(self, parts: List[str]) -> List[types.Message]:
+        """
+        rewrite the messages already sent to hold `parts` instead, editing only the ones that change;
+        the messages holding them
+        """
+        await self.close()
+        texts = pack_messages(parts, self._delivery.message_limit, self._delivery.separator)
+        for i, text in enumerate(texts):
+            if i < len(self._sent):
+                message, sent_text = self._sent[i]
+                if sent_text != text:
+                    await self._delivery.edit(self._chat_id, message.message_id, text)
+                    self._sent[i] = (message, text)
+            else:
+                self._pending.append(text)
+        # already packed, _take does not join them any further
+        if self._pending:
+            self._task = asyncio.create_task(self._run())
+            await self.close()
+        for message, _ in self._sent[len(texts):]:
+            await self._delivery.request(
+                self._chat_id, 'delete', lambda: self._delivery.bot.delete_message(self._chat_id, message.message_id)
+            )
+        del self._sent[len(texts):]
+        return [message for message, _ in self._sent]
+
+
+class Delivery:
+    """
+    Outbound Telegram traffic of the bot: every call waits for a token of the global bucket
+    (Telegram allows ~30 messages per second per bot) and of the bucket of its chat (~1 per second,
+    with small bursts), is retried after the `retry_after` of a 429 (the chat is paused meanwhile)
+    and, for status messages, only the latest text is sent when edits come faster than the limits.
+    """
+    bot: Bot
+    message_limit: int
+    separator: str
+
+    def __init__(
+            self,
+            bot: Bot,
+            global_rate: float = 30.0,
+            chat_rate: float = 1.0,
+            chat_burst: int = 3,
+            max_retries: int = 5,
+            message_limit: int = MESSAGE_LIMIT,
+            separator: str = "\n"
+    ):
+        self.bot = bot
+        self.message_limit = message_limit
+        self.separator = separator
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._chats: dict[int, TokenBucket] = {}
+        # latest status text not sent yet, and the task sending it, per (chat id, message id)
+        self._statuses: dict[tuple[int, int], str] = {}
+        self._status_tasks: dict[tuple[int, int], asyncio.Task] = {}
+        self._stats = {'sent': 0, 'edited': 0, 'deleted': 0, 'coalesced': 0, 'retry_after': 0}
+
+    def _chat(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # forget the chats that would start with a full bucket anyway
+                self._chats = {k: v for k, v in self._chats.items() if not v.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    async def acquire(self, chat_id: int) -> None:
+        await self._chat(chat_id).acquire()
+        await self._global.acquire()
+
+    async def request(
+            self,
+            chat_id: int,
+            method: str,
+            call: Callable[[], Awaitable[T]],
+            acquired: bool = False
+    ) -> T:
+        """
+        `call()` once the rate limits allow it (already allowed if `acquired`), retried after a 429
+        or a network error
+        """
+        for attempt in range(self._max_retries + 1):
+            if attempt or not acquired:
+                await self.acquire(chat_id)
+            try:
+                with metrics.stage(metrics.TELEGRAM_SEND):
+                    result = await call()
+            except TelegramRetryAfter as e:
+                metrics.TELEGRAM_REQUESTS.inc(method=method, result='retry_after')
+                self._stats['retry_after'] += 1
+                if attempt == self._max_retries:
+                    raise
+                logging.warning(f"telegram flood control on chat {chat_id}, retrying in {e.retry_after} s")
+                self._chat(chat_id).pause(e.retry_after)
+                continue
+            except TelegramNetworkError as e:
+                metrics.TELEGRAM_REQUESTS.inc(method=method, result='error')
+                if attempt == self._max_retries:
+                    raise
+                delay = min(2 ** attempt, 30)
+                logging.warning(f"telegram request failed ({e}), retrying in {delay} s")
+                await asyncio.sleep(delay)
+                continue
+            metrics.TELEGRAM_REQUESTS.inc(method=method, result='ok')
+            self._stats[{'send': 'sent', 'edit': 'edited', 'delete': 'deleted'}[method]] += 1
+            return result
+
+    async def send(
+            self,
+            chat_id: int,
+            parts: List[str],
+            reply_to_message_id: Optional[int] = None
+    ) -> List[types.Message]:
+        """send `parts` packed into as few messages as possible, in order"""
+        messages = []
+        for text in pack_messages(parts, self.message_limit, self.separator):
+            messages.append(await self.request(chat_id, 'send', lambda: self.bot.send_message(
+                chat_id, text,
+                reply_to_message_id=reply_to_message_id,
+                link_preview_options=types.LinkPreviewOptions(is_disabled=True),
+                parse_mode=enums.ParseMode.HTML
+            )))
+        return messages
+
+    async def edit(self, chat_id: int, message_id: int, text: str) -> None:
+        try:
+            await self.request(chat_id, 'edit', lambda: self.bot.edit_message_text(
+                text, chat_id=chat_id, message_id=message_id,
+                link_preview_options=types.LinkPreviewOptions(is_disabled=True),
+                parse_mode=enums.ParseMode.HTML
+            ))
+        except TelegramBadRequest as e:
+            if 'message is not modified' not in str(e):
+                raise
+
+    def outbox(self, chat_id: int, reply_to_message_id: Optional[int] = None) -> Outbox:
+        return Outbox(self, chat_id, reply_to_message_id)
+
+    def set_status(self, chat_id: int, message_id: int, text: str) -> None:
+        """edit a status message in the background, superseding the edits of it not sent yet"""
+        key = (chat_id, message_id)
+        if key in self._statuses:
+            self._stats['coalesced'] += 1
+        self._statuses[key] = text
+        if key not in self._status_tasks:
+            self._status_tasks[key] = asyncio.create_task(self._send_statuses(key))
+
+    async def wait_status(self, chat_id: int, message_id: int) -> None:
+        """wait until the latest status of the message is sent"""
+        task = self._status_tasks.get((chat_id, message_id))
+        if task is not None:
+            await asyncio.shield(task)
+
+    async def _send_statuses(self, key: tuple[int, int]) -> None:
+        chat_id, message_id = key
+        last = None
+        try:
+            while key in self._statuses:
+                await self.acquire(chat_id)
+                # the latest status once it is our turn, the ones set meanwhile are skipped
+                text = self._statuses.pop(key)
+                if text == last:
+                    continue
+                try:
+                    await self.request(chat_id, 'edit', lambda: self.bot.edit_message_text(
+                        text, chat_id=chat_id, message_id=message_id
+                    ), acquired=True)
+                except TelegramBadRequest as e:
+                    if 'message is not modified' not in str(e):
+                        logging.warning(f"unable to update the status of chat {chat_id}: {e}")
+                last = text
+        except Exception as e:
+            logging.error(f"unable to update the status of chat {chat_id}: {e}")
+        finally:
+            del self._status_tasks[key]
+            self._statuses.pop(key, None)
+
+    def stats(self) -> dict:
+        """messages sent, edited and deleted, status edits skipped, 429 responses"""
+        return dict(self._stats)
@@ -1,11 +1,15 @@
+import asyncio
 import datetime
 import logging
-from typing import Generator, Tuple
+import time
+from typing import Callable, Awaitable, Optional
 
 from aiogram import types, enums
 from aiogram.utils.text_decorations import HtmlDecoration
 
+from video_summary_bot_core.jobs import JobContext, QueueFullError
 from video_summary_telegram_bot.filters import AllCommands
+from video_summary_telegram_bot.media import MediaFile, MediaLimitError, artifact_name, extension, media_file
 
 
 __all__ = ['OnMessageHandler']
@@ -25,53 +29,268 @@ class OnMessageHandler:
             await self._on_message(message)
         except Exception as e:
             logging.error(f"error on message from {message.from_user.id}: {e}")
-            await message.reply("Sorry, an error occurred. Please try again later.")
+            await self._reply(message, "Sorry, an error occurred. Please try again later.")
 
     @property
     def filters(self):
         return [~AllCommands()]
 
     async def _on_message(self, message: types.Message) -> None:
-        if message.content_type != enums.ContentType.TEXT:
-            await message.reply("not supported")
+        if message.content_type == enums.ContentType.TEXT:
+            source = await self._replied_source(message)
+            if source is not None and not self.bot.ai.validate_video_url(message.text):
+                await self._on_question(message, source)
+                return
+            await self._on_video_url(message)
+            return
+        media = media_file(message)
+        if media is None:
+            await self._reply(message, "not supported")
             logging.info(f"{message.content_type} message from {message.from_user.id} is not supported")
             return
+        try:
+            self.bot.media.check(media)
+        except MediaLimitError as e:
+            await self._reply(message, str(e))
+            logging.info(f"{media['kind']} from {message.from_user.id} rejected: {e}")
+            return
+        logging.info(f"processing {media['kind']} from {message.from_user.id}: {media['file_unique_id']} "
+                     f"({(media['file_size'] or 0) / 2 ** 20:.1f} MiB)")
+        await self._summarize(message, artifact_name(media),
+                              lambda ctx, send_topic: self._process_media(ctx, media, send_topic))
+
+    async def _on_video_url(self, message: types.Message) -> None:
         message_text = message.text
         if not self.bot.ai.validate_video_url(message_text):
-            await message.reply("url not supported")
+            await self._reply(message, "url not supported")
             logging.info(f"message from {message.from_user.id} has an unsupported url: {message_text}")
             return
         logging.info(f"processing message from {message.from_user.id}: '{message_text}'")
-        reply_message = await message.reply("processing ... please wait")
+        await self._summarize(message, message_text,
+                              lambda ctx, send_topic: self._process_video_url(ctx, message_text, send_topic))
+
+    async def _replied_source(self, message: types.Message) -> Optional[str]:
+        """the video of the summary or answer `message` replies to, None if it is not a reply to one"""
+        replied = message.reply_to_message
+        if replied is None:
+            return None
+        return await asyncio.to_thread(self.bot.summary_messages.source, message.chat.id, replied.message_id)
+
+    async def _on_question(self, message: types.Message, source: str) -> None:
+        """answer a follow-up question about `source` from its transcript"""
+        logging.info(f"question from {message.from_user.id} about {source}: '{message.text}'")
+        try:
+            job = self.bot.jobs.submit(
+                lambda ctx: ctx.run_io(self.bot.ai.ask, source, message.text, self.bot.answer_top_k)
+            )
+        except QueueFullError:
+            await self._reply(message, "too many requests in progress, please try again later")
+            logging.info(f"job queue full, rejecting the question from {message.from_user.id}")
+            return
+        try:
+            answer = await job
+        except ValueError:
+            await self._reply(message, "the transcript of this video is not available anymore")
+            logging.info(f"no transcript of {source} to answer {message.from_user.id}")
+            return
+        logging.info(f"answered {message.from_user.id} about {source} from {answer['prompt_tokens']} prompt tokens "
+                     f"(whole transcript: ~{answer['transcript_tokens']}) in {answer['seconds']:.1f} s")
+        messages = await self.bot.delivery.send(message.chat.id, [self._format_answer_text(answer)],
+                                                reply_to_message_id=message.message_id)
+        # a reply to the answer is another question about the same video
+        await asyncio.to_thread(self.bot.summary_messages.add, message.chat.id,
+                                [m.message_id for m in messages], source)
+
+    async def _summarize(
+            self,
+            message: types.Message,
+            source: str,
+            process: Callable[[JobContext, Callable[[dict], Awaitable[None]]], Awaitable[list[dict]]]
+    ) -> None:
+        """
+        run `process` as a job, replying with its progress and the topics it sends; replies to these
+        messages are questions about `source`
+        """
+        delivery = self.bot.delivery
+        reply_message = await self._reply(message, "processing ... please wait")
+
+        def set_status(text: str) -> None:
+            # only the latest status is sent when the job reports progress faster than the rate limits
+            delivery.set_status(message.chat.id, reply_message.message_id, text)
 
-        for text, is_status in self._process_video_url(message_text):
-            if is_status:
-                await reply_message.edit_text(text)
-            else:
-                await self.bot.send_message_async(message.chat.id, text)
+        # topics queued for sending, packed into as few messages as possible
+        outbox = delivery.outbox(message.chat.id)
+        sent: list[dict] = []
 
-    def _process_video_url(self, video_url: str) -> Generator[Tuple[str, bool], None, None]:
-        yield "processing: getting transcript ...", True
-        transcript = self.bot.ai.transcript_video(video_url)
+        async def send_topic(topic: dict) -> None:
+            sent.append(topic)
+            outbox.add(self._format_response_text(topic, len(sent)))
+
+        try:
+            job = self.bot.jobs.submit(lambda ctx: process(ctx, send_topic), progress=set_status)
+        except QueueFullError:
+            set_status("too many videos in progress, please try again later")
+            logging.info(f"job queue full, rejecting message from {message.from_user.id}")
+            return
+        try:
+            summary = await job
+        except MediaLimitError as e:
+            set_status(str(e))
+            logging.info(f"upload from {message.from_user.id} rejected: {e}")
+            return
+        except ValueError:
+            set_status("url not supported")
+            logging.info(f"message from {message.from_user.id} has an unresolvable url: {message.text}")
+            return
+        if not self.bot.stream_summary:
+            for topic in summary:
+                await send_topic(topic)
+        sent_messages = await outbox.close()
+        # topics streamed per transcript window were merged into the summary since
+        merged = sorted(sent, key=lambda x: x['timestamp'][0]) != summary
+        if self.bot.stream_summary and (self.bot.reorder_summary or merged):
+            # rewrite the streamed messages so the topics read in timestamp order, as merged
+            sent_messages = await outbox.replace(
+                [self._format_response_text(topic, i) for i, topic in enumerate(summary, start=1)]
+            )
+        await delivery.wait_status(message.chat.id, reply_message.message_id)
+        await asyncio.to_thread(self.bot.summary_messages.add, message.chat.id,
+                                [reply_message.message_id] + [m.message_id for m in sent_messages], source)
+        whisper_stats = self.bot.ai.whisper_stats()
+        if whisper_stats and whisper_stats['batches']:
+            logging.info(f"whisper scheduler: mean batch {whisper_stats['mean_batch_size']:.1f} windows, "
+                         f"{whisper_stats['throughput']:.1f} audio s / wall s")
 
-        yield "processing: summarizing ...", True
-        summary = list(self.bot.ai.generate_summary(video_url, transcript))
+    async def _process_video_url(
+            self,
+            ctx: JobContext,
+            video_url: str,
+            send_topic: Callable[[dict], Awaitable[None]]
+    ) -> list[dict]:
+        """the summary topics sorted by timestamp, when streaming each topic is also sent as soon as it is ready"""
+        timings = {'queue': ctx.queue_wait}
+        started = time.monotonic()
+        if await ctx.run_io(self.bot.ai.needs_audio, video_url):
+            await ctx.progress("processing: downloading ...")
+            await ctx.run_io(self.bot.ai.download_audio, video_url)
+        timings['download'] = time.monotonic() - started
+
+        needs_whisper = await ctx.run_io(self.bot.ai.needs_whisper, video_url)
+        if needs_whisper and self.bot.ai.incremental_summary:
+            return await self._pipelined_summary(ctx, video_url, send_topic, timings)
+
+        await ctx.progress("processing: getting transcript ...")
+        started = time.monotonic()
+        # cached transcripts, captions and near-duplicates do not wait behind Whisper jobs
+        run = ctx.run_transcribe if needs_whisper else ctx.run_io
+        transcript = await run(self.bot.ai.transcript_segments, video_url)
+        timings['transcript'] = time.monotonic() - started
+        return await self._summarize_transcript(ctx, video_url, transcript, send_topic, timings)
+
+    async def _pipelined_summary(
+            self,
+            ctx: JobContext,
+            video_url: str,
+            send_topic: Callable[[dict], Awaitable[None]],
+            timings: dict[str, float]
+    ) -> list[dict]:
+        """
+        the summary of a video transcribed with Whisper: the transcript windows are made on the Whisper
+        executor and each one is summarized on the I/O executor as soon as it is transcribed; when streaming,
+        the topics of every window are sent as they come (and replaced by the merged summary at the end)
+        """
+        ai = self.bot.ai
+        await ctx.progress("processing: transcribing and summarizing ...")
+        started = time.monotonic()
+
+        async def summarize(window: str, index: int) -> list[dict]:
+            topics = await ctx.run_io(ai.summarize_window, video_url, window, index)
+            if self.bot.stream_summary:
+                for topic in topics:
+                    await send_topic(topic)
+            return topics
+
+        segments: list[dict] = []
+        tasks: list[asyncio.Task] = []
+        try:
+            async for window in ctx.iterate_transcribe(ai.transcript_windows, video_url, segments):
+                tasks.append(asyncio.create_task(summarize(window, len(tasks))))
+            windows = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        summary = await ctx.run_io(ai.merge_windows, video_url, windows, segments)
+        timings['transcript+summary'] = time.monotonic() - started
+        logging.info(f"{video_url}: " + ", ".join(f"{stage} {seconds:.1f} s" for stage, seconds in timings.items()))
+        summary = sorted(summary, key=lambda x: x['timestamp'][0])
+
+        await ctx.progress("processing: complete")
+        return summary
+
+    async def _process_media(
+            self,
+            ctx: JobContext,
+            media: MediaFile,
+            send_topic: Callable[[dict], Awaitable[None]]
+    ) -> list[dict]:
+        """like `_process_video_url` for an uploaded file, which is downloaded only if not transcribed yet"""
+        ai = self.bot.ai
+        name = artifact_name(media)
+        timings = {'queue': ctx.queue_wait}
+        started = time.monotonic()
+        if not await ctx.run_io(ai.has_media_transcript, name) and await ctx.run_io(ai.media_audio, name) is None:
+            await ctx.progress("processing: downloading ...")
+            audio_file = await self.bot.media.download(media, ai.media_audio_path(name, extension(media)))
+            await ctx.run_io(ai.add_media_audio, name, audio_file, {'producer': 'telegram', 'kind': media['kind']})
+        timings['download'] = time.monotonic() - started
+
+        await ctx.progress("processing: getting transcript ...")
+        started = time.monotonic()
+        run = ctx.run_transcribe if await ctx.run_io(ai.media_needs_whisper, name) else ctx.run_io
+        transcript = await run(ai.media_transcript_segments, name, media['duration'])
+        timings['transcript'] = time.monotonic() - started
+        return await self._summarize_transcript(ctx, name, transcript, send_topic, timings)
+
+    async def _summarize_transcript(
+            self,
+            ctx: JobContext,
+            source: str,
+            transcript: list[dict],
+            send_topic: Callable[[dict], Awaitable[None]],
+            timings: dict[str, float]
+    ) -> list[dict]:
+        """the summary topics of the transcript of `source` (a url or the name of an upload)"""
+        await ctx.progress("processing: summarizing ...")
+        started = time.monotonic()
+        if self.bot.stream_summary:
+            summary = []
+            async for topic in ctx.iterate_io(self.bot.ai.stream_summary, source, transcript):
+                summary.append(topic)
+                await send_topic(topic)
+        else:
+            summary = await ctx.run_io(lambda: list(self.bot.ai.generate_summary(source, transcript)))
+        timings['summary'] = time.monotonic() - started
+        logging.info(f"{source}: " + ", ".join(f"{stage} {seconds:.1f} s" for stage, seconds in timings.items()))
         # sort by timestamp
         summary = sorted(summary, key=lambda x: x['timestamp'][0])
 
-        yield "processing: complete", True
-        for topic_id, d in enumerate(summary, start=1):
-            yield self._format_response_text(d, topic_id), False
+        await ctx.progress("processing: complete")
+        return summary
+
+    async def _reply(self, message: types.Message, text: str) -> types.Message:
+        return (await self.bot.delivery.send(message.chat.id, [text], reply_to_message_id=message.message_id))[0]
 
     @staticmethod
     def _format_response_text(d: dict, topic_id: int) -> str:
         _ = HtmlDecoration()
-        title = _.bold(f"{topic_id} - {d['topic']}")
+        # the topics are model output, not HTML
+        title = _.bold(f"{topic_id} - {_.quote(d['topic'])}")
         if d['ref_url']:
             response_text = _.link(title, d['ref_url'])
         else:
             response_text = title
-        response_text += _.blockquote(d['summary'])
+        response_text += _.blockquote(_.quote(d['summary']))
         response_text += _.italic(
             f"{datetime.timedelta(seconds=int(d['timestamp'][0]))} - {datetime.timedelta(seconds=int(d['timestamp'][1]))}"
         )
@@ -80,3 +299,16 @@ class OnMessageHandler:
             response_text += _.link(d['ref_url'], d['ref_url'])
             response_text += "\n"
         return response_text
+
+    @staticmethod
+    def _format_answer_text(answer: dict) -> str:
+        _ = HtmlDecoration()
+        response_text = _.quote(answer['answer'] or "no answer")
+        sources = []
+        for source in answer['sources']:
+            start, end = (datetime.timedelta(seconds=int(source[k])) for k in ('start', 'end'))
+            when = f"{start} - {end}"
+            sources.append(_.link(when, source['ref_url']) if source['ref_url'] else _.italic(when))
+        if sources:
+            response_text += "\n\n" + _.italic("from: ") + ", ".join(sources)
+        return response_text
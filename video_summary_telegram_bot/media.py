@@ -0,0 +1,182 @@
+"""
+Audio and video files sent to the bot: voice notes, audio, video, round video notes and documents with
+an audio/video mime type. The file is streamed from the Bot API straight to the artifact cache (never
+held in memory); with a local Bot API server the file already on disk is hard linked (or copied by
+the kernel when on another filesystem). Files are cached by `file_unique_id`, the same for every
+forward of a file, so a forwarded voice note is downloaded and transcribed once.
+"""
+import asyncio
+import contextlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Optional, TypedDict
+
+from aiogram import Bot, enums, types
+
+from video_summary_bot_core import metrics
+
+__all__ = [
+    'MediaFile', 'MediaLimitError', 'MediaDownloader', 'media_file', 'artifact_name', 'extension',
+    'CLOUD_MAX_BYTES', 'LOCAL_MAX_BYTES',
+]
+
+# getFile of the cloud Bot API serves files up to 20 MB, a local Bot API server up to 2000 MB
+CLOUD_MAX_BYTES = 20 * 2 ** 20
+LOCAL_MAX_BYTES = 2000 * 2 ** 20
+
+_MEDIA_TYPES = (enums.ContentType.VOICE, enums.ContentType.AUDIO, enums.ContentType.VIDEO,
+                enums.ContentType.VIDEO_NOTE)
+_EXTENSIONS = {enums.ContentType.VOICE: '.ogg', enums.ContentType.VIDEO_NOTE: '.mp4'}
+
+
+class MediaFile(TypedDict):
+    # the message content type
+    kind: str
+    file_id: str
+    file_unique_id: str
+    file_size: Optional[int]
+    # seconds, unknown for documents
+    duration: Optional[float]
+    mime_type: Optional[str]
+    file_name: Optional[str]
+
+
+class MediaLimitError(Exception):
+    """the file is too large or too long, the message is meant for the user"""
+
+
+def media_file(message: types.Message) -> Optional[MediaFile]:
+    """the audio/video file of `message`, None if it has none"""
+    if message.content_type in _MEDIA_TYPES:
+        media = getattr(message, message.content_type)
+    elif message.content_type == enums.ContentType.DOCUMENT and \
+            (message.document.mime_type or '').split('/')[0] in ('audio', 'video'):
+        media = message.document
+    else:
+        return None
+    return MediaFile(
+        kind=message.content_type,
+        file_id=media.file_id,
+        file_unique_id=media.file_unique_id,
+        file_size=media.file_size,
+        duration=getattr(media, 'duration', None),
+        mime_type=getattr(media, 'mime_type', None),
+        file_name=getattr(media, 'file_name', None)
+    )
+
+
+def artifact_name(media: MediaFile) -> str:
+    """the name of the cached audio, transcript, ... of the file, like `{extractor}_{video_id}` for urls"""
+    return f"telegram_{media['file_unique_id']}"
+
+
+def extension(media: MediaFile) -> str:
+    """container extension for the downloaded file, ffmpeg probes the content anyway"""
+    if media['file_name'] and Path(media['file_name']).suffix:
+        return Path(media['file_name']).suffix.lower()
+    if media['kind'] in _EXTENSIONS:
+        return _EXTENSIONS[media['kind']]
+    return mimetypes.guess_extension(media['mime_type'] or '') or '.bin'
+
+
+class MediaDownloader:
+    """
+    Downloads the files of `MediaFile`s within `max_bytes` (by default what the Bot API serves) and
+    `max_duration` seconds; concurrent downloads of the same file are shared.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            max_bytes: Optional[int] = None,
+            max_duration: Optional[float] = None,
+            chunk_size: int = 2 ** 18,
+            timeout: int = 3600
+    ):
+        self._bot = bot
+        self._local = bot.session.api.is_local
+        self.max_bytes = max_bytes if max_bytes is not None else (LOCAL_MAX_BYTES if self._local else CLOUD_MAX_BYTES)
+        self.max_duration = max_duration
+        self._chunk_size = chunk_size
+        self._timeout = timeout
+        self._downloads: dict[str, asyncio.Future] = {}
+
+    def check(self, media: MediaFile) -> None:
+        """
+        the limits known from the message, before downloading
+        :raise MediaLimitError: if the file is too large or too long
+        """
+        if media['file_size'] is not None and media['file_size'] > self.max_bytes:
+            raise MediaLimitError(f"file too large, the limit is {self.max_bytes / 2 ** 20:.0f} MB")
+        if self.max_duration is not None and media['duration'] is not None and media['duration'] > self.max_duration:
+            raise MediaLimitError(f"file too long, the limit is {self.max_duration / 60:.0f} minutes")
+
+    async def download(self, media: MediaFile, destination: Path) -> Path:
+        """
+        the file of `media` at `destination`, which is either missing or complete
+        :raise MediaLimitError: if the file turns out larger than `max_bytes`
+        """
+        self.check(media)
+        key = media['file_unique_id']
+        future = self._downloads.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._download(media, destination))
+            self._downloads[key] = future
+            future.add_done_callback(lambda _: self._downloads.pop(key, None))
+        # a cancelled waiter does not cancel the download shared with the others
+        return await asyncio.shield(future)
+
+    async def _download(self, media: MediaFile, destination: Path) -> Path:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        with metrics.stage(metrics.DOWNLOAD):
+            file = await self._bot.get_file(media['file_id'])
+            if file.file_size is not None and file.file_size > self.max_bytes:
+                raise MediaLimitError(f"file too large, the limit is {self.max_bytes / 2 ** 20:.0f} MB")
+            local_path = Path(self._bot.session.api.wrap_local_file.to_local(file.file_path)) if self._local else None
+            if local_path is not None and local_path.is_file():
+                size = await asyncio.to_thread(self._link, local_path, destination)
+            else:
+                size = await self._stream(file.file_path, destination)
+        metrics.DOWNLOAD_BYTES.inc(size)
+        logging.info(f"downloaded {media['kind']} {media['file_unique_id']}: {size / 2 ** 20:.1f} MiB")
+        return destination
+
+    @staticmethod
+    def _link(source: Path, destination: Path) -> int:
+        """zero-copy: a hard link to the file of the local Bot API server, a kernel copy across filesystems"""
+        tmp = destination.with_name(f".{destination.name}.{os.getpid()}.tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(source, tmp)
+        except OSError:
+            # copy_file_range/sendfile, the data never goes through user space
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, destination)
+        return destination.stat().st_size
+
+    async def _stream(self, file_path: str, destination: Path) -> int:
+        url = self._bot.session.api.file_url(self._bot.token, file_path)
+        fd, tmp_name = tempfile.mkstemp(prefix=f".{destination.name}.", suffix='.tmp', dir=destination.parent)
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async for chunk in self._bot.session.stream_content(
+                        url, timeout=self._timeout, chunk_size=self._chunk_size, raise_for_status=True
+                ):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise MediaLimitError(f"file too large, the limit is {self.max_bytes / 2 ** 20:.0f} MB")
+                    # a slow disk does not stall the event loop (and every other chat) for a chunk
+                    await asyncio.to_thread(f.write, chunk)
+                f.flush()
+                await asyncio.to_thread(os.fsync, f.fileno())
+            os.replace(tmp_name, destination)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_name)
+            raise
+        return size
@@ -0,0 +1,63 @@
+import contextlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+__all__ = ['SummaryMessages']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_messages (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS summary_messages_created_at ON summary_messages (created_at);
+"""
+
+
+class SummaryMessages:
+    """
+    The video (url or upload artifact name) each summary and answer message sent by the bot is about,
+    so that a reply to one of them is a question about that video. Kept in SQLite
+    (`data_dir/summary_messages.sqlite3`) for `ttl` seconds: it survives restarts and is shared by the
+    replicas of the bot in webhook mode.
+    """
+
+    def __init__(self, data_dir: str | Path, ttl: float = 30 * 24 * 60 * 60):
+        self._db_path = Path(data_dir) / 'summary_messages.sqlite3'
+        self._db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._ttl = ttl
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def add(self, chat_id: int, message_ids: Iterable[int], source: str) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO summary_messages (chat_id, message_id, source, created_at) VALUES (?, ?, ?, ?)',
+                ((chat_id, message_id, source, now) for message_id in message_ids)
+            )
+            conn.execute('DELETE FROM summary_messages WHERE created_at < ?', (now - self._ttl,))
+
+    def source(self, chat_id: int, message_id: int) -> Optional[str]:
+        """the video the message is about, None if it is not a summary or answer (or too old)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT source FROM summary_messages WHERE chat_id = ? AND message_id = ? AND created_at >= ?',
+                (chat_id, message_id, time.time() - self._ttl)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a short lived connection per operation, like the artifact store
+        conn = sqlite3.connect(self._db_path, timeout=30)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
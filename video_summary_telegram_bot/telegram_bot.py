@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 from pathlib import Path
 from typing import Optional
 
@@ -11,8 +12,15 @@ from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import SimpleEventIsolation
 from aiogram.utils.text_decorations import HtmlDecoration
+from video_summary_bot_core import lazy_imports, metrics
+from video_summary_bot_core.extractor_index import get_extractor_index
+from video_summary_bot_core.jobs import JobQueue
 from video_summary_simple.aibot import AiBot
+from video_summary_telegram_bot.delivery import Delivery
 from video_summary_telegram_bot.handlers.on_message_handler import OnMessageHandler
+from video_summary_telegram_bot.media import MediaDownloader
+from video_summary_telegram_bot.summary_messages import SummaryMessages
+from video_summary_telegram_bot.webhook import WebhookServer, default_secret_token
 
 
 class TelegramBot:
@@ -26,7 +34,45 @@ class TelegramBot:
             openai_api_key: Optional[str] = None,
             whisper_model_name: str = "large-v3",
             whisper_device: str = "cuda",
-            data_dir: str | Path = "data"
+            data_dir: str | Path = "data",
+            transcript_source: str = "prefer-captions",
+            caption_languages: Optional[list[str]] = None,
+            whisper_workers: int = 1,
+            chunk_seconds: float = 600.0,
+            whisper_batch_size: int = 1,
+            whisper_batch_max_wait: float = 0.05,
+            max_pending_jobs: int = 16,
+            max_running_jobs: int = 4,
+            io_workers: int = 8,
+            transcribe_workers: int = 1,
+            transcription_profile: str = "auto",
+            summary_window_tokens: int = 12000,
+            summary_concurrency: int = 4,
+            transcript_merge_seconds: float = 15.0,
+            transcript_token_budget: Optional[int] = None,
+            summary_cache_ttl: float = 7 * 24 * 60 * 60,
+            summary_cache_serve_stale: bool = True,
+            duplicate_threshold: Optional[float] = 0.1,
+            stream_summary: bool = True,
+            incremental_summary: bool = True,
+            reorder_summary: bool = False,
+            answer_top_k: Optional[int] = 4,
+            preload_models: Optional[list[str]] = None,
+            warm_up: bool = True,
+            model_memory_budget: Optional[int] = None,
+            cache_max_bytes: Optional[int] = None,
+            cache_ttl: Optional[float] = None,
+            metrics_port: Optional[int] = None,
+            global_rate_limit: float = 30.0,
+            chat_rate_limit: float = 1.0,
+            webhook_url: Optional[str] = None,
+            webhook_host: str = "0.0.0.0",
+            webhook_port: Optional[int] = None,
+            webhook_path: str = "/telegram",
+            webhook_secret: Optional[str] = None,
+            webhook_max_connections: int = 40,
+            max_upload_bytes: Optional[int] = None,
+            max_upload_duration: Optional[float] = 4 * 60 * 60
     ):
         self._telegram_bot_api_server = telegram_bot_api_server
         if self._telegram_bot_api_server:
@@ -37,6 +83,9 @@ class TelegramBot:
             events_isolation=SimpleEventIsolation(),
         )
         self._bot = Bot(token=token, parse_mode=enums.ParseMode.HTML, session=session)
+        self._delivery = Delivery(self._bot, global_rate=global_rate_limit, chat_rate=chat_rate_limit)
+        # uploads up to what the Bot API serves (20 MB, 2000 MB with a local server) unless limited further
+        self._media = MediaDownloader(self._bot, max_bytes=max_upload_bytes, max_duration=max_upload_duration)
         self._ = HtmlDecoration()
         self._loop = asyncio.get_event_loop()
         self._ai = AiBot(
@@ -45,14 +94,116 @@ class TelegramBot:
             openai_api_key=openai_api_key,
             whisper_model_name=whisper_model_name,
             whisper_device=whisper_device,
-            data_dir=data_dir
+            data_dir=data_dir,
+            transcript_source=transcript_source,
+            caption_languages=caption_languages,
+            whisper_workers=whisper_workers,
+            chunk_seconds=chunk_seconds,
+            whisper_batch_size=whisper_batch_size,
+            whisper_batch_max_wait=whisper_batch_max_wait,
+            model_memory_budget=model_memory_budget,
+            transcription_profile=transcription_profile,
+            summary_window_tokens=summary_window_tokens,
+            summary_concurrency=summary_concurrency,
+            transcript_merge_seconds=transcript_merge_seconds,
+            transcript_token_budget=transcript_token_budget,
+            summary_cache_ttl=summary_cache_ttl,
+            summary_cache_serve_stale=summary_cache_serve_stale,
+            cache_max_bytes=cache_max_bytes,
+            cache_ttl=cache_ttl,
+            duplicate_threshold=duplicate_threshold,
+            incremental_summary=incremental_summary,
+            # read when a video is transcribed, the job queue is created below
+            queue_depth=lambda: self._jobs.waiting
+        )
+        self._stream_summary = stream_summary
+        self._reorder_summary = reorder_summary
+        self._answer_top_k = answer_top_k
+        self._summary_messages = SummaryMessages(data_dir)
+        self._preload_models = preload_models
+        self._warm_up = warm_up
+        self._ml_stack_task: Optional[asyncio.Task] = None
+        self._metrics_port = metrics_port
+        self._metrics_server: Optional[metrics.MetricsServer] = None
+        # webhook mode when a port is given, long polling otherwise
+        self._webhook_url = webhook_url
+        self._webhook_host = webhook_host
+        self._webhook_port = webhook_port
+        self._webhook_path = webhook_path
+        self._webhook_secret = webhook_secret or default_secret_token(token)
+        self._webhook_max_connections = webhook_max_connections
+        self._jobs = JobQueue(
+            max_pending=max_pending_jobs,
+            max_running=max_running_jobs,
+            io_workers=io_workers,
+            transcribe_workers=transcribe_workers
         )
 
     async def start_async(self) -> None:
         logging.info("starting bot")
+        # in webhook mode on the same port, /metrics is served by the webhook server
+        if self._metrics_port is not None and self._metrics_port != self._webhook_port:
+            self._metrics_server = metrics.MetricsServer(self._metrics_port).start()
+        # build the url -> extractor index once, before the first message needs it
+        await asyncio.to_thread(get_extractor_index)
+        # torch/whisper/openai and the Whisper model load while the bot already answers,
+        # a job arriving meanwhile waits for the model in the registry, until it is loaded and warmed up
+        self._ml_stack_task = asyncio.create_task(self._load_ml_stack())
+        stats = self._ai.store.stats()
+        logging.info(f"artifact store: {stats['count']} files, {stats['bytes'] / 2 ** 20:.0f} MiB")
+        self._ai.store.start_eviction()
         await self._register_handlers()
-        await self._bot.delete_webhook()
-        await self._dp.start_polling(self._bot)
+        if self._webhook_port is not None:
+            await self._serve_webhook()
+        else:
+            await self._bot.delete_webhook()
+            await self._dp.start_polling(self._bot)
+
+    async def _serve_webhook(self) -> None:
+        server = WebhookServer(
+            self._dp,
+            self._bot,
+            host=self._webhook_host,
+            port=self._webhook_port,
+            path=self._webhook_path,
+            secret_token=self._webhook_secret,
+            health=self._health
+        )
+        await server.start()
+        if self._webhook_url:
+            # every replica registers the same url and secret, so the order they start in doesn't matter;
+            # the webhook is never deleted on shutdown, the other replicas keep receiving updates
+            await self._bot.set_webhook(
+                self._webhook_url,
+                secret_token=self._webhook_secret,
+                max_connections=self._webhook_max_connections,
+                allowed_updates=self._dp.resolve_used_update_types()
+            )
+            logging.info(f"webhook registered at {self._webhook_url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    def _health(self) -> dict:
+        task = self._ml_stack_task
+        return {
+            'ml_stack_ready': task is not None and task.done(),
+            'jobs': self._jobs.stats(),
+        }
+
+    async def _load_ml_stack(self) -> None:
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(lazy_imports.preload)
+            await asyncio.to_thread(self._ai.preload_models, self._preload_models, self._warm_up)
+        except Exception as e:
+            logging.error(f"unable to preload the models, they will be loaded on first use: {e}")
+            return
+        for stats in self._ai.model_stats():
+            logging.info(f"model {stats['name']} ready: loaded in {stats['load_seconds']:.1f} s, "
+                         f"{stats['resident_bytes'] / 2 ** 20:.0f} MiB resident")
+        logging.info(f"ML stack ready {time.monotonic() - started:.1f} s after startup")
 
     def start(self) -> None:
         task = self.start_async()
@@ -91,16 +242,49 @@ class TelegramBot:
     cmd_start.filters = [filters.CommandStart()]
 
     async def edit_message_text_async(self, text: str, chat_id: int, message_id: int, *args, **kwargs) -> types.Message:
-        return await self._bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, *args, **kwargs)
+        return await self._delivery.request(
+            chat_id, 'edit',
+            lambda: self._bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, *args, **kwargs)
+        )
 
     async def send_message_async(self, chat_id: int, text: str, reply_to_message_id: int = None) -> types.Message:
-        return await self._bot.send_message(chat_id,
-                                            text,
-                                            reply_to_message_id=reply_to_message_id,
-                                            link_preview_options=types.LinkPreviewOptions(is_disabled=True),
-                                            parse_mode=enums.ParseMode.HTML
-                                            )
+        """`text` is split into several messages if too long, the first one is returned"""
+        return (await self._delivery.send(chat_id, [text], reply_to_message_id=reply_to_message_id))[0]
 
     @property
     def ai(self) -> AiBot:
         return self._ai
+
+    @property
+    def jobs(self) -> JobQueue:
+        return self._jobs
+
+    @property
+    def delivery(self) -> Delivery:
+        """rate limited outbound messages"""
+        return self._delivery
+
+    @property
+    def media(self) -> MediaDownloader:
+        """downloads of the audio/video files sent to the bot"""
+        return self._media
+
+    @property
+    def stream_summary(self) -> bool:
+        """send each topic as soon as it is generated"""
+        return self._stream_summary
+
+    @property
+    def reorder_summary(self) -> bool:
+        """once a streamed summary is complete, edit its messages into timestamp order"""
+        return self._reorder_summary
+
+    @property
+    def summary_messages(self) -> SummaryMessages:
+        """the video each summary and answer message is about, for follow-up questions"""
+        return self._summary_messages
+
+    @property
+    def answer_top_k(self) -> Optional[int]:
+        """transcript excerpts sent to answer a follow-up question, None for the whole transcript"""
+        return self._answer_top_k
@@ -0,0 +1,101 @@
+"""
+Webhook mode: Telegram POSTs every update to an embedded aiohttp server instead of the bot polling
+for them. An update is acknowledged with a 200 as soon as it is parsed and handled by the dispatcher
+in a background task, so a long job never delays (or makes Telegram redeliver) the next update.
+The server holds no state of its own: several replicas behind a load balancer can share one webhook
+url as long as they use the same secret token.
+"""
+import hashlib
+import logging
+from typing import Any, Callable, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from video_summary_bot_core import metrics
+
+__all__ = ['WebhookServer', 'default_secret_token']
+
+
+def default_secret_token(bot_token: str) -> str:
+    """a secret token derived from the bot token, the same on every replica"""
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+class _UpdateHandler(SimpleRequestHandler):
+    """checks the secret token header, answers at once and feeds the update to the dispatcher in the background"""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        response = await super().handle(request)
+        metrics.WEBHOOK_UPDATES.inc(result='unauthorized' if response.status == 401 else 'accepted')
+        return response
+
+
+class WebhookServer:
+    """updates at http://host:port/path, health and Prometheus metrics at /health and /metrics"""
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher,
+            bot: Bot,
+            host: str = '0.0.0.0',
+            port: int = 8080,
+            path: str = '/telegram',
+            secret_token: Optional[str] = None,
+            registry: Optional[metrics.MetricsRegistry] = None,
+            health: Optional[Callable[[], dict[str, Any]]] = None
+    ):
+        self._dispatcher = dispatcher
+        self._bot = bot
+        self._host = host
+        self._port = port
+        self._path = path
+        self._secret_token = secret_token
+        self._registry = registry or metrics.get_metrics()
+        self._health = health or (lambda: {})
+        self._runner: Optional[web.AppRunner] = None
+        self._site: Optional[web.TCPSite] = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def port(self) -> int:
+        """the listening port, the one picked by the OS when started on port 0"""
+        if self._site is None:
+            return self._port
+        return self._site._server.sockets[0].getsockname()[1]
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        _UpdateHandler(
+            self._dispatcher, self._bot, handle_in_background=True, secret_token=self._secret_token
+        ).register(app, path=self._path)
+        setup_application(app, self._dispatcher, bot=self._bot)
+        app.router.add_get('/health', self._on_health)
+        app.router.add_get('/metrics', self._on_metrics)
+        return app
+
+    async def start(self) -> 'WebhookServer':
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, self._host, self._port)
+        await self._site.start()
+        logging.info(f"webhook listening on {self._host}:{self.port}{self._path}")
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _on_health(self, request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok', **self._health()})
+
+    async def _on_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self._registry.render().encode(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+        )